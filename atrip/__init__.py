@@ -18,6 +18,7 @@ from .container import Container, ContainerHeader, guess_container
 from .collection import Collection
 from .segment import Segment
 from . import style_bits
+from .utils import load_file, get_extracted_filename
 # from .ataridos import AtrHeader, AtariDosDiskImage, BootDiskImage, AtariDosFile, XexContainerSegment, get_xex, add_atr_header
 # from .dos33 import Dos33DiskImage
 # from .segments import SegmentData, SegmentSaver, DefaultSegment, EmptySegment, ObjSegment, RawSectorsSegment, SegmentedFileSegment, interleave_segments, SegmentList
@@ -96,26 +97,36 @@ def find_container_from_data(name, data, verbose=False):
 
 
 def find_container(filename, verbose=False):
-    sample_data = np.fromfile(filename, dtype=np.uint8)
+    sample_data = load_file(filename)
     return find_container_from_data(os.path.basename(filename), sample_data, verbose)
 
 
-def find_collection(filename, verbose=False):
-    sample_data = np.fromfile(filename, dtype=np.uint8)
+def find_collection(filename, verbose=False, use_cache=True):
+    sample_data = load_file(filename)
     if len(sample_data) > 0:
         log.info(f"loaded {len(sample_data)} bytes from {filename}")
     else:
         raise IOError("No data")
-    return Collection(filename, sample_data)
+    return Collection(filename, sample_data, use_cache=use_cache)
+
+
+def get_extension():
+    return options.ext[0] if options.ext else None
+
+
+def extract_all_files(collection):
+    for dirent, output, written in collection.extract_all("", options.lower, options.force, get_extension()):
+        if written:
+            print("extracting %s -> %s" % (dirent.filename, output))
+        else:
+            print("skipping %s, file exists. Use -f to overwrite" % output)
 
 
 def extract_files(collection, files):
     files = set(files)
     for dirent in collection.iter_dirents():
         if not files or dirent.filename in files:
-            output = dirent.filename
-            if options.lower:
-                output = output.lower()
+            output = get_extracted_filename(dirent.filename, options.lower, get_extension())
             if not options.dry_run:
                 segment = dirent.get_file()
                 if os.path.exists(output) and not options.force:
@@ -485,6 +496,8 @@ def run():
         "vtoc": ["v"],
         "segments": [],
         "menu": [],
+        "scan": [],
+        "signatures": [],
     }
     # reverse aliases does the inverse mapping of command aliases, including
     # the identity mapping of "command" to "command"
@@ -578,6 +591,19 @@ def run():
     p = subparsers.add_parser(command, help="Show the segment hierarchy in the disk image", aliases=command_aliases[command])
     p.add_argument("disk_image", metavar="DISK_IMAGE", nargs=1, help="disk image")
 
+    command = "scan"
+    p = subparsers.add_parser(command, help="Identify every disk image in the specified files and directories using multiple processes", aliases=command_aliases[command])
+    p.add_argument("-o", "--output", action="store", default=None, help="output file; if it exists, files already listed in it are skipped (unless using --restart) and new results are appended. Default is stdout")
+    p.add_argument("-F", "--format", action="store", default=None, choices=["jsonl", "csv"], help="output format; default is csv if the output file ends with .csv, otherwise json lines")
+    p.add_argument("-j", "--jobs", action="store", type=int, default=None, help="number of worker processes; default is the number of CPUs")
+    p.add_argument("-e", "--ext", action="append", default=[], help="only scan files with this extension (may be specified multiple times)")
+    p.add_argument("--restart", action="store_true", default=False, help="overwrite the output file rather than resuming a previous scan")
+    p.add_argument("paths", metavar="PATH", nargs="+", help="disk image files or directories to search recursively")
+
+    command = "signatures"
+    p = subparsers.add_parser(command, help="Rebuild the SHA1 signature index from the signature modules", aliases=command_aliases[command])
+    p.add_argument("-o", "--output", action="store", default=None, help="index file to write; default is the index used by atrip")
+
 
     # argparse doesn't seem to allow a default command, so if the first
     # argument isn't recognized, use the "list" command
@@ -611,6 +637,19 @@ def run():
     if options.trace:
         sys.settrace(trace_calls)
 
+    if command == "scan":
+        from .scan import scan
+        count = scan(options.paths, options.output, options.format, options.jobs, options.ext, not options.restart)
+        log.info(f"scanned {count} files")
+        return
+
+    if command == "signatures":
+        from .signature import rebuild_index, index_path
+        pathname = options.output or index_path
+        count = rebuild_index(pathname)
+        print(f"{pathname}: {count} signatures")
+        return
+
     disk_image_name = options.disk_image[0]
 
     if command == "create":
@@ -642,7 +681,10 @@ def run():
             elif command == "delete":
                 remove_files(container, options.files)
             elif command == "extract":
-                extract_files(collection, options.files)
+                if options.all and not options.dry_run:
+                    extract_all_files(collection)
+                else:
+                    extract_files(collection, options.files)
             elif command == "assemble":
                 asm = options.asm[0] if options.asm else []
                 data = options.data[0] if options.data else []
@@ -6,6 +6,7 @@ import pkg_resources
 import numpy as np
 
 from . import errors
+from .detect import rank_candidates
 from .utils import to_numpy, to_numpy_list, uuid
 
 import logging
@@ -15,6 +16,9 @@ log = logging.getLogger(__name__)
 class Archiver:
     archive_type = ""
 
+    # predicates from `detect` that must be true for archive data
+    detect = ()
+
     supports_multiple_containers = True
 
     def __str__(self):
@@ -23,7 +27,15 @@ class Archiver:
     def iter_archive(self, basename, byte_data):
         yield basename, byte_data
 
-    def pack_data(self, fh, containers, skip_missing_compressors=False):
+    def pack_data(self, fh, containers, skip_missing_compressors=False, source=None):
+        """Write the archive holding all the containers to the file-like
+        object `fh`.
+
+        `source` is the data of the archive that the containers were loaded
+        from, if available. The packed data of containers that haven't
+        changed since loading can be copied from it rather than compressing
+        them again.
+        """
         raise NotImplementedError
 
 
@@ -38,10 +50,15 @@ class PlainFileArchiver:
     def iter_archive(self, basename, byte_data):
         yield basename, byte_data
 
-    def pack_data(self, fh, containers, skip_missing_compressors=False):
+    def pack_data(self, fh, containers, skip_missing_compressors=False, source=None):
         if len(containers) > 1:
             raise errors.InvalidArchiver(f"{str(self)} doesn't support multiple containers")
-        fh.write(containers[0].calc_packed_bytes(skip_missing_compressors))
+        container = containers[0]
+        if source is not None and not container.is_dirty:
+            log.debug(f"{container.pathname}: unchanged, copying original data")
+            fh.write(memoryview(source))
+        else:
+            container.write_packed_bytes(fh, skip_missing_compressors)
 
 
 _archivers = None
@@ -65,10 +82,12 @@ def find_archivers():
         _archivers = _find_archivers()
     return _archivers
 
-def find_container_items_in_archive(pathname, raw_data):
+def find_container_items_in_archive(pathname, raw_data, candidates=None):
     basename = os.path.basename(pathname)
+    if candidates is None:
+        candidates = rank_candidates(find_archivers(), raw_data)
     archiver = None
-    for c in find_archivers():
+    for c in candidates:
         items = []
         log.debug(f"trying archiver {c.archive_type}")
         try:
@@ -1,3 +1,4 @@
+import copy
 import gzip
 import io
 import tarfile
@@ -7,6 +8,9 @@ import numpy as np
 
 from .. import errors
 from ..archiver import Archiver
+from ..detect import Magic, Check, AnyOf
+from ..compressors.lzma import is_lzma_alone_header
+from ..utils import ArrayReader
 
 import logging
 log = logging.getLogger(__name__)
@@ -15,13 +19,29 @@ log = logging.getLogger(__name__)
 class TarArchiver(Archiver):
     archive_type = "tar"
 
+    # tarfile also opens tar files compressed with gzip, bzip2 or lzma
+    detect = [AnyOf(
+        Check(lambda sample: is_tar_header(sample.head), evidence=True),
+        Magic(b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00"),
+        Check(lambda sample: is_lzma_alone_header(sample.head)),
+        )]
+
     def iter_archive(self, basename, byte_data):
-        byte_data = io.BytesIO(byte_data)
+        if isinstance(byte_data, np.ndarray):
+            raw = byte_data
+        else:
+            raw = np.frombuffer(byte_data, dtype=np.uint8)
         try:
-            with tarfile.open(None, "r", byte_data) as zf:
+            with tarfile.open(None, "r", ArrayReader(raw)) as zf:
                 for item in zf.getmembers():
                     log.debug(f"tarinfo item: {item}")
-                    item_data = np.frombuffer(zf.extractfile(item).read(), dtype=np.uint8)
+                    if item.isreg() and not item.issparse():
+                        # regular files are stored contiguously, so use them
+                        # in place; if the archive is memory mapped they are
+                        # only read from disk when accessed
+                        item_data = raw[item.offset_data:item.offset_data + item.size]
+                    else:
+                        item_data = np.frombuffer(zf.extractfile(item).read(), dtype=np.uint8)
                     yield item.name, item_data
         except:
             raise errors.InvalidArchiver("Not a tar file")
@@ -33,11 +53,38 @@ class TarArchiver(Archiver):
         tarinfo.gid = 800
         return tarinfo
 
-    def pack_data(self, fh, containers, skip_missing_compressors=False):
-        with tarfile.open(None, 'w', fh) as zf:
+    def find_members(self, raw):
+        with tarfile.open(None, "r", ArrayReader(raw)) as zf:
+            return {item.name: item for item in zf.getmembers() if item.isreg() and not item.issparse()}
+
+    def pack_data(self, fh, containers, skip_missing_compressors=False, source=None):
+        members = self.find_members(source) if source is not None else {}
+        # stream mode, so fh doesn't need to be seekable
+        with tarfile.open(None, 'w|', fh) as zf:
             for c in containers:
-                byte_data = c.calc_packed_bytes(skip_missing_compressors)
-                d = io.BytesIO(byte_data)
-                tarinfo = self.get_tarinfo(c)
+                if c.pathname in members and not c.is_dirty:
+                    log.debug(f"{c.pathname}: unchanged, copying original tar member")
+                    item = members[c.pathname]
+                    tarinfo = copy.copy(item)
+                    byte_data = source[item.offset_data:item.offset_data + item.size]
+                else:
+                    # the size goes in the header before the data, so it
+                    # has to be packed in memory
+                    buf = io.BytesIO()
+                    c.write_packed_bytes(buf, skip_missing_compressors)
+                    byte_data = buf.getbuffer()
+                    tarinfo = self.get_tarinfo(c)
                 tarinfo.size = len(byte_data)
-                zf.addfile(tarinfo, d)
+                zf.addfile(tarinfo, ArrayReader(byte_data))
+
+
+def is_tar_header(data):
+    """Check the checksum of the first header block, as tarfile does"""
+    block = data[:tarfile.BLOCKSIZE]
+    if len(block) < tarfile.BLOCKSIZE or block.count(0) == tarfile.BLOCKSIZE:
+        return False
+    try:
+        checksum = tarfile.nti(block[148:156])
+    except tarfile.InvalidHeaderError:
+        return False
+    return checksum in tarfile.calc_chksums(block)
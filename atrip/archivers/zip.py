@@ -1,11 +1,15 @@
+import copy
 import gzip
 import io
+import struct
 import zipfile
 
 import numpy as np
 
 from .. import errors
 from ..archiver import Archiver
+from ..detect import TrailingMagic
+from ..utils import ArrayReader
 
 import logging
 log = logging.getLogger(__name__)
@@ -14,19 +18,63 @@ log = logging.getLogger(__name__)
 class ZipArchiver(Archiver):
     archive_type = "zip"
 
+    # zipfile looks for the end of central directory record near the end
+    detect = [TrailingMagic(b"PK\x05\x06")]
+
     def iter_archive(self, basename, byte_data):
-        byte_data = io.BytesIO(byte_data)
+        if isinstance(byte_data, np.ndarray):
+            raw = byte_data
+        else:
+            raw = np.frombuffer(byte_data, dtype=np.uint8)
         try:
-            with zipfile.ZipFile(byte_data) as zf:
+            with zipfile.ZipFile(ArrayReader(raw)) as zf:
                 for item in zf.infolist():
                     log.debug(f"zipinfo item: {item}")
-                    item_data = np.frombuffer(zf.open(item).read(), dtype=np.uint8)
+                    if item.compress_type == zipfile.ZIP_STORED and not item.flag_bits & 0x1:
+                        # uncompressed items are used in place, so if the
+                        # archive is memory mapped they are only read from
+                        # disk when accessed
+                        start = self.calc_data_offset(raw, item)
+                        item_data = raw[start:start + item.file_size]
+                    else:
+                        item_data = np.frombuffer(zf.open(item).read(), dtype=np.uint8)
                     yield item.filename, item_data
         except:
             raise errors.InvalidArchiver("Not a zip file")
 
-    def pack_data(self, fh, containers, skip_missing_compressors=False):
+    def calc_data_offset(self, raw, item):
+        start = item.header_offset
+        header = struct.unpack(zipfile.structFileHeader, raw[start:start + zipfile.sizeFileHeader].tobytes())
+        if header[0] != zipfile.stringFileHeader:
+            raise errors.InvalidArchiver(f"Bad local file header for {item.filename}")
+        filename_length, extra_length = header[-2:]
+        return start + zipfile.sizeFileHeader + filename_length + extra_length
+
+    def find_members(self, raw):
+        with zipfile.ZipFile(ArrayReader(raw)) as zf:
+            return {item.filename: item for item in zf.infolist()}
+
+    def pack_data(self, fh, containers, skip_missing_compressors=False, source=None):
+        members = self.find_members(source) if source is not None else {}
         with zipfile.ZipFile(fh, 'w', zipfile.ZIP_DEFLATED, False) as zf:
             for c in containers:
-                byte_data = c.calc_packed_bytes(skip_missing_compressors)
-                zf.writestr(c.pathname, byte_data)
+                if c.pathname in members and not c.is_dirty:
+                    log.debug(f"{c.pathname}: unchanged, copying original zip member")
+                    self.copy_member(zf, source, members[c.pathname])
+                else:
+                    with zf.open(c.pathname, 'w') as dest:
+                        c.write_packed_bytes(dest, skip_missing_compressors)
+
+    def copy_member(self, zf, raw, item):
+        """Add the still compressed data of a member of another zip file"""
+        start = self.calc_data_offset(raw, item)
+        zinfo = copy.copy(item)
+        # sizes and crc are known, so they go in the local header rather
+        # than in a data descriptor after the data
+        zinfo.flag_bits &= ~0x08
+        zinfo.header_offset = zf.fp.tell()
+        zf.fp.write(zinfo.FileHeader())
+        zf.fp.write(memoryview(raw[start:start + item.compress_size]))
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+        zf.start_dir = zf.fp.tell()
@@ -0,0 +1,218 @@
+"""Byte pattern search across every container of a collection
+
+Each container's data gets a trigram index: the position of every 3 byte
+sequence, sorted by the value of the sequence. A pattern is found by looking
+up its most selective trigram and checking the rest of the pattern only at
+those candidate positions, so a search is a handful of binary searches and
+array comparisons rather than a scan of the whole disk image. Indexes are
+cached using the SHA1 of the container data, so an index is only rebuilt
+after the data changes.
+
+Patterns may contain wildcard bytes. Hits are reported by container offset
+and mapped back through the container's `SegmentIndex` to every segment that
+holds all the bytes of the hit in a row. A hit in the bytes of a file that
+are split across non-consecutive sectors isn't found, because the search is
+done on the container data.
+"""
+import collections
+
+import numpy as np
+
+from . import errors
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class Pattern:
+    """Sequence of bytes to find, where positions in `mask` that are False
+    match any byte
+    """
+    def __init__(self, values, mask=None, text=""):
+        self.values = np.asarray(values, dtype=np.uint8)
+        if mask is None:
+            mask = np.ones(len(self.values), dtype=bool)
+        self.mask = np.asarray(mask, dtype=bool)
+        if len(self.values) == 0 or not self.mask.any():
+            raise errors.InvalidSearchPattern(f"Search pattern '{text}' has no bytes to match")
+        self.text = text
+
+    def __str__(self):
+        return f"<Pattern {self.text}>"
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_hex(cls, text):
+        """Create a pattern from hex digits, optionally separated by spaces,
+        where ?? is a wildcard byte
+        """
+        digits = "".join(text.split())
+        if len(digits) % 2 != 0:
+            raise errors.InvalidSearchPattern(f"Odd number of hex digits in '{text}'")
+        values = []
+        mask = []
+        for i in range(0, len(digits), 2):
+            pair = digits[i:i + 2]
+            if pair == "??":
+                values.append(0)
+                mask.append(False)
+            else:
+                try:
+                    values.append(int(pair, 16))
+                except ValueError:
+                    raise errors.InvalidSearchPattern(f"Invalid hex digits '{pair}' in '{text}'")
+                mask.append(True)
+        return cls(values, mask, text)
+
+    @classmethod
+    def from_text(cls, text, encoding="latin1"):
+        return cls(np.frombuffer(text.encode(encoding), dtype=np.uint8), text=text)
+
+    @classmethod
+    def from_string(cls, text):
+        """Create a pattern from text in quotes, or hex digits otherwise"""
+        if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+            return cls.from_text(text[1:-1])
+        return cls.from_hex(text)
+
+    def check(self, data, candidates):
+        """Return the candidate start positions where the whole pattern
+        matches
+        """
+        candidates = candidates[(candidates >= 0) & (candidates <= len(data) - len(self))]
+        for i in np.flatnonzero(self.mask):
+            candidates = candidates[data[candidates + i] == self.values[i]]
+        return candidates
+
+    def find_in(self, data):
+        """Return the start positions of all matches by comparing every
+        position of the array
+        """
+        data = np.asarray(data, dtype=np.uint8)
+        num = len(data) - len(self) + 1
+        if num <= 0:
+            return np.zeros(0, dtype=np.int64)
+        matches = np.ones(num, dtype=bool)
+        for i in np.flatnonzero(self.mask):
+            matches &= data[i:i + num] == self.values[i]
+        return np.flatnonzero(matches)
+
+
+class NgramIndex:
+    """Positions of every trigram in an array of bytes, sorted by trigram
+    value
+    """
+    ngram_size = 3
+
+    def __init__(self, data):
+        self.data = np.array(data, dtype=np.uint8)
+        d = self.data
+        if len(d) >= self.ngram_size:
+            keys = (d[:-2].astype(np.uint32) << 16) | (d[1:-1].astype(np.uint32) << 8) | d[2:]
+        else:
+            keys = np.zeros(0, dtype=np.uint32)
+        # stable sort keeps the positions of each trigram in order
+        self.positions = np.argsort(keys, kind="stable").astype(np.int64)
+        self.keys = keys[self.positions]
+
+    def __str__(self):
+        return f"<NgramIndex {len(self.data)} bytes>"
+
+    def __len__(self):
+        return len(self.data)
+
+    def find_ngram(self, key):
+        # same dtype as the keys, otherwise searchsorted converts all of them
+        key = self.keys.dtype.type(key)
+        i0 = np.searchsorted(self.keys, key, side="left")
+        i1 = np.searchsorted(self.keys, key, side="right")
+        return self.positions[i0:i1]
+
+    def find(self, pattern):
+        """Return the sorted array of positions where the pattern matches"""
+        best = None
+        n = self.ngram_size
+        v = pattern.values.astype(np.uint32)
+        for i in range(len(pattern) - n + 1):
+            if pattern.mask[i:i + n].all():
+                positions = self.find_ngram((v[i] << 16) | (v[i + 1] << 8) | v[i + 2])
+                if best is None or len(positions) < len(best[1]):
+                    best = (i, positions)
+                    if len(positions) == 0:
+                        break
+        if best is None:
+            # no trigram without wildcards in the pattern
+            return pattern.find_in(self.data)
+        i, positions = best
+        return pattern.check(self.data, positions - i)
+
+
+class NgramIndexCache:
+    """Most recently used indexes, keyed by the SHA1 of the data"""
+    max_entries = 16
+
+    def __init__(self):
+        self.indexes = collections.OrderedDict()
+
+    def __str__(self):
+        return f"<NgramIndexCache {len(self.indexes)} indexes>"
+
+    def get_index(self, container):
+        key = container.sha1
+        try:
+            index = self.indexes.pop(key)
+        except KeyError:
+            index = NgramIndex(container.data)
+            log.debug(f"created {index} for {container}")
+            while len(self.indexes) >= self.max_entries:
+                self.indexes.popitem(last=False)
+        self.indexes[key] = index
+        return index
+
+    def clear(self):
+        self.indexes = collections.OrderedDict()
+
+
+index_cache = NgramIndexCache()
+
+
+class SearchHit:
+    """Location of a pattern in a container, and the (segment, index) pairs
+    of every segment that contains the whole hit
+    """
+    def __init__(self, pattern, container, container_index, segments):
+        self.pattern = pattern
+        self.container = container
+        self.container_index = container_index
+        self.segments = segments
+
+    def __str__(self):
+        return f"<SearchHit {self.pattern.text} in {self.container.name} at {self.container_index}, {len(self.segments)} segments>"
+
+
+def to_pattern_list(patterns):
+    if isinstance(patterns, (str, Pattern)):
+        patterns = [patterns]
+    return [Pattern.from_string(p) if isinstance(p, str) else p for p in patterns]
+
+
+def search_containers(containers, patterns, max_hits=None):
+    """Return a list of `SearchHit`s for each of the patterns in all of the
+    containers. Patterns are `Pattern` instances or strings in the format
+    used by `Pattern.from_string`; a single pattern may be passed instead of
+    a list.
+    """
+    patterns = to_pattern_list(patterns)
+    hits = []
+    for container in containers:
+        index = index_cache.get_index(container)
+        segment_index = container.segment_index
+        for pattern in patterns:
+            for position in index.find(pattern).tolist():
+                segments = segment_index.find_segments_with_range(position, position + len(pattern))
+                hits.append(SearchHit(pattern, container, position, segments))
+                if max_hits is not None and len(hits) >= max_hits:
+                    return hits
+    return hits
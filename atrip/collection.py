@@ -6,11 +6,13 @@ import weakref
 import numpy as np
 
 from . import errors
-from .utils import to_numpy, to_numpy_list, uuid
+from .utils import to_numpy, to_numpy_list, uuid, load_file, write_atomic, get_extracted_filename
 from .container import guess_container, Container, ContainerHeader
-from .compressor import guess_compressor_list, compress_in_reverse_order, Uncompressed
+from .compressor import guess_compressor_list, compress_in_reverse_order, Uncompressed, PackedStreamChain
 from .archiver import Archiver, find_container_items_in_archive, PlainFileArchiver
 from .filesystem import Dirent
+from . import parse_cache
+from . import byte_search
 
 import logging
 log = logging.getLogger(__name__)
@@ -25,18 +27,19 @@ class Collection:
     """
     ui_name = "Collection"
 
-    def __init__(self, pathname, data=None, session=None, container=None, guess=True):
+    def __init__(self, pathname, data=None, session=None, container=None, guess=True, use_cache=True):
         self.pathname = pathname
         self.name = ""
         self.containers = []
         self.decompression_order = [Uncompressed]
         self._uuid_map = None
         self.archiver = None
+        self.archive_source = None
         if container is None:
             if data is None:
-                data = open(pathname, 'rb').read()
+                data = load_file(pathname)
                 log.debug(f"Collection.__init__: {pathname}: read {len(data)} bytes")
-            self.unarchive(data, session)
+            self.unarchive(data, session, use_cache)
         else:
             self.archiver = PlainFileArchiver()
             self.add_container(container, pathname, guess=guess)
@@ -56,6 +59,9 @@ class Collection:
 
     @property
     def mime_type(self):
+        for container in self.containers:
+            if container.media is not None:
+                return container.media.mime
         return "application/octet-stream"
 
     @property
@@ -97,13 +103,22 @@ class Collection:
         container.name = f"D{len(self.containers)}"
         log.info(f"container: {container}")
 
-    def unarchive(self, byte_data, session=None):
+    def unarchive(self, byte_data, session=None, use_cache=True):
         """Attempt to unpack `byte_data` using this archive unpacker.
 
         Calls `find_containers` to loop through each container found. The order
         listed here will be the order returned by the subclass; no sorting is
         done here.
+
+        If `use_cache` is True and a parse cache is available, a previously
+        seen image is restored from the cache without any guessing.
         """
+        cache = parse_cache.get_cache() if use_cache else None
+        if cache is not None:
+            key = parse_cache.calc_cache_key(byte_data)
+            if self.restore_from_cache(cache, key, session):
+                self.set_archive_source(byte_data)
+                return
         decompressed_archive_byte_data, decompression_list = guess_compressor_list(byte_data)
         self.archiver, item_data_list = find_container_items_in_archive(self.pathname, decompressed_archive_byte_data)
         if session is not None:
@@ -119,6 +134,36 @@ class Collection:
                 container = guess_container(item_data)
                 self.add_container(container, item_pathname)
         self._uuid_map = None
+        self.set_archive_source(byte_data)
+        if cache is not None and session is None:
+            cache.save(key, self)
+
+    def restore_from_cache(self, cache, key, session=None):
+        entry = cache.load(key)
+        if entry is None:
+            return False
+        e, data_list = entry
+        item_pathnames = e["item_pathnames"]
+        if not e["archiver"].supports_multiple_containers:
+            # the same image may be stored under a different name
+            item_pathnames = [os.path.basename(self.pathname)]
+        item_data_list = list(zip(item_pathnames, data_list))
+        self.decompression_order = e["decompression_order"]
+        if session is not None:
+            self.restore_session(session, item_data_list)
+        else:
+            pathname = self.pathname
+            self.restore_session(e, item_data_list)
+            self.pathname = pathname
+
+            # the same image opened twice must not share segment uuids
+            for c in self.containers:
+                c.uuid = uuid()
+                for segment in c.iter_segments():
+                    segment.uuid = uuid()
+        self._uuid_map = None
+        log.info(f"restored {self.pathname} from parse cache {key}")
+        return True
 
     def iter_archive(self, basename, byte_data):
         """Return a list of `Container` objects for each item in the archive.
@@ -137,12 +182,37 @@ class Collection:
 
     #### compression and save
 
-    def save(self, pathname=None, skip_missing_compressors=False):
+    def set_archive_source(self, byte_data):
+        """Remember the file the collection was loaded from, so containers
+        that haven't changed can be copied from it when saving
+        """
+        self.archive_source = byte_data
+        for container in self.containers:
+            container.mark_clean()
+
+    def calc_archive_source(self):
+        """Return the uncompressed archive data the containers were loaded
+        from, or None if it's not available
+        """
+        byte_data = self.archive_source
+        if byte_data is None:
+            return None
+        for compressor_cls in self.decompression_order:
+            byte_data = compressor_cls().calc_unpacked_data(byte_data)
+        return to_numpy(byte_data) if not isinstance(byte_data, np.ndarray) else byte_data
+
+    def save(self, pathname=None, skip_missing_compressors=False, copy_unchanged=True):
         """Save the collection.
 
         If pathname is None, will attempt to overwrite the file that used to
         load the collection.
 
+        The file is written as a stream, compressing a chunk at a time, into a
+        temporary file that replaces the original only when complete.
+        If `copy_unchanged` is True, containers that haven't changed since the
+        collection was loaded or last saved are copied from the original file
+        without being compressed again.
+
         Can raise InvalidAlgorithm if one of the compressors is read-only
         (i.e. can only decompress data). However, if `skip_missing_compressors`
         is True, no error will be raised and compression will take place
@@ -150,9 +220,20 @@ class Collection:
         """
         if pathname is None:
             pathname = self.pathname
-        compressed_bytes = self.calc_compressed_data(skip_missing_compressors)
-        with open(pathname, 'wb') as fh:
-            fh.write(compressed_bytes)
+        source = self.calc_archive_source() if copy_unchanged else None
+
+        def write(fh):
+            if any(c().is_compressed for c in self.decompression_order):
+                stream = PackedStreamChain(fh, self.decompression_order, None, skip_missing_compressors)
+                self.save_in_archive(stream, skip_missing_compressors, source)
+                stream.close()
+            else:
+                self.save_in_archive(fh, skip_missing_compressors, source)
+
+        for container in self.containers:
+            container.copy_mapped_data()
+        write_atomic(pathname, write)
+        self.set_archive_source(load_file(pathname))
 
     def calc_compressed_data(self, skip_missing_compressors=False):
         fh = io.BytesIO()
@@ -161,10 +242,10 @@ class Collection:
         compressed_bytes = compress_in_reverse_order(archived_bytes, self.decompression_order)
         return compressed_bytes
 
-    def save_in_archive(self, fh, skip_missing_compressors=False):
+    def save_in_archive(self, fh, skip_missing_compressors=False, source=None):
         """Pack each container into the archive
         """
-        return self.archiver.pack_data(fh, self.containers, skip_missing_compressors)
+        return self.archiver.pack_data(fh, self.containers, skip_missing_compressors, source)
 
     #### iterators
 
@@ -181,6 +262,32 @@ class Collection:
         for container in self.containers:
             yield from container.iter_dirents()
 
+    #### extraction
+
+    def extract_all(self, dest_dir=".", lower_case=False, overwrite=False, ext=None):
+        """Write every file in every container to `dest_dir`, named the same
+        way as by the extract command.
+
+        The data comes from the file segments created when the filesystems
+        were parsed, so no sector chains are followed again. Existing files
+        are skipped unless `overwrite` is True.
+
+        Returns a list of (dirent, pathname, written) for every file, where
+        written is False if the file was skipped.
+        """
+        results = []
+        for dirent in self.iter_dirents():
+            if not dirent.in_use or not dirent.segments:
+                continue
+            pathname = os.path.join(dest_dir, get_extracted_filename(dirent.filename, lower_case, ext))
+            if os.path.exists(pathname) and not overwrite:
+                results.append((dirent, pathname, False))
+                continue
+            with open(pathname, 'wb') as fh:
+                fh.write(dirent.segments[0].tobytes())
+            results.append((dirent, pathname, True))
+        return results
+
     #### search utilities
 
     def find_interesting_segment_to_edit(self):
@@ -219,6 +326,12 @@ class Collection:
             except IndexError:
                 raise errors.MediaError("find_boot_media: no containers, so no booting!")
 
+    def find_bytes(self, patterns, max_hits=None):
+        """Find byte patterns in every container, returning a list of
+        `byte_search.SearchHit`s. See `byte_search.search_containers`.
+        """
+        return byte_search.search_containers(self.containers, patterns, max_hits)
+
     def find_dirent(self, filename, match_case=False):
         try:
             disk_input, pathname = filename.split(":", 1)
@@ -3,6 +3,7 @@ import inspect
 import pkg_resources
 
 from . import errors
+from .detect import rank_candidates
 
 import logging
 log = logging.getLogger(__name__)
@@ -22,6 +23,9 @@ class Compressor:
     """
     compression_algorithm = None
 
+    # predicates from `detect` that must be true for compressed data
+    detect = ()
+
     def __init__(self, byte_data=None):
         if byte_data is not None:
             self.unpacked = self.calc_unpacked_data(byte_data)
@@ -67,6 +71,17 @@ class Compressor:
         """
         raise errors.InvalidAlgorithm(f"Compression for '{self.compression_algorithm}' not implemented.")
 
+    def open_packed_stream(self, fh, media=None, skip_missing_compressors=False):
+        """Return a writable file-like object that compresses everything
+        written to it into `fh`. Closing it finishes the compressed data but
+        doesn't close `fh`.
+
+        Subclasses that can compress incrementally should override this;
+        the default collects all the data and calls `calc_packed_data` when
+        closed.
+        """
+        return BufferedPackedStream(self, fh, media, skip_missing_compressors)
+
 
 class Uncompressed(Compressor):
     compression_algorithm = "none"
@@ -77,6 +92,102 @@ class Uncompressed(Compressor):
     def calc_packed_data(self, byte_data, media):
         return byte_data
 
+    def open_packed_stream(self, fh, media=None, skip_missing_compressors=False):
+        return PackedStream(fh)
+
+
+class PackedStream:
+    """Write-only stream that passes data through to another file-like
+    object, or to the stream object of a compression library.
+
+    It's deliberately not seekable and has no tell method so archivers
+    writing to it use their streaming mode.
+    """
+    def __init__(self, fh, close_fh=False):
+        self.fh = fh
+        self.close_fh = close_fh
+
+    def write(self, data):
+        return self.fh.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.close_fh:
+            self.fh.close()
+        self.fh = None
+
+
+class BufferedPackedStream(PackedStream):
+    """Stream for compressors that need all the data at once"""
+    def __init__(self, compressor, fh, media=None, skip_missing_compressors=False):
+        PackedStream.__init__(self, fh)
+        self.compressor = compressor
+        self.media = media
+        self.skip_missing_compressors = skip_missing_compressors
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def close(self):
+        if self.fh is None:
+            return
+        byte_data = b"".join(self.chunks)
+        self.chunks = []
+        try:
+            byte_data = self.compressor.calc_packed_data(byte_data, self.media)
+        except errors.InvalidAlgorithm:
+            if not self.skip_missing_compressors:
+                log.error(f"Compression algorithm {self.compressor} not yet implemented")
+                raise
+        self.fh.write(byte_data)
+        PackedStream.close(self)
+
+
+class ZLibPackedStream(PackedStream):
+    """Stream using a zlib compressobj"""
+    def __init__(self, fh, compressobj):
+        PackedStream.__init__(self, fh)
+        self.compressobj = compressobj
+
+    def write(self, data):
+        self.fh.write(self.compressobj.compress(data))
+        return len(data)
+
+    def close(self):
+        if self.fh is None:
+            return
+        self.fh.write(self.compressobj.flush())
+        PackedStream.close(self)
+
+
+class PackedStreamChain(PackedStream):
+    """Stream that compresses using every compressor in the decompression
+    order, in reverse, so the first compressor of the list produces the
+    bytes written to the file
+    """
+    def __init__(self, fh, decompression_order, media=None, skip_missing_compressors=False):
+        self.streams = []
+        stream = fh
+        for compressor in decompression_order:
+            if isinstance(compressor, type):
+                compressor = compressor()
+            stream = compressor.open_packed_stream(stream, media, skip_missing_compressors)
+            self.streams.append(stream)
+        PackedStream.__init__(self, stream)
+
+    def close(self):
+        if self.fh is None:
+            return
+        # innermost compressor first, so each flushes into the next
+        for stream in reversed(self.streams):
+            stream.close()
+        self.streams = []
+        self.fh = None
+
 
 _compressors = None
 
@@ -105,9 +216,15 @@ def find_compressor_by_name(name):
             return c()
     raise KeyError(f"Unknown compressor {name}")
 
-def guess_compressor(raw_data):
+def guess_compressor(raw_data, candidates=None):
+    """Return a compressor instance holding the unpacked data, trying only
+    the compressors that `detect` can't rule out unless a list of
+    `candidates` is given.
+    """
+    if candidates is None:
+        candidates = rank_candidates(find_compressors(), raw_data)
     compressor = None
-    for c in find_compressors():
+    for c in candidates:
         log.debug(f"trying compressor {c.compression_algorithm}")
         try:
             compressor = c(raw_data)
@@ -121,10 +238,10 @@ def guess_compressor(raw_data):
         compressor = Uncompressed(raw_data)
     return compressor
 
-def guess_compressor_list(data):
+def guess_compressor_list(data, candidates=None):
     compressors = []
     while True:  # loop until reach an uncompressed state
-        c = guess_compressor(data)
+        c = guess_compressor(data, candidates)
         data = c.unpacked
         if not c.is_compressed:
             if not compressors:
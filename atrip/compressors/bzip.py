@@ -5,11 +5,14 @@ import numpy as np
 
 from .. import errors
 from ..compressor import Compressor
+from ..detect import Magic
 
 
 class BZipCompressor(Compressor):
     compression_algorithm = "bzip2"
 
+    detect = [Magic(b"BZh")]
+
     def calc_unpacked_data(self, byte_data):
         try:
             buf = io.BytesIO(byte_data)
@@ -29,3 +32,6 @@ class BZipCompressor(Compressor):
         else:
             packed = buf.getvalue()
         return packed
+
+    def open_packed_stream(self, fh, media=None, skip_missing_compressors=False):
+        return bz2.BZ2File(fh, mode='wb')
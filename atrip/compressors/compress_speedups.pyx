@@ -0,0 +1,533 @@
+# cython: language_level=3
+"""Compiled versions of the DCM and Unix compress (LZW) codecs
+
+These produce byte-for-byte the same results as the pure Python
+implementations in dcm.py and unix_compress.py, which are used as a
+fallback when this module hasn't been built.
+"""
+import cython
+import numpy as np
+cimport numpy as np
+
+from atrip import errors
+
+
+#### DCM
+
+cdef enum:
+    dcm_pass_buffer_size = 0x6500
+    dcm_pass_buffer_limit = 0x5e00
+    dcm_max_image_size = 200000
+
+
+cdef class DCMReader:
+    cdef const np.uint8_t[:] raw
+    cdef Py_ssize_t index
+
+    def __cinit__(self, const np.uint8_t[:] raw):
+        self.raw = raw
+        self.index = 0
+
+    cdef int get_next(self) except -1:
+        if self.index >= self.raw.shape[0]:
+            raise errors.InvalidAlgorithm("Incomplete DCM file")
+        self.index += 1
+        return self.raw[self.index - 1]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def unpack_dcm(const np.uint8_t[:] raw):
+    """Return the disk image contained in the DCM archive"""
+    cdef DCMReader r = DCMReader(raw)
+    cdef np.uint8_t[:] output = np.zeros(dcm_max_image_size, dtype=np.uint8)
+    cdef np.uint8_t current[256]
+    cdef int num_sectors = 0, sector_size = 0, current_sector = 0
+    cdef int expected_pass = 1, last_pass = 0
+    cdef int archive_type, archive_flags, density_flag, block_type
+    cdef int index, end, fill_byte, pos, i
+
+    for i in range(256):
+        current[i] = 0
+    while not last_pass:
+        archive_type = r.get_next()
+        if archive_type == 0xf9 or archive_type == 0xfa:
+            archive_flags = r.get_next()
+            last_pass = archive_flags & 0x80
+            if archive_flags & 0x1f != expected_pass:
+                if archive_type == 0xf9:
+                    raise errors.InvalidAlgorithm("DCM multi-file archive combined in the wrong order")
+                else:
+                    raise errors.InvalidAlgorithm("Expected pass one of DCM archive first")
+            density_flag = (archive_flags >> 5) & 3
+            if density_flag == 0:
+                num_sectors, sector_size = 720, 128
+            elif density_flag == 1:
+                num_sectors, sector_size = 720, 256
+            elif density_flag == 2:
+                num_sectors, sector_size = 1040, 128
+            else:
+                raise errors.InvalidAlgorithm(f"Unsupported density flag {density_flag} in DCM")
+        else:
+            raise errors.InvalidAlgorithm("Not a DCM file")
+        current_sector = r.get_next()
+        current_sector += r.get_next() * 256
+
+        while True:
+            block_type = r.get_next()
+            if block_type == 0x45:
+                expected_pass = (expected_pass + 1) % 32
+                break
+
+            if block_type & 0x7f == 0x41:
+                index = r.get_next()
+                while index >= 0:
+                    current[index] = r.get_next()
+                    index -= 1
+            elif block_type & 0x7f == 0x42:
+                fill_byte = r.get_next()
+                for i in range(124):
+                    current[i] = fill_byte
+                for i in range(124, 128):
+                    current[i] = r.get_next()
+            elif block_type & 0x7f == 0x43:
+                index = 0
+                while index < sector_size:
+                    end = r.get_next()
+                    if index > 0 and end == 0:
+                        end = 256
+                    while index < end:
+                        current[index] = r.get_next()
+                        index += 1
+                    if index < sector_size:
+                        end = r.get_next()
+                        if index > 0 and end == 0:
+                            end = 256
+                        fill_byte = r.get_next()
+                        while index < end:
+                            current[index] = fill_byte
+                            index += 1
+            elif block_type & 0x7f == 0x44:
+                index = r.get_next()
+                while index < sector_size:
+                    current[index] = r.get_next()
+                    index += 1
+            elif block_type & 0x7f == 0x46:
+                pass
+            elif block_type & 0x7f == 0x47:
+                for i in range(sector_size):
+                    current[i] = r.get_next()
+            elif block_type == 0xfa or block_type == 0xf9:
+                raise errors.InvalidAlgorithm(f"Found section start byte but previous section never ended")
+            else:
+                raise errors.InvalidAlgorithm(f"Unsupported block type {block_type} in DCM")
+
+            if current_sector < 1 or current_sector > num_sectors:
+                raise errors.InvalidAlgorithm(f"Sector {current_sector} out of range in DCM")
+            pos = (current_sector - 1) * sector_size
+            for i in range(sector_size):
+                output[pos + i] = current[i]
+
+            if block_type > 0x80:
+                current_sector += 1
+            else:
+                current_sector = r.get_next()
+                current_sector += r.get_next() * 256
+
+    return np.asarray(output[:num_sectors * sector_size]).tobytes()
+
+
+cdef class DCMWriter:
+    cdef np.uint8_t[:] pass_buffer
+    cdef int pass_buffer_index
+    cdef int record_start_index
+
+    def __cinit__(self):
+        self.pass_buffer = np.zeros(dcm_pass_buffer_size, dtype=np.uint8)
+        self.pass_buffer_index = 0
+        self.record_start_index = 0
+
+    cdef inline void put_byte(self, int value):
+        self.pass_buffer[self.pass_buffer_index] = value & 0xff
+        self.pass_buffer_index += 1
+
+    cdef inline void start_record(self, int block_type):
+        self.record_start_index = self.pass_buffer_index
+        self.put_byte(block_type)
+
+    cdef void encode_fa(self, int sector, int density_flag, int pass_number, int last_pass):
+        self.record_start_index = 0
+        self.pass_buffer_index = 0
+        self.put_byte(0xfa)
+        self.put_byte((0x80 if last_pass else 0) | density_flag << 5 | pass_number & 0x1f)
+        self.put_byte(sector & 0xff)
+        self.put_byte(sector >> 8)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def pack_dcm(const np.uint8_t[:, :] sectors, int density_flag, int allowed_blocks):
+    """Return the DCM archive of the disk image, given as an array of
+    sectors. Bit (block type - 0x40) of `allowed_blocks` is set for each of
+    the optional block types 0x41 - 0x44 that may be used.
+    """
+    cdef int num_sectors = sectors.shape[0]
+    cdef int size = sectors.shape[1]
+    cdef DCMWriter w = DCMWriter()
+    cdef const np.uint8_t[:] current
+    cdef const np.uint8_t[:] previous = sectors[0]
+    cdef int current_sector = 1, previous_sector = 0, first_sector_in_pass
+    cdef int pass_number = 1
+    cdef int i, index, best_size, best_block, first_diff, last_diff, run, length
+    cdef int num_groups = 0
+    cdef int group_starts[129]
+    cdef int group_ends[129]
+    passes = []
+
+    while current_sector <= num_sectors:
+        w.encode_fa(current_sector, density_flag, pass_number, 0)
+        first_sector_in_pass = 0
+
+        while w.pass_buffer_index < dcm_pass_buffer_limit:
+            if current_sector > num_sectors:
+                break
+            current = sectors[current_sector - 1]
+            for i in range(size):
+                if current[i] != 0:
+                    break
+            else:
+                current_sector += 1
+                continue
+
+            if first_sector_in_pass == 0:
+                first_sector_in_pass = current_sector
+                previous_sector = current_sector
+            if current_sector - previous_sector > 1:
+                w.put_byte(current_sector & 0xff)
+                w.put_byte(current_sector >> 8)
+            else:
+                w.pass_buffer[w.record_start_index] |= 0x80
+
+            best_size = size
+            best_block = 0x47
+            first_diff = last_diff = -1
+            if current_sector != first_sector_in_pass:
+                for i in range(size):
+                    if current[i] != previous[i]:
+                        if first_diff < 0:
+                            first_diff = i
+                        last_diff = i
+                if first_diff < 0:
+                    best_block = 0x46
+                    best_size = 0
+                else:
+                    if last_diff + 1 < best_size and allowed_blocks & 0x02:
+                        best_size = last_diff + 1
+                        best_block = 0x41
+                    if size - first_diff + 1 < best_size and allowed_blocks & 0x10:
+                        best_size = size - first_diff + 1
+                        best_block = 0x44
+
+            run = 1
+            while run < size and current[run] == current[0]:
+                run += 1
+            if run > 123 and size == 128 and best_size > 6 and allowed_blocks & 0x04:
+                best_block = 0x42
+                best_size = 6
+
+            if allowed_blocks & 0x08:
+                # runs of at least two identical bytes are run-length encoded
+                num_groups = 0
+                i = 0
+                while i < size - 1:
+                    if current[i] == current[i + 1]:
+                        group_starts[num_groups] = i
+                        i += 1
+                        while i < size - 1 and current[i] == current[i + 1]:
+                            i += 1
+                        group_ends[num_groups] = i + 1
+                        num_groups += 1
+                    i += 1
+                if num_groups > 0:
+                    length = 0
+                    index = 0
+                    for i in range(num_groups):
+                        length += 3 + group_starts[i] - index
+                        index = group_ends[i]
+                    if index < size:
+                        length += 1 + size - index
+                        group_starts[num_groups] = size
+                        group_ends[num_groups] = size
+                        num_groups += 1
+                    if length < best_size:
+                        best_size = length
+                        best_block = 0x43
+
+            if best_block == 0x41:
+                w.start_record(0x41)
+                w.put_byte(last_diff)
+                index = last_diff
+                while index >= 0:
+                    w.put_byte(current[index])
+                    index -= 1
+            elif best_block == 0x42:
+                w.start_record(0x42)
+                for i in range(123, 128):
+                    w.put_byte(current[i])
+            elif best_block == 0x43:
+                w.start_record(0x43)
+                index = 0
+                for i in range(num_groups):
+                    w.put_byte(group_starts[i])
+                    while index < group_starts[i]:
+                        w.put_byte(current[index])
+                        index += 1
+                    if index < size:
+                        w.put_byte(group_ends[i])
+                        w.put_byte(current[index])
+                        index = group_ends[i]
+            elif best_block == 0x44:
+                w.start_record(0x44)
+                w.put_byte(first_diff)
+                for i in range(first_diff, size):
+                    w.put_byte(current[i])
+            elif best_block == 0x46:
+                w.start_record(0x46)
+            else:
+                w.start_record(0x47)
+                for i in range(size):
+                    w.put_byte(current[i])
+
+            previous = current
+            previous_sector = current_sector
+            current_sector += 1
+
+        # force next pass to not attempt to read a sector number
+        w.pass_buffer[w.record_start_index] |= 0x80
+        w.start_record(0x45)
+        length = w.pass_buffer_index
+
+        # rerecord FA block to show if it is the final pass
+        w.encode_fa(first_sector_in_pass, density_flag, pass_number, current_sector > num_sectors)
+        passes.append(np.asarray(w.pass_buffer[:length]).tobytes())
+        pass_number += 1
+
+    return b"".join(passes)
+
+
+#### Unix compress
+
+cdef enum:
+    lzw_max_bits = 16
+    lzw_hash_size = 1 << 18
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def unlzw(const np.uint8_t[:] data):
+    """Decompress the output of the Unix compress utility, raising
+    ValueError with the same messages as `unix_compress.unlzw`
+    """
+    cdef Py_ssize_t inlen = data.shape[0]
+    cdef np.uint16_t[:] prefix = np.zeros(65536, dtype=np.uint16)
+    cdef np.uint8_t[:] suffix = np.zeros(65536, dtype=np.uint8)
+    cdef np.uint8_t[:] stack = np.zeros(65536, dtype=np.uint8)
+    cdef np.uint8_t[:] put
+    cdef int flags, max_, bits, mask, end, prev, final, code, temp, sp, left
+    cdef unsigned long buf
+    cdef Py_ssize_t nxt, mark, rem, outcnt
+
+    if inlen < 3:
+        raise ValueError("Invalid Input: Length of input too short for processing")
+    if data[0] != 0x1f or data[1] != 0x9d:
+        raise ValueError("Invalid Header Flags Byte: Incorrect magic bytes")
+    flags = data[2]
+    if flags & 0x60:
+        raise ValueError("Invalid Header Flags Byte: Flag byte contains invalid data")
+    max_ = flags & 0x1f
+    if max_ < 9 or max_ > 16:
+        raise ValueError("Invalid Header Flags Byte: Max code size bits out of range")
+    if max_ == 9:
+        max_ = 10  # 9 doesn't really mean 9
+    flags &= 0x80
+
+    bits = 9
+    mask = 0x1ff
+    end = 256 if flags else 255
+
+    if inlen == 3:
+        return b""
+    if inlen == 4:
+        raise ValueError("Invalid Data: Stream ended in the middle of a code")
+
+    buf = data[3] | (data[4] << 8)
+    final = prev = buf & mask
+    buf >>= bits
+    left = 16 - bits
+    if prev > 255:
+        raise ValueError("Invalid Data: First code must be a literal")
+
+    put = np.empty(max(inlen * 4, 65536), dtype=np.uint8)
+    put[0] = final
+    outcnt = 1
+    mark = 3
+    nxt = 5
+    while nxt < inlen:
+        if end >= mask and bits < max_:
+            # skip to the next 8*bits bit boundary, a vestige of the VAX
+            # implementation of compress
+            rem = (nxt - mark) % bits
+            if rem:
+                rem = bits - rem
+                if rem >= inlen - nxt:
+                    break
+                nxt += rem
+            buf = 0
+            left = 0
+            mark = nxt
+            bits += 1
+            mask = (mask << 1) + 1
+
+        buf += <unsigned long>data[nxt] << left
+        nxt += 1
+        left += 8
+        if left < bits:
+            if nxt == inlen:
+                raise ValueError("Invalid Data: Stream ended in the middle of a code")
+            buf += <unsigned long>data[nxt] << left
+            nxt += 1
+            left += 8
+        code = buf & mask
+        buf >>= bits
+        left -= bits
+
+        if code == 256 and flags:
+            rem = (nxt - mark) % bits
+            if rem:
+                rem = bits - rem
+                if rem > inlen - nxt:
+                    break
+                nxt += rem
+            buf = 0
+            left = 0
+            mark = nxt
+            bits = 9
+            mask = 0x1ff
+            end = 255
+            continue
+
+        temp = code
+        sp = 0
+        if code > end:
+            if code != end + 1 or prev > end:
+                raise ValueError("Invalid Data: Invalid code detected")
+            stack[sp] = final
+            sp += 1
+            code = prev
+        while code >= 256:
+            stack[sp] = suffix[code]
+            sp += 1
+            code = prefix[code]
+        stack[sp] = code
+        sp += 1
+        final = code
+
+        if end < mask:
+            end += 1
+            prefix[end] = prev
+            suffix[end] = final
+        prev = temp
+
+        if outcnt + sp > put.shape[0]:
+            put = np.concatenate((put, np.empty(put.shape[0] + sp, dtype=np.uint8)))
+        while sp > 0:
+            sp -= 1
+            put[outcnt] = stack[sp]
+            outcnt += 1
+
+    return np.asarray(put[:outcnt]).tobytes()
+
+
+cdef class LZWBitWriter:
+    cdef np.uint8_t[:] output
+    cdef Py_ssize_t outcnt
+    cdef unsigned long buf
+    cdef int left
+
+    def __cinit__(self, Py_ssize_t size):
+        self.output = np.empty(size, dtype=np.uint8)
+        self.outcnt = 0
+        self.buf = 0
+        self.left = 0
+
+    cdef void put_code(self, int code, int bits):
+        if self.outcnt + 4 > self.output.shape[0]:
+            self.output = np.concatenate((self.output, np.empty(self.output.shape[0], dtype=np.uint8)))
+        self.buf |= <unsigned long>code << self.left
+        self.left += bits
+        while self.left >= 8:
+            self.output[self.outcnt] = self.buf & 0xff
+            self.outcnt += 1
+            self.buf >>= 8
+            self.left -= 8
+
+    cdef bytes finish(self):
+        if self.left > 0:
+            self.put_code(0, 8 - self.left)
+        return np.asarray(self.output[:self.outcnt]).tobytes()
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def lzw(const np.uint8_t[:] data):
+    """Compress the data in the format of the Unix compress utility, using
+    block mode with up to 16 bit codes
+    """
+    cdef Py_ssize_t inlen = data.shape[0]
+    cdef np.int32_t[:] hash_keys = np.full(lzw_hash_size, -1, dtype=np.int32)
+    cdef np.uint16_t[:] hash_codes = np.zeros(lzw_hash_size, dtype=np.uint16)
+    cdef LZWBitWriter w = LZWBitWriter(inlen + inlen // 2 + 16)
+    cdef int bits = 9, mask = 0x1ff, free_ent = 257, num_codes = 0
+    cdef int prefix, c, key
+    cdef unsigned int h
+    cdef Py_ssize_t i
+
+    w.put_code(0x9d1f, 16)
+    w.put_code(0x80 | lzw_max_bits, 8)
+    if inlen == 0:
+        return w.finish()
+    prefix = data[0]
+    for i in range(1, inlen):
+        c = data[i]
+        key = (prefix << 8) | c
+        h = (<unsigned int>key * 2654435761u) >> (32 - 18)
+        while hash_keys[h] >= 0 and hash_keys[h] != key:
+            h = (h + 1) & (lzw_hash_size - 1)
+        if hash_keys[h] == key:
+            prefix = hash_codes[h]
+            continue
+
+        # the decoder increases the code size when its table fills, which
+        # happens one code after it does here
+        if free_ent - 2 >= mask and bits < lzw_max_bits:
+            while num_codes % 8:
+                w.put_code(0, bits)
+                num_codes += 1
+            num_codes = 0
+            bits += 1
+            mask = (mask << 1) + 1
+        w.put_code(prefix, bits)
+        num_codes += 1
+        if free_ent < (1 << lzw_max_bits):
+            hash_keys[h] = key
+            hash_codes[h] = free_ent
+            free_ent += 1
+        prefix = c
+
+    if free_ent - 2 >= mask and bits < lzw_max_bits:
+        while num_codes % 8:
+            w.put_code(0, bits)
+            num_codes += 1
+        bits += 1
+    w.put_code(prefix, bits)
+    return w.finish()
@@ -2,6 +2,12 @@ import numpy as np
 
 from .. import errors
 from ..compressor import Compressor
+from ..detect import Magic
+
+try:
+    from . import compress_speedups as speedups
+except ImportError:
+    speedups = None
 
 import logging
 # logging.basicConfig(level=logging.DEBUG)
@@ -12,6 +18,8 @@ log = logging.getLogger(__name__)
 class DCMCompressor(Compressor):
     compression_algorithm = "dcm"
 
+    detect = [Magic(b"\xfa", b"\xf9")]
+
     valid_densities = {
         0: (720, 128),
         1: (720, 256),
@@ -28,6 +36,11 @@ class DCMCompressor(Compressor):
         return data
 
     def calc_unpacked_data(self, data):
+        if speedups is not None:
+            return speedups.unpack_dcm(np.frombuffer(data, dtype=np.uint8))
+        return self.calc_unpacked_data_python(data)
+
+    def calc_unpacked_data_python(self, data):
         self.sector_size = 0
         self.num_sectors = 0
         self.current_sector = 0
@@ -94,6 +107,8 @@ class DCMCompressor(Compressor):
         log.debug(f"index {self.index-2}: found sector {self.current_sector}")
 
     def copy_current_to_sector(self):
+        if self.current_sector < 1 or self.current_sector > self.num_sectors:
+            raise errors.InvalidAlgorithm(f"Sector {self.current_sector} out of range in DCM")
         pos = (self.current_sector - 1) * self.sector_size
         self.output[pos:pos + self.sector_size] = self.current[:self.sector_size]
 
@@ -197,6 +212,35 @@ class DCMCompressor(Compressor):
         self.pass_buffer_index += 1
 
     def calc_packed_data(self, byte_data, media, block_restrictions=None):
+        if speedups is not None:
+            self.init_packing(media)
+            return speedups.pack_dcm(self.get_sector_array(media), self.density_flag, self.calc_allowed_blocks_mask(block_restrictions))
+        return self.calc_packed_data_python(byte_data, media, block_restrictions)
+
+    def get_sector_array(self, media):
+        """Return the sectors as a 2D array, where sectors smaller than the
+        sector size (i.e. double density boot sectors) are padded with zeros
+        """
+        positions, sizes = media.sector_table
+        first = media.starting_sector_label
+        positions = positions[first:first + self.num_sectors, np.newaxis]
+        sizes = sizes[first:first + self.num_sectors, np.newaxis]
+        offsets = np.arange(self.sector_size)
+        # bytes past the end of short sectors are taken from a zero appended
+        # to the data
+        data = np.append(media[:], np.uint8(0))
+        index = np.where(offsets < sizes, positions + offsets, len(data) - 1)
+        return data[index]
+
+    def calc_allowed_blocks_mask(self, block_restrictions=None):
+        if block_restrictions is None:
+            block_restrictions = [0x41, 0x42, 0x43, 0x44]
+        mask = 0
+        for block_type in block_restrictions:
+            mask |= 1 << (block_type - 0x40)
+        return mask
+
+    def calc_packed_data_python(self, byte_data, media, block_restrictions=None):
         self.init_packing(media)
         output_index = 0
         current_sector = 1
@@ -324,7 +368,7 @@ class DCMCompressor(Compressor):
         except IndexError:
             # no differences anywhere
             first_diff = self.sector_size
-        if first_diff > 123 and best_size > 6 and 0x42 in allowed_blocks:
+        if first_diff > 123 and size == 128 and best_size > 6 and 0x42 in allowed_blocks:
             best_block = 0x42
             best_size = 6
         if 0x43 in allowed_blocks:
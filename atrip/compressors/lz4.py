@@ -6,11 +6,15 @@ except ImportError:
 
 from .. import errors
 from ..compressor import Compressor
+from ..detect import Magic
 
 
 class LZ4Compressor(Compressor):
     compression_algorithm = "lz4"
 
+    # frame magic number, or one of the skippable frame magic numbers
+    detect = [Magic(b"\x04\x22\x4d\x18", *[bytes([0x50 + i, 0x2a, 0x4d, 0x18]) for i in range(16)])]
+
     def calc_unpacked_data(self, byte_data):
         if lz4 is None:
             raise errors.InvalidAlgorithm("lz4 module needed for .lz4 support")
@@ -5,11 +5,15 @@ import numpy as np
 
 from .. import errors
 from ..compressor import Compressor
+from ..detect import Magic, Check, AnyOf
 
 
 class LZMACompressor(Compressor):
     compression_algorithm = "lzma"
 
+    # .xz files, or the legacy .lzma format that has no magic number
+    detect = [AnyOf(Magic(b"\xfd7zXZ\x00"), Check(lambda sample: is_lzma_alone_header(sample.head)))]
+
     def calc_unpacked_data(self, byte_data):
         try:
             buf = io.BytesIO(byte_data)
@@ -31,3 +35,31 @@ class LZMACompressor(Compressor):
         else:
             packed = buf.getvalue()
         return packed
+
+    def open_packed_stream(self, fh, media=None, skip_missing_compressors=False):
+        return lzma.LZMAFile(fh, mode='wb')
+
+
+def is_lzma_alone_header(data):
+    """Check the header of a legacy .lzma file the same way liblzma does when
+    automatically detecting the format
+    """
+    if len(data) < 13:
+        return False
+    props = data[0]
+    if props > (4 * 5 + 4) * 9 + 8:
+        return False
+    lc = props % 9
+    lp = (props // 9) % 5
+    if lc + lp > 4:
+        return False
+    dict_size = int.from_bytes(data[1:5], "little")
+    if dict_size != 0xffffffff:
+        # must be 2^n or 2^n + 2^(n-1)
+        d = (dict_size - 1) & 0xffffffff
+        for shift in (2, 3, 4, 8, 16):
+            d |= d >> shift
+        if (d + 1) & 0xffffffff != dict_size:
+            return False
+    uncompressed_size = int.from_bytes(data[5:13], "little")
+    return uncompressed_size == 0xffffffffffffffff or uncompressed_size < (1 << 38)
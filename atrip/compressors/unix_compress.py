@@ -1,19 +1,35 @@
-import io
+import numpy as np
 
 from .. import errors
 from ..compressor import Compressor
+from ..detect import Magic
+
+try:
+    from . import compress_speedups as speedups
+except ImportError:
+    speedups = None
 
 
 class UnixCompressor(Compressor):
     compression_algorithm = "unix compress"
 
+    detect = [Magic(b"\x1f\x9d")]
+
     def calc_unpacked_data(self, byte_data):
         try:
-            unpacked = unlzw(byte_data)
+            if speedups is not None:
+                unpacked = speedups.unlzw(np.frombuffer(byte_data, dtype=np.uint8))
+            else:
+                unpacked = unlzw(byte_data)
         except ValueError as e:
             raise errors.InvalidAlgorithm(e)
         return unpacked
 
+    def calc_packed_data(self, byte_data, media=None):
+        if speedups is not None:
+            return speedups.lzw(np.frombuffer(byte_data, dtype=np.uint8))
+        return lzw(byte_data)
+
 
 def unlzw(data):
     """
@@ -88,7 +104,7 @@ def unlzw(data):
 
     # Ensure stream is initially valid
     if inlen == 3:
-        return 0  # zero-length input is permitted
+        return b""  # zero-length input is permitted
     if inlen == 4:  # a partial code is not okay
         raise ValueError("Invalid Data: Stream ended in the middle of a code")
 
@@ -206,3 +222,70 @@ def unlzw(data):
 
     # Return the decompressed data as string
     return bytes(bytearray(put))
+
+
+max_lzw_bits = 16
+
+
+def lzw(data):
+    """Compress data in the format of the Unix compress utility: block mode
+    (although no clear codes are emitted, the table is simply not added to
+    once full) with a maximum code size of 16 bits.
+    """
+    ba_in = bytearray(data)
+    out = bytearray([0x1f, 0x9d, 0x80 | max_lzw_bits])
+    if not ba_in:
+        return bytes(out)
+
+    buf = 0
+    left = 0
+    bits = 9
+    mask = 0x1ff
+    free_ent = 257
+    num_codes = 0  # codes written since the last change of code size
+    table = {}
+
+    def put_code(code, bits):
+        nonlocal buf, left
+        buf |= code << left
+        left += bits
+        while left >= 8:
+            out.append(buf & 0xff)
+            buf >>= 8
+            left -= 8
+
+    def increase_bits():
+        nonlocal bits, mask, num_codes
+        # pad to the 8*bits bit boundary the decoder skips to
+        while num_codes % 8:
+            put_code(0, bits)
+            num_codes += 1
+        num_codes = 0
+        bits += 1
+        mask = (mask << 1) + 1
+
+    prefix = ba_in[0]
+    for c in ba_in[1:]:
+        key = (prefix << 8) | c
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        # the decoder increases the code size when its table fills, which
+        # happens one code after it does here
+        if free_ent - 2 >= mask and bits < max_lzw_bits:
+            increase_bits()
+        put_code(prefix, bits)
+        num_codes += 1
+        if free_ent < (1 << max_lzw_bits):
+            table[key] = free_ent
+            free_ent += 1
+        prefix = c
+
+    if free_ent - 2 >= mask and bits < max_lzw_bits:
+        increase_bits()
+    put_code(prefix, bits)
+    if left > 0:
+        out.append(buf & 0xff)
+    return bytes(out)
@@ -4,13 +4,16 @@ import io
 import numpy as np
 
 from .. import errors
-from ..compressor import Compressor
+from ..compressor import Compressor, ZLibPackedStream
+from ..detect import Check
 
 
 class ZLibCompressor(Compressor):
     """NOTE: this is the GNU zip compression, not unix compress"""
     compression_algorithm = "zlib"
 
+    detect = [Check(lambda sample: is_zlib_header(sample.head))]
+
     def calc_unpacked_data(self, byte_data):
         try:
             unpacked = zlib.decompress(bytes(byte_data))
@@ -24,3 +27,14 @@ class ZLibCompressor(Compressor):
         except zlib.error as e:
             raise errors.InvalidAlgorithm(e)
         return packed
+
+    def open_packed_stream(self, fh, media=None, skip_missing_compressors=False):
+        return ZLibPackedStream(fh, zlib.compressobj(9))
+
+
+def is_zlib_header(data):
+    """Check the compression method and header checksum of a zlib stream"""
+    if len(data) < 2:
+        return False
+    cmf, flg = data[0], data[1]
+    return cmf & 0x0f == 8 and cmf >> 4 <= 7 and (cmf * 256 + flg) % 31 == 0
@@ -9,9 +9,10 @@ from . import errors
 from . import style_bits
 from . import utils
 from .segment import Segment
+from .segment_index import SegmentIndex
 from . import media_type
 from . import filesystem
-from .compressor import guess_compressor_list, compress_in_reverse_order, Uncompressed
+from .compressor import guess_compressor_list, compress_in_reverse_order, Uncompressed, PackedStreamChain
 from .filesystem import Dirent
 
 import logging
@@ -84,6 +85,8 @@ class Container:
     """
     ui_name = "Raw Data"
 
+    write_chunk_size = 1 << 20
+
     def __init__(self, data, decompression_order=None, style=None, origin=0, name="D1", error=None, verbose_name=None, memory_map=None, disasm_type=None, default_disasm_type=None, force_numpy_data=False):
 
         self.init_empty()
@@ -110,6 +113,7 @@ class Container:
 
     def init_empty(self):
         self.segments = []
+        self._segment_index = None
         self.header = None
         self._filesystem = None
         self._media = None
@@ -123,6 +127,9 @@ class Container:
         self.memory_map = {}
         self.comments = {}
         self.uuid = utils.uuid()
+        self.saved_sha1 = None
+        self.data_version = 0
+        self._sha1 = None
 
         self._data = None
         self._style = None
@@ -139,6 +146,7 @@ class Container:
         if self._data is not None:
             raise errors.ReadOnlyContainer("container already populated with data")
         self._data = utils.to_numpy(unpacked)
+        self.data_changed()
 
     @property
     def style(self):
@@ -160,9 +168,39 @@ class Container:
             value = np.zeros(len(self._data), dtype=np.uint8) + self.default_disasm_type
         self._disasm_type = utils.to_numpy(value)
 
+    @property
+    def is_memory_mapped(self):
+        return isinstance(self._data, np.memmap)
+
+    def data_changed(self):
+        """Invalidate anything computed from the data, like the SHA1. Writes
+        through the container or its segments call this automatically, but
+        writes straight into the numpy array must call it themselves.
+        """
+        self.data_version += 1
+
     @property
     def sha1(self):
-        return hashlib.sha1(self.data).digest()
+        """SHA1 digest of the data, only computed again when the data changes
+        """
+        if self._sha1 is None or self._sha1[0] != self.data_version:
+            self._sha1 = (self.data_version, hashlib.sha1(self._data).digest())
+        return self._sha1[1]
+
+    @property
+    def is_dirty(self):
+        """True if the data has changed since `mark_clean`, or if it has
+        never been called
+        """
+        if self.saved_sha1 is None:
+            return True
+        # always hash the data again; unsaved changes can't be lost just
+        # because something wrote to the array without calling data_changed
+        self.data_changed()
+        return self.sha1 != self.saved_sha1
+
+    def mark_clean(self):
+        self.saved_sha1 = self.sha1
 
     @property
     def header_length(self):
@@ -189,6 +227,20 @@ class Container:
             self.segments.append(self.header)
         if self.media:
             self.segments.append(self.media)
+        self.invalidate_segment_index()
+
+    @property
+    def segment_index(self):
+        """Index to find the segments that contain a given byte, built when
+        first needed after the segment tree changes.
+        """
+        if self._segment_index is None:
+            self._segment_index = SegmentIndex(self.iter_segments())
+            log.debug(f"created {self._segment_index} for {self}")
+        return self._segment_index
+
+    def invalidate_segment_index(self):
+        self._segment_index = None
 
     @property
     def verbose_info(self):
@@ -221,6 +273,7 @@ class Container:
 
     def __iand__(self, other):
         self._data &= other
+        self.data_changed()
         return self
 
     def __getitem__(self, index):
@@ -228,6 +281,7 @@ class Container:
 
     def __setitem__(self, index, value):
         self._data[index] = value
+        self.data_changed()
 
     #### iterators
 
@@ -280,6 +334,24 @@ class Container:
         byte_data = self.data.tobytes()
         return compress_in_reverse_order(byte_data, self.decompression_order, self.media, skip_missing_compressors)
 
+    def write_packed_bytes(self, fh, skip_missing_compressors=False):
+        """Write the packed container to the file-like object a chunk at a
+        time, rather than building the packed data in memory like
+        `calc_packed_bytes`.
+        """
+        stream = PackedStreamChain(fh, self.decompression_order, self.media, skip_missing_compressors)
+        data = self.data
+        for start in range(0, len(data), self.write_chunk_size):
+            stream.write(memoryview(data[start:start + self.write_chunk_size]))
+        stream.close()
+
+    def copy_mapped_data(self):
+        """Replace data that is memory mapped from a file with an in-memory
+        copy, which is needed before the file can be overwritten.
+        """
+        if self.is_memory_mapped:
+            self._data = np.array(self._data)
+
     #### media
 
     def guess_media_type(self):
@@ -529,7 +601,7 @@ def guess_container(data):
 
 
 def load(pathname):
-    sample_data = np.fromfile(pathname, dtype=np.uint8)
+    sample_data = utils.load_file(pathname)
     container = guess_container(sample_data)
     container.pathname = pathname
     container.guess_media_type()
@@ -0,0 +1,259 @@
+"""Cheap format detection used before trial decoding
+
+Compressors, archivers, media types and filesystems are identified by trying
+each registered class on the data until one doesn't raise an error, which
+for a compressor means decompressing everything and for an archiver reading
+the whole archive. To avoid most of that work, each class lists in its
+`detect` attribute some predicates that must all be true if the data could
+possibly be in its format: magic numbers, sizes, etc. They are checked
+against a `Sample` of the data (only the first and last few kilobytes are
+read) and classes that are ruled out are never tried.
+
+Predicates must never rule out data the class would accept; they are only a
+fast way to say no. Classes without any predicates are always tried, but
+after the classes whose predicates all matched.
+"""
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class Sample:
+    """The size and the bytes at the start and end of some data, read only
+    when a predicate needs them. `source` is the data itself, e.g. the
+    `Media` instance when detecting filesystems.
+    """
+    head_size = 4096
+    tail_size = 65536 + 22  # maximum size of a zip end of directory record
+
+    def __init__(self, source):
+        self.source = source
+        self.size = len(source)
+        self._head = None
+        self._tail = None
+
+    def __str__(self):
+        return f"<Sample of {self.size} bytes>"
+
+    @property
+    def head(self):
+        if self._head is None:
+            self._head = np.asarray(self.source[0:self.head_size]).tobytes()
+        return self._head
+
+    @property
+    def tail(self):
+        if self._tail is None:
+            self._tail = np.asarray(self.source[max(0, self.size - self.tail_size):self.size]).tobytes()
+        return self._tail
+
+    def read(self, offset, count):
+        """Return up to `count` bytes starting at `offset`, which is relative
+        to the end of the data if negative
+        """
+        if offset < 0:
+            if -offset > len(self.tail):
+                return b""
+            return self.tail[len(self.tail) + offset:][:count]
+        if offset + count > self.head_size:
+            return np.asarray(self.source[offset:offset + count]).tobytes()
+        return self.head[offset:offset + count]
+
+
+class HeaderSample(Sample):
+    """A sample made from only the first bytes of the data and its total
+    size, for when reading all the data would be too expensive. Any bytes
+    beyond the header are unknown and read as empty.
+    """
+    def __init__(self, header, size):
+        Sample.__init__(self, header)
+        self.size = size
+
+    def __str__(self):
+        return f"<HeaderSample of {len(self.source)} of {self.size} bytes>"
+
+    @property
+    def tail(self):
+        if len(self.source) < self.size:
+            return b""
+        return Sample.tail.fget(self)
+
+
+class Predicate:
+    def __call__(self, sample):
+        raise NotImplementedError
+
+    def is_evidence(self, sample):
+        """Return True if the predicate matches and that is evidence that
+        the data is in the format (like a magic number), rather than only
+        not ruling it out (like a size that fits)
+        """
+        return False
+
+    def __repr__(self):
+        return self.__class__.__name__
+
+
+class Magic(Predicate):
+    """Matches if any of the byte strings are found at `offset`"""
+    def __init__(self, *values, offset=0):
+        self.values = values
+        self.offset = offset
+
+    def __call__(self, sample):
+        count = max([len(v) for v in self.values])
+        found = sample.read(self.offset, count)
+        return any([found[:len(v)] == v for v in self.values])
+
+    def is_evidence(self, sample):
+        return self(sample)
+
+    def __repr__(self):
+        return f"Magic({', '.join([repr(v) for v in self.values])}, offset={self.offset})"
+
+
+class TrailingMagic(Predicate):
+    """Matches if the byte string is anywhere in the last `within` bytes"""
+    def __init__(self, value, within=Sample.tail_size):
+        self.value = value
+        self.within = min(within, Sample.tail_size)
+
+    def __call__(self, sample):
+        return sample.tail.find(self.value, -self.within) >= 0
+
+    def is_evidence(self, sample):
+        return self(sample)
+
+    def __repr__(self):
+        return f"TrailingMagic({self.value!r}, within={self.within})"
+
+
+class Size(Predicate):
+    """Matches if the size of the data is in range. If the data may start
+    with an optional header, the size without the header is also checked
+    when `header_magic` is found at the start of the data.
+    """
+    def __init__(self, exact=None, minimum=0, maximum=None, multiple=None, header_magic=None, header_size=0):
+        self.exact = exact
+        self.minimum = minimum
+        self.maximum = maximum
+        self.multiple = multiple
+        self.header_magic = header_magic
+        self.header_size = header_size
+
+    def check(self, size):
+        if self.exact is not None and size != self.exact:
+            return False
+        if size < self.minimum:
+            return False
+        if self.maximum is not None and size > self.maximum:
+            return False
+        if self.multiple is not None and size % self.multiple != 0:
+            return False
+        return True
+
+    def __call__(self, sample):
+        if self.check(sample.size):
+            return True
+        if self.header_magic is not None and sample.size >= self.header_size and sample.head.startswith(self.header_magic):
+            return self.check(sample.size - self.header_size)
+        return False
+
+    def is_evidence(self, sample):
+        # only a size with a valid header says anything about the format
+        if self.header_magic is None or not sample.head.startswith(self.header_magic):
+            return False
+        return sample.size >= self.header_size and self.check(sample.size - self.header_size)
+
+
+class HasAttribute(Predicate):
+    """Matches if the source of the sample has the attribute, and it has the
+    value if one is specified. Used for filesystems, where the source is the
+    `Media`.
+    """
+    def __init__(self, name, *value):
+        self.name = name
+        self.value = value
+
+    def __call__(self, sample):
+        try:
+            actual = getattr(sample.source, self.name)
+        except AttributeError:
+            return False
+        return not self.value or actual == self.value[0]
+
+    def __repr__(self):
+        return f"HasAttribute({self.name})"
+
+
+class AnyOf(Predicate):
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def __call__(self, sample):
+        return any([p(sample) for p in self.predicates])
+
+    def is_evidence(self, sample):
+        return any([p.is_evidence(sample) for p in self.predicates])
+
+    def __repr__(self):
+        return f"AnyOf({', '.join([repr(p) for p in self.predicates])})"
+
+
+class Check(Predicate):
+    """Matches if `func(sample)` returns True. Set `evidence` if the check
+    is strict enough to identify the format, e.g. it validates a checksum.
+    """
+    def __init__(self, func, evidence=False):
+        self.func = func
+        self.evidence = evidence
+
+    def __call__(self, sample):
+        return bool(self.func(sample))
+
+    def is_evidence(self, sample):
+        return self.evidence and self(sample)
+
+    def __repr__(self):
+        return f"Check({self.func.__name__})"
+
+
+def match_candidates(classes, data):
+    """Return two lists: the classes whose `detect` predicates all match the
+    data, and the classes that don't have any predicates.
+    """
+    sample = data if isinstance(data, Sample) else Sample(data)
+    matched = []
+    unknown = []
+    for c in classes:
+        predicates = c.detect
+        if not predicates:
+            unknown.append(c)
+            continue
+        for predicate in predicates:
+            if not predicate(sample):
+                log.debug(f"ruled out {c.__name__}: {predicate}")
+                break
+        else:
+            matched.append(c)
+    return matched, unknown
+
+
+def match_with_evidence(classes, data):
+    """Return the classes whose `detect` predicates all match the data and
+    include positive evidence of the format, not just a size that fits.
+    """
+    sample = data if isinstance(data, Sample) else Sample(data)
+    matched, _ = match_candidates(classes, sample)
+    return [c for c in matched if any([p.is_evidence(sample) for p in c.detect])]
+
+
+def rank_candidates(classes, data):
+    """Return the classes that may be able to decode the data, in the order
+    they should be tried: first those whose `detect` predicates all match,
+    then those that don't have any predicates. Classes that are ruled out by
+    any of their predicates are not returned.
+    """
+    matched, unknown = match_candidates(classes, data)
+    return matched + unknown
@@ -7,7 +7,27 @@ from . import cputables
 from .flags import *
 from . import dtypes as ud
 from . import libudis
+from .history_index import HistoryIndex
+
+
+class HistoryStorage(libudis.HistoryStorage):
+    def __init__(self, num_entries):
+        libudis.HistoryStorage.__init__(self, num_entries)
+        self.index = HistoryIndex(self)
+
+    def find(self, **kwargs):
+        """Return the rows that match the criteria; see `HistoryIndex.find`
+        """
+        return self.index.find(**kwargs)
+
+    def find_previous(self, row, disassembler_type):
+        return self.index.find_previous(row, disassembler_type)
+
+    def find_next(self, row, disassembler_type):
+        return self.index.find_next(row, disassembler_type)
+
+    def get_frame_rows(self, frame_number):
+        return self.index.get_frame_rows(frame_number)
 
 
-HistoryStorage = libudis.HistoryStorage
 StringifiedHistory = libudis.StringifiedHistory
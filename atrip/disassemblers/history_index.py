@@ -0,0 +1,323 @@
+"""Secondary indexes into the CPU instruction history
+
+The emulator appends entries to a ring buffer (`HistoryStorage`), so finding
+e.g. the previous frame boundary or every write to an address means
+scanning entries one at a time. Here each entry gets a sequence number
+(the count of entries ever added before it), and the entries are indexed in
+runs of consecutive sequence numbers. Each run keeps its entries sorted by
+disassembler type, pc and target address, so a lookup in a run is a pair of
+binary searches. Runs are merged as they are added so there are only a
+logarithmic number of them, and runs are dropped (or trimmed) once the ring
+buffer has overwritten their entries.
+
+Rows are the same as the row numbers used by `HistoryStorage.__getitem__`:
+row zero is the oldest entry still in the ring.
+"""
+import numpy as np
+
+from . import flags
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# flag results of instructions that read or write target_addr
+read_flags = [flags.FLAG_LOAD_A_FROM_MEMORY, flags.FLAG_LOAD_X_FROM_MEMORY, flags.FLAG_LOAD_Y_FROM_MEMORY, flags.FLAG_MEMORY_ALTER, flags.FLAG_MEMORY_READ_ALTER_A, flags.FLAG_PEEK_MEMORY]
+write_flags = [flags.FLAG_MEMORY_ALTER, flags.FLAG_STORE_A_IN_MEMORY, flags.FLAG_STORE_X_IN_MEMORY, flags.FLAG_STORE_Y_IN_MEMORY]
+
+# entry types that use the pc and target_addr fields for something else
+frame_types = [flags.DISASM_FRAME_START, flags.DISASM_FRAME_END]
+
+
+def calc_available_count(history):
+    """Return the sequence number after the last entry in the history that
+    won't change
+    """
+    count = history.cumulative_count
+    if len(history) > 0 and history.entries[history.latest_entry_index]["disassembler_type"] == flags.DISASM_NEXT_INSTRUCTION:
+        # the emulator replaces this entry with the next one it adds
+        count -= 1
+    return count
+
+
+def copy_entries(history, first_seq, end_seq):
+    """Return a copy of the entries with sequence numbers from first_seq up
+    to end_seq, along with the sequence number of the first entry copied,
+    which is later than first_seq if the ring has already overwritten
+    entries.
+    """
+    oldest = history.cumulative_count - len(history)
+    first_seq = max(first_seq, oldest)
+    rows = np.arange(first_seq - oldest, max(end_seq, first_seq) - oldest)
+    return first_seq, history.entries[(history.first_entry_index + rows) % len(history.entries)]
+
+
+class IndexedRun:
+    """Entries with consecutive sequence numbers, sorted by each key
+    """
+    key_names = ["disassembler_type", "pc", "target_addr"]
+
+    def __init__(self, first_seq, columns):
+        self.first_seq = first_seq
+        self.columns = columns
+        self.num_entries = len(columns["disassembler_type"])
+        has_address = ~np.isin(columns["disassembler_type"], frame_types)
+        self.order = {}
+        self.keys = {}
+        for name in self.key_names:
+            values = columns[name]
+            if name == "disassembler_type":
+                positions = np.arange(self.num_entries, dtype=np.uint32)
+            else:
+                positions = np.flatnonzero(has_address).astype(np.uint32)
+            # stable sort keeps positions in increasing order for each key
+            order = positions[np.argsort(values[positions], kind="stable")]
+            self.order[name] = order
+            self.keys[name] = values[order]
+
+    def __str__(self):
+        return f"<IndexedRun {self.first_seq}-{self.end_seq}>"
+
+    @property
+    def end_seq(self):
+        return self.first_seq + self.num_entries
+
+    @classmethod
+    def from_entries(cls, first_seq, entries):
+        columns = {
+            "disassembler_type": entries["disassembler_type"].copy(),
+            "pc": entries["pc"].copy(),
+            "target_addr": entries["target_addr"].copy(),
+            "flag": entries["flag"].copy(),
+        }
+        return cls(first_seq, columns)
+
+    def merge(self, other):
+        """Return a new run with the entries of this run followed by the
+        entries of the other run, which must start where this one ends
+        """
+        columns = {name: np.concatenate((self.columns[name], other.columns[name])) for name in self.columns}
+        return IndexedRun(self.first_seq, columns)
+
+    def trim(self, first_seq):
+        """Return a new run without the entries before first_seq"""
+        skip = first_seq - self.first_seq
+        columns = {name: values[skip:] for name, values in self.columns.items()}
+        return IndexedRun(first_seq, columns)
+
+    def find_positions(self, name, value, start, end):
+        """Return the positions between start and end (not inclusive) whose
+        key matches value
+        """
+        keys = self.keys[name]
+        i0 = np.searchsorted(keys, value, side="left")
+        i1 = np.searchsorted(keys, value, side="right")
+        positions = self.order[name][i0:i1]
+        j0 = np.searchsorted(positions, start, side="left")
+        j1 = np.searchsorted(positions, end, side="left")
+        return positions[j0:j1]
+
+    def find_before(self, name, value, position):
+        """Return the last position before the given position whose key
+        matches value, or -1 if there isn't one
+        """
+        positions = self.find_positions(name, value, 0, position)
+        return int(positions[-1]) if len(positions) > 0 else -1
+
+    def find_after(self, name, value, position):
+        """Return the first position at or after the given position whose key
+        matches value, or -1 if there isn't one
+        """
+        positions = self.find_positions(name, value, position, self.num_entries)
+        return int(positions[0]) if len(positions) > 0 else -1
+
+
+class HistoryIndex:
+    """Indexes for an object with the `HistoryStorage` interface, updated
+    with the entries added since the previous update before every query.
+    """
+    # a run is merged into the previous run if the previous run is at most
+    # this many times bigger
+    merge_ratio = 2
+
+    def __init__(self, history):
+        self.history = history
+        self.clear()
+
+    def __str__(self):
+        return f"<HistoryIndex {len(self.runs)} runs, {self.indexed_count - self.first_indexed_seq} entries>"
+
+    def clear(self):
+        self.runs = []
+        self.indexed_count = 0
+        # sequence number and frame number of every frame end entry, and
+        # the lookup from frame number to the most recent of those entries.
+        # frame_base is the number of entries that have expired.
+        self.frame_seqs = []
+        self.frame_numbers = []
+        self.frame_lookup = {}
+        self.frame_base = 0
+
+    @property
+    def first_indexed_seq(self):
+        return self.runs[0].first_seq if self.runs else self.indexed_count
+
+    @property
+    def oldest_seq(self):
+        return self.history.cumulative_count - len(self.history)
+
+    def update(self):
+        """Index the entries added since the last update"""
+        count = calc_available_count(self.history)
+        if count < self.indexed_count:
+            log.debug("history has been cleared; resetting index")
+            self.clear()
+        first, entries = copy_entries(self.history, self.indexed_count, count)
+        if len(entries) > 0:
+            self.add_run(IndexedRun.from_entries(first, entries))
+            self.add_frames(first, entries)
+        self.indexed_count = count
+        self.expire(self.oldest_seq)
+
+    def add_run(self, run):
+        if self.runs and self.runs[-1].end_seq != run.first_seq:
+            # entries were lost between updates, so the runs can't be merged
+            self.runs = []
+        self.runs.append(run)
+        while len(self.runs) > 1 and self.runs[-2].num_entries <= self.runs[-1].num_entries * self.merge_ratio:
+            last = self.runs.pop()
+            self.runs[-1] = self.runs[-1].merge(last)
+
+    def add_frames(self, first_seq, entries):
+        # only frame end entries are written by the emulator; the frame
+        # number is stored in place of the pc and target address
+        positions = np.flatnonzero(entries["disassembler_type"] == flags.DISASM_FRAME_END)
+        if len(positions) > 0:
+            numbers = entries[positions].view(np.uint32).reshape(len(positions), -1)[:, 0]
+            for seq, frame_number in zip((positions + first_seq).tolist(), numbers.tolist()):
+                self.frame_lookup[frame_number] = self.frame_base + len(self.frame_seqs)
+                self.frame_seqs.append(seq)
+                self.frame_numbers.append(frame_number)
+
+    def expire(self, oldest):
+        while self.runs and self.runs[0].end_seq <= oldest:
+            self.runs.pop(0)
+        if self.runs and self.runs[0].first_seq < oldest:
+            run = self.runs[0]
+            if (oldest - run.first_seq) * 2 > run.num_entries:
+                self.runs[0] = run.trim(oldest)
+        expired = np.searchsorted(self.frame_seqs, oldest)
+        if expired > 0:
+            for frame_number in self.frame_numbers[:expired]:
+                if self.frame_lookup.get(frame_number, -1) < self.frame_base + expired:
+                    del self.frame_lookup[frame_number]
+            del self.frame_seqs[:expired]
+            del self.frame_numbers[:expired]
+            self.frame_base += expired
+
+    #### Queries
+
+    def iter_runs(self, start_seq, end_seq):
+        for run in self.runs:
+            if run.end_seq > start_seq and run.first_seq < end_seq:
+                yield run
+
+    def calc_seq_range(self, start_row, end_row):
+        oldest = self.oldest_seq
+        start = oldest + max(start_row, 0)
+        end = self.indexed_count if end_row is None else min(oldest + end_row, self.indexed_count)
+        return start, end
+
+    def get_frame_rows(self, frame_number):
+        """Return the start and end (not inclusive) rows of the entries in
+        the frame, or None if the frame isn't in the history. The frame in
+        progress is the frame after the last completed frame.
+        """
+        self.update()
+        oldest = self.oldest_seq
+        numbers = self.frame_numbers
+        if numbers and frame_number == numbers[-1] + 1:
+            end = self.indexed_count
+            i = len(numbers)
+        elif frame_number in self.frame_lookup:
+            i = self.frame_lookup[frame_number] - self.frame_base
+            end = self.frame_seqs[i] + 1
+        else:
+            return None
+        start = self.frame_seqs[i - 1] + 1 if i > 0 else oldest
+        return start - oldest, end - oldest
+
+    def calc_frame_seq_ranges(self, first_frame, last_frame):
+        oldest = self.oldest_seq
+        ranges = []
+        for frame_number in range(first_frame, last_frame + 1):
+            rows = self.get_frame_rows(frame_number)
+            if rows is not None:
+                ranges.append((rows[0] + oldest, rows[1] + oldest))
+        return ranges
+
+    def find(self, disassembler_type=None, pc=None, target_addr=None, flag_results=None, frames=None, start_row=0, end_row=None):
+        """Return the array of rows between start_row and end_row (not
+        inclusive) that match all the specified criteria. flag_results is a
+        list of FLAG_* results (e.g. `write_flags`) and frames is a (first,
+        last) inclusive range of frame numbers.
+        """
+        self.update()
+        start, end = self.calc_seq_range(start_row, end_row)
+        if frames is not None:
+            seq_ranges = [(max(s, start), min(e, end)) for s, e in self.calc_frame_seq_ranges(*frames)]
+        else:
+            seq_ranges = [(start, end)]
+        criteria = [("target_addr", target_addr), ("pc", pc), ("disassembler_type", disassembler_type)]
+        criteria = [(name, value) for name, value in criteria if value is not None]
+        found = []
+        for range_start, range_end in seq_ranges:
+            if range_start >= range_end:
+                continue
+            for run in self.iter_runs(range_start, range_end):
+                first = max(range_start - run.first_seq, 0)
+                last = min(range_end - run.first_seq, run.num_entries)
+                if criteria:
+                    # use the most selective index and check the rest
+                    name, value = criteria[0]
+                    positions = run.find_positions(name, value, first, last)
+                    for name, value in criteria[1:]:
+                        positions = positions[run.columns[name][positions] == value]
+                else:
+                    positions = np.arange(first, last)
+                if flag_results is not None:
+                    results = run.columns["flag"][positions] & flags.FLAG_RESULT_MASK
+                    positions = positions[np.isin(results, flag_results)]
+                found.append(positions.astype(np.int64) + run.first_seq)
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(found) - self.oldest_seq
+
+    def find_previous(self, row, disassembler_type):
+        """Return the row of the closest entry of the type before row, or
+        None if there isn't one
+        """
+        self.update()
+        oldest = self.oldest_seq
+        seq = oldest + row
+        for run in reversed(self.runs):
+            if run.first_seq >= seq:
+                continue
+            position = run.find_before("disassembler_type", disassembler_type, seq - run.first_seq)
+            if position >= 0:
+                found = run.first_seq + position
+                return found - oldest if found >= oldest else None
+        return None
+
+    def find_next(self, row, disassembler_type):
+        """Return the row of the closest entry of the type after row, or
+        None if there isn't one
+        """
+        self.update()
+        oldest = self.oldest_seq
+        seq = max(oldest + row + 1, oldest)
+        for run in self.iter_runs(seq, self.indexed_count):
+            position = run.find_after("disassembler_type", disassembler_type, max(seq - run.first_seq, 0))
+            if position >= 0:
+                return run.first_seq + position - oldest
+        return None
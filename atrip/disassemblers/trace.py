@@ -0,0 +1,186 @@
+"""Columnar storage of the CPU instruction history
+
+The history ring buffer only holds the most recent entries. A `TraceWriter`
+copies the new entries out of the ring after every frame and a background
+thread saves them in chunks, one numpy .npy file per field per chunk, so a
+trace of millions of instructions can be analyzed later (see
+`trace_query`) by loading only the columns that are needed.
+
+The trace directory contains a trace.json file describing the fields and
+the chunks, and files named like 00003.pc.npy for each chunk and field.
+"""
+import os
+import json
+import queue
+import threading
+
+import numpy as np
+
+from . import dtypes as dd
+from . import flags
+from .history_index import calc_available_count, copy_entries
+
+import logging
+log = logging.getLogger(__name__)
+
+
+trace_version = 1
+
+# entry types that are CPU instructions
+instruction_types = [flags.DISASM_6502_HISTORY, flags.DISASM_ATARI800_HISTORY]
+
+
+def calc_chunk_filename(path, chunk_number, name):
+    return os.path.join(path, f"{chunk_number:05d}.{name}.npy")
+
+
+class TraceWriter:
+    """Save every entry added to the history to a trace directory.
+
+    Call `update` at least once for every time the history ring fills up,
+    e.g. after every frame; the main thread only copies the entries, the
+    files are written in a worker thread.
+    """
+    chunk_size = 1 << 20
+
+    def __init__(self, history, path, dtype=dd.HISTORY_6502_DTYPE, chunk_size=None):
+        if dtype.itemsize != history.entries.dtype.itemsize:
+            raise ValueError(f"{dtype} is not the same size as history entries")
+        self.history = history
+        self.path = path
+        self.dtype = dtype
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        self.next_seq = history.cumulative_count - len(history)
+        self.pending = []
+        self.pending_first_seq = self.next_seq
+        self.pending_count = 0
+        self.num_chunks = 0
+        self.num_lost = 0
+        self.chunks = []
+        self.write_metadata()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.write_chunks, name="TraceWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __str__(self):
+        return f"<TraceWriter {self.path}: {self.num_chunks} chunks, {self.pending_count} pending>"
+
+    def update(self):
+        """Copy the entries added to the history since the last update"""
+        count = calc_available_count(self.history)
+        first, entries = copy_entries(self.history, self.next_seq, count)
+        if first > self.next_seq:
+            # can't merge chunks across the gap
+            log.warning(f"trace lost {first - self.next_seq} history entries; update called too infrequently")
+            self.num_lost += first - self.next_seq
+            self.flush()
+            self.pending_first_seq = first
+        if len(entries) > 0:
+            self.pending.append(entries.view(self.dtype))
+            self.pending_count += len(entries)
+        self.next_seq = max(count, self.next_seq)
+        if self.pending_count >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Send any pending entries to the worker thread"""
+        if self.pending_count > 0:
+            chunk = np.concatenate(self.pending)
+            self.queue.put((self.num_chunks, self.pending_first_seq, chunk))
+            self.num_chunks += 1
+            self.pending_first_seq += self.pending_count
+        self.pending = []
+        self.pending_count = 0
+
+    def close(self):
+        """Write any remaining entries and wait for the worker thread"""
+        self.update()
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def write_chunks(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            chunk_number, first_seq, entries = item
+            for name in self.dtype.names:
+                np.save(calc_chunk_filename(self.path, chunk_number, name), entries[name])
+            self.chunks.append({"first_seq": first_seq, "count": len(entries)})
+            self.write_metadata()
+            log.debug(f"trace: wrote chunk {chunk_number}, {len(entries)} entries")
+
+    def write_metadata(self):
+        metadata = {
+            "version": trace_version,
+            "fields": [(name, self.dtype[name].base.str, self.dtype[name].shape) for name in self.dtype.names],
+            "chunks": self.chunks,
+        }
+        filename = os.path.join(self.path, "trace.json")
+        with open(filename + ".tmp", "w") as fh:
+            json.dump(metadata, fh)
+        os.replace(filename + ".tmp", filename)
+
+
+class Trace:
+    """Read access to a trace directory written by `TraceWriter`. Columns
+    are loaded on first use.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "trace.json")) as fh:
+            metadata = json.load(fh)
+        self.field_names = [f[0] for f in metadata["fields"]]
+        self.chunks = metadata["chunks"]
+        self.columns = {}
+
+    def __len__(self):
+        return sum(c["count"] for c in self.chunks)
+
+    def __str__(self):
+        return f"<Trace {self.path}: {len(self)} entries in {len(self.chunks)} chunks>"
+
+    def __getitem__(self, name):
+        if name not in self.columns:
+            if name == "seq":
+                column = self.calc_seq()
+            elif name == "frame_number":
+                column = self.calc_frame_numbers()
+            elif name in self.field_names:
+                parts = [np.load(calc_chunk_filename(self.path, i, name), mmap_mode="r") for i in range(len(self.chunks))]
+                if len(parts) == 1:
+                    column = parts[0]
+                else:
+                    column = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8)
+            else:
+                raise KeyError(f"{name} not in trace")
+            self.columns[name] = column
+        return self.columns[name]
+
+    def calc_seq(self):
+        """Sequence number of each entry; there are gaps if the writer
+        missed entries
+        """
+        parts = [np.arange(c["first_seq"], c["first_seq"] + c["count"], dtype=np.int64) for c in self.chunks]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def calc_frame_numbers(self):
+        """Frame number of each entry, from the frame end entries. Entries
+        after the last frame end are in the frame after it.
+        """
+        types = self["disassembler_type"]
+        ends = np.flatnonzero(types == flags.DISASM_FRAME_END)
+        if len(ends) == 0:
+            return np.zeros(len(types), dtype=np.int64)
+        # frame number is stored in place of the pc and target address
+        numbers = self["pc"][ends].astype(np.int64) | (self["target_addr"][ends].astype(np.int64) << 16)
+        numbers = np.append(numbers, numbers[-1] + 1)
+        return numbers[np.searchsorted(ends, np.arange(len(types)), side="left")]
+
+    @property
+    def is_instruction(self):
+        return np.isin(self["disassembler_type"], instruction_types)
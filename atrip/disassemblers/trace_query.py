@@ -0,0 +1,107 @@
+"""Vectorized analysis of CPU traces
+
+The functions here take a `trace.Trace` or anything else that returns
+columns by field name (e.g. a structured array of HISTORY_6502_DTYPE
+entries) and an optional boolean mask to restrict the analysis to a subset
+of entries, e.g. `trace["frame_number"] == 100`.
+"""
+import numpy as np
+
+from . import flags
+from .history_index import write_flags
+from .trace import instruction_types
+
+import logging
+log = logging.getLogger(__name__)
+
+
+jsr_opcode = 0x20
+rts_opcode = 0x60
+
+hot_pc_dtype = np.dtype([("pc", np.uint16), ("count", np.int64), ("cycles", np.int64)])
+call_graph_dtype = np.dtype([("caller", np.int32), ("callee", np.int32), ("count", np.int64)])
+
+
+def calc_instruction_mask(trace, mask=None):
+    is_instruction = np.isin(trace["disassembler_type"], instruction_types)
+    if mask is not None:
+        is_instruction &= mask
+    return is_instruction
+
+
+def calc_hot_pcs(trace, count=20, mask=None):
+    """Return the most executed instructions as an array of `hot_pc_dtype`,
+    with the number of times each was executed and the total number of
+    cycles used.
+    """
+    selected = calc_instruction_mask(trace, mask)
+    pcs = trace["pc"][selected]
+    counts = np.bincount(pcs, minlength=256*256)
+    cycles = np.bincount(pcs, weights=trace["cycles"][selected], minlength=256*256)
+    order = np.argsort(-counts, kind="stable")[:count]
+    order = order[counts[order] > 0]
+    hot = np.zeros(len(order), dtype=hot_pc_dtype)
+    hot["pc"] = order
+    hot["count"] = counts[order]
+    hot["cycles"] = cycles[order]
+    return hot
+
+
+def calc_cycle_histogram(trace, mask=None):
+    """Return the number of instructions that took each number of cycles"""
+    selected = calc_instruction_mask(trace, mask)
+    return np.bincount(trace["cycles"][selected])
+
+
+def calc_write_heatmap(trace, mask=None, flag_results=write_flags):
+    """Return the number of writes to each address as a 256x256 array,
+    indexed by high byte and then low byte of the address.
+    """
+    selected = calc_instruction_mask(trace, mask)
+    results = trace["flag"] & flags.FLAG_RESULT_MASK
+    selected &= np.isin(results, flag_results)
+    counts = np.bincount(trace["target_addr"][selected], minlength=256*256)
+    return counts.reshape((256, 256))
+
+
+def calc_call_graph(trace, mask=None):
+    """Return the subroutine calls as an array of `call_graph_dtype`, sorted
+    from the most calls.
+
+    The caller is the address of the subroutine containing the JSR, found by
+    tracking the call depth through JSR and RTS instructions; it is -1 for
+    calls made from a subroutine entered before the start of the trace.
+    Returning any other way (e.g. pulling the return address off the stack)
+    confuses the depth tracking.
+    """
+    selected = calc_instruction_mask(trace, mask)
+    opcodes = trace["instruction"][:, 0]
+    is_jsr = selected & (opcodes == jsr_opcode)
+    is_rts = selected & (opcodes == rts_opcode)
+    events = np.flatnonzero(is_jsr | is_rts)
+    if len(events) == 0:
+        return np.zeros(0, dtype=call_graph_dtype)
+    steps = np.where(is_jsr[events], 1, -1)
+    depth_after = np.cumsum(steps)
+    jsrs = is_jsr[events]
+    jsr_depth = depth_after[jsrs]
+    operands = trace["instruction"][events[jsrs]]
+    callees = operands[:, 1].astype(np.int32) | (operands[:, 2].astype(np.int32) << 8)
+
+    # the subroutine containing a call at depth d is the callee of the most
+    # recent call that ended at depth d
+    callers = np.zeros(len(callees), dtype=np.int32) - 1
+    caller_depth = jsr_depth - 1
+    for depth in np.unique(caller_depth):
+        openers = np.flatnonzero(jsr_depth == depth)
+        calls = np.flatnonzero(caller_depth == depth)
+        found = np.searchsorted(openers, calls) - 1
+        valid = found >= 0
+        callers[calls[valid]] = callees[openers[found[valid]]]
+
+    edges, counts = np.unique(callers.astype(np.int64) << 32 | callees, return_counts=True)
+    graph = np.zeros(len(edges), dtype=call_graph_dtype)
+    graph["caller"] = edges >> 32
+    graph["callee"] = edges & 0xffffffff
+    graph["count"] = counts
+    return graph[np.argsort(-graph["count"], kind="stable")]
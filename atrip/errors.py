@@ -147,3 +147,21 @@ class ByteNotInFile166(FileError):
 
 class InvalidBinaryFile(FileError):
     pass
+
+
+# search
+
+class InvalidSearchPattern(AtrError):
+    pass
+
+
+# batch operations
+
+class InvalidScanFormat(AtrError):
+    pass
+
+
+# signatures
+
+class InvalidSignatureIndex(AtrError):
+    pass
@@ -7,8 +7,9 @@ import numpy as np
 from . import errors
 from . import style_bits
 from .segment import Segment
-from .utils import to_numpy, to_numpy_list, uuid
+from .utils import to_numpy, to_numpy_list, uuid, concat_ranges
 from .file_type import guess_file_type
+from .detect import rank_candidates
 
 import logging
 log = logging.getLogger(__name__)
@@ -31,6 +32,10 @@ class Filesystem:
 
     extra_serializable_attributes = []
 
+    # predicates from `detect` that must be true for the media, which is the
+    # source of the sample they are checked against
+    detect = ()
+
     def __init__(self, media):
         self.check_media(media)
         self.media = media
@@ -236,6 +241,7 @@ class Directory(Segment):
 
     def set(self, index, dirent):
         self.segments[index] = dirent
+        self.container.invalidate_segment_index()
         if _xd: log.debug("set dirent #%d: %s" % (index, dirent))
 
     def get_free_dirent(self):
@@ -342,6 +348,9 @@ class VTOC(Segment):
 
     extra_serializable_attributes = ['addressable_sectors', 'sector_map']
 
+    # name of the default entry in allocation_strategies
+    allocation_strategy = "first_fit"
+
     def __init__(self, filesystem):
         self.filesystem = filesystem
         offset, length = self.find_segment_location()
@@ -349,11 +358,19 @@ class VTOC(Segment):
         self.addressable_sectors = self.calc_sector_map_size()
         self.create_sector_map()
         self.unpack_vtoc()
+        self.update_free_index()
 
     @property
     def media(self):
         return self.filesystem.media
 
+    def restore_computed_defaults(self):
+        # subclasses that don't serialize the sector map will have to unpack
+        # it from the data once the container data has been restored
+        if hasattr(self, "sector_map"):
+            self.sector_map = np.asarray(self.sector_map, dtype=np.uint8)
+            self.update_free_index()
+
     def find_segment_location(self):
         """Calculate the location on the media for the VTOC. Return either
         sector number and count, or offset list
@@ -382,8 +399,20 @@ class VTOC(Segment):
 
     @property
     def num_free_sectors(self):
-        free = np.where(self.sector_map == 1)[0]
-        return len(free)
+        return self.num_free
+
+    def update_free_index(self):
+        """Rebuild the index of runs of free sectors from the sector map.
+
+        Must be called if the sector map is changed directly instead of
+        through `reserve_space` or `free_sector_list`.
+        """
+        free = np.zeros(len(self.sector_map) + 2, dtype=np.int8)
+        free[1:-1] = self.sector_map != 0
+        edges = np.diff(free)
+        self.free_run_starts = np.flatnonzero(edges == 1)
+        self.free_run_lengths = np.flatnonzero(edges == -1) - self.free_run_starts
+        self.num_free = int(self.free_run_lengths.sum())
 
     def iter_free_sectors(self):
         for i, pos, size in self.filesystem.media.iter_sectors():
@@ -413,32 +442,182 @@ class VTOC(Segment):
             last_sector.next_sector_num = 0
         sector_list.file_length = file_length
 
-    def reserve_space(self, num):
-        order = []
-        for i in range(num):
-            order.append(self.get_next_free_sector())
+    def reserve_space(self, num, strategy=None):
+        """Allocate `num` sectors, returning a list of the sector numbers.
+
+        The sectors are chosen using the named strategy from
+        `allocation_strategies`, or the VTOC's default strategy if not
+        specified. Raises NotEnoughSpaceOnDisk (without allocating anything)
+        if there aren't enough free sectors.
+        """
+        if num > self.num_free:
+            raise errors.NotEnoughSpaceOnDisk(f"Need {num} sectors, VTOC has only {self.num_free} available")
+        if num == 0:
+            return []
+        if strategy is None:
+            strategy = self.allocation_strategy
+        taken = allocation_strategies[strategy](self.free_run_starts, self.free_run_lengths, num)
+
+        # sectors are always taken from the start of a run, so the index can
+        # be updated by shrinking the runs rather than rebuilding it
+        used = taken > 0
+        order = concat_ranges(self.free_run_starts[used], taken[used], np.int64)
+        self.sector_map[order] = 0
+        self.free_run_starts = self.free_run_starts + taken
+        self.free_run_lengths = self.free_run_lengths - taken
+        remaining = self.free_run_lengths > 0
+        self.free_run_starts = self.free_run_starts[remaining]
+        self.free_run_lengths = self.free_run_lengths[remaining]
+        self.num_free -= num
         if _xd: log.debug("Sectors reserved: %s" % order)
         self.calc_bitmap()
-        return order
+        return order.tolist()
 
     def get_next_free_sector(self):
-        free = np.nonzero(self.sector_map)[0]
-        if len(free) > 0:
-            num = free[0]
-            if _xd: log.debug("Found sector %d free" % num)
-            self.sector_map[num] = 0
-            return num
-        raise errors.NotEnoughSpaceOnDisk("No space left in VTOC")
+        return self.reserve_space(1, "first_fit")[0]
 
     def calc_bitmap(self):
-        raise NotImplementedError
+        self.pack_vtoc()
 
     def free_sector_list(self, sector_list):
-        for sector in sector_list:
-            self.sector_map[sector.sector_num] = 1
+        sectors = np.asarray([sector.sector_num for sector in sector_list], dtype=np.int64)
+        self.sector_map[sectors] = 1
+        self.update_free_index()
         self.calc_bitmap()
 
 
+#### VTOC allocation strategies
+
+# Each strategy is passed the arrays of start sector and length of every run
+# of free sectors (sorted by sector number) and the number of sectors needed,
+# and returns an array holding the number of sectors to take from the start
+# of each run. The caller guarantees that there are enough free sectors.
+
+def allocate_first_fit(run_starts, run_lengths, num):
+    """Lowest numbered free sectors, regardless of fragmentation"""
+    before = np.cumsum(run_lengths) - run_lengths
+    return np.clip(num - before, 0, run_lengths)
+
+
+def allocate_best_fit(run_starts, run_lengths, num):
+    """Smallest run that can hold all the sectors, or if none are big enough,
+    the fewest runs possible, using the largest runs first
+    """
+    taken = np.zeros(len(run_lengths), dtype=np.int64)
+    fits = np.flatnonzero(run_lengths >= num)
+    if len(fits) > 0:
+        best = fits[np.argmin(run_lengths[fits])]
+        taken[best] = num
+    else:
+        order = np.argsort(-run_lengths, kind="stable")
+        taken[order] = allocate_first_fit(None, run_lengths[order], num)
+    return taken
+
+
+allocation_strategies = {
+    "first_fit": allocate_first_fit,
+    "best_fit": allocate_best_fit,
+}
+
+
+class SectorChain:
+    """Result of following the linked list of sectors of a single file.
+
+    If the chain couldn't be followed, `offsets` will be None and `error` will
+    contain the exception that describes the problem. An `error` of None with
+    no `offsets` means the chain referenced a sector that isn't on the media.
+    """
+    def __init__(self, sectors=None, offsets=None, error=None):
+        self.sectors = sectors
+        self.offsets = offsets
+        self.error = error
+
+    def __len__(self):
+        return 0 if self.offsets is None else len(self.offsets)
+
+
+class SectorChainResolver:
+    """Follow the sector links of every file on a disk at the same time.
+
+    Filesystems like Atari DOS store a file as a linked list of sectors, with
+    the last bytes of each sector holding the number of the next sector and
+    the count of bytes used. The link bytes of every sector on the media are
+    decoded at once, the chains are followed using the decoded links, and
+    the offsets of every file are built from array operations rather than one
+    sector at a time.
+
+    Link formats:
+
+    "dos2": 6 bits of file number, 10 bits of next sector, 1 byte count
+    "mydos": 16 bits of next sector (big endian), 1 byte count
+    """
+    def __init__(self, media, link_format="dos2"):
+        self.media = media
+        self.link_format = link_format
+        self.positions, self.sizes = media.sector_table
+        self.calc_links()
+
+    def calc_links(self):
+        count = len(self.sizes)
+        has_links = self.sizes >= 3
+        tail = (self.positions + self.sizes)[has_links]
+        b1 = np.zeros(count, dtype=np.int64)
+        b2 = np.zeros(count, dtype=np.int64)
+        b3 = np.zeros(count, dtype=np.int64)
+        if len(tail) > 0:
+            b1[has_links] = self.media[tail - 3]
+            b2[has_links] = self.media[tail - 2]
+            b3[has_links] = self.media[tail - 1]
+        if self.link_format == "mydos":
+            self.next_sector = (b1 << 8) | b2
+            self.file_num = None
+        else:
+            self.next_sector = ((b1 & 0x3) << 8) | b2
+            self.file_num = b1 >> 2
+        self.num_bytes = b3
+
+    def resolve(self, starting_sectors, sector_counts, file_nums):
+        """Return a list of `SectorChain`s, one for each file.
+
+        At most sector_counts[i] sectors are followed for file i. For link
+        formats that store the file number in each sector, it must match
+        file_nums[i].
+        """
+        # Walking a linked list is inherently serial, but it's only a few
+        # list lookups per sector once the links are decoded. The expensive
+        # parts (reading the link bytes and building the offsets) are done on
+        # whole arrays.
+        next_sector = self.next_sector.tolist()
+        file_num_of = None if self.file_num is None else self.file_num.tolist()
+        valid = (self.sizes > 0).tolist()
+        num_table = len(valid)
+        results = []
+        for sector, remaining, file_num in zip(np.asarray(starting_sectors).tolist(), np.asarray(sector_counts).tolist(), np.asarray(file_nums).tolist()):
+            sectors = []
+            seen = set()
+            chain = None
+            while sector > 0 and remaining > 0:
+                if sector >= num_table or not valid[sector]:
+                    chain = SectorChain()
+                    break
+                if file_num_of is not None and file_num_of[sector] != file_num:
+                    chain = SectorChain(error=errors.FileNumberMismatchError164(f"Expecting file {file_num}, found {file_num_of[sector]}"))
+                    break
+                sectors.append(sector)
+                seen.add(sector)
+                sector = next_sector[sector]
+                if sector in seen:
+                    chain = SectorChain(error=errors.FileStructureError(f"Bad sector pointer data: attempting to reread sector {sector}"))
+                    break
+                remaining -= 1
+            if chain is None:
+                sectors = np.asarray(sectors, dtype=np.int64)
+                offsets = concat_ranges(self.positions[sectors], self.num_bytes[sectors])
+                chain = SectorChain(sectors, offsets)
+            results.append(chain)
+        return results
+
+
 _filesystems = None
 
 def _find_filesystems():
@@ -459,8 +638,10 @@ def find_filesystems():
         _filesystems = _find_filesystems()
     return _filesystems
 
-def guess_filesystem(segment):
-    for f in find_filesystems():
+def guess_filesystem(segment, candidates=None):
+    if candidates is None:
+        candidates = rank_candidates(find_filesystems(), segment)
+    for f in candidates:
         log.debug(f"trying filesystem {f.ui_name}")
         try:
             found = f(segment)
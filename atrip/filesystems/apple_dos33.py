@@ -4,6 +4,7 @@ from .. import errors
 from ..segment import Segment
 from ..filesystem import VTOC, Dirent, Directory, Filesystem
 from ..file_type import guess_file_type
+from ..detect import HasAttribute
 
 import logging
 log = logging.getLogger(__name__)
@@ -302,6 +303,8 @@ class AppleDos33(Filesystem):
     ui_name = "Apple DOS 3.3"
     default_executable_extension = "BIN"
 
+    detect = [HasAttribute("sector_from_track")]
+
     def check_media(self, media):
         try:
             media.sector_from_track
@@ -4,6 +4,7 @@ from .. import errors
 from ..segment import Segment
 from ..filesystem import VTOC, Dirent, Directory, Filesystem
 from ..file_type import guess_file_type
+from ..detect import HasAttribute
 
 try:  # Expensive debugging
     _xd = _expensive_debugging
@@ -126,6 +127,8 @@ class AtariCassetteFilesystem(Filesystem):
     ui_name = "Atari Cassette (.cas)"
     default_executable_extension = "XEX"
 
+    detect = [HasAttribute("get_chunk")]
+
     def check_media(self, media):
         try:
             media.get_chunk
@@ -2,8 +2,9 @@ import numpy as np
 
 from .. import errors
 from ..segment import Segment
-from ..filesystem import VTOC, Dirent, Directory, Filesystem
+from ..filesystem import VTOC, Dirent, Directory, Filesystem, SectorChainResolver
 from ..file_type import guess_file_type
+from ..detect import HasAttribute
 
 try:  # Expensive debugging
     _xd = _expensive_debugging
@@ -247,38 +248,20 @@ class AtariDosDirent(Dirent):
         values[4] = self.ext
         return data
 
+    @property
+    def link_format(self):
+        # MyDOS files on large disks use all 16 bits of the link for the
+        # sector number and don't store the file number
+        return "mydos" if self.mydos else "dos2"
+
     def get_file(self):
-        media = self.filesystem.media
-        offsets = np.empty(self.filesystem.max_file_size, dtype=np.uint32)
-        length = 0
-        next_sector = self.starting_sector
-        sectors_remaining = self.num_sectors
-        sectors_seen = set()
-
-        while next_sector > 0 and sectors_remaining > 0:
-            try:
-                index, size = media.get_index_of_sector(next_sector)
-            except errors.MediaError:
-                length = 0
-                self.is_sane = False
-                break
-            num_bytes = media[index + size - 1]
-            file_num = media[index + size - 3] >> 2
-            if file_num != self.file_num:
-                raise errors.FileNumberMismatchError164(f"Expecting file {self.file_num}, found {file_num}")
-            sectors_seen.add(next_sector)
-
-            offsets[length:length + num_bytes] = np.arange(index, index+num_bytes)
-            length += num_bytes
-
-            next_sector = ((media[index + size - 3] & 0x3) << 8) + media[index + size - 2]
-            if next_sector in sectors_seen:
-                raise errors.FileStructureError(f"Bad sector pointer data: attempting to reread sector {next_sector}")
-            sectors_remaining -= 1
-
-        if length > 0:
-            offsets = np.copy(offsets[0:length])
-            file_segment = guess_file_type(media, self.filename, offsets)
+        chain = self.directory.get_sector_chain(self)
+        if chain.error is not None:
+            raise chain.error
+        if chain.offsets is None:
+            self.is_sane = False
+        elif len(chain) > 0:
+            file_segment = guess_file_type(self.filesystem.media, self.filename, chain.offsets)
             self.segments = [file_segment]
             return file_segment
 
@@ -331,6 +314,7 @@ class AtariDos2Directory(Directory):
             raise errors.FilesystemError("Disk image too small to contain a directory")
 
     def calc_dirents(self):
+        self.sector_chains = self.calc_sector_chains()
         segments = []
         for filenum in range(64):
             dirent = AtariDosDirent(self, filenum)
@@ -341,13 +325,42 @@ class AtariDos2Directory(Directory):
                 dirent.set_comment_at(0x05, "FILE #%d: Filename" % filenum)
                 dirent.set_comment_at(0x0d, "FILE #%d: Extension" % filenum)
                 segments.append(dirent)
+        self.sector_chains = {}
         return segments
 
+    def calc_sector_chains(self):
+        """Follow the sector chains for all files in the directory at once,
+        returning a dict of `SectorChain`s keyed on file number
+        """
+        raw = self[0:64 * AtariDosDirent.format.itemsize].view(dtype=AtariDosDirent.format)
+        chains = {}
+        for link_format, flag_test in [("dos2", 0), ("mydos", AtariDosDirent.FLAG_MYDOS)]:
+            in_use = (raw['FLAG'] & AtariDosDirent.FLAG_IN_USE) > 0
+            file_nums = np.flatnonzero(in_use & ((raw['FLAG'] & AtariDosDirent.FLAG_MYDOS) == flag_test))
+            if len(file_nums) > 0:
+                resolver = SectorChainResolver(self.media, link_format)
+                results = resolver.resolve(raw['START'][file_nums], raw['COUNT'][file_nums], file_nums)
+                chains.update(zip(file_nums.tolist(), results))
+        return chains
+
+    def get_sector_chain(self, dirent):
+        """Return the precomputed sector chain for the dirent if the directory
+        is being parsed, otherwise follow the chain now because the data may
+        have changed.
+        """
+        try:
+            return self.sector_chains.pop(dirent.file_num)
+        except (AttributeError, KeyError):
+            resolver = SectorChainResolver(self.media, dirent.link_format)
+            return resolver.resolve([dirent.starting_sector], [dirent.num_sectors], [dirent.file_num])[0]
+
 
 class AtariDos2(Filesystem):
     ui_name = "Atari DOS 2"
     default_executable_extension = "XEX"
 
+    detect = [HasAttribute("get_contiguous_sectors")]
+
     def check_media(self, media):
         try:
             media.get_contiguous_sectors
@@ -4,6 +4,7 @@ from .. import errors
 from ..segment import Segment
 from ..filesystem import VTOC, Dirent, Directory, Filesystem
 from ..file_type import guess_file_type
+from ..detect import HasAttribute
 from ..char_mapping import internal_to_atascii, atascii_to_internal
 from .atari_dos2 import AtariDos2, AtariDosBootSegment
 from ..machines.atari8bit.jumpman import playfield
@@ -141,6 +142,8 @@ class AtariJumpmanDirectory(Directory):
 class AtariJumpman(AtariDos2):
     ui_name = "Atari Jumpman"
 
+    detect = AtariDos2.detect + [HasAttribute("sector_size", 128)]
+
     def check_media(self, media):
         AtariDos2.check_media(self, media)
         if media.sector_size != 128:
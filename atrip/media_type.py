@@ -7,10 +7,11 @@ import numpy as np
 from . import errors
 from . import style_bits
 from .segment import Segment
-from .utils import to_numpy, to_numpy_list, uuid
+from .utils import to_numpy, to_numpy_list, uuid, concat_ranges
 from . import filesystem
 from .file_type import guess_file_type
 from .signature import guess_signature_from_container
+from .detect import rank_candidates
 
 import logging
 log = logging.getLogger(__name__)
@@ -27,8 +28,15 @@ class Media(Segment):
     """
     ui_name = "Unknown media"
 
+    # reported to applications as the type of the file containing the media
+    mime = "application/octet-stream"
+
     extra_serializable_attributes = []
 
+    # predicates from `detect` that must be true for the container data,
+    # including any header
+    detect = ()
+
     def __init__(self, container, signature=None, force=False):
         container.header = self.calc_header(container)
         size = len(container) - container.header_length
@@ -109,6 +117,7 @@ class DiskImage(Media):
     def init_empty(self):
         super().init_empty()
         self.num_sectors = 0
+        self._sector_table = None
 
     # def __str__(self):
     #     return f"{self.ui_name}, size={len(self)} ({self.num_sectors}x{self.sector_size}B)"
@@ -156,7 +165,44 @@ class DiskImage(Media):
         start, size = self.get_contiguous_sectors_offsets(start, count)
         return Segment(self, start, length=size)
 
+    @property
+    def sector_table(self):
+        """Tuple of arrays holding the offset and size of each sector, indexed
+        by sector number. Unused sector numbers (e.g. sector 0 on disks where
+        sectors are numbered from 1) have a size of zero.
+        """
+        if self._sector_table is None:
+            self._sector_table = self.calc_sector_table()
+        return self._sector_table
+
+    def calc_sector_table(self):
+        """Subclasses that override `get_index_of_sector` must also override
+        this to return the same positions and sizes.
+        """
+        first = self.starting_sector_label
+        positions = np.zeros(first + self.num_sectors, dtype=np.int64)
+        sizes = np.zeros(first + self.num_sectors, dtype=np.int64)
+        positions[first:] = np.arange(self.num_sectors) * self.sector_size
+        sizes[first:] = self.sector_size
+        return positions, sizes
+
     def get_sector_list_offsets(self, sector_numbers, sector_size_override=None):
+        if self.num_sectors < 0:
+            # unknown number of sectors, so can't use the sector table
+            return self.get_sector_list_offsets_slow(sector_numbers, sector_size_override)
+        sectors = np.asarray(sector_numbers, dtype=np.int64)
+        positions, sizes = self.sector_table
+        invalid = (sectors < 0) | (sectors >= len(sizes))
+        invalid[~invalid] = sizes[sectors[~invalid]] == 0
+        if invalid.any():
+            # let the media type raise its own error
+            self.get_index_of_sector(int(sectors[invalid][0]))
+        sizes = sizes[sectors]
+        if sector_size_override is not None:
+            sizes = np.minimum(sizes, sector_size_override)
+        return concat_ranges(positions[sectors], sizes)
+
+    def get_sector_list_offsets_slow(self, sector_numbers, sector_size_override=None):
         if sector_size_override is not None:
             sector_size = sector_size_override
         else:
@@ -233,12 +279,14 @@ def find_media_types():
         _media_types = _find_media_types()
     return _media_types
 
-def guess_media_type(container):
+def guess_media_type(container, candidates=None):
     signature = guess_signature_from_container(container)
     if signature:
         log.info(f"found signature {signature}")
+    if candidates is None:
+        candidates = rank_candidates(find_media_types(), container)
     possibilities = []
-    for m in find_media_types():
+    for m in candidates:
         log.debug(f"trying media_type {m.ui_name}")
         try:
             found = m(container, signature)
@@ -2,6 +2,7 @@ import numpy as np
 
 from .. import errors
 from ..media_type import DiskImage
+from ..detect import Size
 
 import logging
 log = logging.getLogger(__name__)
@@ -9,11 +10,14 @@ log = logging.getLogger(__name__)
 
 class Apple16SectorDiskImage(DiskImage):
     ui_name = "Apple ][ Floppy Disk Image (16 sector tracks)"
+    mime = "application/vnd.apple2.dsk"
     sector_size = 256
     expected_size = 143360
     sectors_per_track = 16
     starting_sector_label = 0
 
+    detect = [Size(exact=143360)]
+
     extra_serializable_attributes = ['num_sectors:int', 'first_directory:int', 'max_sectors:int', 'ts_pairs:int', 'dos_release:int', 'last_track_num:int', 'track_alloc_dir:int']
 
     def init_empty(self):
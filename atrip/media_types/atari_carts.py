@@ -2,6 +2,7 @@ import numpy as np
 
 from .. import errors
 from ..media_type import CartImage
+from ..detect import Size
 
 import logging
 log = logging.getLogger(__name__)
@@ -164,8 +165,12 @@ class A8CartHeader:
 
 class Atari8bitCart(CartImage):
     ui_name = "Atari 8bit Cart"
+    mime = "application/vnd.atari8bit.cart"
     platform = "atari800"
 
+    # size is a multiple of 1K, not including any CART header
+    detect = [Size(multiple=1024, header_magic=b"CART", header_size=16)]
+
     def calc_header(self, container):
         header_data = container[0:16]
         try:
@@ -4,6 +4,7 @@ from .. import errors
 from ..media_type import DiskImage
 from ..segment import Segment
 from ..container import ContainerHeader
+from ..detect import Size, Magic
 
 import logging
 log = logging.getLogger(__name__)
@@ -45,11 +46,19 @@ class AtrHeader(ContainerHeader):
         values[6] = self.flags
 
 
+def atr_size(**kwargs):
+    """Size predicate for images that may have an ATR header"""
+    return Size(header_magic=b"\x96\x02", header_size=16, **kwargs)
+
+
 class AtariSingleDensity(DiskImage):
     ui_name = "Atari SD (90K) Floppy Disk Image"
+    mime = "application/vnd.atari8bit.atr"
     sector_size = 128
     expected_size = 92160
 
+    detect = [atr_size(exact=92160)]
+
     def check_header(self, header):
         if header.sector_size != self.sector_size:
             raise errors.InvalidMediaSize(f"Sector size {header.sector_size} invalid for {self.ui_name}")
@@ -69,6 +78,8 @@ class AtariSingleDensity(DiskImage):
 class AtariSingleDensityShortImage(AtariSingleDensity):
     ui_name = "Atari SD Non-Standard Image"
 
+    detect = [Magic(b"\x96\x02"), atr_size(maximum=92160 - 1)]
+
     def check_disk_size(self):
         size = len(self)
         if size >= self.expected_size:
@@ -88,12 +99,16 @@ class AtariEnhancedDensity(AtariSingleDensity):
     sector_size = 128
     expected_size = 133120
 
+    detect = [atr_size(exact=133120)]
+
 
 class AtariDoubleDensity(AtariSingleDensity):
     ui_name = "Atari DD (180K) Floppy Disk Image"
     sector_size = 256
     expected_size = 184320
 
+    detect = [atr_size(exact=184320)]
+
 
 class AtariDoubleDensityShortBootSectors(AtariDoubleDensity):
     ui_name = "Atari DD (180K) Floppy Disk Image (Short Boot Sectors)"
@@ -101,6 +116,8 @@ class AtariDoubleDensityShortBootSectors(AtariDoubleDensity):
     initial_sector_size = 128
     num_initial_sectors = 3
 
+    detect = [atr_size(exact=183936)]
+
     def calc_num_sectors(self):
         size = len(self)
         print(size)
@@ -114,17 +131,28 @@ class AtariDoubleDensityShortBootSectors(AtariDoubleDensity):
         if not self.is_sector_valid(sector):
             raise errors.ByteNotInFile166("Sector %d out of range" % sector)
         if sector <= self.num_initial_sectors:
-            pos = self.num_initial_sectors * (sector - 1)
+            pos = self.initial_sector_size * (sector - 1)
             size = self.initial_sector_size
         else:
             pos = self.num_initial_sectors * self.initial_sector_size + (sector - 1 - self.num_initial_sectors) * self.sector_size
             size = self.sector_size
         return pos, size
 
+    def calc_sector_table(self):
+        positions, sizes = super().calc_sector_table()
+        first = self.starting_sector_label
+        n = self.num_initial_sectors
+        positions[first:first + n] = np.arange(n) * self.initial_sector_size
+        positions[first + n:] = n * self.initial_sector_size + np.arange(self.num_sectors - n) * self.sector_size
+        sizes[first:first + n] = self.initial_sector_size
+        return positions, sizes
+
 
 class AtariDoubleDensityHardDriveImage(AtariDoubleDensity):
     ui_name = "Atari DD Hard Drive Image"
 
+    detect = [atr_size(minimum=184320 + 1)]
+
     def check_disk_size(self):
         size = len(self)
         if size <= self.expected_size:
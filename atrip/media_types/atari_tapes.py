@@ -4,6 +4,7 @@ from .. import errors
 from ..media_type import DiskImage
 from ..segment import Segment
 from ..container import ContainerHeader
+from ..detect import Size, Magic
 
 import logging
 log = logging.getLogger(__name__)
@@ -41,6 +42,9 @@ class CassetteChunk:
 
 class AtariCassetteImage(DiskImage):
     ui_name = "Atari Cassette Image (.cas)"
+    mime = "application/vnd.atari8bit.cas"
+
+    detect = [Magic(b"FUJI"), Size(minimum=8)]
 
     def check_media_size(self):
         size = len(self)
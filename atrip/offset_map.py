@@ -0,0 +1,385 @@
+"""Mapping from segment index to container index
+
+A segment is a view into its container described by the container offset of
+each of its bytes. Most segments are a single contiguous range of the
+container (the whole disk, a boot sector, a VTOC) or a short list of ranges
+(a file made of sectors), so storing an explicit offset for every byte wastes
+4 bytes for each byte of data. The offset maps here store runs of consecutive
+offsets where that's smaller, and fall back to an explicit array for
+scattered offsets (e.g. every 100th byte).
+
+Both types support the subset of numpy indexing used by segments: integer,
+slice and index array lookups return container offsets like indexing a numpy
+array would, and np.asarray() still produces the full offset array for code
+that really needs it.
+"""
+import bisect
+
+import numpy as np
+
+from . import errors
+from . import utils
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Use runs if the number of runs is at most this fraction of the number of
+# bytes. Each run costs three int64 values versus one uint32 for each byte.
+max_runs_per_byte = 1 / 8
+
+
+class OffsetMap:
+    def __len__(self):
+        raise NotImplementedError
+
+    def __str__(self):
+        return f"<{self.__class__.__name__} {len(self)} bytes>"
+
+    def __array__(self, dtype=None):
+        array = self.calc_offsets()
+        if dtype is not None:
+            array = array.astype(dtype)
+        return array
+
+    def __iter__(self):
+        return iter(self.calc_offsets())
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            i = int(index)
+            if i < 0:
+                i += len(self)
+            if i < 0 or i >= len(self):
+                raise IndexError(f"index {index} out of range for {self}")
+            return self.lookup_one(i)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.lookup_range(start, stop)
+            index = np.arange(start, stop, step)
+        indexes = np.asarray(index)
+        if indexes.dtype == bool:
+            indexes = np.flatnonzero(indexes)
+        elif len(indexes) > 0:
+            indexes = indexes.astype(np.int64)
+            indexes[indexes < 0] += len(self)
+            if indexes.min() < 0 or indexes.max() >= len(self):
+                raise IndexError(f"index out of range for {self}")
+        return self.lookup(indexes)
+
+    @property
+    def is_contiguous(self):
+        return False
+
+    def calc_offsets(self):
+        """Return the full array of container offsets"""
+        raise NotImplementedError
+
+    def calc_runs(self):
+        """Return the arrays of container start offsets and lengths of each
+        run of consecutive offsets
+        """
+        raise NotImplementedError
+
+    def as_index(self):
+        """Return the best object to use to index the container arrays: a
+        slice if the map is contiguous so the result is a view, otherwise the
+        array of offsets.
+        """
+        return self.calc_offsets()
+
+    def lookup_one(self, index):
+        raise NotImplementedError
+
+    def lookup_range(self, start, stop):
+        return self.lookup(np.arange(start, stop, dtype=np.int64))
+
+    def lookup(self, indexes):
+        """Return the container offsets for an array of (valid, non-negative)
+        segment indexes.
+        """
+        raise NotImplementedError
+
+    def reverse_lookup(self, container_indexes):
+        """Return the segment index of each container index, or -1 for
+        container indexes that aren't in the segment.
+        """
+        raise NotImplementedError
+
+    def to_ranges(self, compact=False):
+        """Return the list of ranges in the format of
+        `utils.collapse_to_ranges`
+        """
+        raise NotImplementedError
+
+    def clip(self, limit):
+        """Return a new map without offsets at or beyond limit"""
+        raise NotImplementedError
+
+    def compose(self, indexes):
+        """Return the map of container offsets for a subset of this map, where
+        indexes are either another OffsetMap or an array of indexes relative
+        to this map.
+        """
+        return calc_offset_map(self[np.asarray(indexes)])
+
+
+class RangeOffsetMap(OffsetMap):
+    """Container offsets stored as a list of runs, each being the start
+    offset in the container and the number of bytes.
+    """
+    def __init__(self, starts, lengths):
+        starts = np.asarray(starts, dtype=np.int64).reshape(-1)
+        lengths = np.asarray(lengths, dtype=np.int64).reshape(-1)
+        keep = lengths > 0
+        starts, lengths = starts[keep], lengths[keep]
+        if len(starts) > 1:
+            # merge runs that continue where the previous run ends
+            continues = starts[1:] == starts[:-1] + lengths[:-1]
+            if continues.any():
+                first = np.concatenate(([True], ~continues))
+                run_num = np.cumsum(first) - 1
+                lengths = np.bincount(run_num, weights=lengths).astype(np.int64)
+                starts = starts[first]
+        self.starts = starts
+        self.lengths = lengths
+        self.run_index = np.concatenate(([0], np.cumsum(lengths)))
+        self._sorted = None
+        # python lists for single byte lookups, which are much faster with
+        # bisect than with numpy
+        self._run_list = self.run_index.tolist()
+        self._start_list = self.starts.tolist()
+
+    def __len__(self):
+        return self._run_list[-1]
+
+    def __getitem__(self, index):
+        # fast path for the single byte accesses of per-byte loops
+        if type(index) is int and 0 <= index < self._run_list[-1]:
+            run = bisect.bisect_right(self._run_list, index) - 1
+            return self._start_list[run] + index - self._run_list[run]
+        return OffsetMap.__getitem__(self, index)
+
+    def __str__(self):
+        return f"<{self.__class__.__name__} {len(self)} bytes in {len(self.starts)} runs>"
+
+    @property
+    def is_contiguous(self):
+        return len(self.starts) <= 1
+
+    def calc_offsets(self):
+        return utils.concat_ranges(self.starts, self.lengths)
+
+    def calc_runs(self):
+        return self.starts, self.lengths
+
+    def as_index(self):
+        if len(self.starts) == 0:
+            return slice(0, 0)
+        if len(self.starts) == 1:
+            start = int(self.starts[0])
+            return slice(start, start + int(self.lengths[0]))
+        return self.calc_offsets()
+
+    def lookup_one(self, index):
+        run = bisect.bisect_right(self._run_list, index) - 1
+        return self._start_list[run] + index - self._run_list[run]
+
+    def lookup_range(self, start, stop):
+        if stop <= start:
+            return np.zeros(0, dtype=np.uint32)
+        return self.compose_range(start, stop).calc_offsets()
+
+    def lookup(self, indexes):
+        runs = np.searchsorted(self.run_index, indexes, side="right") - 1
+        return (self.starts[runs] + indexes - self.run_index[runs]).astype(np.uint32)
+
+    def compose_range(self, start, stop):
+        first = int(np.searchsorted(self.run_index, start, side="right")) - 1
+        last = int(np.searchsorted(self.run_index, stop, side="left"))
+        starts = self.starts[first:last].copy()
+        lengths = self.lengths[first:last].copy()
+        if len(starts) > 0:
+            skip = start - self.run_index[first]
+            starts[0] += skip
+            lengths[0] -= skip
+            lengths[-1] -= self.run_index[last] - stop
+        return RangeOffsetMap(starts, lengths)
+
+    def compose(self, indexes):
+        if isinstance(indexes, RangeOffsetMap):
+            if len(indexes) > 0 and int((indexes.starts + indexes.lengths).max()) > len(self):
+                raise IndexError(f"index out of range for {self}")
+            starts = []
+            lengths = []
+            for start, count in zip(indexes.starts.tolist(), indexes.lengths.tolist()):
+                sub = self.compose_range(start, start + count)
+                starts.append(sub.starts)
+                lengths.append(sub.lengths)
+            if not starts:
+                return RangeOffsetMap([], [])
+            return RangeOffsetMap(np.concatenate(starts), np.concatenate(lengths))
+        return super().compose(indexes)
+
+    def get_sorted_runs(self):
+        if self._sorted is None:
+            order = np.argsort(self.starts, kind="stable")
+            sorted_starts = self.starts[order]
+            if np.any(sorted_starts[1:] < sorted_starts[:-1] + self.lengths[order][:-1]):
+                raise errors.InvalidSegmentOrder
+            self._sorted = (order, sorted_starts)
+        return self._sorted
+
+    def reverse_lookup(self, container_indexes):
+        order, sorted_starts = self.get_sorted_runs()
+        c = np.asarray(container_indexes, dtype=np.int64)
+        pos = np.searchsorted(sorted_starts, c, side="right") - 1
+        runs = order[np.clip(pos, 0, None)] if len(order) > 0 else np.zeros_like(pos)
+        if len(order) > 0:
+            found = (pos >= 0) & (c < self.starts[runs] + self.lengths[runs])
+            index = np.where(found, self.run_index[runs] + c - self.starts[runs], -1)
+        else:
+            index = np.zeros_like(c) - 1
+        if index.ndim == 0:
+            return int(index)
+        return index
+
+    def to_ranges(self, compact=False):
+        ranges = []
+        for start, count in zip(self.starts.tolist(), self.lengths.tolist()):
+            if compact and count == 1:
+                ranges.append(start)
+            else:
+                ranges.append([start, start + count])
+        return ranges
+
+    def clip(self, limit):
+        lengths = np.clip(limit - self.starts, 0, self.lengths)
+        return RangeOffsetMap(self.starts, lengths)
+
+
+class ArrayOffsetMap(OffsetMap):
+    """Container offsets stored explicitly, one for each byte in the
+    segment.
+    """
+    def __init__(self, offsets):
+        self.offsets = np.asarray(offsets, dtype=np.uint32)
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def calc_offsets(self):
+        return self.offsets
+
+    def calc_runs(self):
+        return calc_runs(self.offsets)
+
+    def lookup_one(self, index):
+        return int(self.offsets[index])
+
+    def lookup_range(self, start, stop):
+        return self.offsets[start:stop]
+
+    def lookup(self, indexes):
+        return self.offsets[indexes]
+
+    def get_sorted_offsets(self):
+        if self._sorted is None:
+            order = np.argsort(self.offsets, kind="stable")
+            sorted_offsets = self.offsets[order]
+            if np.any(sorted_offsets[1:] == sorted_offsets[:-1]):
+                raise errors.InvalidSegmentOrder
+            self._sorted = (order, sorted_offsets)
+        return self._sorted
+
+    def reverse_lookup(self, container_indexes):
+        order, sorted_offsets = self.get_sorted_offsets()
+        c = np.asarray(container_indexes, dtype=np.int64)
+        pos = np.searchsorted(sorted_offsets, c)
+        if len(order) > 0:
+            pos = np.clip(pos, 0, len(order) - 1)
+            index = np.where(sorted_offsets[pos] == c, order[pos], -1)
+        else:
+            index = np.zeros_like(c) - 1
+        if index.ndim == 0:
+            return int(index)
+        return index
+
+    def to_ranges(self, compact=False):
+        return utils.collapse_to_ranges(self.offsets, compact)
+
+    def clip(self, limit):
+        return calc_offset_map(self.offsets[self.offsets < limit])
+
+
+class ReverseOffsets:
+    """Array-like lookup from container index to segment index, with -1 for
+    container indexes not in the segment.
+    """
+    def __init__(self, offset_map, container_size):
+        self.offset_map = offset_map
+        self.container_size = container_size
+
+    def __len__(self):
+        return self.container_size
+
+    def __array__(self, dtype=None):
+        return self[:]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            index = np.arange(*index.indices(self.container_size))
+        return self.offset_map.reverse_lookup(index)
+
+
+def calc_runs(offsets):
+    """Return the arrays of start offsets and lengths of each run of
+    consecutive values in the array of offsets
+    """
+    if len(offsets) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(offsets.astype(np.int64)) != 1) + 1
+    starts = offsets[np.concatenate(([0], breaks))].astype(np.int64)
+    lengths = np.diff(np.concatenate(([0], breaks, [len(offsets)])))
+    return starts, lengths
+
+
+def calc_offset_map(offsets):
+    """Return the most compact OffsetMap for the list of container offsets
+    """
+    if isinstance(offsets, OffsetMap):
+        return offsets
+    offsets = np.asarray(offsets)
+    starts, lengths = calc_runs(offsets)
+    if len(starts) > len(offsets) * max_runs_per_byte:
+        return ArrayOffsetMap(offsets)
+    return RangeOffsetMap(starts, lengths)
+
+
+def calc_offset_map_from_ranges(ranges, size):
+    """Return the OffsetMap for the list produced by `to_ranges`. If the
+    ranges describe fewer than size bytes, the remaining bytes map to their
+    own index, as they would when restoring into an np.arange(size) array.
+    """
+    starts = []
+    lengths = []
+    for item in ranges:
+        try:
+            single = int(item)
+        except TypeError:
+            start, end = item
+            starts.append(start)
+            lengths.append(end - start)
+        else:
+            starts.append(single)
+            lengths.append(1)
+    total = sum(lengths)
+    if total < size:
+        starts.append(total)
+        lengths.append(size - total)
+    offset_map = RangeOffsetMap(starts, lengths)
+    if len(offset_map.starts) > len(offset_map) * max_runs_per_byte:
+        offset_map = ArrayOffsetMap(offset_map.calc_offsets())
+    return offset_map
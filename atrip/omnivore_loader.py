@@ -1,27 +1,85 @@
+"""Identify files for the sawx loader
+
+Identification happens in two phases. `identify_loader` only sniffs the
+first few kilobytes of the file and its size against the `detect`
+predicates of the compressors, archivers and media types to find the MIME
+type. The full parse only happens when the document is actually loaded,
+through `get_collection`, so nothing is parsed if another loader wins.
+
+A specific MIME type is only claimed when the header has positive evidence
+of the format, like a magic number. A size that happens to fit a media type
+proves nothing (any file that is a multiple of 1K could be a cart image), so
+those are reported as generic binary data to give the other loaders a
+chance. If the header isn't enough to tell which media type it is, the MIME
+type is set from the parsed media.
+"""
 from .collection import Collection
-from . import errors
+from .compressor import find_compressors
+from .archiver import find_archivers
+from .media_type import find_media_types
+from .detect import HeaderSample, match_with_evidence
 
 import logging
 log = logging.getLogger(__name__)
 
 
+# Placeholder for data that is certainly something atrip can unpack, until
+# the contents are parsed. It must not be the generic binary type or the
+# other loaders' guesses (like application/gzip) would be used instead.
+deferred_mime = "application/vnd.atrip.deferred"
+
+# MIME types that are replaced by the type of the parsed media
+unparsed_mimes = {deferred_mime, "application/octet-stream"}
+
+
+def sniff(header, size):
+    """Return the MIME type of the data using only the header of the data
+    and the total size, or None if it's empty.
+
+    Any binary data can be loaded as a generic collection, so data without
+    evidence of any format is reported as application/octet-stream.
+    """
+    if size == 0:
+        return None
+    sample = HeaderSample(header, size)
+    matched = match_with_evidence(find_media_types(), sample)
+    if matched:
+        log.debug(f"sniff: matched {[c.__name__ for c in matched]}")
+        mimes = set(c.mime for c in matched)
+        return mimes.pop() if len(mimes) == 1 else deferred_mime
+    for find in [find_compressors, find_archivers]:
+        matched = match_with_evidence(find(), sample)
+        if matched:
+            log.debug(f"sniff: matched {[c.__name__ for c in matched]}")
+            return deferred_mime
+    return "application/octet-stream"
+
+
 def identify_loader(file_guess):
-    mime_type = None
     try:
-        data = file_guess.all_data
+        mime = sniff(file_guess.sample_data, file_guess.size)
     except IOError as e:
-        log.debug(f"atrip loader: error reading entire file: {e}")
-    else:
-        try:
-            collection = Collection(file_guess.uri, data)
-        except (errors.UnsupportedDiskImage, IOError) as e:
-            log.debug(f"error in atrip parser: {e}")
-        else:
-            log.debug(f"{collection}")
-
-        if collection.mime_type:
-            log.debug(f"atrip loader: identified {collection.mime_type}")
-            return dict(mime=collection.mime_type, ext="", atrip_collection=collection)
-        else:
-            log.debug(f"atrip loader: not recognized")
-    return None
+        log.debug(f"atrip loader: error reading file: {e}")
+        return None
+    if mime is None:
+        log.debug(f"atrip loader: not recognized")
+        return None
+    log.debug(f"atrip loader: identified {mime}")
+    return dict(mime=mime, ext="", atrip_file_guess=file_guess)
+
+
+def get_collection(file_metadata):
+    """Return the collection for the file described by the metadata, parsing
+    the file only the first time. The collection is stored in the metadata,
+    so later calls reuse it.
+    """
+    collection = file_metadata.get("atrip_collection", None)
+    if collection is None:
+        file_guess = file_metadata.get("atrip_file_guess", None)
+        data = None if file_guess is None else file_guess.all_data
+        collection = Collection(file_metadata["uri"], data)
+        log.debug(f"atrip loader: parsed {collection}")
+        file_metadata["atrip_collection"] = collection
+        if file_metadata.get("mime", None) in unparsed_mimes:
+            file_metadata["mime"] = collection.mime_type
+    return collection
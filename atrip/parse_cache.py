@@ -0,0 +1,186 @@
+"""Persistent cache of parsed disk images
+
+Identifying a disk image means trying every compressor, archiver, media type
+and filesystem until one fits, and then building all the segments of the
+filesystem. The result only depends on the bytes of the file, so it is saved
+using the SHA1 of the raw (still compressed) file as the key. Loading a known
+image again skips all the guessing and uses the saved decompressed data and
+session info to recreate the collection.
+
+Each entry is two files in the cache directory: a json file holding the
+jsonpickled structure (compressor chain, archiver, containers with their
+media, filesystem and segment offset ranges) and an npz file holding the
+decompressed bytes of each container. When the cache grows beyond
+`max_cache_size`, the least recently used entries are removed.
+
+The cache needs jsonpickle; if it's not installed, nothing is cached.
+"""
+import os
+import hashlib
+
+import numpy as np
+
+from ._version import __version__
+from .utils import write_atomic
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Bump this if the format of the cache entries changes. Entries made with a
+# different version of atrip are also ignored because the classes that are
+# pickled may have changed.
+CACHE_VERSION = 1
+
+# Set to False to never use the cache
+enabled = True
+
+# If set, overrides the default location in the user's cache dir
+cache_dir = None
+
+# Total size in bytes of all the entries
+max_cache_size = 256 * 1024 * 1024
+
+
+def get_cache_dir():
+    if cache_dir is not None:
+        return cache_dir
+    try:
+        import appdirs
+    except ImportError:
+        return None
+    return os.path.join(appdirs.user_cache_dir("atrip"), "parsed_images")
+
+
+def calc_cache_key(byte_data):
+    return hashlib.sha1(byte_data).hexdigest()
+
+
+class ParsedImageCache:
+    def __init__(self, dirname, max_size=None):
+        self.dirname = dirname
+        self.max_size = max_cache_size if max_size is None else max_size
+
+    def __str__(self):
+        return f"<ParsedImageCache {self.dirname}>"
+
+    def get_paths(self, key):
+        base = os.path.join(self.dirname, key)
+        return base + ".json", base + ".npz"
+
+    def __contains__(self, key):
+        return all(os.path.exists(p) for p in self.get_paths(key))
+
+    def load(self, key):
+        """Return the saved session dict and the list of decompressed data
+        of each container, or None if the entry isn't in the cache or can't
+        be used.
+        """
+        try:
+            import jsonpickle
+        except ImportError:
+            log.debug("parse cache: jsonpickle not installed; not loading")
+            return None
+        json_path, npz_path = self.get_paths(key)
+        try:
+            with open(json_path, "r") as fh:
+                e = jsonpickle.loads(fh.read())
+            if e.get("cache_version") != CACHE_VERSION or e.get("atrip_version") != __version__:
+                log.debug(f"parse cache: {key} made by a different version; ignoring")
+                return None
+            with np.load(npz_path) as npz:
+                item_data_list = [npz[f"item{i}"] for i in range(len(e["item_pathnames"]))]
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            log.warning(f"parse cache: removing unusable entry {key}: {err}")
+            self.remove(key)
+            return None
+        try:
+            # the modification time of the json file marks the last use
+            os.utime(json_path)
+        except OSError:
+            pass
+        return e, item_data_list
+
+    def save(self, key, collection):
+        try:
+            import jsonpickle
+        except ImportError:
+            log.debug("parse cache: jsonpickle not installed; not saving")
+            return False
+        e = {
+            "cache_version": CACHE_VERSION,
+            "atrip_version": __version__,
+            "decompression_order": collection.decompression_order,
+            "item_pathnames": [c.pathname for c in collection.containers],
+            "media_types": [c.media.__class__.__name__ for c in collection.containers],
+            "filesystems": [c.filesystem.__class__.__name__ for c in collection.containers],
+        }
+        collection.serialize_session(e)
+        json_path, npz_path = self.get_paths(key)
+        try:
+            text = jsonpickle.dumps(e)
+            # write to a temp file first so another process never sees a
+            # partial entry
+            write_atomic(npz_path, lambda fh: np.savez(fh, **{f"item{i}": c._data for i, c in enumerate(collection.containers)}))
+            write_atomic(json_path, lambda fh: fh.write(text.encode("utf-8")))
+        except Exception as err:
+            log.warning(f"parse cache: failed saving {key}: {err}")
+            self.remove(key)
+            return False
+        log.debug(f"parse cache: saved {key} for {collection.pathname}")
+        self.evict(keep=key)
+        return True
+
+    def remove(self, key):
+        for p in self.get_paths(key):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def calc_usage(self):
+        """Return a dict of key to (last used time, total size in bytes) of
+        each entry
+        """
+        usage = {}
+        for name in os.listdir(self.dirname):
+            key, ext = os.path.splitext(name)
+            if ext not in (".json", ".npz"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.dirname, name))
+            except OSError:
+                continue
+            last_used, size = usage.get(key, (0, 0))
+            if ext == ".json":
+                last_used = st.st_mtime
+            usage[key] = (last_used, size + st.st_size)
+        return usage
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the total size fits
+        in max_size, but never the entry `keep`.
+        """
+        usage = self.calc_usage()
+        total = sum(size for _, size in usage.values())
+        for key in sorted(usage, key=lambda k: usage[k][0]):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            log.debug(f"parse cache: evicting {key}")
+            self.remove(key)
+            total -= usage[key][1]
+
+
+def get_cache():
+    if not enabled:
+        return None
+    dirname = get_cache_dir()
+    if dirname is None:
+        return None
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    return ParsedImageCache(dirname)
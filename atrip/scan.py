@@ -0,0 +1,216 @@
+"""Batch identification of disk images
+
+Walks directories and identifies every file using a pool of worker
+processes, producing one result row for each container found (so archives
+with several disk images produce several rows). Rows are written as JSON
+lines or CSV as soon as they are available, and a scan can be resumed by
+pointing it at the output of a previous run: files whose path, modification
+time and size match a row already in the output are skipped.
+"""
+import os
+import sys
+import csv
+import json
+import contextlib
+import multiprocessing
+
+from . import errors
+from .collection import Collection
+from .signature import guess_signature_from_container
+from .utils import load_file
+
+import logging
+log = logging.getLogger(__name__)
+
+
+scan_fields = ["path", "mtime", "size", "item", "archive", "compression", "media", "filesystem", "signature", "error"]
+
+
+#### Worker process side
+
+def get_compression_names(decompression_order):
+    return [c.compression_algorithm for c in decompression_order if c.compression_algorithm != "none"]
+
+
+def scan_file(path_info):
+    """Identify the file and return a list of rows, one for each container.
+    """
+    # keep stray output from the parsers from getting mixed in with the
+    # results when they are written to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return calc_rows(*path_info)
+
+
+def calc_rows(pathname, mtime, size):
+    base = {"path": pathname, "mtime": mtime, "size": size}
+    try:
+        collection = Collection(pathname, load_file(pathname), use_cache=False)
+    except Exception as e:
+        log.debug(f"{pathname}: {e}")
+        return [dict(base, error=str(e) or e.__class__.__name__)]
+    rows = []
+    archive_compression = get_compression_names(collection.decompression_order)
+    for container in collection.containers:
+        row = dict(base)
+        row["item"] = container.pathname
+        row["archive"] = collection.archiver.archive_type
+        row["compression"] = ",".join(archive_compression + get_compression_names(container.decompression_order)) or "none"
+        row["media"] = container.media.ui_name if container.media is not None else ""
+        row["filesystem"] = container.filesystem.ui_name if container.filesystem is not None else ""
+        try:
+            sig = guess_signature_from_container(container)
+        except Exception as e:
+            row["error"] = f"signature: {e}"
+        else:
+            row["signature"] = sig.name if sig is not None else ""
+        rows.append(row)
+    if not rows:
+        rows.append(dict(base, error="no containers found"))
+    return rows
+
+
+#### Parent process side
+
+def iter_paths(paths, extensions=None):
+    """Yield a (pathname, mtime, size) tuple for every file in paths, which
+    can contain both files and directories to be searched recursively.
+
+    If extensions is specified, only files ending with one of the extensions
+    (case insensitive) are included.
+    """
+    if extensions:
+        extensions = tuple(e.lower() if e.startswith(".") else "." + e.lower() for e in extensions)
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if extensions and not name.lower().endswith(extensions):
+                        continue
+                    info = get_path_info(os.path.join(root, name))
+                    if info is not None:
+                        yield info
+        else:
+            info = get_path_info(path)
+            if info is not None:
+                yield info
+
+
+def get_path_info(pathname):
+    try:
+        stat = os.stat(pathname)
+    except OSError as e:
+        log.warning(f"skipping {pathname}: {e}")
+        return None
+    return (pathname, stat.st_mtime, stat.st_size)
+
+
+class ScanWriter:
+    """Write result rows to a stream in either JSON lines or CSV format
+    """
+    def __init__(self, fh, fmt="jsonl", write_header=True):
+        self.fh = fh
+        self.fmt = fmt
+        if fmt == "csv":
+            self.csv = csv.DictWriter(fh, scan_fields, extrasaction="ignore")
+            if write_header:
+                self.csv.writeheader()
+        elif fmt != "jsonl":
+            raise errors.InvalidScanFormat(f"Unknown scan output format {fmt}")
+
+    def write(self, rows):
+        for row in rows:
+            if self.fmt == "csv":
+                self.csv.writerow(row)
+            else:
+                self.fh.write(json.dumps(row) + "\n")
+        self.fh.flush()
+
+
+def guess_format(pathname):
+    return "csv" if pathname and pathname.lower().endswith(".csv") else "jsonl"
+
+
+def read_scanned_keys(pathname, fmt):
+    """Return the set of (pathname, mtime, size) tuples found in the output
+    of a previous scan.
+    """
+    keys = set()
+    if not os.path.exists(pathname):
+        return keys
+    with open(pathname, "r", newline="") as fh:
+        if fmt == "csv":
+            rows = csv.DictReader(fh)
+        else:
+            rows = []
+            for line in fh:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # last line of an interrupted scan may be incomplete
+                    continue
+        for row in rows:
+            try:
+                keys.add((row["path"], float(row["mtime"]), int(row["size"])))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return keys
+
+
+def truncate_partial_row(pathname, fmt):
+    """Remove the last row of the output of a previous scan if the scan was
+    interrupted in the middle of writing it, so new rows are appended after
+    the last complete row.
+    """
+    with open(pathname, "rb+") as fh:
+        data = fh.read()
+        end = data.rfind(b"\n")
+        if fmt == "csv":
+            # newlines inside quoted fields (e.g. a multi-line error) don't
+            # end a row
+            while end >= 0 and data.count(b'"', 0, end) % 2:
+                end = data.rfind(b"\n", 0, end)
+        end += 1
+        if end < len(data):
+            log.warning(f"resuming scan: removing incomplete last row of {pathname}")
+            fh.truncate(end)
+
+
+def scan(paths, output=None, fmt=None, num_workers=None, extensions=None, resume=True):
+    """Identify all files in paths, writing results to the output file (or
+    stdout if output is None). Returns the number of files scanned.
+    """
+    if fmt is None:
+        fmt = guess_format(output)
+    skip = set()
+    if output is not None and resume and os.path.exists(output):
+        truncate_partial_row(output, fmt)
+        skip = read_scanned_keys(output, fmt)
+        if skip:
+            log.info(f"resuming scan: skipping {len(skip)} previously scanned files")
+    todo = (info for info in iter_paths(paths, extensions) if info not in skip)
+
+    if output is None:
+        fh = sys.stdout
+        write_header = True
+    else:
+        write_header = not (resume and os.path.exists(output) and os.path.getsize(output) > 0)
+        fh = open(output, "a" if resume else "w", newline="")
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    count = 0
+    try:
+        writer = ScanWriter(fh, fmt, write_header)
+        if num_workers > 1:
+            with multiprocessing.Pool(num_workers) as pool:
+                for rows in pool.imap_unordered(scan_file, todo, chunksize=8):
+                    writer.write(rows)
+                    count += 1
+        else:
+            for info in todo:
+                writer.write(scan_file(info))
+                count += 1
+    finally:
+        if fh is not sys.stdout:
+            fh.close()
+    return count
@@ -9,6 +9,7 @@ import numpy as np
 from . import errors
 from . import utils
 from . import style_bits
+from .offset_map import calc_offset_map, calc_offset_map_from_ranges, RangeOffsetMap, ReverseOffsets
 from functools import reduce
 
 import logging
@@ -22,40 +23,73 @@ class ArrayWrapper:
     Numpy's fancy indexing can't be used for setting set values, so this
     intermediate layer is needed that defines the __setitem__ method that
     explicitly references the byte ordering in the data array.
+
+    If the byte ordering is a contiguous range of the data, operations work on
+    a view of the data and the offset array is never created. Otherwise,
+    integer and slice indexes are looked up in the ordering directly, and the
+    full offset array is only created for operations on the whole array.
+
+    If changed is specified, it is called after every write.
     """
 
-    def __init__(self, data, order):
+    def __init__(self, data, order, changed=None):
         self.np_data = data
         self.order = order
+        self.changed = changed
+        # indexing a memmap goes through python code in numpy, so single byte
+        # access uses a plain array of the same memory
+        self.raw = data.view(np.ndarray) if isinstance(data, np.memmap) else data
+        self.view = self.raw[order.as_index()] if order.is_contiguous else None
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self.order.as_index()
+        return self._index
 
     def __str__(self):
         return f"ArrayWrapper at {hex(id(self))} count={len(self)} order={self.order}"
 
     def __len__(self):
-        return np.alen(self.order)
+        return len(self.order)
 
     def __and__(self, other):
-        return self.np_data[self.order] & other
+        return self.np_data[self.index] & other
 
     def __iand__(self, other):
-        self.np_data[self.order] &= other
+        self.np_data[self.index] &= other
+        self.notify_changed()
         return self
 
     def __or__(self, other):
-        return self.np_data[self.order] | other
+        return self.np_data[self.index] | other
 
     def __ior__(self, other):
-        self.np_data[self.order] |= other
+        self.np_data[self.index] |= other
+        self.notify_changed()
         return self
 
     def __getitem__(self, index):
-        return self.np_data[self.order[index]]
+        if self.view is not None:
+            # always return a copy, like fancy indexing would
+            value = self.view[index]
+            return value.copy() if isinstance(value, np.ndarray) else value
+        return self.raw[self.order[index]]
 
     def __setitem__(self, index, value):
-        self.np_data[self.order[index]] = value
+        if self.view is not None:
+            self.view[index] = value
+        else:
+            self.raw[self.order[index]] = value
+        self.notify_changed()
+
+    def notify_changed(self):
+        if self.changed is not None:
+            self.changed()
 
     def tobytes(self):
-        return self.np_data[self.order].tobytes()
+        return self.np_data[self.index].tobytes()
 
 
 class Segment:
@@ -74,7 +108,7 @@ class Segment:
         if hasattr(container_or_segment, 'container_offset'):
             log.debug(f"creating {name},  {len(offset_list)} bytes from {container_or_segment}")
             # log.debug(f"  offset_list = {offset_list}")
-            offset_list = container_or_segment.container_offset[offset_list]
+            offset_list = container_or_segment.container_offset.compose(offset_list)
             container_or_segment = container_or_segment.container
 
         self.container = container_or_segment
@@ -95,21 +129,34 @@ class Segment:
         self.verbose_name = ""
         self.uuid = utils.uuid()
         self._reverse_offset = None
+        self._wrappers = {}
         self.segments = []
 
     #### properties
 
+    def get_wrapper(self, name):
+        """Return the ArrayWrapper for one of the container's arrays, reusing
+        the previous one if neither the array nor the offsets have changed.
+        """
+        array = getattr(self.container, name)
+        wrapper = self._wrappers.get(name, None)
+        if wrapper is None or wrapper.np_data is not array or wrapper.order is not self.container_offset:
+            changed = self.container.data_changed if name == "_data" else None
+            wrapper = ArrayWrapper(array, self.container_offset, changed)
+            self._wrappers[name] = wrapper
+        return wrapper
+
     @property
     def data(self):
-        return ArrayWrapper(self.container._data, self.container_offset)
+        return self.get_wrapper("_data")
 
     @property
     def style(self):
-        return ArrayWrapper(self.container._style, self.container_offset)
+        return self.get_wrapper("_style")
 
     @property
     def disasm_type(self):
-        return ArrayWrapper(self.container._disasm_type, self.container_offset)
+        return self.get_wrapper("_disasm_type")
 
     @property
     def reverse_offset(self):
@@ -118,7 +165,7 @@ class Segment:
         return self._reverse_offset
 
     def __len__(self):
-        return np.alen(self.container_offset)
+        return len(self.container_offset)
 
     #### dunder methods and convenience functions to operate on data (not style)
 
@@ -133,17 +180,17 @@ class Segment:
         return s
 
     def __and__(self, other):
-        return self.container._data[self.container_offset] & other
+        return self.data & other
 
     def __iand__(self, other):
-        self.container._data[self.container_offset] &= other
+        self.data.__iand__(other)
         return self
 
     def __getitem__(self, index):
-        return self.container._data[self.container_offset[index]]
+        return self.data[index]
 
     def __setitem__(self, index, value):
-        self.container._data[self.container_offset[index]] = value
+        self.data[index] = value
 
     #### iterator utilities
 
@@ -230,29 +277,24 @@ class Segment:
         try:
             start_offset = int(offset_or_offset_list)
         except TypeError:
-            offset_list = utils.to_numpy_list(offset_or_offset_list)
+            offset_list = calc_offset_map(utils.to_numpy_list(offset_or_offset_list))
         else:
             if length is None:
                 length = len(container_or_segment)
-            offset_list = np.arange(offset_or_offset_list, offset_or_offset_list + length, dtype=np.uint32)
+            offset_list = RangeOffsetMap(start_offset, length)
         return offset_list
 
     def enforce_offset_bounds(self, offset_list):
-        return offset_list[offset_list < len(self.container)]
+        return offset_list.clip(len(self.container))
 
     def calc_reverse_offsets(self):
-        # Initialize array to out of range
-        r = np.zeros(len(self.container), dtype=np.int32) - 1
-        r[self.container_offset] = np.arange(len(self), dtype=np.int32)
-        valid = np.where(r >= 0)[0]
-        if len(valid) != len(self):
-            raise errors.InvalidSegmentOrder
-        return r
+        # Raises InvalidSegmentOrder here rather than on the first lookup if
+        # the segment includes a container byte more than once
+        self.container_offset.reverse_lookup([])
+        return ReverseOffsets(self.container_offset, len(self.container))
 
     def calc_offsets_of_range(self, start, end):
-        in_here = np.arange(start, end, dtype=np.int32)
-        in_container = self.container_offset[in_here]
-        return in_container
+        return self.container_offset[start:end]
 
     def calc_index_from_other_segment(self, other_segment_index, other_segment):
         """Convert an index from another segment by mapping it to the container
@@ -260,7 +302,7 @@ class Segment:
         in this segment.
         """
         container_index = other_segment.container_offset[other_segment_index]
-        index = self.reverse_offset[container_index]
+        index = self.container_offset.reverse_lookup(container_index)
         return index
 
     def calc_indexes_from_other_segment(self, other_segment_indexes, other_segment):
@@ -269,7 +311,7 @@ class Segment:
         container index in this segment.
         """
         container_indexes = other_segment.container_offset[other_segment_indexes]
-        indexes = self.reverse_offset[container_indexes]
+        indexes = self.container_offset.reverse_lookup(container_indexes)
         return indexes
 
     #### creation
@@ -312,7 +354,7 @@ class Segment:
         for key in self.base_serializable_attributes + self.extra_serializable_attributes + self.dependent_file_attributes:
             key, value = get_value(key)
             state[key] = value
-        state['container_offset'] = utils.collapse_to_ranges(self.container_offset, compact=True)
+        state['container_offset'] = self.container_offset.to_ranges(compact=True)
         state['segments'] = self.segments
         return state
 
@@ -326,9 +368,7 @@ class Segment:
         """
         self.init_empty()
         size = state.pop('__size__')
-        raw = np.arange(size, dtype=np.uint32)
-        self.container_offset = raw
-        utils.restore_from_ranges(self.container_offset, state.pop('container_offset', []))
+        self.container_offset = calc_offset_map_from_ranges(state.pop('container_offset', []), size)
         self.segments = state.pop('segments')
 
         # Can't restore here because it would result in many unrelated copies
@@ -389,7 +429,7 @@ class Segment:
         return i >= 0 and i < len(self)
 
     def tobytes(self):
-        return self.container._data[self.container_offset].tobytes()
+        return self.data.tobytes()
 
     def calc_source_indexes_from_ranges(self, ranges):
         source_indexes = np.zeros(len(self.container), dtype=np.uint8)
@@ -410,7 +450,7 @@ class Segment:
         self.container.clear_style_at_indexes(indexes, **kwargs)
 
     def clear_style_bits(self, **kwargs):
-        self.container.clear_style_at_indexes(self.container_offset, **kwargs)
+        self.container.clear_style_at_indexes(self.container_offset.as_index(), **kwargs)
 
     def get_style_ranges(self, **kwargs):
         """Return a list of start, end pairs that match the specified style
@@ -560,14 +600,13 @@ class Segment:
     def get_comments_in_range(self, start, end):
         """Get a list of comments at specified indexes"""
         comments = {}
+        items = list(self.container.comments.items())
+        if not items:
+            return comments
 
-        # Naive way, but maybe it's fast enough: loop over all comments
-        # gathering those within the bounds
-        for rawindex, comment in self.container.comments.items():
-            try:
-                index = self.get_index_from_base_index(rawindex)
-            except IndexError:
-                continue
+        # look up all the comments at once, keeping those within the bounds
+        indexes = self.container_offset.reverse_lookup([rawindex for rawindex, _ in items])
+        for index, (rawindex, comment) in zip(indexes.tolist(), items):
             if index >= start and index < end:
                 comments[index] = comment
         return comments
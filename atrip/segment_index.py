@@ -0,0 +1,108 @@
+"""Reverse lookup from container byte to the segments that contain it
+
+Every segment's offset map is broken into runs of consecutive container
+offsets. The start and end of all the runs split the container into
+elementary intervals, each of which is covered by exactly the same set of
+runs for every byte inside it. Storing the list of covering runs for each
+elementary interval means a lookup is a binary search to find the interval
+followed by reading its runs, no matter how many segments there are.
+
+Segments nest (disk image, directory, dirent, file) so each byte is typically
+covered by only a handful of runs and the index stays small.
+"""
+import numpy as np
+
+from . import utils
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class SegmentIndex:
+    """Index of all the runs of a list of segments that share a container.
+    """
+    def __init__(self, segments):
+        self.segments = list(segments)
+        self.segment_order = {id(s): i for i, s in enumerate(self.segments)}
+        starts = [np.zeros(0, dtype=np.int64)]
+        lengths = [np.zeros(0, dtype=np.int64)]
+        segment_nums = [np.zeros(0, dtype=np.int64)]
+        segment_index = [np.zeros(0, dtype=np.int64)]
+        for i, s in enumerate(self.segments):
+            run_starts, run_lengths = s.container_offset.calc_runs()
+            run_lengths = np.asarray(run_lengths, dtype=np.int64)
+            starts.append(np.asarray(run_starts, dtype=np.int64))
+            lengths.append(run_lengths)
+            segment_nums.append(np.full(len(run_starts), i, dtype=np.int64))
+            # segment index of the first byte in each run
+            segment_index.append(np.cumsum(run_lengths) - run_lengths)
+        self.run_starts = np.concatenate(starts)
+        self.run_lengths = run_lengths = np.concatenate(lengths)
+        self.run_segment_nums = np.concatenate(segment_nums)
+        self.run_segment_index = np.concatenate(segment_index)
+
+        run_ends = self.run_starts + run_lengths
+        self.breakpoints = np.unique(np.concatenate((self.run_starts, run_ends)))
+        first = np.searchsorted(self.breakpoints, self.run_starts)
+        counts = np.searchsorted(self.breakpoints, run_ends) - first
+        intervals = utils.concat_ranges(first, counts, dtype=np.int64)
+        runs = np.repeat(np.arange(len(self.run_starts)), counts)
+
+        # sorting by run number within each interval keeps the results in
+        # the same order as the list of segments
+        order = np.lexsort((runs, intervals))
+        self.interval_runs = runs[order]
+        num_intervals = max(len(self.breakpoints) - 1, 0)
+        self.interval_ptr = np.concatenate(([0], np.cumsum(np.bincount(intervals, minlength=num_intervals))))
+
+    def __str__(self):
+        return f"<SegmentIndex {len(self.segments)} segments, {len(self.run_starts)} runs, {len(self.interval_runs)} entries>"
+
+    def find_runs(self, container_index):
+        interval = int(np.searchsorted(self.breakpoints, container_index, side="right")) - 1
+        if interval < 0 or interval >= len(self.breakpoints) - 1:
+            return self.interval_runs[0:0]
+        return self.interval_runs[self.interval_ptr[interval]:self.interval_ptr[interval + 1]]
+
+    def find_segments(self, container_index):
+        """Return a list of (segment, index) tuples for every segment that
+        includes the container byte, where index is the position of that byte
+        in the segment.
+        """
+        found = []
+        for run in self.find_runs(container_index).tolist():
+            segment = self.segments[self.run_segment_nums[run]]
+            index = int(self.run_segment_index[run] + container_index - self.run_starts[run])
+            found.append((segment, index))
+        return found
+
+    def find_segments_with_range(self, start, end):
+        """Return a list of (segment, index) tuples for every segment that
+        includes all the container bytes from start to end (not inclusive)
+        in a row, where index is the position of the start byte in the
+        segment.
+        """
+        found = []
+        for run in self.find_runs(start).tolist():
+            if self.run_starts[run] + self.run_lengths[run] >= end:
+                segment = self.segments[self.run_segment_nums[run]]
+                index = int(self.run_segment_index[run] + start - self.run_starts[run])
+                found.append((segment, index))
+        return found
+
+    def get_segment_number(self, segment):
+        return self.segment_order.get(id(segment), -1)
+
+    def map_indexes(self, from_segment, indexes, to_segment):
+        """Return the index in to_segment of each index in from_segment, or -1
+        if the byte isn't in to_segment.
+        """
+        container_indexes = from_segment.container_offset[indexes]
+        return to_segment.container_offset.reverse_lookup(container_indexes)
+
+    def map_range(self, from_segment, start, end, to_segment):
+        """Return the indexes in to_segment for the range of indexes start to
+        end (not inclusive) in from_segment, with -1 for bytes that aren't in
+        to_segment.
+        """
+        return self.map_indexes(from_segment, slice(start, end), to_segment)
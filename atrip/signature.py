@@ -1,11 +1,41 @@
+"""Identify known images by the SHA1 of their data
+
+The known SHA1 values are in the modules listed under the `atrip.signatures`
+entry point, each with a `sha1_signatures` dict mapping a MIME type to a dict
+of digests and names. Some of these are thousands of lines of bytes literals,
+so instead of importing them all and checking every dict, lookups use an index
+compiled from them: a single file holding the sorted digests, memory mapped
+the first time it's needed. After changing a signature module, rebuild the
+index with `atrip signatures`.
+
+The index file starts with a header (magic, number of signatures, number of
+MIME types) followed by these arrays:
+
+* MIME type string offsets: uint32[num_mimes + 1]
+* name string offsets: uint32[count + 1]
+* digests, sorted: 20 bytes each
+* MIME type index of each digest: uint16[count]
+* the MIME type and name strings in UTF-8
+"""
+import os
 import pkg_resources
 
 import numpy as np
 
+from . import errors
+from .utils import write_atomic
+
 import logging
 log = logging.getLogger(__name__)
 
 
+index_path = os.path.join(os.path.dirname(__file__), "signatures", "sha1_signatures.idx")
+
+index_magic = b"ATRSHA1\x01"
+
+index_header_dtype = np.dtype([("magic", "S8"), ("count", "<u4"), ("num_mimes", "<u4")])
+
+
 _signatures = None
 
 def _find_signatures():
@@ -34,22 +64,142 @@ class Signature:
         return f"{self.mime}: {self.name}"
 
 
+class SignatureIndex:
+    """Lookup table of SHA1 digests, using the arrays of an index file in
+    place so nothing is decoded until a digest is found.
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        if len(raw) < index_header_dtype.itemsize:
+            raise errors.InvalidSignatureIndex("Signature index too short")
+        header = raw[0:index_header_dtype.itemsize].view(index_header_dtype)[0]
+        if header["magic"] != index_magic:
+            raise errors.InvalidSignatureIndex("Unknown signature index format")
+        self.count = int(header["count"])
+        self.num_mimes = int(header["num_mimes"])
+        offset = index_header_dtype.itemsize
+        self.mime_offsets, offset = self.get_array(offset, self.num_mimes + 1, "<u4")
+        self.name_offsets, offset = self.get_array(offset, self.count + 1, "<u4")
+        self.digests_start = offset
+        self.digests, offset = self.get_array(offset, self.count, "S20")
+        self.mime_index, offset = self.get_array(offset, self.count, "<u2")
+        self.strings_start = offset
+        if len(raw) != self.strings_start + self.mime_offsets[-1] + self.name_offsets[-1]:
+            raise errors.InvalidSignatureIndex("Signature index size mismatch")
+
+    def __len__(self):
+        return self.count
+
+    def get_array(self, offset, count, dtype):
+        dtype = np.dtype(dtype)
+        end = offset + count * dtype.itemsize
+        if end > len(self.raw):
+            raise errors.InvalidSignatureIndex("Signature index truncated")
+        return self.raw[offset:end].view(dtype), end
+
+    @classmethod
+    def from_file(cls, pathname):
+        return cls(np.memmap(pathname, dtype=np.uint8, mode="r"))
+
+    def get_string(self, offsets, index, base):
+        start = self.strings_start + base + offsets[index]
+        end = self.strings_start + base + offsets[index + 1]
+        return self.raw[start:end].tobytes().decode("utf-8")
+
+    def lookup(self, digest):
+        """Return the `Signature` for the SHA1 digest, or None"""
+        i = int(np.searchsorted(self.digests, digest))
+        if i >= self.count:
+            return None
+        start = self.digests_start + i * 20
+        # compare the raw bytes; numpy strips trailing nulls from S20 items
+        if self.raw[start:start + 20].tobytes() != digest:
+            return None
+        mime = self.get_string(self.mime_offsets, self.mime_index[i], 0)
+        name = self.get_string(self.name_offsets, i, self.mime_offsets[-1])
+        return Signature(mime, name)
+
+
+def iter_signatures():
+    """Yield the digest, MIME type and name of each signature in the
+    signature modules. If a digest appears more than once, only the first is
+    used.
+    """
+    seen = set()
+    for mod in find_signatures():
+        for mime, sigs in mod.sha1_signatures.items():
+            for digest, name in sigs.items():
+                if digest not in seen:
+                    seen.add(digest)
+                    yield digest, mime, name
+
+
+def build_index(signatures):
+    """Return the contents of an index file for a list of (digest, MIME
+    type, name) tuples
+    """
+    signatures = sorted(signatures)
+    mimes = sorted(set([s[1] for s in signatures]))
+    mime_lookup = {m: i for i, m in enumerate(mimes)}
+    mime_strings = [m.encode("utf-8") for m in mimes]
+    name_strings = [s[2].encode("utf-8") for s in signatures]
+
+    header = np.zeros(1, dtype=index_header_dtype)
+    header["magic"] = index_magic
+    header["count"] = len(signatures)
+    header["num_mimes"] = len(mimes)
+    parts = [
+        header.tobytes(),
+        np.cumsum([0] + [len(m) for m in mime_strings], dtype="<u4").tobytes(),
+        np.cumsum([0] + [len(n) for n in name_strings], dtype="<u4").tobytes(),
+        b"".join([s[0] for s in signatures]),
+        np.asarray([mime_lookup[s[1]] for s in signatures], dtype="<u2").tobytes(),
+        b"".join(mime_strings),
+        b"".join(name_strings),
+    ]
+    return b"".join(parts)
+
+
+def rebuild_index(pathname=None):
+    """Compile the signature modules into the index file and return the
+    number of signatures
+    """
+    global _index
+
+    if pathname is None:
+        pathname = index_path
+    data = build_index(iter_signatures())
+    write_atomic(pathname, lambda fh: fh.write(data))
+    _index = None
+    index = SignatureIndex(np.frombuffer(data, dtype=np.uint8))
+    log.info(f"wrote {len(index)} signatures to {pathname}")
+    return len(index)
+
+
+_index = None
+
+def get_index():
+    global _index
+
+    if _index is None:
+        try:
+            _index = SignatureIndex.from_file(index_path)
+        except (OSError, ValueError, errors.InvalidSignatureIndex) as e:
+            log.warning(f"signature index {index_path} unusable ({e}); building from signature modules")
+            data = build_index(iter_signatures())
+            _index = SignatureIndex(np.frombuffer(data, dtype=np.uint8))
+    return _index
+
+
 def guess_signature_from_container(container, verbose=False):
-    found = None
     sha_hash = container.sha1
     log.debug(f"container: {container}; sha1={sha_hash}")
-    for mod in find_signatures():
-        for mime, sigs in mod.sha1_signatures.items():
-            try:
-                name = sigs[sha_hash]
-            except KeyError:
-                continue
-            else:
-                log.debug(f"found match: {name}")
-                return Signature(mime, name)
+    found = get_index().lookup(sha_hash)
+    if found is not None:
+        log.debug(f"found match: {found.name}")
     else:
         log.debug(f"no match found in sha1 signature database")
-    return None
+    return found
 
 
 # different than the above mime_parse_order, this list is the order in which
@@ -1,4 +1,8 @@
+import io
+import os
 import types
+import shutil
+import tempfile
 import uuid as stdlib_uuid
 
 import numpy as np
@@ -22,7 +26,11 @@ def uuid():
 
 
 def to_numpy(value):
-    if type(value) is np.ndarray:
+    if isinstance(value, np.memmap) and value.mode == "c":
+        # copy-on-write mapping of a file: it's already private to this array
+        # and pages only get copied if they are modified
+        return value
+    if isinstance(value, np.ndarray):
         # force copy to make sure we aren't pointing to an immutable array
         return value.copy()
     elif type(value) is bytes:
@@ -32,6 +40,112 @@ def to_numpy(value):
     raise TypeError("Can't convert to numpy data")
 
 
+def load_file(pathname):
+    """Return the contents of the file as a uint8 numpy array.
+
+    The file is memory mapped in copy-on-write mode, so data is only read
+    from disk when it's accessed and modifications are never written back
+    to the file.
+    """
+    if os.path.getsize(pathname) == 0:
+        # can't mmap an empty file
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(pathname, dtype=np.uint8, mode="c")
+
+
+def write_atomic(pathname, write_func):
+    """Call write_func with a file opened for writing in binary mode, and
+    replace pathname with its contents only if write_func succeeds.
+
+    The data is written to a temporary file in the same directory and then
+    renamed, so another process never sees a partially written file and a
+    failure leaves the original file untouched. The permissions of the
+    original file are kept; a new file gets the same permissions as if it
+    had been created with open().
+    """
+    dirname = os.path.dirname(os.path.abspath(pathname))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            write_func(fh)
+        try:
+            shutil.copymode(pathname, tmp_path)
+        except FileNotFoundError:
+            # mkstemp always creates the file as 0600
+            os.chmod(tmp_path, 0o666 & ~get_umask())
+        os.replace(tmp_path, pathname)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def get_umask():
+    # the only way to read the umask is to set it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def get_extracted_filename(filename, lower_case=False, ext=None):
+    """Return the name on the local filesystem of a file extracted from a
+    disk image, optionally converted to lower case and with an added
+    extension.
+    """
+    filename = filename.replace(os.sep, "_")
+    if lower_case:
+        filename = filename.lower()
+    if ext:
+        filename += "." + ext.lstrip(".")
+    return filename
+
+
+class ArrayReader(io.RawIOBase):
+    """Read-only file-like object that reads from a numpy array (or anything
+    supporting the buffer protocol) without making a copy of it
+    """
+    def __init__(self, data):
+        self.view = memoryview(data).cast("B")
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self.pos = offset
+        return self.pos
+
+    def readinto(self, b):
+        count = max(min(len(b), len(self.view) - self.pos), 0)
+        b[:count] = self.view[self.pos:self.pos + count]
+        self.pos += count
+        return count
+
+
+def concat_ranges(starts, lengths, dtype=np.uint32):
+    """Return the concatenation of np.arange(start, start + length) for each
+    start, length pair, without looping in python
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=dtype)
+    run_starts = np.cumsum(lengths) - lengths
+    offsets = np.repeat(np.asarray(starts, dtype=np.int64) - run_starts, lengths) + np.arange(total)
+    return offsets.astype(dtype)
+
+
 def to_numpy_list(value):
     if type(value) is np.ndarray:
         return value
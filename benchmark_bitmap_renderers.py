@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Compare per-frame render times of the mask-per-color compositor used by
+the bitmap renderers before the styled color lookup table and the lookup
+table that replaced it.
+
+usage: benchmark_bitmap_renderers.py [bytes per row] [number of rows] [repeat count]
+"""
+import sys
+import time
+
+import numpy as np
+
+from atrip import style_bits
+from omnivore.arch import colors
+
+
+highlight_color = (100, 200, 255)
+match_color = (250, 250, 0)
+comment_color = (200, 0, 200)
+background_color = (255, 255, 255)
+data_color = (224, 224, 224)
+ignore_mask = style_bits.not_user_bit_mask & (0xff ^ style_bits.diff_bit_mask)
+
+
+def render_with_masks(pixels, style_per_pixel, color_registers):
+    normal = (style_per_pixel & ignore_mask) == 0
+    highlight = (style_per_pixel & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
+    data = (style_per_pixel & style_bits.data_bit_mask) == style_bits.data_bit_mask
+    comment = (style_per_pixel & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
+    match = (style_per_pixel & style_bits.match_bit_mask) == style_bits.match_bit_mask
+
+    h_colors = colors.get_blended_color_registers(color_registers, highlight_color)
+    m_colors = colors.get_blended_color_registers(color_registers, match_color)
+    c_colors = colors.get_blended_color_registers(color_registers, comment_color)
+    d_colors = colors.get_dimmed_color_registers(color_registers, background_color, data_color)
+    bitimage = np.empty(pixels.shape + (3,), dtype=np.uint8)
+    for i in range(len(color_registers)):
+        color_is_set = (pixels == i)
+        bitimage[color_is_set & normal] = color_registers[i]
+        bitimage[color_is_set & data] = d_colors[i]
+        bitimage[color_is_set & comment] = c_colors[i]
+        bitimage[color_is_set & match] = m_colors[i]
+        bitimage[color_is_set & highlight] = h_colors[i]
+    return bitimage
+
+
+def render_with_table(pixels, style_per_pixel, color_registers):
+    table = colors.StyledColorTable(color_registers, highlight_color, match_color, comment_color, background_color, data_color)
+    return table.get_rgb(pixels, style_per_pixel)
+
+
+def timeit(func, repeat, *args):
+    start = time.perf_counter()
+    for i in range(repeat):
+        result = func(*args)
+    return (time.perf_counter() - start) / repeat, result
+
+
+if __name__ == "__main__":
+    bytes_per_row = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    nr = int(sys.argv[2]) if len(sys.argv) > 2 else 192
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    rng = np.random.RandomState(0)
+    byte_values = rng.randint(0, 256, bytes_per_row * nr).astype(np.uint8)
+    style = rng.choice([0, 0, 0, 0, style_bits.data_bit_mask, style_bits.comment_bit_mask, style_bits.match_bit_mask, style_bits.selected_bit_mask], len(byte_values)).astype(np.uint8)
+
+    print(("%d bytes per row, %d rows, average of %d renders" % (bytes_per_row, nr, repeat)))
+    for bpp in [1, 2, 4]:
+        pixels_per_byte = 8 // bpp
+        shifts = np.arange(8 - bpp, -1, -bpp, dtype=np.uint8)
+        pixels = (byte_values[:, np.newaxis] >> shifts) & ((1 << bpp) - 1)
+        style_per_pixel = np.repeat(style, pixels_per_byte).reshape(pixels.shape)
+        color_registers = [(i * 16, 255 - i * 16, (i * 40) % 256) for i in range(1 << bpp)]
+
+        old, old_image = timeit(render_with_masks, repeat, pixels, style_per_pixel, color_registers)
+        new, new_image = timeit(render_with_table, repeat, pixels, style_per_pixel, color_registers)
+        same = np.array_equal(old_image, new_image)
+        print(("%dbpp: masks %8.3fms  table %8.3fms  (%.1fx) identical=%s" % (bpp, old * 1000, new * 1000, old / new, same)))
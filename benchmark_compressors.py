@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Compare the throughput of the pure Python DCM and Unix compress (LZW)
+codecs with the compiled versions in atrip.compressors.compress_speedups,
+using the DCM and .Z files in the samples directory. Throughput is measured
+in MB/s of uncompressed data.
+
+usage: benchmark_compressors.py [repeat count] [sample directory]
+"""
+import os
+import sys
+import glob
+import time
+
+import numpy as np
+
+from atrip.compressors import dcm, unix_compress
+from atrip.container import Container
+from atrip.media_type import guess_media_type
+
+
+def timeit(func, repeat, *args):
+    start = time.perf_counter()
+    for i in range(repeat):
+        result = func(*args)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def report(name, num_bytes, python, compiled, same):
+    mb = num_bytes / 1024 / 1024
+    text = "  %-7s python %8.2f MB/s" % (name, mb / python)
+    if compiled is not None:
+        text += "  compiled %8.2f MB/s  (%.1fx) identical=%s" % (mb / compiled, python / compiled, same)
+    print(text)
+
+
+def benchmark_dcm(pathname, repeat):
+    compressor = dcm.DCMCompressor()
+    packed = open(pathname, "rb").read()
+    python, unpacked = timeit(compressor.calc_unpacked_data_python, repeat, packed)
+    compiled = same = None
+    if dcm.speedups is not None:
+        compiled, result = timeit(dcm.speedups.unpack_dcm, repeat, packed)
+        same = result == unpacked
+    print("%s: %d bytes, %d uncompressed" % (os.path.basename(pathname), len(packed), len(unpacked)))
+    report("decode", len(unpacked), python, compiled, same)
+
+    container = Container(np.frombuffer(unpacked, dtype=np.uint8))
+    media = guess_media_type(container)
+    python, repacked = timeit(compressor.calc_packed_data_python, repeat, media.data, media)
+    if dcm.speedups is not None:
+        compiled, result = timeit(compressor.calc_packed_data, repeat, media.data, media)
+        same = result == repacked
+    report("encode", len(unpacked), python, compiled, same)
+
+
+def benchmark_lzw(pathname, repeat):
+    packed = open(pathname, "rb").read()
+    python, unpacked = timeit(unix_compress.unlzw, repeat, packed)
+    compiled = same = None
+    if unix_compress.speedups is not None:
+        compiled, result = timeit(unix_compress.speedups.unlzw, repeat, packed)
+        same = result == unpacked
+    print("%s: %d bytes, %d uncompressed" % (os.path.basename(pathname), len(packed), len(unpacked)))
+    report("decode", len(unpacked), python, compiled, same)
+
+    python, repacked = timeit(unix_compress.lzw, repeat, unpacked)
+    if unix_compress.speedups is not None:
+        compiled, result = timeit(unix_compress.speedups.lzw, repeat, unpacked)
+        same = result == repacked
+    report("encode", len(unpacked), python, compiled, same)
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sample_dir = sys.argv[2] if len(sys.argv) > 2 else "samples"
+    if dcm.speedups is None:
+        print("compress_speedups not built; only timing the Python versions")
+    print("average of %d runs" % repeat)
+    for pathname in sorted(glob.glob(os.path.join(sample_dir, "*.dcm"))):
+        benchmark_dcm(pathname, repeat)
+    for pathname in sorted(glob.glob(os.path.join(sample_dir, "*.Z"))):
+        benchmark_lzw(pathname, repeat)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Compare the time to identify the compressors, archiver, media type and
+filesystem of each file in the samples directory by trying every registered
+class with the time when the classes are first ranked by the cheap
+predicates in atrip.detect, and check that both find the same formats.
+
+usage: benchmark_detection.py [repeat count] [sample directory]
+"""
+import os
+import sys
+import glob
+import time
+import logging
+
+from atrip.utils import load_file
+from atrip.container import Container
+from atrip.compressor import guess_compressor_list, find_compressors
+from atrip.archiver import find_container_items_in_archive, find_archivers
+from atrip.media_type import guess_media_type, find_media_types
+from atrip.filesystem import guess_filesystem, find_filesystems
+
+stages = ["compressor", "archiver", "media", "filesystem"]
+
+
+def identify(pathname, byte_data, exhaustive, times):
+    def candidates(find):
+        return find() if exhaustive else None
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        times[stage] += time.perf_counter() - start
+        return result
+
+    data, compressors = timed("compressor", guess_compressor_list, byte_data, candidates(find_compressors))
+    archiver, items = timed("archiver", find_container_items_in_archive, pathname, data, candidates(find_archivers))
+    found = [[c.compression_algorithm for c in compressors], str(archiver)]
+    for item_pathname, item_data in items:
+        if archiver.supports_multiple_containers:
+            item_data, compressors = timed("compressor", guess_compressor_list, item_data, candidates(find_compressors))
+        container = Container(item_data, compressors)
+        media = timed("media", guess_media_type, container, candidates(find_media_types))
+        container.media = media
+        filesystem = timed("filesystem", guess_filesystem, media, candidates(find_filesystems))
+        found.append((media.ui_name, filesystem.ui_name))
+    return found
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sample_dir = sys.argv[2] if len(sys.argv) > 2 else "samples"
+    logging.disable(logging.CRITICAL)
+    totals = {True: dict.fromkeys(stages, 0.0), False: dict.fromkeys(stages, 0.0)}
+    print("average of %d runs, times in ms" % repeat)
+    print("%-40s %9s %9s" % ("file", "trial all", "detect"))
+    for pathname in sorted(glob.glob(os.path.join(sample_dir, "*"))):
+        if os.path.isdir(pathname) or pathname.endswith(".omnivore"):
+            continue
+        byte_data = load_file(pathname)
+        if len(byte_data) == 0:
+            continue
+        results = {}
+        elapsed = {}
+        for exhaustive in [True, False]:
+            times = dict.fromkeys(stages, 0.0)
+            for i in range(repeat):
+                results[exhaustive] = identify(pathname, byte_data, exhaustive, times)
+            for stage in stages:
+                totals[exhaustive][stage] += times[stage] / repeat
+            elapsed[exhaustive] = sum(times.values()) / repeat
+        same = results[True] == results[False]
+        print("%-40s %9.3f %9.3f %s" % (os.path.basename(pathname), elapsed[True] * 1000, elapsed[False] * 1000, "" if same else "MISMATCH %s" % results))
+    print()
+    for stage in stages:
+        before = totals[True][stage]
+        after = totals[False][stage]
+        print("%-10s trial all %9.3fms  detect %9.3fms  (%.1fx)" % (stage, before * 1000, after * 1000, before / after if after > 0 else 0))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""Compare the speed of normal and turbo frame stepping
+
+usage: benchmark_run_frames.py [emulator name] [number of frames] [boot file]
+"""
+import sys
+import time
+
+import omnivore.emulator
+import omnivore.errors as errors
+
+
+def run_normal(emu, num_frames):
+    start = time.perf_counter()
+    end = emu.current_frame_number + num_frames
+    while emu.current_frame_number < end:
+        emu.next_frame()
+    return num_frames / (time.perf_counter() - start)
+
+
+def run_turbo(emu, num_frames):
+    emu.run_frames(num_frames, turbo=True)
+    return emu.frames_per_second
+
+
+if __name__ == "__main__":
+    emu_name = sys.argv[1] if len(sys.argv) > 1 else "atari800"
+    num_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    bootfile = sys.argv[3] if len(sys.argv) > 3 else None
+    try:
+        emu_cls = omnivore.emulator.find_emulator(emu_name)
+    except errors.UnknownEmulatorError:
+        print(("Unknown emulator: %s" % emu_name))
+    else:
+        print(("Emulating: %s, %d frames" % (emu_cls.ui_name, num_frames)))
+        emu = emu_cls()
+        emu.configure_emulator()
+        if bootfile:
+            emu.boot_from_file(bootfile)
+        normal = run_normal(emu, num_frames)
+        print(("next_frame:         %8.1f fps" % normal))
+        turbo = run_turbo(emu, num_frames)
+        print(("run_frames (turbo): %8.1f fps  (%.1fx)" % (turbo, turbo / normal)))
+        emu.end_emulation()
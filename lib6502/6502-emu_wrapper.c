@@ -425,11 +425,8 @@ void lib6502_show_next_instruction(emulator_history_t *history)
 	}
 }
 
-int lib6502_next_frame(history_input_t *input, output_t *output, breakpoints_t *breakpoints, emulator_history_t *history)
+static void lib6502_start_frame(history_input_t *input, frame_status_t *status)
 {
-	int bpid;
-	frame_status_t *status = &output->status;
-
 	if (apple2_mode) {
 		if (input->keychar > 0) {
 			printf("lib6502_next_frame: apple2_mode key = %x\n", input->keychar);
@@ -449,11 +446,38 @@ int lib6502_next_frame(history_input_t *input, output_t *output, breakpoints_t *
 		tv_cycle = status->current_cycle_in_frame;
 		tv_line = 0;
 	}
+}
+
+int lib6502_next_frame(history_input_t *input, output_t *output, breakpoints_t *breakpoints, emulator_history_t *history)
+{
+	int bpid;
+	frame_status_t *status = &output->status;
+
+	lib6502_start_frame(input, status);
 	bpid = libdebugger_calc_frame(&lib6502_calc_frame, memory, status, breakpoints, history);
 	lib6502_get_current_state(output);
 	return bpid;
 }
 
+/* Run up to num_frames frames without recording CPU history, only updating
+ the output state after the last frame. Returns early if a breakpoint is hit. */
+int lib6502_run_frames(history_input_t *input, output_t *output, breakpoints_t *breakpoints, int num_frames)
+{
+	int bpid = -1;
+	frame_status_t *status = &output->status;
+
+	while (num_frames > 0) {
+		lib6502_start_frame(input, status);
+		bpid = libdebugger_calc_frame(&lib6502_calc_frame, memory, status, breakpoints, NULL);
+		if (status->frame_status == FRAME_FINISHED) {
+			num_frames--;
+		}
+		if (bpid >= 0) break;
+	}
+	lib6502_get_current_state(output);
+	return bpid;
+}
+
 void lib6502_set_a2_emulation_mode(int mode) {
 	if (mode) apple2_mode = 1;
 	else apple2_mode = 0;
@@ -92,6 +92,7 @@ int lib6502_register_callback(uint16_t token, uint16_t addr);
 int lib6502_step_cpu(output_t *output, history_6502_t *entry, breakpoints_t *breakpoints);
 
 int lib6502_next_frame(history_input_t *input, output_t *output, breakpoints_t *state, emulator_history_t *history);
+int lib6502_run_frames(history_input_t *input, output_t *output, breakpoints_t *state, int num_frames);
 
 void lib6502_show_next_instruction(emulator_history_t *history);
 
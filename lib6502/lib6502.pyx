@@ -6,6 +6,7 @@ cdef extern:
     int lib6502_clear_state_arrays(np.uint8_t *buf, np.uint8_t *buf)
     int lib6502_configure_state_arrays(np.uint8_t *buf, np.uint8_t *buf)
     int lib6502_next_frame(np.uint8_t *buf, np.uint8_t *buf, np.uint8_t *buf, np.uint8_t *buf)
+    int lib6502_run_frames(np.uint8_t *buf, np.uint8_t *buf, np.uint8_t *buf, int num_frames)
     void lib6502_show_next_instruction(np.uint8_t *buf)
     void lib6502_get_current_state(np.uint8_t *buf)
     void lib6502_restore_state(np.uint8_t *buf)
@@ -48,6 +49,17 @@ def next_frame(np.ndarray input not None, np.ndarray output not None, np.ndarray
     bpid = lib6502_next_frame(&ibuf[0], &obuf[0], &dbuf[0], hbuf)
     return bpid
 
+def run_frames(np.ndarray input not None, np.ndarray output not None, np.ndarray breakpoints not None, int num_frames):
+    cdef np.uint8_t[:] ibuf
+    cdef np.uint8_t[:] obuf
+    cdef np.uint8_t[:] dbuf
+
+    ibuf = input.view(np.uint8)
+    obuf = output.view(np.uint8)
+    dbuf = breakpoints.view(np.uint8)
+    bpid = lib6502_run_frames(&ibuf[0], &obuf[0], &dbuf[0], num_frames)
+    return bpid
+
 def show_next_instruction(history_storage):
     cdef np.uint8_t *hbuf
     cdef np.uint8_t[:] tmp
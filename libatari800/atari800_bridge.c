@@ -409,6 +409,30 @@ int a8bridge_next_frame(input_template_t *input, output_template_t *output, brea
 	return bpid;
 }
 
+/* Run up to num_frames frames without returning to Python in between. No
+ CPU history is recorded and the state save and screen copy are only done
+ once, after the last frame. Returns early if a breakpoint is hit. */
+int a8bridge_run_frames(input_template_t *input, output_template_t *output, breakpoints_t *breakpoints, int num_frames)
+{
+	int bpid = -1;
+
+	LIBATARI800_Input_array = input;
+	while (num_frames > 0) {
+		INPUT_key_code = PLATFORM_Keyboard();
+		bpid = libdebugger_calc_frame(&a8bridge_calc_frame, MEMORY_mem, &output->status, breakpoints, NULL);
+		if (output->status.frame_status == FRAME_FINISHED) {
+			num_frames--;
+		}
+		if (bpid >= 0) break;
+	}
+
+	LIBATARI800_StateSave(output->current.state, &output->current.tags);
+	if (output->status.frame_status == FRAME_FINISHED) {
+		copy_screen(output->video);
+	}
+	return bpid;
+}
+
 void a8bridge_show_current_instruction(history_atari800_t *entry) {
 	int count;
 	uint8_t opcode;
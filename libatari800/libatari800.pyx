@@ -9,6 +9,7 @@ cdef extern:
     void a8bridge_get_current_state(void *output)
     void a8bridge_restore_state(void *restore)
     int a8bridge_next_frame(void *input, void *output, void *breakpoints, void *history)
+    int a8bridge_run_frames(void *input, void *output, void *breakpoints, int num_frames)
     void a8bridge_show_next_instruction(void *history)
 
     int libatari800_mount_disk_image(int diskno, const char *filename, int readonly)
@@ -76,6 +77,17 @@ def next_frame(np.ndarray input not None, np.ndarray output not None, np.ndarray
     bpid = a8bridge_next_frame(&ibuf[0], &obuf[0], &dbuf[0], hbuf)
     return bpid
 
+def run_frames(np.ndarray input not None, np.ndarray output not None, np.ndarray breakpoints not None, int num_frames):
+    cdef np.uint8_t[:] ibuf
+    cdef np.uint8_t[:] obuf
+    cdef np.uint8_t[:] dbuf
+
+    ibuf = input.view(np.uint8)
+    obuf = output.view(np.uint8)
+    dbuf = breakpoints.view(np.uint8)
+    bpid = a8bridge_run_frames(&ibuf[0], &obuf[0], &dbuf[0], num_frames)
+    return bpid
+
 def show_next_instruction(history_storage):
     cdef np.uint8_t *hbuf
     cdef np.uint8_t[:] tmp
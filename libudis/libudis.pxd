@@ -45,6 +45,6 @@ cdef struct jmp_targets_t:
     np.uint8_t discovered[256*256];
     label_storage_t *labels;
 
-ctypedef int (*parse_func_t)(history_entry_t *, unsigned char *, unsigned int, unsigned int, jmp_targets_t *)
+ctypedef int (*parse_func_t)(history_entry_t *, unsigned char *, unsigned int, unsigned int, jmp_targets_t *) nogil
 
 ctypedef int (*string_func_t)(history_entry_t *, char *, char *, int, jmp_targets_t *)
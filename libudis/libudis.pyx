@@ -1,6 +1,6 @@
 # cython: language_level=3
 from libc.stdio cimport printf
-from libc.string cimport strstr, strcasestr
+from libc.string cimport strstr, strcasestr, memcpy, memmove, memset
 import cython
 import numpy as np
 cimport numpy as np
@@ -16,6 +16,20 @@ cdef extern:
     string_func_t find_string_function(char *)
 
 
+# must match FLAG_BRANCH_TAKEN, FLAG_TARGET_ADDR and FLAG_RESULT_MASK in
+# libudis_flags.h
+cdef int flag_branch_taken = 1
+cdef int flag_target_addr = 64
+cdef int flag_result_mask = 0x3f
+
+# maximum number of entries parsed between reacquiring the GIL
+cdef int parse_block_size = 4096
+
+cdef inline int is_jmp_target_source(history_entry_t *h) nogil:
+    # the generated parsers add a discovered label for branches and for
+    # instructions that flag their target address
+    return h.flag & flag_target_addr or (h.flag & flag_result_mask) == flag_branch_taken
+
 cdef char *hexdigits_lower = "000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f202122232425262728292a2b2c2d2e2f303132333435363738393a3b3c3d3e3f404142434445464748494a4b4c4d4e4f505152535455565758595a5b5c5d5e5f606162636465666768696a6b6c6d6e6f707172737475767778797a7b7c7d7e7f808182838485868788898a8b8c8d8e8f909192939495969798999a9b9c9d9e9fa0a1a2a3a4a5a6a7a8a9aaabacadaeafb0b1b2b3b4b5b6b7b8b9babbbcbdbebfc0c1c2c3c4c5c6c7c8c9cacbcccdcecfd0d1d2d3d4d5d6d7d8d9dadbdcdddedfe0e1e2e3e4e5e6e7e8e9eaebecedeeeff0f1f2f3f4f5f6f7f8f9fafbfcfdfeff"
 cdef char *hexdigits_upper = "000102030405060708090A0B0C0D0E0F101112131415161718191A1B1C1D1E1F202122232425262728292A2B2C2D2E2F303132333435363738393A3B3C3D3E3F404142434445464748494A4B4C4D4E4F505152535455565758595A5B5C5D5E5F606162636465666768696A6B6C6D6E6F707172737475767778797A7B7C7D7E7F808182838485868788898A8B8C8D8E8F909192939495969798999A9B9C9D9E9FA0A1A2A3A4A5A6A7A8A9AAABACADAEAFB0B1B2B3B4B5B6B7B8B9BABBBCBDBEBFC0C1C2C3C4C5C6C7C8C9CACBCCCDCECFD0D1D2D3D4D5D6D7D8D9DADBDCDDDEDFE0E1E2E3E4E5E6E7E8E9EAEBECEDEEEFF0F1F2F3F4F5F6F7F8F9FAFBFCFDFEFF"
 
@@ -229,13 +243,34 @@ cdef class ParsedDisassembly:
     cdef int current_pc
     cdef public np.ndarray jmp_targets
     cdef jmp_targets_t *jmp_targets_data
+    cdef public np.ndarray target_counts
+    cdef np.uint32_t *target_counts_data
     cdef public int num_bytes
     cdef np.uint32_t *index_to_row_data
     cdef public np.ndarray index_to_row
     cdef int index_index
     cdef int max_text_lines
 
-    def __init__(self, max_entries, origin, num_bytes):
+    # used when reparsing to stop at the first instruction boundary after
+    # the changed bytes that is also a boundary in the previous parse
+    cdef np.uint32_t *resync_rows
+    cdef int resync_origin
+    cdef int resync_after
+    cdef int resync_num_bytes
+    cdef public int resynced
+
+    # parsing stops at the first instruction boundary at or after this index
+    # so a large segment can be parsed in pieces
+    cdef int pause_index
+
+    # copies of the segment data, style and disassembly type, held until
+    # the parse is complete
+    cdef public object source
+
+    def __init__(self, max_entries, origin, num_bytes, ParsedDisassembly share_targets_with=None):
+        # max_entries is only the initial size; the storage grows as needed
+        if max_entries < 1:
+            max_entries = 1
         self.max_entries = max_entries
         self.entry_size = sizeof(history_entry_t)
         self.raw_entries = np.zeros((max_entries + 1) * self.entry_size, dtype=np.uint8)
@@ -244,8 +279,16 @@ cdef class ParsedDisassembly:
         self.origin = origin
         self.last_pc = origin
         self.current_pc = origin
-        self.jmp_targets = np.zeros(sizeof(jmp_targets_t), dtype=np.uint8)
+        if share_targets_with is None:
+            self.jmp_targets = np.zeros(sizeof(jmp_targets_t), dtype=np.uint8)
+            # number of entries that reference each address, so labels can
+            # be removed when the last reference is reparsed away
+            self.target_counts = np.zeros(256*256, dtype=np.uint32)
+        else:
+            self.jmp_targets = share_targets_with.jmp_targets
+            self.target_counts = share_targets_with.target_counts
         self.jmp_targets_data = <jmp_targets_t *>self.jmp_targets.data
+        self.target_counts_data = <np.uint32_t *>self.target_counts.data
 
         self.num_bytes = num_bytes
         self.index_to_row = np.zeros(num_bytes + 1, dtype=np.uint32)
@@ -253,33 +296,180 @@ cdef class ParsedDisassembly:
         self.index_index = 0
 
         self.max_text_lines = 256
+        self.resync_rows = NULL
+        self.resynced = 0
+        self.pause_index = num_bytes
+        self.source = None
 
     def __len__(self):
         return self.num_entries
 
+    @property
+    def num_parsed_bytes(self):
+        return self.current_pc - self.origin
+
+    @property
+    def is_complete(self):
+        return self.source is None
+
+    cdef grow(self, int min_entries):
+        cdef int n = self.max_entries
+        while n < min_entries:
+            n *= 2
+        raw = np.zeros((n + 1) * self.entry_size, dtype=np.uint8)
+        raw[0:len(self.raw_entries)] = self.raw_entries
+        self.raw_entries = raw
+        self.history_entries = <history_entry_t *>self.raw_entries.data
+        self.max_entries = n
+
     cdef parse_next(self, parse_func_t processor, unsigned char *src, int num_bytes):
-        cdef history_entry_t *h = &self.history_entries[self.num_entries]
         cdef int last_pc = self.current_pc + num_bytes
-        cdef np.uint32_t *index_list = self.index_to_row_data
-        cdef int i
-        while self.current_pc < last_pc and self.num_entries < self.max_entries:
-            if num_bytes > 0:
-                count = processor(h, src, self.current_pc, last_pc, self.jmp_targets_data)
-                src += count
-                num_bytes -= count
-                self.current_pc += count
-                for i in range(count):
-                    index_list[self.index_index] = self.num_entries
-                    self.index_index += 1
-                self.num_entries += 1
-                h += 1
-            else:
+        cdef int block, room, count
+        while self.current_pc < last_pc:
+            # every entry uses at least one byte, so the block of entries
+            # can be parsed without holding the GIL as long as there is room
+            # to store the most entries the block could produce
+            block = last_pc - self.current_pc
+            if block > parse_block_size:
+                block = parse_block_size
+            room = self.max_entries - self.num_entries
+            if room < 1:
+                self.grow(self.num_entries + 1)
+                room = self.max_entries - self.num_entries
+            if block > room:
+                block = room
+            with nogil:
+                count = self.parse_block(processor, src, last_pc, block)
+            src += count
+            if self.resynced or self.current_pc - self.origin >= self.pause_index:
                 break
-        if self.num_entries >= self.max_entries:
-            print(f"CYTHON ERROR! ParsedDisassembly disassembly entries {self.max_entries} exceeded, attempted to save {self.num_entries}")
         if self.index_index > self.num_bytes:
             print(f"CYTHON ERROR! ParsedDisassembly index_to_row entries {self.num_bytes} exceeded, attempted to save {self.index_index}")
 
+    cdef int parse_block(self, parse_func_t processor, unsigned char *src, int last_pc, int max_entries) nogil:
+        # Parse at most max_entries entries, returning the number of bytes
+        # used
+        cdef history_entry_t *h
+        cdef np.uint32_t *index_list = self.index_to_row_data
+        cdef int first_pc = self.current_pc
+        cdef int i, count, index
+        while self.current_pc < last_pc and max_entries > 0:
+            h = &self.history_entries[self.num_entries]
+            memset(h, 0, self.entry_size)
+            count = processor(h, src, self.current_pc, last_pc, self.jmp_targets_data)
+            if is_jmp_target_source(h):
+                self.target_counts_data[h.target_addr] += 1
+            src += count
+            self.current_pc += count
+            for i in range(count):
+                index_list[self.index_index] = self.num_entries
+                self.index_index += 1
+            self.num_entries += 1
+            max_entries -= 1
+            if self.resync_rows != NULL:
+                index = self.current_pc - self.resync_origin
+                if index >= self.resync_after and (index >= self.resync_num_bytes or self.resync_rows[index] != self.resync_rows[index - 1]):
+                    self.resynced = 1
+                    break
+            if self.current_pc - self.origin >= self.pause_index:
+                break
+        return self.current_pc - first_pc
+
+    cdef int find_row_start(self, int index):
+        cdef int row = self.index_to_row_data[index]
+        while index > 0 and self.index_to_row_data[index - 1] == row:
+            index -= 1
+        return index
+
+    cdef splice(self, ParsedDisassembly new, int restart_index):
+        # Replace the rows covering restart_index up to the point where the
+        # new parse stopped with the entries of the new parse
+        cdef int stop_index = new.current_pc - self.origin
+        cdef int first_row = self.index_to_row_data[restart_index]
+        cdef int last_row
+        cdef int num_new = new.num_entries
+        cdef int delta, i, addr
+        cdef history_entry_t *h
+        cdef np.uint8_t *discovered = <np.uint8_t *>self.jmp_targets_data
+        if stop_index < self.num_bytes:
+            last_row = self.index_to_row_data[stop_index]
+        else:
+            last_row = self.num_entries
+        delta = num_new - (last_row - first_row)
+
+        # the new entries have already been counted while parsing
+        changed_targets = []
+        for i in range(first_row, last_row):
+            h = &self.history_entries[i]
+            if is_jmp_target_source(h):
+                self.target_counts_data[h.target_addr] -= 1
+                if self.target_counts_data[h.target_addr] == 0:
+                    discovered[h.target_addr] = 0
+                    changed_targets.append(h.target_addr)
+        for i in range(num_new):
+            h = &new.history_entries[i]
+            if is_jmp_target_source(h):
+                changed_targets.append(h.target_addr)
+
+        if self.num_entries + delta > self.max_entries:
+            self.grow(self.num_entries + delta)
+        if delta != 0:
+            memmove(&self.history_entries[last_row + delta], &self.history_entries[last_row], (self.num_entries - last_row) * self.entry_size)
+        memcpy(&self.history_entries[first_row], new.history_entries, num_new * self.entry_size)
+        self.num_entries += delta
+
+        for i in range(restart_index, stop_index):
+            self.index_to_row_data[i] = new.index_to_row_data[i - restart_index] + first_row
+        if delta != 0:
+            for i in range(stop_index, self.num_bytes):
+                self.index_to_row_data[i] += delta
+
+        if self.num_bytes > 256*256:
+            # addresses wrap around, so every instruction could be affected
+            for i in range(256*256):
+                if self.target_counts_data[i] == 0:
+                    discovered[i] = 0
+            self.fix_offset_labels()
+            return
+
+        # labels added by fix_offset_labels are only correct for the
+        # instruction boundaries in the replaced area and for targets that
+        # haven't changed
+        for i in range(restart_index, stop_index):
+            addr = (self.origin + i) & 0xffff
+            if self.target_counts_data[addr] == 0:
+                discovered[addr] = 0
+        i = restart_index
+        while i < stop_index:
+            i = self.update_offset_label(i)
+        for addr in changed_targets:
+            i = (addr - self.origin) & 0xffff
+            if i < self.num_bytes:
+                self.update_offset_label(i)
+
+    cdef int update_offset_label(self, int index):
+        # Same as fix_offset_labels, but only for the instruction containing
+        # index. Returns the index of the next instruction.
+        cdef np.uint32_t *index_to_row = self.index_to_row_data
+        cdef np.uint8_t *discovered = <np.uint8_t *>self.jmp_targets_data
+        cdef np.uint32_t row = index_to_row[index]
+        cdef int start = index
+        cdef int end = index + 1
+        cdef int addr
+        cdef np.uint8_t label = 0
+        while start > 0 and index_to_row[start - 1] == row:
+            start -= 1
+        while end < self.num_bytes and index_to_row[end] == row:
+            end += 1
+        for index in range(start + 1, end):
+            addr = (self.origin + index) & 0xffff
+            if self.target_counts_data[addr] > 0:
+                label = discovered[addr]
+        addr = (self.origin + start) & 0xffff
+        if self.target_counts_data[addr] == 0:
+            discovered[addr] = label
+        return end
+
     cdef fix_offset_labels(self):
         # fast loop in C to check for references to addresses that are in the
         # middle of an instruction. If found, a discovered address is generated
@@ -289,6 +479,7 @@ cdef class ParsedDisassembly:
         cdef np.uint8_t *jmp_target = <np.uint8_t *>self.jmp_targets_data
         cdef np.uint32_t *index_to_row = self.index_to_row_data
         cdef np.uint8_t disassembler_type
+        cdef np.uint8_t old_label
 
         #print "pc=%04x, last=%04x, i=%04x" % (pc, pc + i, i)
         while i > 0:
@@ -296,7 +487,7 @@ cdef class ParsedDisassembly:
             old_label = jmp_target[(pc + i) & 0xffff]
             if old_label:
                 #print "disasm_info: found label %04x, index_to_row[%04x]=%04x" % (pc + i, i, index_to_row[i])
-                while index_to_row[i - 1] == index_to_row[i] and i > 1:
+                while i > 0 and index_to_row[i - 1] == index_to_row[i]:
                     i -= 1
                 #if labels[pc + i] == 0:
                 #    print "  disasm_info: added label at %04x" % (pc + i)
@@ -327,24 +518,87 @@ cdef class DisassemblyConfig:
     cdef np.uint8_t c_split_comments[256]
     cdef parse_func_t segment_parsers[256]
     cdef np.uint8_t default_disasm_type
+    cdef public int reparse_lookbehind
 
     def __init__(self, def_disasm_type=0, split_comments=[data_style]):
         cdef int i
         for i in range(256):
             self.c_split_comments[i] = 1 if i in split_comments else 0
         self.default_disasm_type = def_disasm_type
+        self.reparse_lookbehind = 32
 
     def get_parser(self, num_entries, origin, num_bytes):
         # has to be a python function because it can be overridden in
         # subclasses
         return ParsedDisassembly(num_entries, origin, num_bytes)
 
+    def parse(self, segment, num_entries=None):
+        """Disassemble the entire segment. num_entries is the initial size
+        of the entry storage, which grows as needed.
+        """
+        parsed = self.parse_start(segment, num_entries)
+        self.parse_more(parsed, parsed.num_bytes)
+        return parsed
+
+    def parse_start(self, segment, num_entries=None):
+        """Return an empty disassembly of the segment to be filled in by
+        calls to parse_more. The segment data is copied, so changes to the
+        segment after this call don't affect the parse.
+        """
+        src_copy = segment.data.tobytes()
+        num_bytes = len(src_copy)
+        if num_entries is None:
+            num_entries = num_bytes // 2 + 1
+        parsed = self.get_parser(num_entries, segment.origin, num_bytes)
+        if num_bytes > 0:
+            parsed.source = (src_copy, segment.style.tobytes(), segment.disasm_type.tobytes())
+        return parsed
+
     @cython.boundscheck(False)
     @cython.wraparound(False)
-    def parse(self, segment, num_entries):
-        cdef np.uint8_t s, t
-        cdef int comment_bit_mask = 0x40
+    def parse_more(self, ParsedDisassembly parsed, int num_bytes):
+        """Continue a disassembly created by parse_start until at least
+        num_bytes more bytes have been parsed, stopping at an instruction
+        boundary. Returns True when the whole segment has been parsed.
+
+        The GIL is released while parsing instructions, so this can be
+        called from a worker thread. Entries before len(parsed) at the time
+        of the call don't change.
+        """
+        if parsed.source is None:
+            return True
+        src_copy, style_copy, disasm_type_copy = parsed.source
+        cdef np.uint8_t *src = <np.uint8_t *>src_copy
+        cdef np.uint8_t *c_style = <np.uint8_t *>style_copy
+        cdef np.uint8_t *c_disasm_type = <np.uint8_t *>disasm_type_copy
+        cdef int first_index = parsed.current_pc - parsed.origin
+
+        if first_index < parsed.num_bytes:
+            parsed.pause_index = first_index + num_bytes
+            self.parse_chunks(parsed, src, c_style, c_disasm_type, first_index, parsed.num_bytes)
+            parsed.pause_index = parsed.num_bytes
+            first_index = parsed.current_pc - parsed.origin
+            if first_index < parsed.num_bytes:
+                return False
+        parsed.fix_offset_labels()
+        # print("finished offset label generation")
+        parsed.source = None
+        return True
 
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def reparse(self, ParsedDisassembly parsed, segment, int start_index, int end_index):
+        """Update a previous parse of the segment after the bytes, styles or
+        disassembly types from start_index up to (but not including)
+        end_index have changed.
+
+        Parsing restarts at an instruction boundary before the change and
+        stops at the first instruction boundary after the change that is also
+        a boundary in the previous parse, because everything past that point
+        will be parsed the same way. The new entries are spliced into the
+        previous parse, which is returned. If the segment has changed size
+        or origin, a new full parse is returned instead.
+        """
         src_copy = segment.data.tobytes()
         cdef np.uint8_t *src = <np.uint8_t *>src_copy
         style_copy = segment.style.tobytes()
@@ -352,24 +606,55 @@ cdef class DisassemblyConfig:
         disasm_type_copy = segment.disasm_type.tobytes()
         cdef np.uint8_t *c_disasm_type = <np.uint8_t *>disasm_type_copy
         cdef int num_bytes = len(src_copy)
+        cdef int restart_index
+        cdef ParsedDisassembly new
+
+        if num_bytes != parsed.num_bytes or segment.origin != parsed.origin or num_bytes < 1:
+            return self.parse(segment)
+        if start_index < 0:
+            start_index = 0
+        if end_index > num_bytes:
+            end_index = num_bytes
+        if start_index >= end_index:
+            return parsed
+
+        # some parsers look ahead past the end of the entry (e.g. data
+        # parsers check for runs of bytes), so entries that end shortly
+        # before the change may also be affected
+        restart_index = start_index - self.reparse_lookbehind
+        if restart_index < 0:
+            restart_index = 0
+        restart_index = parsed.find_row_start(restart_index)
+
+        new = parsed.__class__((end_index - restart_index) // 2 + 16, parsed.origin + restart_index, num_bytes - restart_index, parsed)
+        new.resync_rows = parsed.index_to_row_data
+        new.resync_origin = parsed.origin
+        new.resync_after = end_index
+        new.resync_num_bytes = num_bytes
+        self.parse_chunks(new, src, c_style, c_disasm_type, restart_index, num_bytes)
+        parsed.splice(new, restart_index)
+        return parsed
 
-        cdef int origin = segment.origin
-        cdef int end_addr = origin + len(segment)
-        cdef int pc = origin
-
-        if num_bytes < 1:
-            return self.get_parser(0, origin, 0)
-        cdef ParsedDisassembly parsed = self.get_parser(num_entries, origin, num_bytes)
-
-        cdef int first_index = 0
-        cdef np.uint8_t current_disasm_type = c_disasm_type[0]
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef parse_chunks(self, ParsedDisassembly parsed, np.uint8_t *src, np.uint8_t *c_style, np.uint8_t *c_disasm_type, int first_index, int num_bytes):
+        # Break the bytes into chunks of the same disassembly type and parse
+        # each using the processor for that type, stopping early if the
+        # parser has resynchronized with a previous parse or has reached
+        # the pause index.
+        cdef np.uint8_t s, t
+        cdef int comment_bit_mask = 0x40
+        cdef np.uint8_t current_disasm_type = c_disasm_type[first_index]
         if current_disasm_type > 127:
             current_disasm_type = self.default_disasm_type
         cdef int start_index
-        cdef int end_index = 0
+        cdef int end_index = first_index
         cdef int count
+        cdef parse_func_t processor
+
+        src += first_index
         # print "CYTHON FAST_GET_ENTIRE", style_copy
-        for end_index in range(1, num_bytes):
+        for end_index in range(first_index + 1, num_bytes):
             s = c_style[end_index]
             t = c_disasm_type[end_index]
             if t > 127:
@@ -389,6 +674,8 @@ cdef class DisassemblyConfig:
             # print("break here -> %x:%x = %s" % (start_index, end_index, current_disasm_type))
             processor = parser_map[current_disasm_type]
             parsed.parse_next(processor, src, count)
+            if parsed.resynced or parsed.current_pc - parsed.origin >= parsed.pause_index:
+                return
             src += count
             first_index = end_index
             current_disasm_type = t
@@ -401,10 +688,6 @@ cdef class DisassemblyConfig:
         processor = parser_map[current_disasm_type]
         parsed.parse_next(processor, src, count)
 
-        parsed.fix_offset_labels()
-        # print("finished offset label generation")
-        return parsed
-
 
 cdef class StringifiedHistory:
     cdef public int origin
@@ -18,6 +18,11 @@ import logging
 log = logging.getLogger(__name__)
 
 
+# bit shifts to extract each pixel from a byte, leftmost pixel first
+shifts_2bpp = np.array([6, 4, 2, 0], dtype=np.uint8)
+shifts_4bpp = np.array([4, 0], dtype=np.uint8)
+
+
 class BaseRenderer(object):
     name = "base"
     scale_width = 1
@@ -26,6 +31,10 @@ class BaseRenderer(object):
     bitplanes = 1
     ignore_mask = style_bits.not_user_bit_mask & (0xff ^ style_bits.diff_bit_mask)
 
+    # if each row of the image depends only on the bytes in that row, changed
+    # rows can be rendered without rendering the rest of the image
+    rows_are_independent = True
+
     def __str__(self):
         return self.name
 
@@ -43,8 +52,11 @@ class BaseRenderer(object):
     def validate_bytes_per_row(self, bytes_per_row):
         return bytes_per_row
 
+    def get_color_registers(self, segment_viewer, registers):
+        return [segment_viewer.color_registers[r] for r in registers]
+
     def get_colors(self, segment_viewer, registers):
-        color_registers = [segment_viewer.color_registers[r] for r in registers]
+        color_registers = self.get_color_registers(segment_viewer, registers)
         log.debug(f"get_colors: {color_registers} from {segment_viewer}")
         h_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.highlight_background_color)
         m_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.match_background_color)
@@ -52,6 +64,22 @@ class BaseRenderer(object):
         d_colors = colors.get_dimmed_color_registers(color_registers, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
         return color_registers, h_colors, m_colors, c_colors, d_colors
 
+    def get_color_table(self, segment_viewer, registers):
+        color_registers = self.get_color_registers(segment_viewer, registers)
+        return colors.get_styled_color_table(color_registers, segment_viewer.preferences)
+
+    def get_bw_color_table(self, segment_viewer):
+        return colors.get_styled_color_table(self.get_bw_colors(segment_viewer), segment_viewer.preferences)
+
+    def get_styled_rgb(self, segment_viewer, count, pixels, style_per_pixel, color_table):
+        """Convert color register indexes to RGB using the styled variant of
+        each color, then fill anything past count with the empty background
+        color.
+        """
+        bitimage = color_table.get_rgb(pixels, style_per_pixel)
+        bitimage[count:] = segment_viewer.preferences.empty_background_color.Get(False)
+        return bitimage
+
     def reshape(self, bitimage, bytes_per_row, nr):
         # source array 'bitimage' in the shape of (size, w, 3)
         h, w, colors = bitimage.shape
@@ -97,61 +125,17 @@ class BaseRenderer(object):
         elif self.pixels_per_byte == 8:
             return self.calc_style_per_pixel_1bpp(style)
 
-    def get_2bpp(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel=None):
-        bits = np.unpackbits(byte_values)
-        bits = bits.reshape((-1, 8))
-        pixels = np.empty((nr * bytes_per_row, 4), dtype=np.uint8)
-        pixels[:,0] = bits[:,0] * 2 + bits[:,1]
-        pixels[:,1] = bits[:,2] * 2 + bits[:,3]
-        pixels[:,2] = bits[:,4] * 2 + bits[:,5]
-        pixels[:,3] = bits[:,6] * 2 + bits[:,7]
-
+    def get_2bpp(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, color_table, style_per_pixel=None):
+        pixels = (byte_values[:, np.newaxis] >> shifts_2bpp) & 0x03
         if style_per_pixel is None:
             style_per_pixel = self.calc_style_per_pixel_2bpp(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
-        data = (style_per_pixel & style_bits.data_bit_mask) == style_bits.data_bit_mask
-        comment = (style_per_pixel & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
-        match = (style_per_pixel & style_bits.match_bit_mask) == style_bits.match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr * bytes_per_row, 4, 3), dtype=np.uint8)
-        for i in range(4):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage
-
-    def get_4bpp(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel=None):
-        bits = np.unpackbits(byte_values)
-        bits = bits.reshape((-1, 8))
-        pixels = np.empty((nr * bytes_per_row, 2), dtype=np.uint8)
-        pixels[:,0] = bits[:,0] * 8 + bits[:,1] * 4 + bits[:,2] * 2 + bits[:,3]
-        pixels[:,1] = bits[:,4] * 8 + bits[:,5] * 4 + bits[:,6] * 2 + bits[:,7]
+        return self.get_styled_rgb(segment_viewer, count, pixels, style_per_pixel, color_table)
 
+    def get_4bpp(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, color_table, style_per_pixel=None):
+        pixels = (byte_values[:, np.newaxis] >> shifts_4bpp) & 0x0f
         if style_per_pixel is None:
             style_per_pixel = self.calc_style_per_pixel_4bpp(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
-        data = (style_per_pixel & style_bits.data_bit_mask) == style_bits.data_bit_mask
-        comment = (style_per_pixel & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
-        match = (style_per_pixel & style_bits.match_bit_mask) == style_bits.match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr * bytes_per_row, 2, 3), dtype=np.uint8)
-        for i in range(16):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage
+        return self.get_styled_rgb(segment_viewer, count, pixels, style_per_pixel, color_table)
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         """Fill the pixels array with color register data
@@ -164,9 +148,9 @@ class BaseRenderer(object):
     def get_bitplane_style(self, style):
         raise NotImplemented
 
-    def get_bitplanes(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, colors):
+    def get_bitplanes(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, color_table, style_per_pixel=None):
         bitplanes = self.bitplanes
-        _, rem = divmod(np.alen(byte_values), bitplanes)
+        _, rem = divmod(len(byte_values), bitplanes)
         if rem > 0:
             byte_values = np.append(byte_values, np.zeros(rem, dtype=np.uint8))
             style = np.append(style, np.zeros(rem, dtype=np.uint8))
@@ -177,23 +161,7 @@ class BaseRenderer(object):
         pixels = pixels.reshape((nr, pixels_per_row))
         s = self.get_bitplane_style(style)
         style_per_pixel = s.repeat(8).reshape((-1, pixels_per_row))
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
-        data = (style_per_pixel & style_bits.data_bit_mask) == style_bits.data_bit_mask
-        comment = (style_per_pixel & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
-        match = (style_per_pixel & style_bits.match_bit_mask) == style_bits.match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr, pixels_per_row, 3), dtype=np.uint8)
-        for i in range(2**bitplanes):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage
+        return self.get_styled_rgb(segment_viewer, count, pixels, style_per_pixel, color_table)
 
 
 class OneBitPerPixelB(BaseRenderer):
@@ -205,37 +173,10 @@ class OneBitPerPixelB(BaseRenderer):
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
         bits = np.unpackbits(byte_values)
         pixels = bits.reshape((-1, 8))
-
-        background = (pixels == 0)
-        color1 = (pixels == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
         if style_per_pixel is None:
             style_per_pixel = self.calc_style_per_pixel_1bpp(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
-        data = (style_per_pixel & style_bits.data_bit_mask) == style_bits.data_bit_mask
-        comment = (style_per_pixel & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
-        match = (style_per_pixel & style_bits.match_bit_mask) == style_bits.match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 8, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
+        color_table = self.get_bw_color_table(segment_viewer)
+        bitimage = self.get_styled_rgb(segment_viewer, count, pixels, style_per_pixel, color_table)
         return self.reshape(bitimage, bytes_per_row, nr)
 
 
@@ -288,38 +229,11 @@ class OneBitPerPixelApple2Linear(BaseRenderer):
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
         bits = np.unpackbits(bit_reverse_table[byte_values])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
+        pixels = bits.reshape((-1, 8))[:,0:7]
         if style_per_pixel is None:
             style_per_pixel = self.calc_style_per_pixel(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
-        data = (style_per_pixel & style_bits.data_bit_mask) == style_bits.data_bit_mask
-        comment = (style_per_pixel & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
-        match = (style_per_pixel & style_bits.match_bit_mask) == style_bits.match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
+        color_table = self.get_bw_color_table(segment_viewer)
+        bitimage = self.get_styled_rgb(segment_viewer, count, pixels, style_per_pixel, color_table)
         return bitimage.reshape((nr, bytes_per_row * 7, 3))
 
 
@@ -341,6 +255,7 @@ def generate_apple2_index():
 
 class OneBitPerPixelApple2FullScreen(OneBitPerPixelApple2Linear):
     name = "B/W, Apple 2, Screen Order"
+    rows_are_independent = False
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
         screen = np.zeros((8192,), dtype=np.uint8)
@@ -348,38 +263,11 @@ class OneBitPerPixelApple2FullScreen(OneBitPerPixelApple2Linear):
         num_valid = len(byte_values)  # might be smaller than 8192
         screen[:num_valid] = byte_values
         bits = np.unpackbits(bit_reverse_table[screen])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
+        pixels = bits.reshape((-1, 8))[:,0:7]
         if style_per_pixel is None:
             style_per_pixel = self.calc_style_per_pixel(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
-        data = (style_per_pixel & style_bits.data_bit_mask) == style_bits.data_bit_mask
-        comment = (style_per_pixel & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
-        match = (style_per_pixel & style_bits.match_bit_mask) == style_bits.match_bit_mask
-
-        bitimage = np.empty((192 * 40, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
+        color_table = self.get_bw_color_table(segment_viewer)
+        bitimage = self.get_styled_rgb(segment_viewer, count, pixels, style_per_pixel, color_table)
         return bitimage.reshape((nr, bytes_per_row * 7, 3))
 
 
@@ -431,38 +319,11 @@ class OneBitPerPixelApple2Artifacting(OneBitPerPixelApple2Linear):
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
         bits = np.unpackbits(bit_reverse_table[byte_values])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
+        pixels = bits.reshape((-1, 8))[:,0:7]
         if style_per_pixel is None:
             style_per_pixel = self.calc_style_per_pixel(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
-        data = (style_per_pixel & style_bits.data_bit_mask) == style_bits.data_bit_mask
-        comment = (style_per_pixel & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
-        match = (style_per_pixel & style_bits.match_bit_mask) == style_bits.match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
+        color_table = self.get_bw_color_table(segment_viewer)
+        bitimage = self.get_styled_rgb(segment_viewer, count, pixels, style_per_pixel, color_table)
         return bitimage.reshape((nr, bytes_per_row * 7, 3))
 
 
@@ -471,8 +332,8 @@ class TwoBitsPerPixel(BaseRenderer):
     pixels_per_byte = 4
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
-        colors = self.get_colors(segment_viewer, [0, 1, 2, 3])
-        bitimage = self.get_2bpp(segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel)
+        color_table = self.get_color_table(segment_viewer, [0, 1, 2, 3])
+        bitimage = self.get_2bpp(segment_viewer, bytes_per_row, nr, count, byte_values, style, color_table, style_per_pixel)
         return self.reshape(bitimage, bytes_per_row, nr)
 
 
@@ -483,8 +344,8 @@ class ModeD(TwoBitsPerPixel):
     pixels_per_byte = 4
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
-        colors = self.get_colors(segment_viewer, [8, 4, 5, 6])
-        bitimage = self.get_2bpp(segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel)
+        color_table = self.get_color_table(segment_viewer, [8, 4, 5, 6])
+        bitimage = self.get_2bpp(segment_viewer, bytes_per_row, nr, count, byte_values, style, color_table, style_per_pixel)
         return self.reshape(bitimage, bytes_per_row, nr)
 
 
@@ -500,8 +361,8 @@ class FourBitsPerPixel(BaseRenderer):
     pixels_per_byte = 2
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
-        colors = self.get_colors(segment_viewer, list(range(16)))
-        bitimage = self.get_4bpp(segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel)
+        color_table = self.get_color_table(segment_viewer, list(range(16)))
+        bitimage = self.get_4bpp(segment_viewer, bytes_per_row, nr, count, byte_values, style, color_table, style_per_pixel)
         return self.reshape(bitimage, bytes_per_row, nr)
 
 
@@ -524,8 +385,8 @@ class TwoBitPlanesLE(BaseRenderer):
         return bytes_per_row
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
-        colors = self.get_colors(segment_viewer, list(range(2**self.bitplanes)))
-        bitimage = self.get_bitplanes(segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel)
+        color_table = self.get_color_table(segment_viewer, list(range(2**self.bitplanes)))
+        bitimage = self.get_bitplanes(segment_viewer, bytes_per_row, nr, count, byte_values, style, color_table, style_per_pixel)
         return bitimage
 
 
@@ -665,14 +526,9 @@ class GTIA9(FourBitsPerPixel):
         first_color = segment_viewer.antic_color_registers[8] & 0xf0
         return list(range(first_color, first_color + 16))
 
-    def get_colors(self, segment_viewer, registers):
+    def get_color_registers(self, segment_viewer, registers):
         antic_color_registers = self.get_antic_color_registers(segment_viewer)
-        color_registers = colors.get_color_registers(antic_color_registers, segment_viewer.color_standard)
-        h_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(color_registers, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-        return color_registers, h_colors, m_colors, c_colors, d_colors
+        return colors.get_color_registers(antic_color_registers, segment_viewer.color_standard)
 
 
 class GTIA10(GTIA9):
@@ -716,22 +572,9 @@ class BaseBytePerPixelRenderer(BaseRenderer):
         return pixels, style_per_pixel
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
-        normal = style == 0
-        highlight = (style & style_bits.selected_bit_mask) == style_bits.selected_bit_mask
-        comment = (style & style_bits.comment_bit_mask) == style_bits.comment_bit_mask
-        data = (style & style_bits.data_bit_mask) == style_bits.data_bit_mask
-        match = (style & style_bits.match_bit_mask) == style_bits.match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = self.get_colors(segment_viewer, list(range(16)))
-        bitimage = np.empty((nr * bytes_per_row, 3), dtype=np.uint8)
-        for i in range(16):
-            color_is_set = (byte_values == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:] = segment_viewer.preferences.empty_background_color.Get(False)
+        color_table = self.get_color_table(segment_viewer, list(range(16)))
+        pixels = byte_values & 0x0f  # only the first 16 colors are used
+        bitimage = self.get_styled_rgb(segment_viewer, count, pixels, style, color_table)
         return bitimage.reshape((nr, bytes_per_row, 3))
 
 
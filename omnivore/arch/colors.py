@@ -4,6 +4,8 @@ import math
 
 import numpy as np
 
+from atrip import style_bits
+
 
 def get_blended_color_registers(colors, blend_color):
     registers = []
@@ -37,3 +39,83 @@ def calc_dimmed_rgb(rgb_colors, background_color, dimmed_color):
     for i in range(len(registers)):
         registers[i] = [max(0, int(rgb_colors[i,j]) - dimmed_difference[j]) for j in range(3)]
     return registers
+
+
+#### Style-aware color lookup
+
+# Style classes used to pick the color variant of a pixel. If more than one
+# style bit is set, the highest numbered class wins.
+STYLE_NORMAL = 0
+STYLE_DATA = 1
+STYLE_COMMENT = 2
+STYLE_MATCH = 3
+STYLE_HIGHLIGHT = 4
+NUM_STYLE_CLASSES = 5
+
+
+def calc_style_class_table():
+    """Map each of the 256 possible style bytes to its style class"""
+    style = np.arange(256, dtype=np.uint8)
+    table = np.zeros(256, dtype=np.uint8)
+    for style_class, mask in [
+            (STYLE_DATA, style_bits.data_bit_mask),
+            (STYLE_COMMENT, style_bits.comment_bit_mask),
+            (STYLE_MATCH, style_bits.match_bit_mask),
+            (STYLE_HIGHLIGHT, style_bits.selected_bit_mask),
+            ]:
+        table[(style & mask) == mask] = style_class
+    return table
+
+style_class_table = calc_style_class_table()
+
+
+class StyledColorTable:
+    """Lookup table of (style class, color index) -> RGB
+
+    Every style variant of every color is computed up front, so an image can
+    be rendered from its color indexes and per-pixel style with a single
+    gather rather than a set of masks for each style and color.
+    """
+
+    def __init__(self, color_registers, highlight_color, match_color, comment_color, background_color, data_color):
+        self.num_colors = len(color_registers)
+        lut = np.empty((NUM_STYLE_CLASSES, self.num_colors, 3), dtype=np.uint8)
+        lut[STYLE_NORMAL] = [c[0:3] for c in color_registers]
+        lut[STYLE_DATA] = get_dimmed_color_registers(color_registers, background_color, data_color)
+        lut[STYLE_COMMENT] = get_blended_color_registers(color_registers, comment_color)
+        lut[STYLE_MATCH] = get_blended_color_registers(color_registers, match_color)
+        lut[STYLE_HIGHLIGHT] = get_blended_color_registers(color_registers, highlight_color)
+        self.lut = lut.reshape((-1, 3))
+
+    def calc_indexes(self, pixels, style_per_pixel):
+        index = style_class_table[style_per_pixel].astype(np.intp)
+        index *= self.num_colors
+        index += pixels
+        return index
+
+    def get_rgb(self, pixels, style_per_pixel):
+        """Return an array of shape pixels.shape + (3,) of the RGB values for
+        each pixel. The style array must be the same shape as pixels.
+        """
+        return np.take(self.lut, self.calc_indexes(pixels, style_per_pixel), axis=0)
+
+
+styled_color_table_cache = {}
+
+max_styled_color_tables = 32
+
+def get_styled_color_table(color_registers, preferences):
+    """Return a StyledColorTable for the colors, using the highlight colors
+    from the preferences. Tables are cached so they are only recomputed when
+    the colors or preferences change.
+    """
+    pref_colors = (preferences.highlight_background_color, preferences.match_background_color, preferences.comment_background_color, preferences.background_color, preferences.data_background_color)
+    key = (tuple(tuple(c[0:3]) for c in color_registers), tuple(tuple(c[0:3]) for c in pref_colors))
+    try:
+        table = styled_color_table_cache[key]
+    except KeyError:
+        if len(styled_color_table_cache) >= max_styled_color_tables:
+            styled_color_table_cache.clear()
+        table = StyledColorTable(color_registers, *pref_colors)
+        styled_color_table_cache[key] = table
+    return table
@@ -285,8 +285,19 @@ class Debugger(Serializable):
     def restore_computed_attributes(self, state):
         self.debug_cmd_raw[:] = state['debug_cmd_raw']
 
-    def clear_all_breakpoints(self):
-        c = self.debug_cmd[0]
+    def create_free_run_commands(self):
+        """Return a debugger command array with no active breakpoints, for
+        running the emulator without stopping.
+        """
+        raw = np.zeros([dd.DEBUGGER_COMMANDS_DTYPE.itemsize], dtype=np.uint8)
+        cmd = raw.view(dtype=dd.DEBUGGER_COMMANDS_DTYPE)
+        self.clear_all_breakpoints(cmd)
+        return cmd
+
+    def clear_all_breakpoints(self, debug_cmd=None):
+        if debug_cmd is None:
+            debug_cmd = self.debug_cmd
+        c = debug_cmd[0]
         c['breakpoint_type'][:] = dd.BREAKPOINT_CONDITIONAL
         c['breakpoint_status'][:] = 0
         c['breakpoint_status'][0] = dd.BREAKPOINT_DISABLED
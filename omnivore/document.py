@@ -11,6 +11,7 @@ from sawx.utils.nputil import to_numpy
 from sawx.events import EventHandler
 
 from atrip.disassembler import DisassemblyConfig, valid_cpu_ids, cpu_name_to_id
+from atrip.omnivore_loader import get_collection
 from .utils.templateutil import load_memory_map
 
 import logging
@@ -115,7 +116,7 @@ class DiskImageDocument(SawxDocument):
 
     def load(self, file_metadata):
         log.debug(f"load: file_metadata={file_metadata}")
-        collection = file_metadata["atrip_collection"]
+        collection = get_collection(file_metadata)
         self.load_collection(collection, file_metadata)
 
     def load_collection(self, collection, file_metadata):
@@ -205,7 +206,7 @@ class DiskImageDocument(SawxDocument):
                 found.append((i, s, addr - s.origin))
         return found
 
-    def find_segments_with_raw_index(self, raw_index):
+    def find_segments_with_raw_index(self, raw_index, container=None):
         """Find all segments that contain the specified raw index
 
         The raw index points to a specific byte, so this will return all
@@ -213,14 +214,17 @@ class DiskImageDocument(SawxDocument):
         segment start address because different views may have different start
         addresses; to find segments that contain a specific address, use
         find_segment_in_range.
+
+        The raw index is relative to the container, which defaults to the
+        first container in the collection.
         """
+        if container is None:
+            container = self.collection.containers[0]
         found = []
-        for i, s in enumerate(self.segments):
-            try:
-                index = s.get_index_from_base_index(raw_index)
+        for s, index in container.segment_index.find_segments(raw_index):
+            i = self.find_segment_index(s)
+            if i >= 0:
                 found.append((i, s, index))
-            except IndexError:
-                pass
         return found
 
     ##### Initial viewer defaults
@@ -272,7 +276,8 @@ class DiskImageDocument(SawxDocument):
 
     @classmethod
     def can_load_file_exact(cls, file_metadata):
-        return "atrip_identified" in file_metadata
+        # anything identified by the atrip loader, or an existing collection
+        return "atrip_file_guess" in file_metadata or "atrip_collection" in file_metadata
  
     @classmethod
     def can_load_file_generic(cls, file_metadata):
@@ -176,8 +176,8 @@ class EmulationDocument(DiskImageDocument):
         else:
             raise errors.EmulatorError(f"Can't find bootable segment in {self.source_document}")
         emu.boot_from_segment(segment)
-        for i in range(self.skip_frames_on_boot):
-            emu.next_frame()
+        if self.skip_frames_on_boot > 0:
+            emu.run_frames(self.skip_frames_on_boot)
         self.create_segments()
         self.create_timer()
         if not self.pause_emulator_on_boot:
@@ -1,4 +1,5 @@
 import os
+import time
 import tempfile
 import inspect
 import pkg_resources
@@ -9,9 +10,11 @@ from atrip import find_container
 
 from .debugger import Debugger
 from .debugger.dtypes import FRAME_STATUS_DTYPE
-from .utils.historyutil import RestartTree
+from .utils.historyutil import RestartTree, TieredFrameHistory
 from atrip import disassembler as disasm
+from atrip.disassemblers.trace import TraceWriter
 from .utils.templateutil import load_memory_map
+from .utils.framebufferutil import readonly_view
 from . import errors
 
 # INPUT_DTYPE must match history_input_t from libudis.h and input_template_t from libatari800.h
@@ -62,13 +65,25 @@ class Emulator(Debugger):
 
     history_entry_dtype = disasm.dd.HISTORY_ENTRY_DTYPE
 
-    def __init__(self):
+    # Set to False to skip saving any frame history, e.g. for batch processing
+    save_frame_history = True
+
+    # Frame history is stored as a full keyframe every N frames with deltas
+    # in between. Every frame is kept for the most recent dense frame count,
+    # older frames are progressively thinned and regenerated by emulating
+    # forward when needed. If the budget (in bytes) is exceeded, the oldest
+    # frames of each restart are moved to a spill file in the cache dir.
+    history_keyframe_interval = 60
+    history_memory_budget = 512 * 1024 * 1024
+    history_dense_frame_count = 600
+
+    def __init__(self, input_raw=None, output_raw=None):
         Debugger.__init__(self)
-        self.input_raw = np.zeros([self.input_array_dtype.itemsize], dtype=np.uint8)
-        self.input = self.input_raw.view(dtype=self.input_array_dtype)
-        self.output_raw = np.zeros([FRAME_STATUS_DTYPE.itemsize + self.output_array_dtype.itemsize], dtype=np.uint8)
-        self.status = self.output_raw[0:FRAME_STATUS_DTYPE.itemsize].view(dtype=FRAME_STATUS_DTYPE)
-        self.output = self.output_raw[FRAME_STATUS_DTYPE.itemsize:].view(dtype=self.output_array_dtype)
+        if input_raw is None:
+            input_raw = np.zeros([self.input_array_dtype.itemsize], dtype=np.uint8)
+        if output_raw is None:
+            output_raw = np.zeros([self.output_raw_size], dtype=np.uint8)
+        self.create_io_views(input_raw, output_raw)
         self.num_stringified_lines = 500
         self.stringified_lines = disasm.StringifiedHistory(self.num_stringified_lines)
         self.bootfile = None
@@ -80,13 +95,36 @@ class Emulator(Debugger):
         self.main_memory = None
         self.last_boot_state = None
         self.forced_modifier = None
+        self.frames_per_second = 0.0
         self.emulator_started = False
         self.cpu_history = None
+        self.trace_writer = None
         self.labels = None
 
         self.compute_color_map()
+        self.calc_palettes()
         self.screen_rgb, self.screen_rgba = self.calc_screens()
 
+    @classmethod
+    def calc_output_raw_size(cls):
+        return FRAME_STATUS_DTYPE.itemsize + cls.output_array_dtype.itemsize
+
+    @property
+    def output_raw_size(self):
+        return self.calc_output_raw_size()
+
+    def create_io_views(self, input_raw, output_raw):
+        """Set the arrays used to exchange data with the low level emulator.
+
+        The arrays may be supplied by the caller (e.g. backed by shared
+        memory) but must be uint8 arrays of the correct size.
+        """
+        self.input_raw = input_raw
+        self.input = self.input_raw.view(dtype=self.input_array_dtype)
+        self.output_raw = output_raw
+        self.status = self.output_raw[0:FRAME_STATUS_DTYPE.itemsize].view(dtype=FRAME_STATUS_DTYPE)
+        self.output = self.output_raw[FRAME_STATUS_DTYPE.itemsize:].view(dtype=self.output_array_dtype)
+
     @property
     def raw_array(self):
         return self.output_raw
@@ -188,11 +226,39 @@ class Emulator(Debugger):
     def compute_color_map(self):
         pass
 
+    def calc_palettes(self):
+        """Combine the per-channel color maps into lookup tables so that an
+        entire color indexed screen can be converted with a single gather.
+        """
+        try:
+            rmap, gmap, bmap = self.rmap, self.gmap, self.bmap
+        except AttributeError:
+            self.rgb_palette = self.rgba_palette = None
+            return
+        self.rgb_palette = np.stack([rmap, gmap, bmap], axis=-1).astype(np.uint8)
+        self.rgba_palette = np.empty((len(rmap), 4), dtype=np.uint8)
+        self.rgba_palette[:,0:3] = self.rgb_palette
+        self.rgba_palette[:,3] = 255
+
     def calc_screens(self):
         rgb = np.empty((self.height, self.width, 3), np.uint8)
         rgba = np.empty((self.height, self.width, 4), np.uint8)
         return rgb, rgba
 
+    def color_indexed_to_rgb(self, raw):
+        """Convert color indexes to RGB in the preallocated screen, returning
+        a read-only view that is only valid until the next call.
+        """
+        np.take(self.rgb_palette, raw, axis=0, out=self.screen_rgb)
+        return readonly_view(self.screen_rgb)
+
+    def color_indexed_to_rgba(self, raw):
+        """Convert color indexes to RGBA in the preallocated screen, returning
+        a read-only view that is only valid until the next call.
+        """
+        np.take(self.rgba_palette, raw, axis=0, out=self.screen_rgba)
+        return readonly_view(self.screen_rgba)
+
     ##### Serialization
 
     def restore_computed_attributes(self, state):
@@ -255,7 +321,7 @@ class Emulator(Debugger):
     #### cleanup
 
     def prepare_destroy(self):
-        pass
+        self.restart_tree.close()
 
     ##### Machine boot
 
@@ -328,6 +394,7 @@ class Emulator(Debugger):
         if KFEST_HACK:
             self.kfest_before_history_count = len(self.cpu_history)
         bpid = self.low_level_interface.next_frame(self.input, self.output_raw, self.debug_cmd, self.cpu_history)
+        self.update_trace()
         if self.is_frame_finished:
             self.frame_count += 1
             self.process_frame_events()
@@ -335,6 +402,55 @@ class Emulator(Debugger):
         self.forced_modifier = None
         return self.get_breakpoint(bpid)
 
+    def run_frames(self, num_frames, turbo=True):
+        """Run the emulator for num_frames, stopping early if a breakpoint is
+        hit.
+
+        In turbo mode the low level emulator loops over all the frames itself
+        without returning to python in between, and the video copy, CPU
+        history, memory access tracking and frame history are skipped for all
+        but the final frame. Emulators without a low level run_frames fall
+        back to calling next_frame without CPU history. The speed achieved is
+        stored in the frames_per_second attribute.
+        """
+        start_frame = int(self.current_frame_number)
+        start_time = time.perf_counter()
+        if not turbo:
+            bp = None
+            for i in range(num_frames):
+                bp = self.next_frame()
+                if bp is not None:
+                    break
+        else:
+            self.process_key_state()
+            saved_use_memory_access = self.status['use_memory_access'][0]
+            self.status['use_memory_access'][0] = 0
+            try:
+                run_frames = getattr(self.low_level_interface, "run_frames", None)
+                if run_frames is None:
+                    bpid = -1
+                    end = start_frame + num_frames
+                    while self.current_frame_number < end:
+                        bpid = self.low_level_interface.next_frame(self.input, self.output_raw, self.debug_cmd, None)
+                        if bpid >= 0:
+                            break
+                else:
+                    bpid = run_frames(self.input, self.output_raw, self.debug_cmd, num_frames)
+                self.update_trace()
+            finally:
+                self.status['use_memory_access'][0] = saved_use_memory_access
+            self.frame_count += int(self.current_frame_number) - start_frame
+            if self.is_frame_finished:
+                self.process_frame_events()
+                self.save_history()
+            self.forced_modifier = None
+            bp = self.get_breakpoint(bpid)
+        elapsed = time.perf_counter() - start_time
+        count = int(self.current_frame_number) - start_frame
+        self.frames_per_second = count / elapsed if elapsed > 0 else 0.0
+        log.debug(f"run_frames: {count} frames in {elapsed:.3f}s ({self.frames_per_second:.1f} fps, turbo={turbo})")
+        return bp
+
     def process_frame_events(self):
         still_waiting = []
         for count, callback in self.frame_event:
@@ -346,7 +462,7 @@ class Emulator(Debugger):
         self.frame_event = still_waiting
 
     def end_emulation(self):
-        pass
+        self.stop_trace()
 
     def debug_video(self):
         """Return text based view of portion of video array, for debugging
@@ -441,9 +557,51 @@ class Emulator(Debugger):
 
     def init_restart_tree(self):
         self.frame_count = 0
-        self.restart_tree = RestartTree()
+        try:
+            self.restart_tree.close()
+        except AttributeError:
+            pass
+        self.restart_tree = RestartTree(self.create_frame_history)
         self.current_restart = self.restart_tree.emulator_start
 
+    def create_frame_history(self):
+        return TieredFrameHistory(self.history_keyframe_interval, self.history_memory_budget, self.history_dense_frame_count, self.get_history_spill_dir(), regenerate_callback=self.regenerate_frames)
+
+    def get_history_spill_dir(self):
+        try:
+            from sawx.persistence import get_cache_dir
+            return get_cache_dir("emulator_history")
+        except (ImportError, TypeError):
+            # not running in the GUI, or the cache dir hasn't been set up yet
+            return None
+
+    def regenerate_frames(self, frame_history, base_frame_number, base_data, frame_number):
+        """Emulate forward from the saved state base_data to frame_number,
+        returning a list of (frame number, state) tuples for each frame
+        generated.
+
+        The current emulator state is restored afterward, and neither
+        breakpoints nor CPU history are affected.
+        """
+        saved_state = self.calc_current_state()
+        saved_input = self.input_raw.copy()
+        free_run = self.create_free_run_commands()
+        frames = []
+        try:
+            self.restore_state(base_data)
+            while self.current_frame_number < frame_number:
+                try:
+                    self.input_raw[:] = frame_history.get_input(self.current_frame_number + 1)
+                except IndexError:
+                    pass
+                self.low_level_interface.next_frame(self.input, self.output_raw, free_run, None)
+                if self.is_frame_finished:
+                    frames.append((int(self.current_frame_number), self.calc_current_state()))
+        finally:
+            self.restore_state(saved_state)
+            self.input_raw[:] = saved_input
+        return frames
+
     def get_restart_summary(self):
         return self.restart_tree.get_summary()
 
@@ -462,11 +620,14 @@ class Emulator(Debugger):
         # History is saved in a big list, which will waste space for empty
         # entries but makes things extremely easy to manage. Simply delete
         # a history entry by setting it to NONE.
+        if not self.save_frame_history and not force:
+            return
         frame_number = int(self.status['frame_number'][0])
         if force or self.current_restart.is_memorable(frame_number):
             log.debug(f"Saving history at {frame_number}")
-            d = self.calc_current_state()
-            self.current_restart.save_frame(frame_number, d)
+            # the frame history makes its own copy, so save straight from the
+            # live output rather than copying through the frame buffer ring
+            self.current_restart.save_frame(frame_number, self.output_raw, self.input_raw)
             if KFEST_HACK:
                 try:
                     for i in range(self.kfest_before_history_count, len(self.cpu_history)):
@@ -564,6 +725,7 @@ class Emulator(Debugger):
         self.restore_restart(restart_number, frame_number)
         self.step_into(num_instructions)
         bpid = self.low_level_interface.next_frame(self.input, self.output_raw, self.debug_cmd, self.cpu_history)
+        self.update_trace()
         if self.is_frame_finished:
             self.frame_count += 1
             self.process_frame_events()
@@ -628,6 +790,27 @@ class Emulator(Debugger):
             self.kfest_history_to_frame_number = [0]*num_entries
             self.kfest_frame_number_to_history = {}
 
+    def start_trace(self, path):
+        """Save every CPU history entry from now on to a trace directory;
+        see `atrip.disassemblers.trace`
+        """
+        self.stop_trace()
+        self.trace_writer = TraceWriter(self.cpu_history, path)
+
+    def update_trace(self):
+        """Save the CPU history entries added since the last update to the
+        trace, if one is active. Must be called at least once per frame so
+        the history ring doesn't wrap around before the entries are saved.
+        """
+        if self.trace_writer is not None:
+            self.trace_writer.update()
+
+    def stop_trace(self):
+        if self.trace_writer is not None:
+            self.trace_writer.close()
+            log.info(f"stopped trace: {self.trace_writer}")
+            self.trace_writer = None
+
     def cpu_history_show_range(self, from_index, details=False):
         self.cpu_history.debug_range(from_index)
 
@@ -0,0 +1,303 @@
+"""Headless batch emulation using a pool of worker processes
+
+The low level emulators keep their state in C globals, so only a single
+instance can run in any process. The pool works around this by starting one
+emulator per worker process. Each worker's input and output arrays live in
+shared memory so the frame data never has to be pickled; the parent process
+gets an emulator object that uses the same shared arrays, so the usual
+accessors like get_frame_rgb work on the worker's current frame.
+
+Nothing here requires wx, so it can be used from scripts, e.g.:
+
+    with EmulatorPool("atari800", 8) as pool:
+        for result in pool.boot_and_run(glob.glob("*.atr"), 300):
+            save_png(result.pathname + ".png", result.rgb)
+"""
+import os
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from . import errors
+from .emulator import find_emulator
+
+import logging
+log = logging.getLogger(__name__)
+
+
+#### Worker process side
+
+def cmd_configure(emu, emu_args, instruction_history_count):
+    emu.configure_emulator(emu_args, instruction_history_count)
+    emu.save_frame_history = False
+
+def cmd_boot(emu, pathname):
+    emu.boot_from_file(pathname)
+
+def cmd_load_disk(emu, drive_num, pathname):
+    emu.load_disk(drive_num, pathname)
+
+def cmd_coldstart(emu):
+    emu.coldstart()
+
+def cmd_run(emu, num_frames):
+    # a breakpoint can only stop the emulator early if one was set by a
+    # previous command, so let the caller know where it stopped
+    emu.run_frames(num_frames, turbo=True)
+    return int(emu.current_frame_number)
+
+def cmd_boot_and_run(emu, pathname, num_frames):
+    emu.boot_from_file(pathname)
+    return cmd_run(emu, num_frames)
+
+worker_commands = {
+    "configure": cmd_configure,
+    "boot": cmd_boot,
+    "load_disk": cmd_load_disk,
+    "coldstart": cmd_coldstart,
+    "run": cmd_run,
+    "boot_and_run": cmd_boot_and_run,
+}
+
+
+def worker_main(emu_cls, conn, shared_input, shared_output):
+    input_raw = np.frombuffer(shared_input, dtype=np.uint8)
+    output_raw = np.frombuffer(shared_output, dtype=np.uint8)
+    emu = emu_cls(input_raw, output_raw)
+    while True:
+        try:
+            cmd, args = conn.recv()
+        except EOFError:
+            break
+        if cmd == "quit":
+            break
+        try:
+            result = worker_commands[cmd](emu, *args)
+        except Exception as e:
+            conn.send(("error", f"{cmd}: {e}\n{traceback.format_exc()}"))
+        else:
+            conn.send(("ok", result))
+    emu.end_emulation()
+    conn.close()
+
+
+#### Parent process side
+
+class EmulatorWorker:
+    """Parent-side handle to an emulator running in a worker process.
+
+    The emulator attribute is an unconfigured instance of the emulator class
+    that shares its input and output arrays with the worker, so it can be
+    used to examine the current frame (video, frame status, raw output) and
+    to set the input for the next frame.
+    """
+
+    def __init__(self, ctx, emu_cls, worker_number):
+        self.worker_number = worker_number
+        self.shared_input = ctx.RawArray('B', emu_cls.input_array_dtype.itemsize)
+        self.shared_output = ctx.RawArray('B', emu_cls.calc_output_raw_size())
+        input_raw = np.frombuffer(self.shared_input, dtype=np.uint8)
+        output_raw = np.frombuffer(self.shared_output, dtype=np.uint8)
+        self.emulator = emu_cls(input_raw, output_raw)
+        self.emulator.save_frame_history = False
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(emu_cls, child_conn, self.shared_input, self.shared_output), name=f"emulator-worker-{worker_number}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.pending = None
+
+    def __str__(self):
+        return f"<EmulatorWorker {self.worker_number}: pid={self.process.pid} pending={self.pending}>"
+
+    @property
+    def is_busy(self):
+        return self.pending is not None
+
+    @property
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def send(self, cmd, *args, tag=None):
+        if self.is_busy:
+            raise errors.EmulatorInUseError(f"worker {self.worker_number} is still processing {self.pending}")
+        self.pending = (cmd, tag)
+        self.conn.send((cmd, args))
+
+    def receive(self):
+        try:
+            status, result = self.conn.recv()
+        except (EOFError, OSError) as e:
+            # the worker process has died, so no result is coming
+            self.pending = None
+            self.process.join(1)
+            raise errors.EmulatorWorkerError(f"worker {self.worker_number} died with exit code {self.process.exitcode}: {e!r}")
+        self.pending = None
+        if status == "error":
+            raise errors.EmulatorWorkerError(f"worker {self.worker_number}: {result}")
+        return result
+
+    def call(self, cmd, *args):
+        self.send(cmd, *args)
+        return self.receive()
+
+    def close(self):
+        if self.process.is_alive():
+            try:
+                self.conn.send(("quit", ()))
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.conn.close()
+
+
+class BootResult:
+    def __init__(self, pathname, worker, frame_number):
+        self.pathname = pathname
+        self.frame_number = frame_number
+        emu = worker.emulator
+        rgb = emu.get_frame_rgb()
+        self.rgb = None if rgb is None else rgb.copy()
+        self.cycles_since_power_on = int(emu.cycles_since_power_on)
+
+    def __str__(self):
+        return f"<BootResult {self.pathname}: frame={self.frame_number} cycles={self.cycles_since_power_on}>"
+
+
+class EmulatorPool:
+    """Run several independent instances of an emulator, each in its own
+    process.
+
+    Each worker is configured with emu_args and keeps only a small CPU
+    history and no frame history, as neither are useful for batch jobs.
+
+    The emulator is specified by name or by class; the class must be
+    importable by the worker processes.
+    """
+
+    def __init__(self, emulator_name, num_workers=None, emu_args=None, instruction_history_count=1000):
+        if isinstance(emulator_name, type):
+            self.emu_cls = emulator_name
+        else:
+            self.emu_cls = find_emulator(emulator_name)
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        self.num_workers = num_workers
+        self.emu_args = emu_args
+        self.instruction_history_count = instruction_history_count
+        self.ctx = None
+        self.workers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def start(self):
+        if self.workers:
+            return
+        # spawn rather than fork so each worker gets a fresh copy of the C
+        # globals, no matter what the parent process has done
+        self.ctx = multiprocessing.get_context("spawn")
+        self.workers = [EmulatorWorker(self.ctx, self.emu_cls, i) for i in range(self.num_workers)]
+        try:
+            for worker in self.workers:
+                worker.send("configure", self.emu_args, self.instruction_history_count)
+            for worker in self.workers:
+                worker.receive()
+        except errors.EmulatorWorkerError:
+            self.close()
+            raise
+        log.debug(f"started {self.num_workers} {self.emu_cls.name} workers")
+
+    def replace_worker(self, worker):
+        """Start a new worker in place of one whose process has died, returning
+        the new worker or None if it couldn't be started either, in which case
+        the pool continues with one fewer worker.
+        """
+        worker.close()
+        index = self.workers.index(worker)
+        new_worker = EmulatorWorker(self.ctx, self.emu_cls, worker.worker_number)
+        try:
+            new_worker.call("configure", self.emu_args, self.instruction_history_count)
+        except errors.EmulatorWorkerError as e:
+            log.error(f"can't replace dead worker {worker.worker_number}: {e}")
+            new_worker.close()
+            del self.workers[index]
+            return None
+        self.workers[index] = new_worker
+        return new_worker
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+
+    def run_jobs(self, jobs, process_result):
+        """Distribute jobs to idle workers and yield results as they complete.
+
+        Each job is a tuple of (tag, command, args...) using a command name
+        from worker_commands. When a worker finishes, process_result(worker,
+        tag, value) is called in the parent process while the worker's shared
+        output still holds the state at the end of the job, and its return
+        value is yielded. Results are yielded in order of completion, not in
+        the order of the jobs.
+
+        If a worker process dies, its job fails and a new worker is started
+        in its place.
+        """
+        self.start()
+        jobs = iter(jobs)
+        idle = list(self.workers)
+        busy = {}
+        finished = False
+        while True:
+            while idle:
+                try:
+                    tag, cmd, *args = next(jobs)
+                except StopIteration:
+                    finished = True
+                    break
+                worker = idle.pop()
+                worker.send(cmd, *args, tag=tag)
+                busy[worker.conn] = worker
+            if not busy:
+                if not finished:
+                    raise errors.EmulatorWorkerError("no emulator workers left to run the remaining jobs")
+                break
+            for conn in wait(list(busy.keys())):
+                worker = busy.pop(conn)
+                _, tag = worker.pending
+                try:
+                    value = worker.receive()
+                except errors.EmulatorWorkerError as e:
+                    log.error(f"job {tag} failed: {e}")
+                    value = e
+                if worker.is_alive:
+                    idle.append(worker)
+                else:
+                    new_worker = self.replace_worker(worker)
+                    if new_worker is not None:
+                        idle.append(new_worker)
+                yield process_result(worker, tag, value)
+
+    def boot_and_run(self, pathnames, num_frames, process_result=None):
+        """Boot each file and run for num_frames, yielding a BootResult (or the
+        return value of process_result(worker, pathname, frame_number)) for
+        each as it completes.
+
+        If the job fails in the worker, frame_number will be the
+        EmulatorWorkerError instance.
+        """
+        if process_result is None:
+            def process_result(worker, pathname, frame_number):
+                if isinstance(frame_number, Exception):
+                    return frame_number
+                return BootResult(pathname, worker, frame_number)
+        jobs = ((pathname, "boot_and_run", pathname, num_frames) for pathname in pathnames)
+        yield from self.run_jobs(jobs, process_result)
@@ -10,6 +10,7 @@ except ImportError:
     wx = None
 
 from ...utils import apple2util as a2
+from ...utils.framebufferutil import readonly_view
 
 from ..generic6502 import lib6502, Generic6502
 from ..generic6502 import dtypes as d
@@ -72,21 +73,22 @@ class Crabapple(Generic6502):
             output = self.output
         else:
             _, output = self.get_history(frame_number)
-        doubled = np.empty((384, 40), dtype=np.uint8)
+        try:
+            doubled, raw = self.a2_screen_buffers
+        except AttributeError:
+            doubled = np.empty((384, 40), dtype=np.uint8)
+            raw = np.empty(self.height * self.width, dtype=np.uint8)
+            self.a2_screen_buffers = doubled, raw
         source = output['video'].reshape((192, 40))
         doubled[::2,:] = source
         doubled[1::2,:] = source
-        raw = np.empty(self.height * self.width, dtype=np.uint8)
         a2.to_560_bw_pixels(doubled, raw)
         #print "get_raw_screen", frame_number, raw
-        return raw.reshape((self.height, self.width))
+        return readonly_view(raw.reshape((self.height, self.width)))
 
     def get_frame_rgb(self, frame_number=-1):
         raw = self.get_color_indexed_screen(frame_number)
-        self.screen_rgb[:,:,0] = self.rmap[raw]
-        self.screen_rgb[:,:,1] = self.gmap[raw]
-        self.screen_rgb[:,:,2] = self.bmap[raw]
-        return self.screen_rgb
+        return self.color_indexed_to_rgb(raw)
 
     if wx is not None:
         def process_key_down(self, evt, keycode):
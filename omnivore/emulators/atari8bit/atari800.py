@@ -7,6 +7,7 @@ from . import dtypes as d
 from . import akey
 from .colors import NTSC
 from ...emulator import Emulator
+from ...utils.framebufferutil import readonly_view
 from ...errors import FrameNotFinishedError
 
 import logging
@@ -240,30 +241,19 @@ class Atari800Mixin:
             _, output = self.get_history(frame_number)
         raw = output['video'].reshape((self.height, self.width))
         #print "get_raw_screen", frame_number, raw
-        return raw
+        return readonly_view(raw)
 
     def get_frame_rgb(self, frame_number=-1):
         raw = self.get_color_indexed_screen(frame_number)
-        self.screen_rgb[:,:,0] = self.rmap[raw]
-        self.screen_rgb[:,:,1] = self.gmap[raw]
-        self.screen_rgb[:,:,2] = self.bmap[raw]
-        return self.screen_rgb
+        return self.color_indexed_to_rgb(raw)
 
     def get_frame_rgba(self, frame_number=-1):
         raw = self.get_color_indexed_screen(frame_number)
-        self.screen_rgba[:,:,0] = self.rmap[raw]
-        self.screen_rgba[:,:,1] = self.gmap[raw]
-        self.screen_rgba[:,:,2] = self.bmap[raw]
-        self.screen_rgba[:,:,3] = 255
-        return self.screen_rgba
+        return self.color_indexed_to_rgba(raw)
 
     def get_frame_rgba_opengl(self, frame_number=-1):
         raw = np.flipud(self.get_color_indexed_screen(frame_number))
-        self.screen_rgba[:,:,0] = self.rmap[raw]
-        self.screen_rgba[:,:,1] = self.gmap[raw]
-        self.screen_rgba[:,:,2] = self.bmap[raw]
-        self.screen_rgba[:,:,3] = 255
-        return self.screen_rgba
+        return self.color_indexed_to_rgba(raw)
 
     ##### Input routines
 
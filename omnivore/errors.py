@@ -24,6 +24,12 @@ class EmulatorInUseError(EmulatorError):
     pass
 
 
+class EmulatorWorkerError(EmulatorError):
+    """Raised when a command fails in a headless emulator worker process
+    """
+    pass
+
+
 class FrameNotFinishedError(EmulatorError):
     """Raised when an operation that must occur between frames is
     attempted while in the middle of a frame.
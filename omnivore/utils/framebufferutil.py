@@ -0,0 +1,12 @@
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def readonly_view(arr):
+    """Return a view of the array that can't be used to modify the data
+    """
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
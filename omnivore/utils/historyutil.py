@@ -1,5 +1,8 @@
 import os
+import zlib
+import bisect
 import tempfile
+from collections import OrderedDict
 
 import numpy as np
 
@@ -9,13 +12,569 @@ import logging
 log = logging.getLogger(__name__)
 
 
+# Runs of changed bytes separated by fewer than this many unchanged bytes are
+# merged into a single run, because each run costs 8 bytes of bookkeeping
+RUN_MERGE_GAP = 8
+
+
+def calc_run_indexes(starts, lengths):
+    """Return the array of indexes covered by the runs described by the
+    starts and lengths arrays.
+    """
+    offsets = np.cumsum(lengths, dtype=np.int64) - lengths
+    total = int(offsets[-1] + lengths[-1]) if len(lengths) > 0 else 0
+    return np.arange(total, dtype=np.int64) + np.repeat(starts.astype(np.int64) - offsets, lengths)
+
+
+def encode_xor_delta(reference, data, scratch=None):
+    """Compute the run-length encoded XOR difference between two frames of
+    identical size.
+
+    Returns a tuple (starts, lengths, values), where values holds the XOR'd
+    bytes of every run concatenated together. If supplied, scratch is used
+    as working space to avoid allocating a frame-sized temporary array.
+    """
+    diff = np.bitwise_xor(reference, data, out=scratch)
+    changed = np.flatnonzero(diff)
+    if len(changed) == 0:
+        empty = np.zeros(0, dtype=np.uint32)
+        return empty, empty, np.zeros(0, dtype=np.uint8)
+    breaks = np.flatnonzero(np.diff(changed) > RUN_MERGE_GAP)
+    starts = changed[np.concatenate(([0], breaks + 1))]
+    ends = changed[np.concatenate((breaks, [len(changed) - 1]))] + 1
+    lengths = ends - starts
+    values = diff[calc_run_indexes(starts, lengths)]
+    return starts.astype(np.uint32), lengths.astype(np.uint32), values
+
+
+def apply_xor_delta(data, starts, lengths, values):
+    """Apply a delta created by encode_xor_delta to data in place.
+
+    Because the delta is an XOR, applying it to either frame produces the
+    other one.
+    """
+    if len(values) > 0:
+        data[calc_run_indexes(starts, lengths)] ^= values
+
+
+class FrameHistory:
+    """Frame storage for a Restart that keeps a complete copy of every frame.
+
+    This is the base class for history backends; subclasses can store frames
+    any way they like as long as they provide the same mapping interface of
+    frame number to the raw state array.
+    """
+
+    def __init__(self):
+        self.frames = dict()
+        self.sorted_keys = []
+
+        # the emulator input used to generate each frame, stored only when it
+        # changes from the previous frame
+        self.input_changes = dict()
+        self.input_change_keys = []
+
+    def create_empty(self):
+        return self.__class__()
+
+    def close(self):
+        pass
+
+    #### dunder methods
+
+    def __len__(self):
+        return len(self.sorted_keys)
+
+    def __contains__(self, frame_number):
+        return frame_number in self.frames
+
+    def __iter__(self):
+        return iter(self.sorted_keys)
+
+    def __getitem__(self, frame_number):
+        return self.frames[frame_number]
+
+    def __setitem__(self, frame_number, data):
+        if frame_number not in self.frames:
+            bisect.insort(self.sorted_keys, frame_number)
+        self.frames[frame_number] = np.array(data, dtype=np.uint8, copy=True)
+
+    #### mapping interface
+
+    def keys(self):
+        return list(self.sorted_keys)
+
+    def items(self):
+        for frame_number in self.sorted_keys:
+            yield frame_number, self[frame_number]
+
+    @property
+    def nbytes(self):
+        return sum([d.nbytes for d in self.frames.values()])
+
+    #### emulator input
+
+    def save_input(self, frame_number, input_data):
+        try:
+            current = self.get_input(frame_number)
+        except IndexError:
+            current = None
+        if current is None or not np.array_equal(current, input_data):
+            if frame_number not in self.input_changes:
+                bisect.insort(self.input_change_keys, frame_number)
+            self.input_changes[frame_number] = np.array(input_data, dtype=np.uint8, copy=True)
+
+    def get_input(self, frame_number):
+        """Return the input that was in effect when frame_number was generated.
+        """
+        i = bisect.bisect_right(self.input_change_keys, frame_number)
+        if i == 0:
+            raise IndexError(f"No input recorded for frame {frame_number}")
+        return self.input_changes[self.input_change_keys[i - 1]]
+
+    #### search
+
+    def previous_key(self, frame_number):
+        """Return the largest stored frame number that is less than
+        frame_number, or raise IndexError.
+        """
+        i = bisect.bisect_left(self.sorted_keys, frame_number)
+        if i == 0:
+            raise IndexError("No previous frame")
+        return self.sorted_keys[i - 1]
+
+    def next_key(self, frame_number):
+        """Return the smallest stored frame number that is greater than
+        frame_number, or raise IndexError.
+        """
+        i = bisect.bisect_right(self.sorted_keys, frame_number)
+        if i == len(self.sorted_keys):
+            raise IndexError("No next frame")
+        return self.sorted_keys[i]
+
+
+class DeltaFrameHistory(FrameHistory):
+    """Frame storage that keeps a full keyframe every keyframe_interval frames
+    and stores the frames in between as run-length encoded XOR deltas against
+    the previous frame.
+
+    If memory_budget is specified (in bytes), the oldest frames are discarded
+    when the storage grows beyond that size.
+
+    Frames are returned as new arrays, so callers are free to modify them
+    without affecting the stored history.
+    """
+
+    def __init__(self, keyframe_interval=60, memory_budget=None):
+        FrameHistory.__init__(self)
+        self.keyframe_interval = keyframe_interval
+        self.memory_budget = memory_budget
+
+        # frame number -> (base frame number, data) for keyframes, where base
+        # is None; or (base frame number, (starts, lengths, values)) for deltas
+        self.frames = dict()
+
+        # base frame number -> frame number of the delta that references it
+        self.dependents = dict()
+        self.stored_bytes = 0
+
+        self.last_frame_number = None
+        self.last_frame = None
+        self.frames_since_keyframe = 0
+
+        self.cached_frame_number = None
+        self.cached_frame = None
+        self.scratch = None
+
+    def create_empty(self):
+        return self.__class__(self.keyframe_interval, self.memory_budget)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['scratch'] = None
+        return state
+
+    @property
+    def nbytes(self):
+        return self.stored_bytes
+
+    @property
+    def num_keyframes(self):
+        return len([f for f in self.frames.values() if f[0] is None])
+
+    #### storage
+
+    def calc_entry_size(self, entry):
+        base, payload = entry
+        if base is None:
+            return payload.nbytes
+        return sum([a.nbytes for a in payload])
+
+    def is_keyframe_needed(self, frame_number, data):
+        # Deltas are only computed when appending to the end of the history;
+        # anything else (out of order frames, the previous frame having been
+        # discarded, etc.) is stored as a full keyframe.
+        if self.last_frame_number is None or self.last_frame_number not in self.frames:
+            return True
+        if frame_number <= self.last_frame_number or len(data) != len(self.last_frame):
+            return True
+        return self.frames_since_keyframe + 1 >= self.keyframe_interval
+
+    def __setitem__(self, frame_number, data):
+        data = np.array(data, dtype=np.uint8, copy=True)
+        if frame_number in self.frames:
+            self.discard_frame(frame_number)
+        if self.is_keyframe_needed(frame_number, data):
+            entry = (None, data)
+            self.frames_since_keyframe = 0
+        else:
+            if self.scratch is None or len(self.scratch) != len(data):
+                self.scratch = np.empty_like(data)
+            entry = (self.last_frame_number, encode_xor_delta(self.last_frame, data, self.scratch))
+            self.dependents[self.last_frame_number] = frame_number
+            self.frames_since_keyframe += 1
+        self.frames[frame_number] = entry
+        self.stored_bytes += self.calc_entry_size(entry)
+        bisect.insort(self.sorted_keys, frame_number)
+        if self.last_frame_number is None or frame_number >= self.last_frame_number:
+            self.last_frame_number = frame_number
+            self.last_frame = data
+        self.cached_frame_number = frame_number
+        self.cached_frame = data
+        self.enforce_memory_budget()
+
+    def remove_entry(self, frame_number):
+        entry = self.frames.pop(frame_number)
+        self.stored_bytes -= self.calc_entry_size(entry)
+        self.sorted_keys.remove(frame_number)
+        base = entry[0]
+        if base is not None and self.dependents.get(base) == frame_number:
+            del self.dependents[base]
+        if self.cached_frame_number == frame_number:
+            self.cached_frame_number = None
+            self.cached_frame = None
+
+    def release_frame(self, frame_number):
+        """Make sure that no delta references frame_number so that it can be
+        replaced or discarded.
+
+        A delta that depends on the frame is re-encoded against the frame's
+        own base, or turned into a keyframe if the frame is a keyframe.
+        """
+        dependent = self.dependents.get(frame_number)
+        if dependent is None:
+            return
+        base = self.frames[frame_number][0]
+        data = self.reconstruct(dependent)
+        if base is None:
+            entry = (None, data)
+        else:
+            entry = (base, encode_xor_delta(self.reconstruct(base), data))
+            self.dependents[base] = dependent
+        del self.dependents[frame_number]
+        self.stored_bytes += self.calc_entry_size(entry) - self.calc_entry_size(self.frames[dependent])
+        self.frames[dependent] = entry
+
+    def discard_frame(self, frame_number):
+        self.release_frame(frame_number)
+        self.remove_entry(frame_number)
+
+    def evict_frame(self, frame_number):
+        log.debug(f"history over budget ({self.stored_bytes} > {self.memory_budget}), discarding frame {frame_number}")
+        self.discard_frame(frame_number)
+
+    def enforce_memory_budget(self):
+        if self.memory_budget is None:
+            return
+        while self.stored_bytes > self.memory_budget and len(self.sorted_keys) > 1:
+            self.evict_frame(self.sorted_keys[0])
+
+    #### retrieval
+
+    def reconstruct(self, frame_number):
+        """Return the frame data, which may be the internal cached array.
+        """
+        if frame_number == self.cached_frame_number:
+            return self.cached_frame
+        if self.cached_frame_number is not None and self.dependents.get(frame_number) == self.cached_frame_number:
+            # XOR deltas are reversible, so stepping backward from the cached
+            # frame only needs the cached frame's own delta
+            data = self.cached_frame.copy()
+            apply_xor_delta(data, *self.frames[self.cached_frame_number][1])
+        else:
+            # walk back to a keyframe (or the cached frame) and then apply
+            # each delta going forward
+            chain = []
+            n = frame_number
+            while True:
+                base, payload = self.frames[n]  # raises KeyError if missing
+                if base is None:
+                    data = payload.copy()
+                    break
+                chain.append(payload)
+                if base == self.cached_frame_number:
+                    data = self.cached_frame.copy()
+                    break
+                n = base
+            for payload in reversed(chain):
+                apply_xor_delta(data, *payload)
+        self.cached_frame_number = frame_number
+        self.cached_frame = data
+        return data
+
+    def __getitem__(self, frame_number):
+        return self.reconstruct(frame_number).copy()
+
+
+class TieredFrameHistory(DeltaFrameHistory):
+    """Frame storage with a retention policy that keeps every frame of the
+    most recent dense_count frames and progressively thins older frames: in
+    the next dense_count frames only every 2nd frame is kept, in the next
+    2 * dense_count frames only every 4th, then every 8th, etc.
+
+    Frames that are pushed out of memory by the memory budget are appended to
+    a spill file in spill_dir, and are read back through a small LRU cache.
+
+    Thinned frames are still reported as present; when requested, they are
+    regenerated by calling regenerate_callback(history, base_frame_number,
+    base_data, frame_number), which must return an iterable of
+    (frame_number, data) tuples produced by emulating forward from the
+    stored base frame up to and including the requested frame.
+    """
+
+    def __init__(self, keyframe_interval=60, memory_budget=None, dense_count=600, spill_dir=None, cache_count=16, regenerate_callback=None):
+        DeltaFrameHistory.__init__(self, keyframe_interval, memory_budget)
+        self.dense_count = dense_count
+        self.spill_dir = spill_dir
+        self.cache_count = cache_count
+        self.regenerate_callback = regenerate_callback
+
+        # ranges of frame numbers that have been recorded, whether or not the
+        # frame is currently stored; end values are exclusive
+        self.range_starts = []
+        self.range_ends = []
+
+        self.spill_path = None
+        self.spill_fh = None
+        self.spilled = dict()  # frame number -> (file offset, byte count)
+        self.spilled_keys = []
+
+        self.lru = OrderedDict()
+        self.frames_since_thinning = 0
+
+    def create_empty(self):
+        return self.__class__(self.keyframe_interval, self.memory_budget, self.dense_count, self.spill_dir, self.cache_count, self.regenerate_callback)
+
+    def close(self):
+        if self.spill_fh is not None:
+            self.spill_fh.close()
+            self.spill_fh = None
+        if self.spill_path is not None:
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                log.warning(f"Unable to remove history spill file {self.spill_path}")
+            self.spill_path = None
+        self.spilled = dict()
+        self.spilled_keys = []
+
+    def __getstate__(self):
+        state = DeltaFrameHistory.__getstate__(self)
+        state['spill_fh'] = None
+        state['regenerate_callback'] = None
+        state['lru'] = OrderedDict()
+        return state
+
+    #### recorded frame ranges
+
+    def add_recorded(self, frame_number):
+        starts, ends = self.range_starts, self.range_ends
+        i = bisect.bisect_right(starts, frame_number) - 1
+        if i >= 0 and frame_number < ends[i]:
+            return
+        if i >= 0 and frame_number == ends[i]:
+            ends[i] += 1
+            if i + 1 < len(starts) and ends[i] == starts[i + 1]:
+                ends[i] = ends[i + 1]
+                del starts[i + 1]
+                del ends[i + 1]
+        elif i + 1 < len(starts) and frame_number + 1 == starts[i + 1]:
+            starts[i + 1] = frame_number
+        else:
+            starts.insert(i + 1, frame_number)
+            ends.insert(i + 1, frame_number + 1)
+
+    def __len__(self):
+        return sum([e - s for s, e in zip(self.range_starts, self.range_ends)])
+
+    def __contains__(self, frame_number):
+        i = bisect.bisect_right(self.range_starts, frame_number) - 1
+        return i >= 0 and frame_number < self.range_ends[i]
+
+    def __iter__(self):
+        for s, e in zip(self.range_starts, self.range_ends):
+            yield from range(s, e)
+
+    def keys(self):
+        return list(iter(self))
+
+    def items(self):
+        # only frames that are actually stored; regenerating every thinned
+        # frame would defeat the purpose of thinning them
+        for frame_number in sorted(self.sorted_keys + self.spilled_keys):
+            yield frame_number, self[frame_number]
+
+    def previous_key(self, frame_number):
+        n = frame_number - 1
+        i = bisect.bisect_right(self.range_starts, n) - 1
+        if i < 0:
+            raise IndexError("No previous frame")
+        return min(n, self.range_ends[i] - 1)
+
+    def next_key(self, frame_number):
+        n = frame_number + 1
+        i = bisect.bisect_right(self.range_starts, n) - 1
+        if i >= 0 and n < self.range_ends[i]:
+            return n
+        if i + 1 < len(self.range_starts):
+            return self.range_starts[i + 1]
+        raise IndexError("No next frame")
+
+    #### storage
+
+    def __setitem__(self, frame_number, data):
+        self.forget_spilled(frame_number)
+        self.lru.pop(frame_number, None)
+        DeltaFrameHistory.__setitem__(self, frame_number, data)
+        self.add_recorded(frame_number)
+        self.frames_since_thinning += 1
+        if self.frames_since_thinning >= max(1, self.dense_count // 4):
+            self.thin(frame_number)
+
+    def is_retained(self, frame_number, newest):
+        if frame_number == self.range_starts[0]:
+            # always keep the first frame so there is a base from which to
+            # regenerate anything
+            return True
+        age = newest - frame_number
+        if age < self.dense_count:
+            return True
+        tier = (age // self.dense_count).bit_length()
+        return frame_number % (1 << tier) == 0
+
+    def thin(self, newest):
+        self.frames_since_thinning = 0
+        for frame_number in [f for f in self.sorted_keys if not self.is_retained(f, newest)]:
+            self.discard_frame(frame_number)
+        for frame_number in [f for f in self.spilled_keys if not self.is_retained(f, newest)]:
+            # the space in the append-only spill file isn't reclaimed
+            self.forget_spilled(frame_number)
+
+    def evict_frame(self, frame_number):
+        data = self.reconstruct(frame_number)
+        self.spill(frame_number, data)
+        self.discard_frame(frame_number)
+
+    #### spill file
+
+    def spill(self, frame_number, data):
+        if self.spill_fh is None:
+            if self.spill_path is None:
+                fd, self.spill_path = tempfile.mkstemp(".omnivore_history", dir=self.spill_dir)
+                self.spill_fh = os.fdopen(fd, "w+b")
+            else:
+                self.spill_fh = open(self.spill_path, "a+b")
+        packed = zlib.compress(data.tobytes(), 1)
+        self.spill_fh.seek(0, os.SEEK_END)
+        offset = self.spill_fh.tell()
+        self.spill_fh.write(packed)
+        self.forget_spilled(frame_number)
+        self.spilled[frame_number] = (offset, len(packed))
+        bisect.insort(self.spilled_keys, frame_number)
+        log.debug(f"spilled frame {frame_number} to {self.spill_path} at {offset}")
+
+    def forget_spilled(self, frame_number):
+        if frame_number in self.spilled:
+            del self.spilled[frame_number]
+            self.spilled_keys.remove(frame_number)
+
+    def read_spilled(self, frame_number):
+        offset, count = self.spilled[frame_number]
+        if self.spill_fh is None:
+            self.spill_fh = open(self.spill_path, "a+b")
+        self.spill_fh.flush()
+        self.spill_fh.seek(offset)
+        return np.frombuffer(zlib.decompress(self.spill_fh.read(count)), dtype=np.uint8).copy()
+
+    #### retrieval
+
+    def add_to_cache(self, frame_number, data):
+        self.lru[frame_number] = data
+        self.lru.move_to_end(frame_number)
+        while len(self.lru) > self.cache_count:
+            self.lru.popitem(last=False)
+
+    def find_stored_base(self, frame_number):
+        """Find the nearest stored frame, in memory or spilled to disk, at or
+        before frame_number.
+        """
+        candidates = []
+        for keys in [self.sorted_keys, self.spilled_keys]:
+            i = bisect.bisect_right(keys, frame_number)
+            if i > 0:
+                candidates.append(keys[i - 1])
+        if not candidates:
+            raise KeyError(frame_number)
+        return max(candidates)
+
+    def load_stored(self, frame_number):
+        if frame_number in self.frames:
+            return self.reconstruct(frame_number)
+        try:
+            data = self.lru[frame_number]
+        except KeyError:
+            data = self.read_spilled(frame_number)
+            self.add_to_cache(frame_number, data)
+        else:
+            self.lru.move_to_end(frame_number)
+        return data
+
+    def regenerate(self, frame_number):
+        if self.regenerate_callback is None:
+            raise KeyError(frame_number)
+        base = self.find_stored_base(frame_number)
+        log.debug(f"regenerating frame {frame_number} starting from frame {base}")
+        data = None
+        for n, generated in self.regenerate_callback(self, base, self.load_stored(base).copy(), frame_number):
+            self.add_to_cache(n, generated)
+            if n == frame_number:
+                data = generated
+        if data is None:
+            raise KeyError(frame_number)
+        return data
+
+    def __getitem__(self, frame_number):
+        if frame_number in self.frames or frame_number in self.spilled:
+            return self.load_stored(frame_number).copy()
+        if frame_number not in self:
+            raise KeyError(frame_number)
+        try:
+            data = self.lru[frame_number]
+        except KeyError:
+            data = self.regenerate(frame_number)
+        else:
+            self.lru.move_to_end(frame_number)
+        return data.copy()
+
+
 class RestartTree(Serializable):
     name = None
 
     serializable_attributes = ['restarts']
 
-    def __init__(self):
-        self.emulator_start = Restart(0, None)
+    def __init__(self, frame_history_factory=FrameHistory):
+        self.frame_history_factory = frame_history_factory
+        self.emulator_start = Restart(0, None, 0, frame_history_factory())
         self.restarts = [self.emulator_start]
 
     #### dunder methods
@@ -44,10 +603,14 @@ class RestartTree(Serializable):
         restart = self.restarts[restart_number]
         parent = restart.get_restart(frame_number)
         index = len(self.restarts)
-        new_restart = Restart(index, parent, frame_number)
+        new_restart = Restart(index, parent, frame_number, self.frame_history_factory())
         self.restarts.append(new_restart)
         return new_restart
 
+    def close(self):
+        for r in self.restarts:
+            r.frame_history.close()
+
     def get_summary(self):
         # Return list of tuples for use in checkpoint tree. Each tuple in in form (parent restart number, start frame, restart number, last frame)
         restarts = [(-1, 0, 0, self.emulator_start.end_frame)]
@@ -62,15 +625,17 @@ class Restart(Serializable):
     serializable_attributes = ['frame_history']
     serializable_computed = {'frame_history'}
 
-    def __init__(self, restart_number, parent, start_frame=0):
+    def __init__(self, restart_number, parent, start_frame=0, frame_history=None):
         self.restart_number = restart_number
         self.parent = parent
         self.start_frame = start_frame
         self.end_frame = start_frame
-        self.frame_history = self.calc_history_iterable()
+        if frame_history is None:
+            frame_history = self.calc_history_iterable()
+        self.frame_history = frame_history
 
     def calc_history_iterable(self):
-        return dict()
+        return FrameHistory()
 
     ##### Serialization
 
@@ -80,7 +645,10 @@ class Restart(Serializable):
         return getattr(self, key).copy()
 
     def restore_computed_attributes(self, state):
-        self.frame_history = self.calc_history_iterable()
+        try:
+            self.frame_history = self.frame_history.create_empty()
+        except AttributeError:
+            self.frame_history = self.calc_history_iterable()
         for frame_number, data in state['frame_history']:
             self.frame_history[frame_number] = data
 
@@ -95,37 +663,30 @@ class Restart(Serializable):
     #         yield self.frame_history[k]
 
     def keys(self):
-        return sorted(self.frame_history.keys())
+        return self.frame_history.keys()
 
     def is_memorable(self, frame_number):
         # return frame_number % 10 == 0
         return True
 
     def get_previous_frame(self, frame_cursor):
-        n = frame_cursor - 1
-        while n > 0:
-            if n in self.frame_history:
-                return n
-            n -= 1
-        raise IndexError("No previous frame")
+        n = self.frame_history.previous_key(frame_cursor)
+        if n <= 0:
+            raise IndexError("No previous frame")
+        return n
 
     def get_next_frame(self, frame_cursor):
-        n = frame_cursor + 1
-        largest = max(self.frame_history.keys())
-        while n < largest:
-            if n in self.frame_history:
-                return n
-            n += 1
-        raise IndexError("No next frame")
+        return self.frame_history.next_key(frame_cursor)
 
     ##### Storage
 
-    def save_frame(self, frame_number, data):
-        # History is saved in a big list, which will waste space for empty
-        # entries but makes things extremely easy to manage. Simply delete
-        # a history entry by setting it to NONE.
+    def save_frame(self, frame_number, data, input_data=None):
+        # Frame history storage and retention is handled by the frame history
+        # backend; the optional input is used to regenerate discarded frames.
         frame_number = int(frame_number)
         self.frame_history[frame_number] = data
+        if input_data is not None:
+            self.frame_history.save_input(frame_number, input_data)
         self.end_frame = frame_number
 
     ##### Retrieval
@@ -158,7 +719,7 @@ class Restart(Serializable):
     def get_frame(self, frame_number):
         parent = self.get_restart(frame_number)  # could raise IndexError
         frame_number = int(frame_number)
-        return self.frame_history[frame_number]
+        return parent.frame_history[frame_number]
 
     ##### Compact
 
@@ -166,4 +727,9 @@ class Restart(Serializable):
         """Remove old history items according to an algorithm that discards
         some portion of the older history as time goes on
         """
-        pass
+        try:
+            thin = self.frame_history.thin
+        except AttributeError:
+            log.debug(f"frame history {self.frame_history} doesn't support thinning")
+        else:
+            thin(self.end_frame)
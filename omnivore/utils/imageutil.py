@@ -0,0 +1,131 @@
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def calc_row_runs(dirty):
+    """Return a list of (start, end) tuples for each run of True values in
+    the boolean array
+    """
+    rows = np.flatnonzero(dirty)
+    if len(rows) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > 1) + 1
+    starts = np.concatenate(([rows[0]], rows[breaks]))
+    ends = np.concatenate((rows[breaks - 1], [rows[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class IncrementalRowImage:
+    """Persistent RGB image of a block of table rows that is updated by
+    rendering only the rows that have changed since the last draw.
+
+    Rows are marked dirty by index range (from the undo flags of the commands
+    that changed the data), and rows not marked are still checked against a
+    snapshot of the bytes and styles used to render them so that changes
+    that don't go through the command system (selection highlighting,
+    emulator memory updates, edits in a different segment of the same
+    container) still show up. Rows that scroll into view are rendered, rows
+    that stay in view are reused.
+
+    The layout is an opaque tuple describing everything other than the bytes
+    and styles that affects the image (columns displayed, bytes per row,
+    etc.). If it changes, the whole image is rendered again.
+    """
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        self.array = None
+        self.layout = None
+        self.first_row = 0
+        self.row_height = 0
+        self.data = None
+        self.style = None
+        self.dirty_ranges = []
+
+    @property
+    def num_rows(self):
+        return 0 if self.data is None else self.data.shape[0]
+
+    def mark_dirty_indexes(self, index1, index2):
+        """Mark the range of byte indexes, inclusive on both ends, as needing
+        to be rendered again.
+        """
+        self.dirty_ranges.append((index1, index2))
+
+    def calc_dirty_rows(self, nr, first_index, bytes_per_row):
+        dirty = np.zeros(nr, dtype=bool)
+        for index1, index2 in self.dirty_ranges:
+            r1 = max((index1 - first_index) // bytes_per_row, 0)
+            r2 = min((index2 - first_index) // bytes_per_row + 1, nr)
+            if r1 < r2:
+                dirty[r1:r2] = True
+        self.dirty_ranges = []
+        return dirty
+
+    def get_image(self, first_row, first_index, bytes_per_row, data, style, layout, render_rows):
+        """Return the image for the rows of data and style, both of which
+        must be 2d arrays with one table row per array row. first_index is
+        the byte index of the start of first_row, and bytes_per_row is the
+        width of the table (used to convert dirty indexes to rows).
+
+        render_rows(start, end) is called for each block of changed rows, with
+        start and end relative to first_row, and must return the image of
+        those rows.
+        """
+        nr = data.shape[0]
+        if layout != self.layout or self.array is None or self.data.shape[1:] != data.shape[1:]:
+            return self.render_all(first_row, data, style, layout, render_rows)
+
+        dirty = self.calc_dirty_rows(nr, first_index, bytes_per_row)
+
+        # reuse rows that are still in view, new rows need to be rendered
+        old_first = self.first_row
+        overlap_first = max(first_row, old_first)
+        overlap_last = min(first_row + nr, old_first + self.num_rows)
+        if overlap_last - overlap_first <= 0:
+            return self.render_all(first_row, data, style, layout, render_rows)
+        if first_row != old_first or nr != self.num_rows:
+            h = self.row_height
+            array = np.empty((nr * h,) + self.array.shape[1:], dtype=np.uint8)
+            snap_data = np.empty_like(data)
+            snap_style = np.empty_like(style)
+            src = slice(overlap_first - old_first, overlap_last - old_first)
+            dest = slice(overlap_first - first_row, overlap_last - first_row)
+            array[dest.start * h:dest.stop * h] = self.array[src.start * h:src.stop * h]
+            snap_data[dest] = self.data[src]
+            snap_style[dest] = self.style[src]
+            exposed = np.ones(nr, dtype=bool)
+            exposed[dest] = False
+            dirty |= exposed
+            self.array = array
+            self.data = snap_data
+            self.style = snap_style
+            self.first_row = first_row
+
+        dirty |= (data != self.data).any(axis=1)
+        dirty |= (style != self.style).any(axis=1)
+        runs = calc_row_runs(dirty)
+        log.debug(f"get_image: rows {first_row}-{first_row + nr}, rendering {runs}")
+        h = self.row_height
+        for start, end in runs:
+            self.array[start * h:end * h] = render_rows(start, end)
+        self.data[dirty] = data[dirty]
+        self.style[dirty] = style[dirty]
+        return self.array
+
+    def render_all(self, first_row, data, style, layout, render_rows):
+        nr = data.shape[0]
+        log.debug(f"render_all: rows {first_row}-{first_row + nr}")
+        array = render_rows(0, nr)
+        self.array = np.array(array, dtype=np.uint8, copy=True)
+        self.layout = layout
+        self.first_row = first_row
+        self.row_height = array.shape[0] // nr if nr > 0 else 0
+        self.data = data.copy()
+        self.style = style.copy()
+        self.dirty_ranges = []
+        return self.array
@@ -2,7 +2,10 @@ import re
 
 import numpy as np
 
-from sawx.utils.parseutil import NumpyIntExpression, ParseException
+from atrip import errors, style_bits
+from atrip.byte_search import Pattern
+from atrip.utils import bool_to_ranges
+from sawx.utils.parseutil import compile_int_expression, ParseException
 
 import logging
 log = logging.getLogger(__name__)
@@ -36,12 +39,17 @@ class HexSearcher(BaseSearcher):
         return "hex matches: %s" % str(self.matches)
 
     def get_search_text(self, text):
+        # ?? in the hex digits matches any byte
         try:
-            return bytes.fromhex(text)
-        except ValueError:
-            log.debug("%s: fromhex failed on: %s")
+            return Pattern.from_hex(text)
+        except errors.InvalidSearchPattern:
+            log.debug(f"{self.ui_name}: invalid hex: {text}")
             return ""
 
+    def get_matches(self, editor):
+        pattern = self.search_text
+        return [(i, i + len(pattern)) for i in pattern.find_in(np.frombuffer(self.search_copy, dtype=np.uint8)).tolist()]
+
 
 class CharSearcher(BaseSearcher):
     ui_name = "text"
@@ -77,6 +85,27 @@ class CommentSearcher(BaseSearcher):
 
 
 class AlgorithmSearcher(BaseSearcher):
+    """Search using an expression evaluated at every byte of the segment.
+
+    Variables are `a` (address), `b` (byte), `w` (little endian word
+    starting at the byte) and `s` (style), and each can be referenced
+    relative to the current byte like `b[+1]` or `w[-2]`. The style bit
+    masks are available as `data`, `comment`, `selected` and `user`. For
+    example, LDA #imm followed by STA $D01A is:
+
+        b == $a9 && b[+2] == $8d && w[+3] == $d01a
+
+    Each match covers all the bytes referenced by the expression.
+    """
+    extents = (('w', 2),)
+
+    style_masks = {
+        'data': style_bits.data_bit_mask,
+        'comment': style_bits.comment_bit_mask,
+        'selected': style_bits.selected_bit_mask,
+        'user': style_bits.user_bit_mask,
+        }
+
     def __str__(self):
         return "pyparsing matches: %s" % str(self.matches)
 
@@ -85,19 +114,29 @@ class AlgorithmSearcher(BaseSearcher):
 
     def get_matches(self, editor):
         s = editor.segment
-        a = np.arange(s.origin, s.origin + len(s))
-        b = np.asarray(self.search_copy, dtype=np.uint8)
-        v = {
-            'a': a,
-            'b': b,
-            }
-        expression = NumpyIntExpression(v)
         try:
-            result = expression.eval(self.search_text)
-            matches = s.bool_to_ranges(result)
-            return matches
+            expression = compile_int_expression(self.search_text, self.extents)
         except ParseException as e:
             raise ValueError(e)
+        b = np.frombuffer(self.search_copy, dtype=np.uint8)
+        num = len(b)
+        names = expression.names
+        v = dict(self.style_masks)
+        if 'a' in names:
+            v['a'] = np.arange(s.origin, s.origin + num)
+        if 'b' in names:
+            v['b'] = b
+        if 'w' in names:
+            w = np.zeros(num, dtype=np.uint16)
+            w[:-1] = b[:-1] | (b[1:].astype(np.uint16) << 8)
+            v['w'] = w
+        if 's' in names:
+            v['s'] = s.style[:]
+        unknown = names - set(v.keys())
+        if unknown:
+            raise ValueError(f"Unknown variable {', '.join(sorted(unknown))}")
+        result = expression.eval(v, num)
+        return bool_to_ranges(expression.calc_covered(result))
 
 
 known_searchers = [
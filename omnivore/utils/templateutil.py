@@ -1,5 +1,4 @@
 from atrip.memory_map import MemoryMap
-from sawx.persistence import get_template, iter_templates
 
 import logging
 log = logging.getLogger(__name__)
@@ -12,6 +11,12 @@ def load_memory_map(keyword):
     try:
         rwlabels = machine_labels[keyword]
     except KeyError:
+        try:
+            # imported here so emulators can run headless without wx
+            from sawx.persistence import get_template
+        except ImportError:
+            log.warning(f"Templates not available; using empty memory map for '{keyword}'")
+            return MemoryMap(keyword)
         try:
             text = get_template(keyword)
         except OSError as e:
@@ -28,6 +33,7 @@ available_memory_maps = {}
 
 def calc_available_memory_maps():
     global available_memory_maps
+    from sawx.persistence import iter_templates
     if not available_memory_maps:
         for template in iter_templates("labels"):
             available_memory_maps[template.keyword] = template
@@ -6,6 +6,7 @@ import numpy as np
 
 from sawx.utils.nputil import intscale
 from sawx.ui import compactgrid as cg
+from sawx.utils.command import DisplayFlags
 
 from atrip.machines import atari8bit
 
@@ -74,6 +75,22 @@ class AnticColorViewer(SegmentViewer):
         """
         pass
 
+    def mark_rendered_rows_dirty(self, flags):
+        """Flag the rows changed by a command so they will be rendered again
+        on the next refresh rather than reusing the previous image.
+
+        Events can also be fired without a DisplayFlags instance (e.g. with
+        flags=True), in which case all rows are dirty.
+        """
+        try:
+            row_image = self.control.line_renderer.row_image
+        except AttributeError:
+            return
+        if not isinstance(flags, DisplayFlags) or flags.index_range is None:
+            row_image.invalidate()
+        else:
+            row_image.mark_dirty_indexes(*flags.index_range)
+
     def graphics_properties_changed(self):
         print(f"graphics_properties_changed! std={self.color_standard_name}")
         self.control.recalc_view()
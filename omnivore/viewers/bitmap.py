@@ -8,6 +8,7 @@ from sawx.ui import compactgrid as cg
 
 from ..ui.segment_grid import SegmentGridControl, SegmentTable
 from ..arch.bitmap_renderers import valid_bitmap_renderers
+from ..utils.imageutil import IncrementalRowImage
 
 from .antic import AnticColorViewer
 
@@ -39,6 +40,7 @@ class BitmapLineRenderer(cg.TableLineRenderer):
         image_cache = BitmapImageCache()
         w, h = self.calc_cell_size_in_pixels(grid_control)
         cg.LineRenderer.__init__(self, grid_control, w, h, grid_control.items_per_row, image_cache)
+        self.row_image = IncrementalRowImage()
 
     def calc_cell_size_in_pixels(self, grid_control):
         w = grid_control.zoom_w * grid_control.scale_width * grid_control.pixels_per_byte
@@ -59,6 +61,24 @@ class BitmapLineRenderer(cg.TableLineRenderer):
     def calc_bytes_per_row(self, table):
         return table.items_per_row
 
+    def get_rows_image(self, grid_control, first_row, first_index, bytes_per_row, first_col, data, style):
+        """Return the unscaled image of the 2d data and style arrays, only
+        rendering the rows that have changed since the previous draw.
+        """
+        renderer = grid_control.bitmap_renderer
+        segment_viewer = grid_control.segment_viewer
+        nr, nc = data.shape
+
+        def render_rows(start, end):
+            n = end - start
+            return renderer.get_image(segment_viewer, nc, n, nc * n, data[start:end].flatten(), style[start:end].flatten())
+
+        if not renderer.rows_are_independent:
+            self.row_image.invalidate()
+            return render_rows(0, nr)
+        layout = (renderer.name, first_col, nc, bytes_per_row, first_row * bytes_per_row - first_index)
+        return self.row_image.get_image(first_row, first_index, bytes_per_row, data, style, layout, render_rows)
+
     def draw_grid(self, grid_control, dc, first_row, visible_rows, first_cell, visible_cells):
         t = grid_control.table
         log.debug(f"draw_grid: first_row={first_row} visible_rows={visible_rows}; first_cell={first_cell} visible_cells={visible_cells}")
@@ -110,12 +130,9 @@ class BitmapLineRenderer(cg.TableLineRenderer):
             first_index = (first_row * bytes_per_row) - offset
             last_index = (last_row * bytes_per_row) - offset
             log.debug(f"drawing rectangular grid: bpr={bytes_per_row}, first,last={first_index},{last_index}, nr={nr}, start_offset={offset}")
-            data = t.data[first_index:last_index].reshape((nr, bytes_per_row))[0:nr,first_col:last_col].flatten()
-            style = t.style[first_index:last_index].reshape((nr, bytes_per_row))[0:nr,first_col:last_col].flatten()
-
-            # get_image(cls, machine, antic_font, byte_values, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
-
-            array = grid_control.bitmap_renderer.get_image(grid_control.segment_viewer, nc, nr, nc * nr, data, style)
+            data = t.data[first_index:last_index].reshape((nr, bytes_per_row))[0:nr,first_col:last_col]
+            style = t.style[first_index:last_index].reshape((nr, bytes_per_row))[0:nr,first_col:last_col]
+            array = self.get_rows_image(grid_control, first_row, first_index, bytes_per_row, first_col, data, style)
             width = array.shape[1]
             height = array.shape[0]
             if width > 0 and height > 0:
@@ -213,6 +230,12 @@ class BitmapViewer(AnticColorViewer):
     def recalc_data_model(self):
         self.control.recalc_view()
 
+    def on_update_table_for_value_change(self, evt):
+        self.mark_rendered_rows_dirty(evt.flags)
+
+    def on_update_table_for_style_change(self, evt):
+        self.mark_rendered_rows_dirty(evt.flags)
+
 
 class MemoryMapViewer(BitmapViewer):
     name = "memmap"
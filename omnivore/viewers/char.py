@@ -11,6 +11,7 @@ from ..ui.segment_grid import SegmentGridControl, SegmentTable
 from ..arch.fonts import AnticFont, valid_fonts
 from atrip.char_mapping import valid_font_mappings
 from ..arch.font_renderers import valid_font_renderers
+from ..utils.imageutil import IncrementalRowImage
 from .antic import AnticColorViewer
 
 import logging
@@ -44,6 +45,7 @@ class AnticCharRenderer(cg.TableLineRenderer):
         w = parent.font_renderer.char_bit_width * parent.zoom_w
         h = parent.font_renderer.char_bit_height * parent.zoom_h
         cg.LineRenderer.__init__(self, parent, w, h, parent.items_per_row, image_cache)
+        self.row_image = IncrementalRowImage()
 
     # BaseLineRenderer interface
 
@@ -113,10 +115,16 @@ class AnticCharRenderer(cg.TableLineRenderer):
             style = t.style[first_index:last_index]
         data = data.reshape((nr, -1))
         style = style.reshape((nr, -1))
+        v = grid_control.segment_viewer
 
         # get_image(cls, machine, antic_font, byte_values, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
 
-        array = grid_control.font_renderer.get_image(grid_control.segment_viewer, grid_control.segment_viewer.antic_font, data, style, first_index, last_index, bytes_per_row, nr, first_col, nc)
+        def render_rows(start, end):
+            return grid_control.font_renderer.get_image(v, v.antic_font, data[start:end], style[start:end], first_index + start * bytes_per_row, end_byte, bytes_per_row, end - start, first_col, nc)
+
+        end_byte = len(t.data)
+        layout = (grid_control.font_renderer.name, first_col, nc, bytes_per_row, t.start_offset, end_byte)
+        array = self.row_image.get_image(first_row, first_index, bytes_per_row, data, style, layout, render_rows)
         width = array.shape[1]
         height = array.shape[0]
         if width > 0 and height > 0:
@@ -268,3 +276,9 @@ class CharViewer(AnticColorViewer):
         """Hook for subclasses that need to invalidate stuff when colors change
         """
         self._antic_font = None
+
+    def on_update_table_for_value_change(self, evt):
+        self.mark_rendered_rows_dirty(evt.flags)
+
+    def on_update_table_for_style_change(self, evt):
+        self.mark_rendered_rows_dirty(evt.flags)
@@ -1,5 +1,7 @@
 import os
 import sys
+import time
+import threading
 
 import numpy as np
 
@@ -15,28 +17,90 @@ from ..viewer import SegmentViewer
 from ..commands.disasm import MiniAssemblerCommand
 from ..commands.comment import SetCommentCommand
 from atrip.disassembler import get_miniasm
+from atrip import style_bits
 from ..utils import searchutil
 
 import logging
 log = logging.getLogger(__name__)
 
 
+class BackgroundParse(threading.Thread):
+    """Disassemble a segment in a worker thread a piece at a time.
+
+    The callbacks are called in the main thread: progress_callback with the
+    number of rows and bytes that are complete, and finished_callback when
+    the whole segment has been disassembled. Setting wants_cancel stops the
+    thread without calling either callback again.
+    """
+    chunk_size = 0x1000
+    progress_interval = 0.1
+    thread_count = 0
+
+    def __init__(self, disassembler, segment, progress_callback, finished_callback):
+        self.__class__.thread_count += 1
+        threading.Thread.__init__(self, name=f"BackgroundParse-{self.thread_count}")
+        self.daemon = True
+        self.disassembler = disassembler
+        self.parsed = disassembler.parse_start(segment)
+        self.progress_callback = progress_callback
+        self.finished_callback = finished_callback
+        self.wants_cancel = False
+
+    def run(self):
+        log.debug(f"{self.name}: parsing {self.parsed.num_bytes} bytes")
+        last_progress = time.time()
+        while not self.wants_cancel:
+            if self.disassembler.parse_more(self.parsed, self.chunk_size):
+                break
+            now = time.time()
+            if now - last_progress > self.progress_interval:
+                wx.CallAfter(self.report_progress, len(self.parsed), self.parsed.num_parsed_bytes)
+                last_progress = now
+        if not self.wants_cancel:
+            wx.CallAfter(self.report_finished)
+        log.debug(f"{self.name}: finished, cancelled={self.wants_cancel}")
+
+    def report_progress(self, num_rows, num_bytes):
+        if not self.wants_cancel:
+            self.progress_callback(self, num_rows, num_bytes)
+
+    def report_finished(self):
+        if not self.wants_cancel:
+            self.finished_callback(self)
+
+
 class DisassemblyTable(SegmentTable):
     column_labels = ["^Disassembly"]
     column_sizes = [48]
 
+    # segments at least this size are disassembled in a worker thread
+    background_parse_size = 0x4000
+
     def __init__(self, linked_base):
         SegmentTable.__init__(self, linked_base, len(self.column_labels), False)
 
-        self.max_num_entries = 80000
+        self.current = None
+        self.parsed_from = None
+        self.parsed_snapshot = None
+        self.background_parse = None
+        self.num_parsed_rows = 0
+        self.num_parsed_bytes = 0
+        self.parse_progress_callback = None
         self.rebuild()
 
     def calc_num_rows(self):
+        if self.background_parse is not None:
+            return self.num_parsed_rows
         try:
             return len(self.current)
         except AttributeError:
             return 0
 
+    def calc_last_valid_index(self):
+        if self.background_parse is not None:
+            return self.num_parsed_bytes
+        return SegmentTable.calc_last_valid_index(self)
+
     def get_index_range(self, row, cell):
         """Get the byte offset from start of file given row, col
         position.
@@ -108,18 +172,79 @@ class DisassemblyTable(SegmentTable):
     def search(self, search_bytes, match_case=False):
         return self.current.search(search_bytes, match_case, self.linked_base.document.labels)
 
+    def calc_parse_snapshot(self, segment):
+        # only the comment bit of the style affects the disassembly, so
+        # selection changes don't force a reparse
+        return np.vstack((segment.data[:], segment.style[:] & style_bits.comment_bit_mask, segment.disasm_type[:]))
+
     def rebuild(self):
+        """Disassemble the segment, reparsing only the area around any bytes
+        that have changed since the last time if the segment and disassembler
+        are the same.
+
+        Large segments are disassembled in a worker thread, and the rows are
+        shown as they become available.
+        """
         segment = self.linked_base.segment
-        self.current = self.linked_base.document.disassembler.parse(segment, self.max_num_entries)
+        disassembler = self.linked_base.document.disassembler
+        snapshot = self.calc_parse_snapshot(segment)
+        if self.background_parse is None and self.current is not None and self.parsed_from == (segment, disassembler) and snapshot.shape == self.parsed_snapshot.shape:
+            changed = np.flatnonzero((snapshot != self.parsed_snapshot).any(axis=0))
+            if len(changed) > 0:
+                log.debug(f"rebuild: reparsing {changed[0]}-{changed[-1]}")
+                self.current = disassembler.reparse(self.current, segment, int(changed[0]), int(changed[-1]) + 1)
+        elif len(segment) >= self.background_parse_size:
+            self.start_background_parse(disassembler, segment)
+        else:
+            self.cancel_background_parse()
+            self.current = disassembler.parse(segment)
+        self.parsed_from = (segment, disassembler)
+        self.parsed_snapshot = snapshot
         self.parsed = None
         self.init_boundaries()
 
+    def start_background_parse(self, disassembler, segment):
+        self.cancel_background_parse()
+        job = BackgroundParse(disassembler, segment, self.on_parse_progress, self.on_parse_finished)
+        self.background_parse = job
+        self.current = job.parsed
+        self.num_parsed_rows = 0
+        self.num_parsed_bytes = 0
+        job.start()
+
+    def cancel_background_parse(self):
+        if self.background_parse is not None:
+            self.background_parse.wants_cancel = True
+            self.background_parse = None
+
+    def on_parse_progress(self, job, num_rows, num_bytes):
+        if job is self.background_parse:
+            self.num_parsed_rows = num_rows
+            self.num_parsed_bytes = num_bytes
+            self.init_boundaries()
+            if self.parse_progress_callback is not None:
+                self.parse_progress_callback(self)
+
+    def on_parse_finished(self, job):
+        if job is self.background_parse:
+            self.background_parse = None
+            self.init_boundaries()
+            if self.parse_progress_callback is not None:
+                self.parse_progress_callback(self)
+
 
 class DisassemblyControl(SegmentGridControl):
     default_table_cls = DisassemblyTable
 
     def calc_default_table(self, linked_base):
-        return self.default_table_cls(linked_base)
+        table = self.default_table_cls(linked_base)
+        table.parse_progress_callback = self.on_parse_progress
+        return table
+
+    def on_parse_progress(self, table):
+        if table is self.table:
+            cg.CompactGrid.recalc_view(self)
+            self.refresh_view()
 
     def calc_line_renderer(self):
         return cg.VirtualTableLineRenderer(self, 2, widths=self.default_table_cls.column_sizes, col_labels=self.default_table_cls.column_labels)
@@ -129,7 +254,9 @@ class DisassemblyControl(SegmentGridControl):
         super().set_viewer_defaults()
 
     def recalc_view(self):
-        self.table.rebuild()
+        # the table is recreated (and so the segment disassembled again) by
+        # the superclass
+        self.table.cancel_background_parse()
         super().recalc_view()
 
     def calc_ranges_for_edit(self):
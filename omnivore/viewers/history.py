@@ -83,26 +83,16 @@ class InstructionHistoryTable(cg.VirtualTable):
                 yield "%d" % (emu.cpu_history[line][0])
 
     def find_previous_line(self, start, flag_type):
-        emu = self.emulator
-        line = start
-        while line > 0:
-            line -= 1
-            h = emu.cpu_history[line]
-            t = h['disassembler_type']
-            if flag_type == t:
-                break
-        return line
+        row = self.emulator.cpu_history.find_previous(start, flag_type)
+        if row is None:
+            row = min(start, 0)
+        return row
 
     def find_next_line(self, start, flag_type):
-        emu = self.emulator
-        line = start
-        while line < self.num_rows - 1:
-            line += 1
-            h = emu.cpu_history[line]
-            t = h['disassembler_type']
-            if flag_type == t:
-                break
-        return line
+        row = self.emulator.cpu_history.find_next(start, flag_type)
+        if row is None or row > self.num_rows - 1:
+            row = max(start, self.num_rows - 1)
+        return row
 
     def find_frame_instruction(self, line):
         line = self.find_previous_line(line, flags.DISASM_FRAME_END)
@@ -85,7 +85,8 @@ class JumpmanFrameRenderer(BitmapLineRenderer):
         style = model.style[first_index:last_index]
         drawlog.debug("draw_grid: first_index:%d last_index:%d" % (first_index, last_index))
 
-        array = grid_control.bitmap_renderer.get_image(grid_control.segment_viewer, bytes_per_row, last_row - first_row, last_index - first_index, data, style)
+        nr = last_row - first_row
+        array = self.get_rows_image(grid_control, first_row, first_index, bytes_per_row, 0, data.reshape((nr, bytes_per_row)), style.reshape((nr, bytes_per_row)))
         width = array.shape[1]
         height = array.shape[0]
         drawlog.debug("Calculated image: %dx%d" % (width, height))
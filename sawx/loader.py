@@ -22,6 +22,7 @@ class FileGuess:
         self._sample_data = None
         self._sample_lines = None
         self._all_data = None
+        self._size = None
         self._is_binary = None
         self._is_zipfile = None
         self._zipfile = None
@@ -47,6 +48,13 @@ class FileGuess:
             self._all_data = self.fh.read()
         return self._all_data
 
+    @property
+    def size(self):
+        if self._size is None:
+            self.fh.seek(0, os.SEEK_END)
+            self._size = self.fh.tell()
+        return self._size
+
     @property
     def is_binary(self):
         if self._is_binary is None:
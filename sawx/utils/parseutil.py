@@ -2,10 +2,13 @@
 # Glenn Linderman, licensed under the pyparsing license arith.py from:
 #
 # http://pyparsing.wikispaces.com/file/view/arith.py/241810293/arith.py
+import functools
+
 import numpy as np
 
 from pyparsing import Word, nums, hexnums, alphas, alphanums, Combine, oneOf, Optional, \
-    opAssoc, operatorPrecedence, ParseException, ParserElement, Literal, Regex, pyparsing_common
+    opAssoc, operatorPrecedence, ParseException, ParserElement, Literal, Regex, pyparsing_common, \
+    Suppress, Group
 
 ParserElement.enablePackrat()
 
@@ -29,6 +32,31 @@ class EvalConstant():
                 return int(v)
 
 
+class EvalShiftedVariable():
+    "Class to evaluate a variable at a relative offset, like b[+1] or b[-2]"
+
+    def __init__(self, tokens):
+        self.value, self.offset = tokens[0]
+        self.offset = int(self.offset)
+
+    def eval(self, vars_):
+        if hasattr(vars_, "shifted"):
+            return vars_.shifted(self.value, self.offset)
+        return shift_array(vars_[self.value], self.offset)
+
+
+def shift_array(values, offset):
+    """Return a copy of the array where element i is values[i + offset];
+    elements that would be outside the array are zero.
+    """
+    shifted = np.zeros_like(values)
+    if offset >= 0:
+        shifted[:len(values) - offset] = values[offset:]
+    else:
+        shifted[-offset:] = values[:offset]
+    return shifted
+
+
 class EvalSignOp():
     "Class to evaluate expressions with a leading + or - sign"
 
@@ -185,7 +213,8 @@ class NumpyIntExpression():
     hexint = Combine(oneOf('0x $') + Word(hexnums))
 
     variable = Word(alphas)
-    operand = hexint | integer | variable
+    shifted_variable = Group(Word(alphas) + Suppress('[') + Combine(Optional(oneOf('+ -')) + Word(nums)) + Suppress(']'))
+    operand = hexint | integer | shifted_variable | variable
 
     signop = oneOf('+ -')
     multop = oneOf('* / // %')
@@ -197,7 +226,10 @@ class NumpyIntExpression():
     comparisonop = oneOf("< <= > >= == != <>")
 
     # use parse actions to attach EvalXXX constructors to sub-expressions
-    operand.setParseAction(EvalConstant)
+    shifted_variable.setParseAction(EvalShiftedVariable)
+    hexint.setParseAction(EvalConstant)
+    integer.setParseAction(EvalConstant)
+    variable.setParseAction(EvalConstant)
     arith_expr = operatorPrecedence(operand,
         [(signop, 1, opAssoc.RIGHT, EvalSignOp),
          (multop, 2, opAssoc.LEFT, EvalMultOp),
@@ -219,11 +251,142 @@ class NumpyIntExpression():
         self.vars_[ var ] = val
 
     def eval( self, strExpr ):
-        ret = self.arith_expr.parseString( strExpr, parseAll=True)[0]
+        ret = parse_int_expression(strExpr)
         result = ret.eval( self.vars_ )
         return result
 
 
+@functools.lru_cache(maxsize=64)
+def parse_int_expression(text):
+    """Return the parsed tree of a `NumpyIntExpression`, cached because
+    parsing takes much longer than evaluating for typical array sizes
+    """
+    return NumpyIntExpression.arith_expr.parseString(text, parseAll=True)[0]
+
+
+def iter_operands(node):
+    "generator of the constants and variables in a parsed expression"
+    if isinstance(node, (EvalConstant, EvalShiftedVariable)):
+        yield node
+    elif isinstance(node, EvalSignOp):
+        yield from iter_operands(node.value)
+    else:
+        for item in node.value[0::2]:
+            yield from iter_operands(item)
+
+
+class ShiftedVariables(dict):
+    """Variables for evaluating an expression with relative references.
+
+    Each array is copied once into a zero-padded buffer so every reference
+    like b[+1] is a view into the buffer rather than a new array.
+    """
+
+    def __init__(self, padded, before, length):
+        dict.__init__(self)
+        self.padded = padded
+        self.before = before
+        self.length = length
+
+    def shifted(self, name, offset):
+        start = self.before + offset
+        return self.padded[name][start:start + self.length]
+
+
+class CompiledIntExpression():
+    """Integer expression parsed once and evaluated on arrays of values,
+    where element i of every array describes the same position.
+
+    Variables can be referenced at relative positions, e.g. `b[+1]` is the
+    value of b at the following position. `extents` gives the number of
+    positions covered by the value of a variable (e.g. 2 for a word built
+    from two bytes), which defaults to one.
+
+    The result is true only at positions where every relative reference
+    is inside the arrays.
+    """
+
+    def __init__(self, text, extents={}):
+        self.text = text
+        self.root = parse_int_expression(text)
+        self.offsets = {}
+        for operand in iter_operands(self.root):
+            name = operand.value
+            if isinstance(operand, EvalShiftedVariable):
+                offset = operand.offset
+            elif name.isalpha():
+                offset = 0
+            else:
+                continue
+            self.offsets.setdefault(name, set()).add(offset)
+        self.first_offset = 0
+        self.last_offset = 0
+        for name, offsets in self.offsets.items():
+            self.first_offset = min(self.first_offset, min(offsets))
+            self.last_offset = max(self.last_offset, max(offsets) + extents.get(name, 1) - 1)
+
+    def __str__(self):
+        return f"<CompiledIntExpression {self.text}: offsets {self.first_offset} to {self.last_offset}>"
+
+    @property
+    def names(self):
+        return set(self.offsets.keys())
+
+    def eval(self, vars_, length):
+        """Return a boolean array of the given length that is True where the
+        expression is non-zero.
+
+        Values of vars_ are arrays of the given length or scalars; only the
+        arrays of variables used in the expression are referenced.
+        """
+        before = -self.first_offset
+        after = self.last_offset
+        padded = {}
+        scalars = {}
+        for name, values in vars_.items():
+            if name not in self.offsets:
+                continue
+            if isinstance(values, np.ndarray):
+                # promote bytes so arithmetic doesn't wrap around
+                buffer = np.zeros(length + before + after, dtype=np.promote_types(values.dtype, np.int32))
+                buffer[before:before + length] = values
+                padded[name] = buffer
+            else:
+                scalars[name] = values
+        shifted_vars = ShiftedVariables(padded, before, length)
+        shifted_vars.update(scalars)
+        for name in padded:
+            shifted_vars[name] = shifted_vars.shifted(name, 0)
+        result = self.root.eval(shifted_vars)
+        matches = np.zeros(length, dtype=bool)
+        matches[:] = result != 0
+        matches[:before] = False
+        matches[max(length - after, 0):] = False
+        return matches
+
+    def calc_covered(self, matches):
+        """Return a boolean array that is True for every position that
+        contributed to a match, from the first to the last relative
+        reference
+        """
+        length = len(matches)
+        covered = np.zeros(length, dtype=bool)
+        for offset in range(self.first_offset, self.last_offset + 1):
+            if offset >= 0:
+                covered[offset:] |= matches[:length - offset]
+            else:
+                covered[:offset] |= matches[-offset:]
+        return covered
+
+
+@functools.lru_cache(maxsize=64)
+def compile_int_expression(text, extents=()):
+    """Return a cached `CompiledIntExpression`; extents is a tuple of (name,
+    extent) pairs so it can be used as part of the cache key.
+    """
+    return CompiledIntExpression(text, dict(extents))
+
+
 class EvalFloatConstant():
     "Class to evaluate a parsed constant or variable"
 
@@ -56,6 +56,9 @@ class clean_py(clean):
             "omnivore/*/*/*.so",
             "omnivore/*/*/*.pyd",
             "omnivore/arch/antic_speedups.c",
+            "atrip/compressors/compress_speedups.c",
+            "atrip/*/*.so",
+            "atrip/*/*.pyd",
             "omnivore/disassembler/cputables.py",
             "lib6502/lib6502.c",
             "libatari800/libatari800.c",
@@ -117,6 +120,12 @@ else:
                   extra_link_args = extra_link_args,
                   include_dirs = [np.get_include()],
                   ),
+        Extension("atrip.compressors.compress_speedups",
+                  sources=["atrip/compressors/compress_speedups.pyx"],
+                  extra_compile_args = extra_compile_args,
+                  extra_link_args = extra_link_args,
+                  include_dirs = [np.get_include()],
+                  ),
         Extension("omnivore.emulators.atari8bit.libatari800",
             sources = [
                 "libatari800/atari800_bridge.c",
@@ -35,6 +35,11 @@ from atrip.media_types.atari_disks import *
 from atrip.media_types.atari_tapes import *
 from atrip.media_types.apple_disks import *
 
+# Images parsed in earlier runs must not affect the tests, and the tests
+# shouldn't fill the user's cache dir
+from atrip import parse_cache
+parse_cache.enabled = False
+
 sample_atari_files = [
     "../samples/dos_sd_test1.atr",
     "../samples/dos_ed_test1.atr",
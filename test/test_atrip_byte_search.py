@@ -0,0 +1,74 @@
+from mock import *
+
+from atrip.container import Container
+from atrip.segment import Segment
+from atrip import byte_search as bs
+from atrip import errors
+
+
+class TestPattern:
+    def test_from_string(self):
+        p = bs.Pattern.from_string("a9 ?? 8d1ad0")
+        assert list(p.values) == [0xa9, 0, 0x8d, 0x1a, 0xd0]
+        assert list(p.mask) == [True, False, True, True, True]
+        p = bs.Pattern.from_string('"READY"')
+        assert p.values.tobytes() == b"READY"
+        for text in ["a9 8", "zz", "?? ??", ""]:
+            with pytest.raises(errors.InvalidSearchPattern):
+                bs.Pattern.from_string(text)
+
+
+class TestNgramIndex:
+    def setup(self):
+        self.rng = np.random.RandomState(4321)
+        self.data = self.rng.randint(0, 4, 5000).astype(np.uint8)
+        self.index = bs.NgramIndex(self.data)
+
+    def test_find(self):
+        for text in ["01 02 03", "00 ?? 03 01", "02", "?? 01", "03 02 01 00 01", "01 ?? 02 ?? 03 ??"]:
+            p = bs.Pattern.from_hex(text)
+            expected = p.find_in(self.data)
+            assert len(expected) > 0
+            assert np.array_equal(self.index.find(p), expected)
+        assert len(self.index.find(bs.Pattern.from_hex("01 02 04"))) == 0
+
+    def test_short_data(self):
+        index = bs.NgramIndex(np.array([1, 2], dtype=np.uint8))
+        assert list(index.find(bs.Pattern.from_hex("0102"))) == [0]
+        assert list(index.find(bs.Pattern.from_hex("010203"))) == []
+
+
+class TestSearchContainers:
+    def setup(self):
+        bs.index_cache.clear()
+        data = np.zeros(4096, dtype=np.uint8)
+        data[1000:1005] = [0xa9, 0x01, 0x8d, 0x1a, 0xd0]
+        data[3000:3005] = [0xa9, 0x02, 0x8d, 0x1a, 0xd0]
+        self.container = Container(data)
+        everything = Segment(self.container)
+        first_half = Segment(everything, 0, length=2048)
+        # sectors in reverse order, so the bytes at 1000 are split
+        sectors = Segment(first_half, np.concatenate((np.arange(1003, 2048), np.arange(0, 1003))))
+        everything.segments = [first_half, sectors]
+        self.container.segments = [everything]
+        self.everything, self.first_half, self.sectors = list(self.container.iter_segments())
+        self.other = Container(np.tile(np.array([0xa9, 0x03, 0x8d, 0x1a, 0xd0], dtype=np.uint8), 10))
+
+    def test_find(self):
+        hits = bs.search_containers([self.container, self.other], ["a9 ?? 8d 1a d0", "1a d0"])
+        found = [(h.pattern.text, h.container, h.container_index) for h in hits]
+        assert found[:4] == [("a9 ?? 8d 1a d0", self.container, 1000), ("a9 ?? 8d 1a d0", self.container, 3000), ("1a d0", self.container, 1003), ("1a d0", self.container, 3003)]
+        assert len(hits) == 4 + 20
+        assert hits[0].segments == [(self.everything, 1000), (self.first_half, 1000)]
+        assert hits[1].segments == [(self.everything, 3000)]
+        assert hits[2].segments == [(self.everything, 1003), (self.first_half, 1003), (self.sectors, 0)]
+
+    def test_cache(self):
+        bs.search_containers([self.container], "a9")
+        index = bs.index_cache.get_index(self.container)
+        assert len(bs.index_cache.indexes) == 1
+        self.container[0] = 0xa9
+        hits = bs.search_containers([self.container], "a9", max_hits=2)
+        assert [h.container_index for h in hits] == [0, 1000]
+        assert bs.index_cache.get_index(self.container) is not index
+        assert len(bs.index_cache.indexes) == 2
@@ -1,5 +1,9 @@
+import io
 import os
 import glob
+import shutil
+import zipfile
+import tarfile
 
 import numpy as np
 import pytest
@@ -11,6 +15,11 @@ from atrip.collection import Collection
 from atrip.container import Container
 from atrip.segment import Segment
 import atrip.errors as errors
+from atrip.compressor import PackedStreamChain, guess_compressor_list
+from atrip.compressors.gzip import GZipCompressor
+from atrip.compressors.bzip import BZipCompressor
+from atrip.compressors.lzma import LZMACompressor
+from atrip.compressors.zlib import ZLibCompressor
 
 
 class TestCollection:
@@ -61,7 +70,7 @@ class TestCollection:
         output = "tmp." + os.path.basename(pathname)
         output = os.path.join(os.path.dirname(__file__), output)
         try:
-            collection.save(output)
+            collection.save(output, copy_unchanged=False)
         except errors.InvalidAlgorithm as e:
             pytest.skip(f"skipping {pathname}: {e}")
         else:
@@ -105,6 +114,71 @@ class TestCollection:
     def test_multiple(self, pathname):
         self.test_single(pathname)
 
+
+class TestSave:
+    def copy_sample(self, tmpdir, filename):
+        pathname = str(tmpdir.join(filename))
+        shutil.copy(os.path.join(os.path.dirname(__file__), "../samples", filename), pathname)
+        return pathname
+
+    def read_members(self, pathname):
+        if pathname.endswith(".zip"):
+            with zipfile.ZipFile(pathname) as zf:
+                return {i.filename: (i.CRC, i.compress_size) for i in zf.infolist()}
+        with tarfile.open(pathname) as tf:
+            return {i.name: tf.extractfile(i).read() for i in tf.getmembers()}
+
+    @pytest.mark.parametrize(("filename"), ["dos_sd_test_collection.zip", "dos_sd_test_collection.tar"])
+    def test_copy_unchanged(self, tmpdir, filename):
+        pathname = self.copy_sample(tmpdir, filename)
+        before = self.read_members(pathname)
+        collection = Collection(pathname, use_cache=False)
+        assert not any(c.is_dirty for c in collection.containers)
+        edited = collection.containers[1]
+        edited.data[1000] ^= 0xff
+        assert edited.is_dirty
+        collection.save()
+        assert not edited.is_dirty
+        after = self.read_members(pathname)
+        assert list(after.keys()) == list(before.keys())
+        for name in before:
+            if name == edited.pathname:
+                assert after[name] != before[name]
+            else:
+                assert after[name] == before[name]
+        collection2 = Collection(pathname, use_cache=False)
+        for c, c2 in zip(collection.containers, collection2.containers):
+            assert np.array_equal(c._data, c2._data)
+
+    def test_failed_save(self, tmpdir):
+        pathname = self.copy_sample(tmpdir, "dos_sd_test1.atr")
+        with open(pathname, "rb") as fh:
+            original = fh.read()
+        collection = Collection(pathname, use_cache=False)
+        collection.containers[0].data[100] = 0x55
+
+        def fail(*args, **kwargs):
+            raise errors.InvalidAlgorithm("fail")
+        collection.archiver.pack_data = fail
+        with pytest.raises(errors.InvalidAlgorithm):
+            collection.save()
+        with open(pathname, "rb") as fh:
+            assert fh.read() == original
+        assert os.listdir(str(tmpdir)) == ["dos_sd_test1.atr"]
+
+    def test_stream_chain(self):
+        data = np.arange(100000, dtype=np.uint32).astype(np.uint8).tobytes()
+        order = [BZipCompressor, ZLibCompressor, LZMACompressor, GZipCompressor]
+        fh = io.BytesIO()
+        stream = PackedStreamChain(fh, order)
+        for i in range(0, len(data), 30000):
+            stream.write(data[i:i + 30000])
+        stream.close()
+        unpacked, found = guess_compressor_list(fh.getvalue())
+        assert found == order
+        assert unpacked == data
+
+
 if __name__ == "__main__":
     t = TestCollection()
     # t.test_serialize()
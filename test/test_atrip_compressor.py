@@ -12,11 +12,11 @@ compressors_and_decompressors = [
     lz4.LZ4Compressor,
     lzma.LZMACompressor,
     zlib.ZLibCompressor,
+    unix_compress.UnixCompressor,
 ]
 
 read_only_compressors = [
     dcm.DCMCompressor,
-    unix_compress.UnixCompressor,
 ]
 
 class TestCompressor:
@@ -37,6 +37,41 @@ class TestCompressor:
         print(len(self.byte_data), len(packed), len(unpacked))
         assert unpacked == self.byte_data
 
+
+class TestUnixCompress:
+    def setup(self):
+        rng = np.random.RandomState(1234)
+        self.samples = [
+            b"",
+            b"a",
+            rng.randint(0, 4, 100000).astype(np.uint8).tobytes(),
+            # enough codes to fill the table at 16 bits
+            rng.randint(0, 256, 200000).astype(np.uint8).tobytes(),
+        ]
+        # at the code size changes
+        self.samples.extend([rng.randint(0, 256, n).astype(np.uint8).tobytes() for n in [255, 256, 257, 511, 512]])
+
+    def test_python(self):
+        for data in self.samples:
+            packed = unix_compress.lzw(data)
+            assert unix_compress.unlzw(packed) == data
+
+    @pytest.mark.skipif(unix_compress.speedups is None, reason="compress_speedups not built")
+    def test_speedups(self):
+        for data in self.samples:
+            packed = unix_compress.speedups.lzw(data)
+            assert packed == unix_compress.lzw(data)
+            assert unix_compress.speedups.unlzw(packed) == data
+
+    def test_sample(self):
+        with open("../samples/dos_sd_test1.atr.Z", "rb") as fh:
+            packed = fh.read()
+        unpacked = unix_compress.unlzw(packed)
+        assert len(unpacked) == 92176
+        assert unix_compress.unlzw(unix_compress.lzw(unpacked)) == unpacked
+        with pytest.raises(ValueError):
+            unix_compress.unlzw(b"\x1f\x9e" + packed[2:])
+
 if __name__ == "__main__":
     t = TestCompressor()
     t.setup()
@@ -1,10 +1,12 @@
 import glob
+import hashlib
 
 import numpy as np
 
 from mock import *
 
-from atrip.container import guess_container
+from atrip.container import Container, guess_container
+from atrip.segment import Segment
 from atrip import errors
 
 
@@ -85,6 +87,37 @@ class TestMultipleCompression:
             assert np.array_equal(container._data, container2._data)
 
 
+class TestSha1:
+    def setup(self):
+        self.container = Container(np.arange(256, dtype=np.uint8))
+
+    def test_cached(self, monkeypatch):
+        first = self.container.sha1
+        monkeypatch.setattr(hashlib, "sha1", None)
+        assert self.container.sha1 == first
+
+    def test_container_write(self):
+        first = self.container.sha1
+        self.container[10] = 0
+        assert self.container.sha1 != first
+        self.container[10] = 10
+        assert self.container.sha1 == first
+
+    def test_segment_write(self):
+        first = self.container.sha1
+        segment = Segment(self.container, 100, length=20)
+        segment[5] = 0
+        assert self.container.sha1 != first
+        segment.data[5:6] = 105
+        assert self.container.sha1 == first
+
+    def test_dirty_after_array_write(self):
+        self.container.mark_clean()
+        assert not self.container.is_dirty
+        self.container.data[0] = 0xff
+        assert self.container.is_dirty
+
+
 if __name__ == "__main__":
     import logging
     logging.basicConfig(level=logging.DEBUG)
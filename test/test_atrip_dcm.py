@@ -247,6 +247,17 @@ class TestFileCompression:
         else:
             assert np.array_equal(m.data, out)
 
+    @pytest.mark.skipif(dcm.speedups is None, reason="compress_speedups not built")
+    @pytest.mark.parametrize(("pathname"), globbed_sample_atari_files)
+    def test_speedups(self, pathname):
+        sample_data = np.fromfile(pathname, dtype=np.uint8)
+        container = guess_container(sample_data)
+        container.guess_media_type()
+        m = container.media
+        packed = compressor.calc_packed_data_python(m.data, m)
+        assert compressor.calc_packed_data(m.data, m) == packed
+        assert dcm.speedups.unpack_dcm(packed) == compressor.calc_unpacked_data_python(packed)
+
 if __name__ == "__main__":
     t = TestDCMBlocks()
     t.setup()
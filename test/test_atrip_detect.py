@@ -0,0 +1,115 @@
+import glob
+import gzip
+import lzma
+
+import pytest
+
+import numpy as np
+
+from atrip.detect import Sample, Magic, TrailingMagic, Size, HasAttribute, AnyOf, Check, rank_candidates
+from atrip.compressor import guess_compressor_list, find_compressors
+from atrip.compressors.zlib import is_zlib_header
+from atrip.compressors.lzma import is_lzma_alone_header
+from atrip.archiver import find_container_items_in_archive, find_archivers
+from atrip.archivers.tar import is_tar_header
+from atrip.container import Container
+from atrip.media_type import guess_media_type, find_media_types
+
+sample_files = [f for f in sorted(glob.glob("../samples/*")) if not f.endswith(".omnivore")]
+
+
+class Thing:
+    def __init__(self, name, detect):
+        self.__name__ = name
+        self.detect = detect
+
+
+class TestPredicates:
+    def setup(self):
+        data = np.zeros(100000, dtype=np.uint8)
+        data[0:2] = [0x96, 0x02]
+        data[5000:5004] = [1, 2, 3, 4]
+        data[-22:-18] = list(b"PK\x05\x06")
+        self.data = data
+        self.sample = Sample(data)
+
+    def test_magic(self):
+        assert Magic(b"\x96\x02")(self.sample)
+        assert Magic(b"xx", b"\x96")(self.sample)
+        assert not Magic(b"\x96\x03")(self.sample)
+        assert Magic(b"\x01\x02\x03\x04", offset=5000)(self.sample)
+        assert Magic(b"PK\x05\x06", offset=-22)(self.sample)
+        assert not Magic(b"PK")(Sample(b""))
+
+    def test_trailing_magic(self):
+        assert TrailingMagic(b"PK\x05\x06")(self.sample)
+        assert not TrailingMagic(b"PK\x05\x06", within=10)(self.sample)
+        assert not TrailingMagic(b"\x01\x02\x03\x04")(self.sample)
+
+    def test_size(self):
+        assert Size(exact=100000)(self.sample)
+        assert not Size(exact=99984)(self.sample)
+        assert Size(exact=99984, header_magic=b"\x96\x02", header_size=16)(self.sample)
+        assert not Size(exact=99984, header_magic=b"CART", header_size=16)(self.sample)
+        assert Size(minimum=1000, maximum=100000, multiple=1000)(self.sample)
+        assert not Size(maximum=1000)(self.sample)
+        assert not Size(multiple=1024)(self.sample)
+
+    def test_attribute(self):
+        sample = Sample(Container(self.data))
+        assert HasAttribute("decompression_order")(sample)
+        assert not HasAttribute("get_contiguous_sectors")(sample)
+        assert not HasAttribute("decompression_order", "bad")(sample)
+
+    def test_combined(self):
+        assert AnyOf(Magic(b"xx"), Size(exact=100000))(self.sample)
+        assert not AnyOf(Magic(b"xx"), Size(exact=1))(self.sample)
+        assert Check(lambda s: s.size == 100000)(self.sample)
+
+    def test_rank(self):
+        a = Thing("a", [])
+        b = Thing("b", [Magic(b"xx")])
+        c = Thing("c", [Magic(b"\x96\x02"), Size(exact=100000)])
+        d = Thing("d", [Magic(b"\x96\x02"), Size(exact=1)])
+        assert rank_candidates([a, b, c, d], self.data) == [c, a]
+
+
+class TestHeaders:
+    def test_zlib(self):
+        assert is_zlib_header(b"\x78\x9c")
+        assert not is_zlib_header(b"\x78\x9d")
+        assert not is_zlib_header(b"\x78")
+
+    def test_lzma(self):
+        data = lzma.compress(b"abc" * 100, format=lzma.FORMAT_ALONE)
+        assert is_lzma_alone_header(data)
+        assert not is_lzma_alone_header(lzma.compress(b"abc"))
+        assert not is_lzma_alone_header(gzip.compress(b"abc"))
+
+    def test_tar(self):
+        data = open("../samples/tar_test1.tar", "rb").read()
+        assert is_tar_header(data)
+        assert not is_tar_header(data[1:])
+        assert not is_tar_header(b"")
+
+
+class TestRankedGuess:
+    def identify(self, pathname, exhaustive):
+        def candidates(find):
+            return find() if exhaustive else None
+
+        byte_data = open(pathname, "rb").read()
+        data, compressors = guess_compressor_list(byte_data, candidates(find_compressors))
+        archiver, items = find_container_items_in_archive(pathname, data, candidates(find_archivers))
+        found = [[c.compression_algorithm for c in compressors], str(archiver)]
+        for item_pathname, item_data in items:
+            if archiver.supports_multiple_containers:
+                item_data, compressors = guess_compressor_list(item_data, candidates(find_compressors))
+            container = Container(item_data, compressors)
+            media = guess_media_type(container, candidates(find_media_types))
+            found.append(media.__class__.__name__)
+        return found
+
+    @pytest.mark.parametrize("pathname", sample_files)
+    def test_same_as_exhaustive(self, pathname):
+        assert self.identify(pathname, False) == self.identify(pathname, True)
@@ -73,6 +73,68 @@ class TestLabels(TestORA):
     labels = [(0x80, "ADDR80"), (0xff, "ADDRFF")]
 
 
+class TestReparse:
+    def setup(self):
+        rng = np.random.RandomState(1234)
+        data = rng.randint(0, 256, 4096).astype(np.uint8)
+        data[1000:1100] = 0  # run of data bytes
+        self.container = Container(data)
+        self.segment = Segment(self.container, origin=0x6000)
+        self.segment.style[:] = 0
+        self.segment.disasm_type[:] = 10
+        self.segment.disasm_type[900:1200] = 0
+        self.driver = DisassemblyConfig()
+        self.rng = rng
+
+    def check_same(self, p):
+        full = self.driver.parse(self.segment)
+        assert len(p) == len(full)
+        assert np.array_equal(p.entries[:len(p)], full.entries[:len(full)])
+        assert np.array_equal(p.index_to_row, full.index_to_row)
+        assert np.array_equal(p.jmp_targets[:256*256] != 0, full.jmp_targets[:256*256] != 0)
+
+    @pytest.mark.parametrize("start,end", [(0, 1), (10, 11), (950, 960), (1050, 1051), (1199, 1201), (2000, 2100), (4095, 4096)])
+    def test_byte_changes(self, start, end):
+        p = self.driver.parse(self.segment)
+        self.segment[start:end] = self.rng.randint(0, 256, end - start)
+        p = self.driver.reparse(p, self.segment, start, end)
+        self.check_same(p)
+
+    def test_type_changes(self):
+        p = self.driver.parse(self.segment)
+        self.segment.disasm_type[2000:2010] = 0
+        p = self.driver.reparse(p, self.segment, 2000, 2010)
+        self.check_same(p)
+        self.segment.style[3000] = 0x40
+        p = self.driver.reparse(p, self.segment, 3000, 3001)
+        self.check_same(p)
+
+    def test_many_changes(self):
+        p = self.driver.parse(self.segment)
+        for i in range(200):
+            index = self.rng.randint(0, 4096)
+            self.segment[index] = self.rng.randint(0, 256)
+            p = self.driver.reparse(p, self.segment, index, index + 1)
+        self.check_same(p)
+
+    def test_growable(self):
+        p = self.driver.parse(self.segment, 10)
+        assert len(p) > 10
+        self.check_same(p)
+
+    @pytest.mark.parametrize("chunk_size", [1, 5, 100, 4096])
+    def test_parse_in_pieces(self, chunk_size):
+        p = self.driver.parse_start(self.segment)
+        last = 0
+        while not self.driver.parse_more(p, chunk_size):
+            assert not p.is_complete
+            assert p.num_parsed_bytes >= last + chunk_size
+            last = p.num_parsed_bytes
+        assert p.is_complete
+        assert p.num_parsed_bytes == 4096
+        self.check_same(p)
+
+
 def sample():
     if len(sys.argv) > 1:
         with open(sys.argv[1], 'rb') as fh:
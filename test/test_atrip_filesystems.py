@@ -4,7 +4,10 @@ import numpy as np
 
 from mock import *
 
-from atrip.container import guess_container
+from atrip.container import guess_container, load
+from atrip.collection import Collection
+from atrip.filesystem import SectorChainResolver, allocate_first_fit, allocate_best_fit
+from atrip.filesystems.atari_dos2 import AtariDos2
 from atrip.media_type import Media, guess_media_type
 from atrip import errors
 
@@ -40,6 +43,128 @@ class TestAtariDos2:
         is_expected_media(container, pathname)
 
 
+class TestSectorChains:
+    def setup(self):
+        self.container = load(os.path.join(os.path.dirname(__file__), "../samples/dos_sd_test1.atr"))
+        self.media = self.container.media
+        self.fs = AtariDos2(self.media)
+        self.dirents = [d for d in self.fs.directory.segments if d.in_use]
+
+    def resolve(self, dirent):
+        resolver = SectorChainResolver(self.media)
+        return resolver.resolve([dirent.starting_sector], [dirent.num_sectors], [dirent.file_num])[0]
+
+    def test_all_files(self):
+        assert len(self.dirents) > 1
+        for dirent in self.dirents:
+            chain = self.resolve(dirent)
+            assert len(chain.sectors) == dirent.num_sectors
+            assert np.array_equal(dirent.segments[0].container_offset, self.media.container_offset[chain.offsets])
+            assert np.array_equal(self.media.get_sector_list_offsets(chain.sectors), self.media.get_sector_list_offsets_slow(chain.sectors))
+
+    def test_bad_links(self):
+        dirent = self.dirents[0]
+        original = self.resolve(dirent)
+        first, second = original.sectors[0:2]
+        index, size = self.media.get_index_of_sector(first)
+        link = self.media[index + size - 3:index + size - 1].copy()
+
+        # point first sector back to itself
+        self.media[index + size - 2] = first & 0xff
+        self.media[index + size - 3] = (dirent.file_num << 2) | (first >> 8)
+        assert isinstance(self.resolve(dirent).error, errors.FileStructureError)
+
+        # wrong file number
+        self.media[index + size - 3] = ((dirent.file_num + 1) << 2) | (second >> 8)
+        self.media[index + size - 2] = second & 0xff
+        assert isinstance(self.resolve(dirent).error, errors.FileNumberMismatchError164)
+
+        # link past the end of the disk
+        self.media[index + size - 3] = (dirent.file_num << 2) | 3
+        self.media[index + size - 2] = 0xff
+        chain = self.resolve(dirent)
+        assert chain.offsets is None and chain.error is None
+
+        self.media[index + size - 3:index + size - 1] = link
+        assert np.array_equal(self.resolve(dirent).offsets, original.offsets)
+
+    def test_extract_all(self, tmpdir):
+        collection = Collection("dos_sd_test1.atr", container=self.container, guess=False)
+        self.container.filesystem = self.fs
+        results = collection.extract_all(str(tmpdir), lower_case=True)
+        assert [r[0] for r in results] == self.dirents
+        for dirent, pathname, written in results:
+            assert written
+            assert os.path.basename(pathname) == dirent.filename.lower()
+            assert open(pathname, "rb").read() == dirent.segments[0].tobytes()
+        assert not any(r[2] for r in collection.extract_all(str(tmpdir), lower_case=True))
+        assert all(r[2] for r in collection.extract_all(str(tmpdir), lower_case=True, overwrite=True))
+
+        results = collection.extract_all(str(tmpdir), ext="xex")
+        for dirent, pathname, written in results:
+            assert os.path.basename(pathname) == dirent.filename + ".xex"
+        assert sorted(os.listdir(str(tmpdir))) == sorted([os.path.basename(r[1]) for r in results] + [d.filename.lower() for d in self.dirents])
+
+
+class FakeSector:
+    def __init__(self, sector_num):
+        self.sector_num = sector_num
+
+
+class TestVTOC:
+    def setup(self):
+        container = load(os.path.join(os.path.dirname(__file__), "../samples/dos_sd_test1.atr"))
+        self.vtoc = AtariDos2(container.media).vtoc
+
+    def check_index(self):
+        vtoc = self.vtoc
+        assert vtoc.num_free_sectors == np.sum(vtoc.sector_map == 1)
+        starts, lengths = vtoc.free_run_starts, vtoc.free_run_lengths
+        vtoc.update_free_index()
+        assert np.array_equal(starts, vtoc.free_run_starts)
+        assert np.array_equal(lengths, vtoc.free_run_lengths)
+
+    def test_strategies(self):
+        starts = np.array([10, 20, 40, 100])
+        lengths = np.array([3, 8, 5, 50])
+        assert list(allocate_first_fit(starts, lengths, 6)) == [3, 3, 0, 0]
+        assert list(allocate_best_fit(starts, lengths, 6)) == [0, 8 - 2, 0, 0]
+        assert list(allocate_best_fit(starts, lengths, 5)) == [0, 0, 5, 0]
+        assert list(allocate_best_fit(starts, lengths, 60)) == [0, 8, 2, 50]
+
+    def test_reserve_and_free(self):
+        vtoc = self.vtoc
+        free = vtoc.num_free_sectors
+        expected = list(np.flatnonzero(vtoc.sector_map)[0:10])
+        order = vtoc.reserve_space(10)
+        assert order == expected
+        assert vtoc.num_free_sectors == free - 10
+        self.check_index()
+
+        # first fit leaves a hole when freeing the middle sectors
+        vtoc.free_sector_list([FakeSector(s) for s in order[3:6]])
+        assert vtoc.num_free_sectors == free - 7
+        self.check_index()
+        assert vtoc.reserve_space(2, "best_fit") == order[3:5]
+        assert vtoc.get_next_free_sector() == order[5]
+        self.check_index()
+
+        # the VTOC data is kept in sync with the sector map
+        sector_map = vtoc.sector_map.copy()
+        vtoc.unpack_vtoc()
+        assert np.array_equal(sector_map, vtoc.sector_map)
+
+    def test_not_enough_space(self):
+        vtoc = self.vtoc
+        free = vtoc.num_free_sectors
+        with pytest.raises(errors.NotEnoughSpaceOnDisk):
+            vtoc.reserve_space(free + 1)
+        assert vtoc.num_free_sectors == free
+        assert len(vtoc.reserve_space(free, "best_fit")) == free
+        assert vtoc.num_free_sectors == 0
+        self.check_index()
+
+
 if __name__ == "__main__":
     import logging
     logging.basicConfig(level=logging.WARNING)
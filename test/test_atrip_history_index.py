@@ -0,0 +1,111 @@
+from mock import *
+
+from atrip.disassemblers import dtypes as dd
+from atrip.disassemblers import flags
+from atrip.disassemblers.history_index import HistoryIndex, write_flags
+
+
+class RingHistory:
+    """Same ring buffer behavior as libudis_get_next_entry, in python"""
+
+    def __init__(self, num_entries):
+        self.entries = np.zeros(num_entries, dtype=dd.HISTORY_ENTRY_DTYPE)
+        self.first_entry_index = 0
+        self.latest_entry_index = -1
+        self.num_entries = 0
+        self.cumulative_count = 0
+
+    def __len__(self):
+        return self.num_entries
+
+    def __getitem__(self, index):
+        return self.entries[(index + self.first_entry_index) % len(self.entries)]
+
+    def add(self, disassembler_type, pc=0, target_addr=0, flag=0):
+        n = len(self.entries)
+        if self.latest_entry_index < 0 or self.entries[self.latest_entry_index]["disassembler_type"] != flags.DISASM_NEXT_INSTRUCTION:
+            self.latest_entry_index = (self.latest_entry_index + 1) % n
+            if self.latest_entry_index == self.first_entry_index and self.num_entries == n:
+                self.first_entry_index = (self.first_entry_index + 1) % n
+            if self.num_entries < n:
+                self.num_entries += 1
+            self.cumulative_count += 1
+        e = self.entries[self.latest_entry_index]
+        e["disassembler_type"] = disassembler_type
+        e["pc"] = pc
+        e["target_addr"] = target_addr
+        e["flag"] = flag
+
+    def add_frame(self, rng, frame_number, count):
+        for i in range(count):
+            flag = rng.choice([0, flags.FLAG_STORE_A_IN_MEMORY, flags.FLAG_LOAD_A_FROM_MEMORY, flags.FLAG_MEMORY_ALTER])
+            self.add(flags.DISASM_ATARI800_HISTORY, rng.randint(0x2000, 0x2010), rng.choice([0xd40a, 0x80, 0x81]), flag)
+        self.add(flags.DISASM_FRAME_END)
+        self.entries[self.latest_entry_index:self.latest_entry_index + 1].view(np.uint32)[0] = frame_number
+
+
+class TestHistoryIndex:
+    def setup(self):
+        self.rng = np.random.RandomState(1234)
+        self.history = RingHistory(1000)
+        self.index = HistoryIndex(self.history)
+
+    def rows(self):
+        return [self.history[i] for i in range(len(self.history))]
+
+    def brute_force(self, **criteria):
+        found = []
+        for row, e in enumerate(self.rows()):
+            t = e["disassembler_type"]
+            if "disassembler_type" in criteria and t != criteria["disassembler_type"]:
+                continue
+            if "target_addr" in criteria and (t in [flags.DISASM_FRAME_START, flags.DISASM_FRAME_END] or e["target_addr"] != criteria["target_addr"]):
+                continue
+            if "flag_results" in criteria and (e["flag"] & flags.FLAG_RESULT_MASK) not in criteria["flag_results"]:
+                continue
+            found.append(row)
+        return found
+
+    def test_wrap(self):
+        for frame_number in range(1, 60):
+            self.history.add_frame(self.rng, frame_number, self.rng.randint(10, 80))
+            # only query sometimes so several frames are indexed at once
+            if frame_number % 3 == 0:
+                assert list(self.index.find(disassembler_type=flags.DISASM_FRAME_END)) == self.brute_force(disassembler_type=flags.DISASM_FRAME_END)
+                assert list(self.index.find(target_addr=0xd40a, flag_results=write_flags)) == self.brute_force(target_addr=0xd40a, flag_results=write_flags)
+        assert self.history.cumulative_count > 2000
+        assert len(self.index.runs) < 10
+
+    def test_frames(self):
+        for frame_number in range(1, 40):
+            self.history.add_frame(self.rng, frame_number, 50)
+        ends = self.brute_force(disassembler_type=flags.DISASM_FRAME_END)
+        assert self.index.get_frame_rows(39) == (ends[-2] + 1, ends[-1] + 1)
+        assert self.index.get_frame_rows(1) is None
+        rows = self.index.find(target_addr=0x80, frames=(37, 38))
+        expected = [r for r in self.brute_force(target_addr=0x80) if ends[-4] < r <= ends[-2]]
+        assert list(rows) == expected
+
+        # frame in progress
+        self.history.add(flags.DISASM_ATARI800_HISTORY, 0x2000, 0x80)
+        self.history.add(flags.DISASM_NEXT_INSTRUCTION, 0x2003)
+        ends = self.brute_force(disassembler_type=flags.DISASM_FRAME_END)
+        assert self.index.get_frame_rows(40) == (ends[-1] + 1, ends[-1] + 2)
+
+    def test_previous_next(self):
+        for frame_number in range(1, 30):
+            self.history.add_frame(self.rng, frame_number, 60)
+        ends = self.brute_force(disassembler_type=flags.DISASM_FRAME_END)
+        assert self.index.find_previous(ends[3] + 5, flags.DISASM_FRAME_END) == ends[3]
+        assert self.index.find_previous(ends[3], flags.DISASM_FRAME_END) == ends[2]
+        assert self.index.find_previous(ends[0], flags.DISASM_FRAME_END) is None
+        assert self.index.find_next(ends[3], flags.DISASM_FRAME_END) == ends[4]
+        assert self.index.find_next(ends[-1], flags.DISASM_FRAME_END) is None
+
+    def test_next_instruction_replaced(self):
+        self.history.add(flags.DISASM_ATARI800_HISTORY, 0x2000, 0x80)
+        self.history.add(flags.DISASM_NEXT_INSTRUCTION, 0x2003)
+        assert list(self.index.find(pc=0x2003)) == []
+        self.history.add(flags.DISASM_ATARI800_HISTORY, 0x2003, 0x81)
+        assert list(self.index.find(pc=0x2003)) == [1]
+        assert list(self.index.find(target_addr=0x81)) == [1]
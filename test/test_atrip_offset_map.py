@@ -0,0 +1,82 @@
+from mock import *
+
+from atrip.container import Container
+from atrip.segment import Segment
+from atrip.offset_map import calc_offset_map, calc_offset_map_from_ranges, RangeOffsetMap, ArrayOffsetMap
+from atrip import errors
+
+
+class TestOffsetMap:
+    def setup(self):
+        self.offsets = np.concatenate((np.arange(100, 200), np.arange(20, 50), np.arange(500, 600))).astype(np.uint32)
+        self.ranges = calc_offset_map(self.offsets)
+        self.scattered = calc_offset_map(np.arange(40, dtype=np.uint32) * 100)
+
+    def test_type(self):
+        assert isinstance(self.ranges, RangeOffsetMap)
+        assert len(self.ranges.starts) == 3
+        assert isinstance(self.scattered, ArrayOffsetMap)
+        assert calc_offset_map(np.arange(10, 20)).is_contiguous
+
+    @pytest.mark.parametrize("index", [0, 99, 100, 129, 130, -1, slice(None), slice(90, 140), slice(0, 230, 3), [5, 150, 3, 229], np.arange(230) % 2 == 0])
+    def test_lookup(self, index):
+        assert np.array_equal(self.ranges[index], self.offsets[index])
+
+    def test_out_of_range(self):
+        with pytest.raises(IndexError):
+            self.ranges[230]
+        with pytest.raises(IndexError):
+            self.ranges[[0, 230]]
+
+    def test_reverse(self):
+        for m, offsets in [(self.ranges, self.offsets), (self.scattered, np.arange(40) * 100)]:
+            expected = np.zeros(5000, dtype=np.int64) - 1
+            expected[offsets] = np.arange(len(offsets))
+            assert np.array_equal(m.reverse_lookup(np.arange(5000)), expected)
+            assert m.reverse_lookup(offsets[7]) == 7
+
+    def test_duplicates(self):
+        with pytest.raises(errors.InvalidSegmentOrder):
+            calc_offset_map(np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 5, 6, 7, 8, 9, 10] * 2)).reverse_lookup(0)
+
+    def test_ranges(self):
+        for m in [self.ranges, self.scattered]:
+            ranges = m.to_ranges(compact=True)
+            restored = calc_offset_map_from_ranges(ranges, len(m))
+            assert np.array_equal(restored, m)
+
+    def test_compose(self):
+        sub = RangeOffsetMap([90, 140], [20, 10])
+        expected = self.offsets[np.asarray(sub)]
+        composed = self.ranges.compose(sub)
+        assert isinstance(composed, RangeOffsetMap)
+        assert np.array_equal(composed, expected)
+        assert composed.to_ranges() == [[190, 200], [20, 30], [510, 520]]
+
+    def test_clip(self):
+        assert np.array_equal(self.ranges.clip(550), self.offsets[self.offsets < 550])
+        assert np.array_equal(self.scattered.clip(550), np.arange(6) * 100)
+
+
+class TestSegmentOffsets:
+    def setup(self):
+        self.container = Container(np.arange(4096, dtype=np.uint32).astype(np.uint8))
+
+    def test_contiguous_view(self):
+        s = Segment(self.container, 1000, length=500)
+        assert s.container_offset.is_contiguous
+        s.data[10:20] = 0x55
+        assert np.all(self.container._data[1010:1020] == 0x55)
+        copy = s.data[10:20]
+        copy[:] = 0
+        assert np.all(self.container._data[1010:1020] == 0x55)
+
+    def test_sub_segments(self):
+        s = Segment(self.container, 1000, length=500)
+        sub = Segment(s, [10, 11, 12, 13, 200, 201, 202, 203])
+        assert list(sub.container_offset) == [1010, 1011, 1012, 1013, 1200, 1201, 1202, 1203]
+        assert sub.calc_index_from_other_segment(201, s) == 5
+        assert s.calc_index_from_other_segment(5, sub) == 201
+        assert list(s.calc_indexes_from_other_segment([0, 4], sub)) == [10, 200]
+        assert sub.reverse_offset[1201] == 5
+        assert sub.reverse_offset[1204] == -1
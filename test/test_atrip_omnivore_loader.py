@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from atrip import omnivore_loader
+from atrip.collection import Collection
+
+
+class MockFileGuess:
+    """Same interface as sawx.loader.FileGuess, counting full reads"""
+    def __init__(self, uri):
+        self.uri = uri
+        self.all_data_count = 0
+        with open(uri, "rb") as fh:
+            self.data = fh.read()
+
+    @property
+    def sample_data(self):
+        return self.data[:10240]
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def all_data(self):
+        self.all_data_count += 1
+        return self.data
+
+
+class TestLoader:
+    @pytest.mark.parametrize(("filename", "mime"), [
+        ("dos_sd_test1.atr", "application/vnd.atari8bit.atr"),
+        # a size that fits isn't enough to claim a headerless image
+        ("dos_sd_test1.xfd", "application/octet-stream"),
+        ("dos33_master.dsk", "application/octet-stream"),
+        ("dos_sd_test1.atr.gz", omnivore_loader.deferred_mime),
+        ("mydos_sd_mydos4534.dcm", omnivore_loader.deferred_mime),
+        ("dos_sd_test_collection.tar", omnivore_loader.deferred_mime),
+        # the zip directory is at the end, beyond the sniffed header
+        ("dos_sd_test_collection.zip", "application/octet-stream"),
+        ("lasers.s", "application/octet-stream"),
+        ])
+    def test_sniff(self, filename, mime):
+        file_guess = MockFileGuess(os.path.join("../samples", filename))
+        file_metadata = omnivore_loader.identify_loader(file_guess)
+        assert file_metadata["mime"] == mime
+        assert file_guess.all_data_count == 0
+
+    @pytest.mark.parametrize("data", [
+        b"hello world\n" * 341 + b"\n" * 4,
+        b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR" + b"\0" * 1008,
+        ])
+    def test_not_cart(self, data):
+        # any data can be a multiple of 1K in size
+        assert len(data) % 1024 == 0
+        assert omnivore_loader.sniff(data, len(data)) == "application/octet-stream"
+
+    def test_cart_header(self):
+        data = b"CART" + b"\0" * 12 + b"\xff" * 8192
+        assert omnivore_loader.sniff(data, len(data)) == "application/vnd.atari8bit.cart"
+
+    def test_octet_stream_parse(self):
+        file_guess = MockFileGuess("../samples/dos_sd_test1.xfd")
+        file_metadata = omnivore_loader.identify_loader(file_guess)
+        file_metadata["uri"] = file_guess.uri
+        omnivore_loader.get_collection(file_metadata)
+        assert file_metadata["mime"] == "application/vnd.atari8bit.atr"
+
+    def test_empty(self):
+        assert omnivore_loader.sniff(b"", 0) is None
+
+    def test_deferred_parse(self):
+        file_guess = MockFileGuess("../samples/dos_sd_test1.atr.gz")
+        file_metadata = omnivore_loader.identify_loader(file_guess)
+        file_metadata["uri"] = file_guess.uri
+        assert "atrip_collection" not in file_metadata
+        collection = omnivore_loader.get_collection(file_metadata)
+        assert file_guess.all_data_count == 1
+        assert file_metadata["atrip_collection"] is collection
+        assert file_metadata["mime"] == "application/vnd.atari8bit.atr"
+        assert omnivore_loader.get_collection(file_metadata) is collection
+        assert file_guess.all_data_count == 1
+
+    def test_existing_collection(self):
+        collection = Collection("../samples/dos_sd_test1.atr")
+        file_metadata = dict(uri="", mime="application/octet-stream", atrip_collection=collection)
+        assert omnivore_loader.get_collection(file_metadata) is collection
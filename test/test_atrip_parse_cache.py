@@ -0,0 +1,97 @@
+from mock import *
+from unittest.mock import patch
+
+from atrip import parse_cache
+from atrip.collection import Collection
+
+
+def get_structure(collection):
+    s = []
+    for c in collection.containers:
+        s.append((c.pathname, c.media.__class__, c.filesystem.__class__, [(seg.name, list(seg.container_offset)) for seg in c.iter_segments()]))
+    return s
+
+
+class TestParseCache:
+    def setup(self):
+        self.saved_cache_dir = parse_cache.cache_dir
+        parse_cache.enabled = True
+
+    def teardown(self):
+        parse_cache.cache_dir = self.saved_cache_dir
+        parse_cache.enabled = False
+
+    @pytest.mark.parametrize("filename", ["dos_sd_test1.atr.gz", "dos_sd_test_collection.zip"])
+    def test_reload(self, tmpdir, filename):
+        parse_cache.cache_dir = str(tmpdir)
+        pathname = os.path.join(os.path.dirname(__file__), "../samples", filename)
+        data = open(pathname, 'rb').read()
+        key = parse_cache.calc_cache_key(data)
+        cache = parse_cache.get_cache()
+        assert key not in cache
+
+        uncached = Collection(pathname, use_cache=False)
+        assert key not in cache
+        c1 = Collection(pathname)
+        assert key in cache
+
+        # guessing must not happen when restoring from the cache
+        with patch("atrip.collection.guess_compressor_list", side_effect=AssertionError):
+            c2 = Collection(pathname)
+        assert c2.pathname == pathname
+        assert c2.decompression_order == uncached.decompression_order
+        assert get_structure(c2) == get_structure(uncached)
+        for a, b in zip(c2.containers, uncached.containers):
+            assert np.array_equal(a.data, b.data)
+            assert a.decompression_order == b.decompression_order
+        assert set(c1.uuid_map.keys()).isdisjoint(c2.uuid_map.keys())
+
+    def test_bad_entry(self, tmpdir):
+        parse_cache.cache_dir = str(tmpdir)
+        pathname = os.path.join(os.path.dirname(__file__), "../samples/dos_sd_test1.atr")
+        key = parse_cache.calc_cache_key(open(pathname, 'rb').read())
+        Collection(pathname)
+        cache = parse_cache.get_cache()
+        json_path, _ = cache.get_paths(key)
+        with open(json_path, "w") as fh:
+            fh.write("not json")
+        c = Collection(pathname)
+        assert len(c.containers) == 1
+        assert key in cache
+
+    def test_no_jsonpickle(self, tmpdir):
+        parse_cache.cache_dir = str(tmpdir)
+        pathname = os.path.join(os.path.dirname(__file__), "../samples/dos_sd_test1.atr")
+        key = parse_cache.calc_cache_key(open(pathname, 'rb').read())
+        with patch.dict("sys.modules", {"jsonpickle": None}):
+            c = Collection(pathname)
+            assert len(c.containers) == 1
+            cache = parse_cache.get_cache()
+            assert key not in cache
+            assert not cache.save(key, c)
+            assert cache.load(key) is None
+
+    def test_eviction(self, tmpdir):
+        parse_cache.cache_dir = str(tmpdir)
+        pathnames = [os.path.join(os.path.dirname(__file__), "../samples", f) for f in ["dos_sd_test1.atr", "dos_ed_test1.atr", "dos_dd_test1.atr"]]
+        keys = [parse_cache.calc_cache_key(open(p, 'rb').read()) for p in pathnames]
+        cache = parse_cache.get_cache()
+        for i, pathname in enumerate(pathnames):
+            Collection(pathname)
+            json_path, _ = cache.get_paths(keys[i])
+            os.utime(json_path, (i * 10, i * 10))
+        usage = cache.calc_usage()
+        assert sorted(usage.keys()) == sorted(keys)
+
+        # using the oldest entry makes the second one the least recently used
+        assert cache.load(keys[0]) is not None
+        cache.max_size = usage[keys[0]][1] + usage[keys[2]][1]
+        cache.evict()
+        assert keys[0] in cache
+        assert keys[1] not in cache
+        assert keys[2] in cache
+
+        # the entry just saved is kept even if it's too big by itself
+        cache.max_size = 0
+        cache.evict(keep=keys[2])
+        assert sorted(cache.calc_usage().keys()) == [keys[2]]
@@ -0,0 +1,73 @@
+from mock import *
+
+from atrip import scan, errors
+
+
+class TestScan:
+    def setup(self):
+        self.rows = [
+            {"path": "a/b.atr", "mtime": 1590875472.25, "size": 92176, "item": "b.atr", "archive": "plain file", "compression": "none", "media": "Atari SD (90K) Floppy Disk Image", "filesystem": "Atari DOS 2", "signature": ""},
+            {"path": "a/c,d.zip", "mtime": 1590875473.5, "size": 10, "error": "Not a zip file"},
+        ]
+
+    def make_tree(self, tmpdir):
+        for name in ["one.atr", "two.ATR", "sub/three.atr", "sub/four.xex"]:
+            tmpdir.join(name).write_binary(bytes(range(256)) * 4, ensure=True)
+        return str(tmpdir)
+
+    def test_iter_paths(self, tmpdir):
+        top = self.make_tree(tmpdir)
+        names = [os.path.relpath(p, top) for p, mtime, size in scan.iter_paths([top])]
+        assert names == ["one.atr", "two.ATR", "sub/four.xex", "sub/three.atr"]
+        names = [os.path.relpath(p, top) for p, mtime, size in scan.iter_paths([top], ["atr"])]
+        assert names == ["one.atr", "two.ATR", "sub/three.atr"]
+        infos = list(scan.iter_paths([os.path.join(top, "one.atr"), os.path.join(top, "missing.atr")]))
+        assert len(infos) == 1
+        assert infos[0][2] == 1024
+
+    @pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+    def test_read_keys(self, tmpdir, fmt):
+        pathname = str(tmpdir.join("out." + fmt))
+        with open(pathname, "w", newline="") as fh:
+            writer = scan.ScanWriter(fh, fmt)
+            writer.write(self.rows)
+        keys = scan.read_scanned_keys(pathname, fmt)
+        assert keys == {(r["path"], r["mtime"], r["size"]) for r in self.rows}
+
+    def test_bad_format(self):
+        with pytest.raises(errors.InvalidScanFormat):
+            scan.ScanWriter(None, "xml")
+
+    @pytest.mark.parametrize("output", ["out.jsonl", "out.csv"])
+    def test_resume(self, tmpdir, output):
+        top = self.make_tree(tmpdir.mkdir("images"))
+        output = str(tmpdir.join(output))
+        assert scan.scan([top], output, num_workers=1, extensions=["atr"]) == 3
+        assert scan.scan([top], output, num_workers=1) == 1
+        assert scan.scan([top], output, num_workers=1) == 0
+        tmpdir.join("images/one.atr").write_binary(bytes(range(256)) * 2)
+        assert scan.scan([top], output, num_workers=1) == 1
+        assert len(scan.read_scanned_keys(output, scan.guess_format(output))) == 5
+        assert scan.scan([top], output, num_workers=1, resume=False) == 4
+        assert len(scan.read_scanned_keys(output, scan.guess_format(output))) == 4
+
+    @pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+    def test_partial_row(self, tmpdir, fmt):
+        top = self.make_tree(tmpdir.mkdir("images"))
+        output = str(tmpdir.join("out." + fmt))
+        assert scan.scan([top], output, num_workers=1, extensions=["atr"]) == 3
+        complete = open(output, "rb").read()
+
+        # interrupted while writing a row with a multi-line error
+        row = dict(path=os.path.join(top, "sub", "four.xex"), mtime=1.0, size=1024, error="first\nsecond")
+        with open(output, "a", newline="") as fh:
+            scan.ScanWriter(fh, fmt, False).write([row])
+        with open(output, "rb+") as fh:
+            fh.truncate(fh.read().index(b"first", len(complete)) + 6)
+
+        scan.truncate_partial_row(output, fmt)
+        assert open(output, "rb").read() == complete
+        scan.truncate_partial_row(output, fmt)
+        assert open(output, "rb").read() == complete
+        assert scan.scan([top], output, num_workers=1) == 1
+        assert len(scan.read_scanned_keys(output, fmt)) == 4
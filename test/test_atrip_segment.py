@@ -127,6 +127,21 @@ class TestSegment:
         assert s1000.style[1] == s100.style[10]
         assert s1000.style[2] == s100.style[20]
 
+    def test_byte_access(self):
+        # sector-like runs, so the segment isn't contiguous
+        offsets = np.concatenate([np.arange(i, i + 125) for i in range(0, 4000, 128)])
+        s = Segment(self.container, offsets)
+        wrapper = s.data
+        assert s.data is wrapper
+        for i in [0, 124, 125, 1000, len(s) - 1, -1]:
+            assert s[i] == self.container[offsets[i]]
+            s[i] = 0x55
+            assert self.container[offsets[i]] == 0x55
+        assert np.array_equal(s[10:300], self.container[offsets[10:300]])
+        assert wrapper._index is None
+        assert np.array_equal(s.data.tobytes(), self.container[offsets].tobytes())
+        assert wrapper._index is not None
+
     def test_metadata(self):
         s = self.segment
         s.set_style_ranges([[200, 400]], selected=True)
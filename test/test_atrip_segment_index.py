@@ -0,0 +1,50 @@
+from mock import *
+
+from atrip.container import Container
+from atrip.segment import Segment
+
+
+class TestSegmentIndex:
+    def setup(self):
+        self.container = Container(np.arange(4096, dtype=np.uint32).astype(np.uint8))
+        everything = Segment(self.container)
+        first_half = Segment(everything, 0, length=2048)
+        sectors = Segment(first_half, np.concatenate((np.arange(1000, 1128), np.arange(128, 256), np.arange(1900, 2000))))
+        by_100 = Segment(everything, np.arange(40) * 100)
+        first_half.segments = [sectors]
+        everything.segments = [first_half, by_100]
+        self.container.segments = [everything]
+        self.segments = list(self.container.iter_segments())
+
+    def brute_force(self, container_index):
+        found = []
+        for s in self.segments:
+            where = np.flatnonzero(np.asarray(s.container_offset) == container_index)
+            if len(where) > 0:
+                found.append((s, int(where[0])))
+        return found
+
+    def test_find_segments(self):
+        index = self.container.segment_index
+        assert len(index.segments) == 4
+        for container_index in [0, 1, 99, 100, 127, 128, 255, 256, 1000, 1127, 1128, 1999, 2000, 2047, 2048, 3900, 4095, 4096, 5000, -1]:
+            assert index.find_segments(container_index) == self.brute_force(container_index)
+
+    def test_invalidate(self):
+        index = self.container.segment_index
+        assert self.container.segment_index is index
+        extra = Segment(self.container, 4000, length=10)
+        self.container.segments.append(extra)
+        self.container.invalidate_segment_index()
+        assert self.container.segment_index is not index
+        assert self.container.segment_index.find_segments(4005)[-1] == (extra, 5)
+
+    def test_map_range(self):
+        index = self.container.segment_index
+        everything, first_half, sectors, by_100 = self.segments
+        indexes = index.map_range(sectors, 120, 140, everything)
+        assert list(indexes) == list(range(1120, 1128)) + list(range(128, 140))
+        indexes = index.map_range(everything, 95, 305, by_100)
+        expected = np.zeros(305 - 95, dtype=np.int64) - 1
+        expected[[5, 105, 205]] = [1, 2, 3]
+        assert np.array_equal(indexes, expected)
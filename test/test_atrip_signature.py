@@ -0,0 +1,64 @@
+import hashlib
+
+import pytest
+
+import numpy as np
+
+from atrip import signature, errors
+from atrip.container import Container
+
+
+def make_index(signatures):
+    return signature.SignatureIndex(np.frombuffer(signature.build_index(signatures), dtype=np.uint8))
+
+
+class TestIndex:
+    def setup(self):
+        self.data = np.arange(1024, dtype=np.uint8)
+        self.signatures = [
+            (hashlib.sha1(self.data).digest(), "application/x.test", "Test Image"),
+            (b"\x00" * 20, "application/x.other", "All zeros"),
+            (b"\x12" * 19 + b"\x00", "application/x.test", "Trailing null"),
+            (b"\xff" * 20, "application/x.test", "Ünicode name"),
+        ]
+
+    def test_lookup(self):
+        index = make_index(self.signatures)
+        assert len(index) == 4
+        for digest, mime, name in self.signatures:
+            found = index.lookup(digest)
+            assert found.mime == mime
+            assert found.name == name
+        assert index.lookup(b"\x12" * 19 + b"\x01") is None
+        assert index.lookup(b"\x12" * 19) is None
+        assert index.lookup(b"\x00" * 19 + b"\x01") is None
+        assert make_index([]).lookup(b"\x00" * 20) is None
+
+    def test_invalid(self):
+        data = signature.build_index(self.signatures)
+        for bad in [b"", b"x" * len(data), data[:-1], data + b"x"]:
+            with pytest.raises(errors.InvalidSignatureIndex):
+                signature.SignatureIndex(np.frombuffer(bad, dtype=np.uint8))
+
+    def test_rebuild(self, tmpdir):
+        pathname = str(tmpdir.join("test.idx"))
+        count = signature.rebuild_index(pathname)
+        index = signature.SignatureIndex.from_file(pathname)
+        assert len(index) == count
+        for digest, mime, name in signature.iter_signatures():
+            found = index.lookup(digest)
+            assert found.mime == mime
+            assert found.name == name
+
+    def test_index_is_current(self):
+        with open(signature.index_path, "rb") as fh:
+            data = fh.read()
+        assert data == signature.build_index(signature.iter_signatures())
+
+    def test_guess(self, monkeypatch):
+        monkeypatch.setattr(signature, "_index", make_index(self.signatures))
+        container = Container(self.data)
+        found = signature.guess_signature_from_container(container)
+        assert found.name == "Test Image"
+        container[0] = 1
+        assert signature.guess_signature_from_container(container) is None
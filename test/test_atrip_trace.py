@@ -0,0 +1,92 @@
+from mock import *
+
+from atrip.disassemblers import flags
+from atrip.disassemblers.trace import TraceWriter, Trace
+from atrip.disassemblers import trace_query as q
+
+from test_atrip_history_index import RingHistory
+
+
+def add_instruction(history, pc, opcode, operand=0, target_addr=0, flag=0, cycles=2):
+    history.add(flags.DISASM_6502_HISTORY, pc, target_addr, flag)
+    e = history.entries[history.latest_entry_index]
+    e["instruction"][0:3] = [opcode, operand & 0xff, operand >> 8]
+    e["cycles"] = cycles
+
+
+def add_frame_end(history, frame_number):
+    history.add(flags.DISASM_FRAME_END)
+    history.entries[history.latest_entry_index:history.latest_entry_index + 1].view(np.uint32)[0] = frame_number
+
+
+def run_program(history, frame_number):
+    # main at $2000 calls $3000, which calls $4000 twice
+    add_instruction(history, 0x2000, 0x20, 0x3000, cycles=6)
+    add_instruction(history, 0x3000, 0x8d, 0xd40a, target_addr=0xd40a, flag=flags.FLAG_STORE_A_IN_MEMORY, cycles=4)
+    for i in range(2):
+        add_instruction(history, 0x3003 + i * 3, 0x20, 0x4000, cycles=6)
+        add_instruction(history, 0x4000, 0xe6, 0x80, target_addr=0x80, flag=flags.FLAG_MEMORY_ALTER, cycles=5)
+        add_instruction(history, 0x4002, 0x60, cycles=6)
+    add_instruction(history, 0x3009, 0x60, cycles=6)
+    add_frame_end(history, frame_number)
+
+
+class TestTrace:
+    def setup(self):
+        self.history = RingHistory(100)
+
+    def write_trace(self, path, num_frames, chunk_size=50):
+        writer = TraceWriter(self.history, path, chunk_size=chunk_size)
+        for frame_number in range(1, num_frames + 1):
+            run_program(self.history, frame_number)
+            writer.update()
+        writer.close()
+        return writer
+
+    def test_roundtrip(self, tmpdir):
+        path = str(tmpdir.join("trace"))
+        writer = self.write_trace(path, 30)
+        assert writer.num_lost == 0
+        trace = Trace(path)
+        assert len(trace) == 30 * 10
+        assert len(trace.chunks) > 1
+        assert np.array_equal(trace["seq"], np.arange(300))
+        assert np.array_equal(trace["frame_number"][9::10], np.arange(1, 31))
+        assert np.array_equal(trace["frame_number"][:10], np.ones(10))
+        assert trace["instruction"].shape == (300, 3)
+
+    def test_lost_entries(self, tmpdir):
+        path = str(tmpdir.join("trace"))
+        writer = TraceWriter(self.history, path)
+        for frame_number in range(1, 30):
+            run_program(self.history, frame_number)
+        writer.close()
+        assert writer.num_lost == 190
+        trace = Trace(path)
+        assert trace["seq"][0] == 190
+        assert len(trace) == 100
+
+    def test_queries(self, tmpdir):
+        path = str(tmpdir.join("trace"))
+        self.write_trace(path, 20)
+        trace = Trace(path)
+        hot = q.calc_hot_pcs(trace, 2)
+        assert list(hot["pc"]) == [0x4000, 0x4002]
+        assert list(hot["count"]) == [40, 40]
+        assert list(hot["cycles"]) == [200, 240]
+
+        histogram = q.calc_cycle_histogram(trace)
+        assert histogram[6] == 20 * 6
+
+        heatmap = q.calc_write_heatmap(trace, mask=trace["frame_number"] <= 5)
+        assert heatmap[0xd4, 0x0a] == 5
+        assert heatmap[0, 0x80] == 10
+        assert heatmap.sum() == 15
+
+        graph = q.calc_call_graph(trace)
+        assert graph[0]["caller"] == 0x3000
+        assert graph[0]["callee"] == 0x4000
+        assert graph[0]["count"] == 40
+        assert graph[1]["caller"] == -1
+        assert graph[1]["callee"] == 0x3000
+        assert graph[1]["count"] == 20
@@ -1,4 +1,5 @@
 from builtins import object
+import io
 from mock import *
 from atrip import utils
 
@@ -46,3 +47,90 @@ if __name__ == "__main__":
     t.setup()
     t.test_normal()
     t.test_compact()
+
+
+class TestLoadFile:
+    def test_copy_on_write(self, tmpdir):
+        pathname = str(tmpdir.join("image.bin"))
+        original = np.arange(1000, dtype=np.uint8)
+        original.tofile(pathname)
+        data = utils.load_file(pathname)
+        assert isinstance(data, np.memmap)
+        assert np.array_equal(data, original)
+
+        # memory mapped data is used in place, other arrays are copied
+        assert utils.to_numpy(data) is data
+        assert utils.to_numpy(data[10:20]).base is not None
+        assert utils.to_numpy(original) is not original
+
+        data[0:10] = 0xff
+        assert np.array_equal(np.fromfile(pathname, dtype=np.uint8), original)
+
+    def test_empty(self, tmpdir):
+        pathname = str(tmpdir.join("empty.bin"))
+        open(pathname, "wb").close()
+        assert len(utils.load_file(pathname)) == 0
+
+    def test_array_reader(self):
+        data = np.arange(256, dtype=np.uint8)
+        fh = utils.ArrayReader(data)
+        assert fh.read(4) == bytes([0, 1, 2, 3])
+        fh.seek(-2, io.SEEK_END)
+        assert fh.read() == bytes([254, 255])
+        assert fh.read(10) == b""
+        fh.seek(100)
+        assert fh.tell() == 100
+
+    def test_write_atomic_mode(self, tmpdir):
+        pathname = str(tmpdir.join("image.bin"))
+        utils.write_atomic(pathname, lambda fh: fh.write(b"new"))
+        assert os.stat(pathname).st_mode & 0o777 == 0o666 & ~utils.get_umask()
+
+        os.chmod(pathname, 0o640)
+        utils.write_atomic(pathname, lambda fh: fh.write(b"replaced"))
+        assert os.stat(pathname).st_mode & 0o777 == 0o640
+        assert open(pathname, "rb").read() == b"replaced"
+
+    def test_write_atomic_failure(self, tmpdir):
+        pathname = str(tmpdir.join("image.bin"))
+        utils.write_atomic(pathname, lambda fh: fh.write(b"original"))
+
+        def interrupted(fh):
+            fh.write(b"partial")
+            raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            utils.write_atomic(pathname, interrupted)
+        assert open(pathname, "rb").read() == b"original"
+        assert os.listdir(str(tmpdir)) == ["image.bin"]
+
+
+class TestArchiveMembers:
+    @pytest.mark.parametrize("filename,archiver", [
+        ("dos_sd_test_collection.zip", "ZipArchiver"),
+        ("dos_sd_test_collection.tar", "TarArchiver"),
+        ])
+    def test_members(self, filename, archiver):
+        from atrip.archiver import find_container_items_in_archive
+        pathname = os.path.join(os.path.dirname(__file__), "../samples", filename)
+        mapped = utils.load_file(pathname)
+        a1, items1 = find_container_items_in_archive(pathname, mapped)
+        a2, items2 = find_container_items_in_archive(pathname, open(pathname, "rb").read())
+        assert a1.__class__.__name__ == archiver
+        assert len(items1) == len(items2) > 1
+        for (name1, data1), (name2, data2) in zip(items1, items2):
+            assert name1 == name2
+            assert np.array_equal(data1, data2)
+
+    def test_stored_zip_in_place(self, tmpdir):
+        import zipfile
+        from atrip.archivers.zip import ZipArchiver
+        pathname = str(tmpdir.join("stored.zip"))
+        payloads = [np.arange(i, i + 1000, dtype=np.uint8).tobytes() for i in range(3)]
+        with zipfile.ZipFile(pathname, "w", zipfile.ZIP_STORED) as zf:
+            for i, payload in enumerate(payloads):
+                zf.writestr(f"item{i}.bin", payload)
+        items = list(ZipArchiver().iter_archive("stored.zip", utils.load_file(pathname)))
+        for (name, data), payload in zip(items, payloads):
+            assert isinstance(data, np.memmap)
+            assert data.tobytes() == payload
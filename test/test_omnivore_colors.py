@@ -0,0 +1,44 @@
+from mock import *
+from atrip import style_bits
+from omnivore.arch import colors
+
+
+class Prefs:
+    highlight_background_color = (100, 200, 255)
+    match_background_color = (250, 250, 0)
+    comment_background_color = (200, 0, 200)
+    background_color = (255, 255, 255)
+    data_background_color = (224, 224, 224)
+
+
+class TestStyledColorTable:
+    def setup(self):
+        self.registers = [(0, 0, 0), (255, 255, 255), (10, 100, 200), (255, 0, 0)]
+        self.table = colors.get_styled_color_table(self.registers, Prefs())
+
+    def test_style_class(self):
+        t = colors.style_class_table
+        assert t[0] == colors.STYLE_NORMAL
+        assert t[style_bits.user_bit_mask | style_bits.diff_bit_mask] == colors.STYLE_NORMAL
+        assert t[style_bits.data_bit_mask] == colors.STYLE_DATA
+        assert t[style_bits.data_bit_mask | style_bits.match_bit_mask] == colors.STYLE_MATCH
+        assert t[0xff] == colors.STYLE_HIGHLIGHT
+
+    def test_rgb(self):
+        pixels = np.array([[0, 1], [2, 3], [1, 2]], dtype=np.uint8)
+        style = np.array([[0, 0], [style_bits.comment_bit_mask, 0], [style_bits.selected_bit_mask, style_bits.data_bit_mask]], dtype=np.uint8)
+        rgb = self.table.get_rgb(pixels, style)
+        assert rgb.shape == (3, 2, 3)
+        assert tuple(rgb[0, 1]) == (255, 255, 255)
+        assert tuple(rgb[1, 1]) == (255, 0, 0)
+        comment = colors.get_blended_color_registers(self.registers, Prefs.comment_background_color)
+        assert np.array_equal(rgb[1, 0], np.array(comment[2]).astype(np.uint8))
+        highlight = colors.get_blended_color_registers(self.registers, Prefs.highlight_background_color)
+        assert np.array_equal(rgb[2, 0], np.array(highlight[1]).astype(np.uint8))
+        dimmed = colors.get_dimmed_color_registers(self.registers, Prefs.background_color, Prefs.data_background_color)
+        assert np.array_equal(rgb[2, 1], np.array(dimmed[2]).astype(np.uint8))
+
+    def test_cache(self):
+        assert colors.get_styled_color_table(list(self.registers), Prefs()) is self.table
+        other = colors.get_styled_color_table(self.registers[::-1], Prefs())
+        assert other is not self.table
@@ -0,0 +1,94 @@
+from mock import *
+
+from omnivore.emulator import Emulator, FRAME_FINISHED
+from omnivore.debugger.dtypes import FRAME_STATUS_DTYPE
+from atrip.disassemblers.trace import Trace
+
+from test_atrip_history_index import RingHistory
+from test_atrip_trace import run_program
+
+
+class StubLowLevel:
+    """Stands in for the cython module, running the same 10 instruction
+    program every frame
+    """
+    @staticmethod
+    def next_frame(input, output_raw, debug_cmd, history):
+        status = output_raw[0:FRAME_STATUS_DTYPE.itemsize].view(dtype=FRAME_STATUS_DTYPE)
+        status['frame_number'] += 1
+        status['frame_status'] = FRAME_FINISHED
+        if history is not None:
+            run_program(history, int(status['frame_number'][0]))
+        return -1
+
+
+class StubEmulator(Emulator):
+    name = "stub"
+    output_array_dtype = np.dtype([("video", np.uint8, 16), ("audio", np.uint8, 16), ("state", np.uint8, 16)])
+    low_level_interface = StubLowLevel
+    save_frame_history = False
+
+
+class TestTrace:
+    def setup(self):
+        self.emu = StubEmulator()
+        self.emu.cpu_history = RingHistory(100)
+        self.emu.status['frame_status'] = FRAME_FINISHED
+
+    def test_next_frame(self, tmpdir):
+        path = str(tmpdir.join("trace"))
+        self.emu.start_trace(path)
+        for i in range(30):
+            self.emu.next_frame()
+        writer = self.emu.trace_writer
+        self.emu.stop_trace()
+        assert writer.num_lost == 0
+        trace = Trace(path)
+        assert len(trace) == 30 * 10
+        assert np.array_equal(trace["frame_number"][9::10], np.arange(1, 31))
+
+    def test_run_frames(self, tmpdir):
+        path = str(tmpdir.join("trace"))
+        self.emu.start_trace(path)
+        self.emu.run_frames(30, turbo=False)
+        writer = self.emu.trace_writer
+        self.emu.stop_trace()
+        assert writer.num_lost == 0
+        assert len(Trace(path)) == 30 * 10
+
+
+class TestHistory:
+    def setup(self):
+        self.emu = StubEmulator()
+        self.emu.save_frame_history = True
+        self.emu.status['frame_status'] = FRAME_FINISHED
+
+    def test_single_copy(self):
+        self.emu.next_frame()
+        status, output = self.emu.get_history(1)
+        assert status['frame_number'][0] == 1
+        assert not np.shares_memory(status, self.emu.output_raw)
+
+
+class FailingLowLevel:
+    @staticmethod
+    def next_frame(input, output_raw, debug_cmd, history):
+        raise RuntimeError("emulator crashed")
+
+
+class TestTurbo:
+    def setup(self):
+        self.emu = StubEmulator()
+        self.emu.status['frame_status'] = FRAME_FINISHED
+        self.emu.status['use_memory_access'] = 1
+
+    def test_restore_memory_access(self):
+        self.emu.run_frames(3, turbo=True)
+        assert self.emu.current_frame_number == 3
+        assert self.emu.status['use_memory_access'][0] == 1
+
+    def test_restore_after_error(self):
+        self.emu.low_level_interface = FailingLowLevel
+        with pytest.raises(RuntimeError):
+            self.emu.run_frames(3, turbo=True)
+        assert self.emu.status['use_memory_access'][0] == 1
@@ -0,0 +1,137 @@
+import time
+
+from mock import *
+
+from omnivore import errors
+from omnivore.emulator_pool import EmulatorPool
+
+
+STUB_OUTPUT_DTYPE = np.dtype([
+    ("frame_number", np.uint32),
+    ("video", np.uint8, (4, 4)),
+])
+
+
+class StubEmulator:
+    """Just enough of the Emulator interface to run in the pool. Each frame
+    takes 10ms, and booting fills the video with the length of the pathname.
+    """
+    name = "stub"
+    input_array_dtype = np.dtype([("keychar", np.uint8)])
+    save_frame_history = True
+
+    @classmethod
+    def calc_output_raw_size(cls):
+        return STUB_OUTPUT_DTYPE.itemsize
+
+    def __init__(self, input_raw, output_raw):
+        self.input_raw = input_raw
+        self.output = output_raw.view(dtype=STUB_OUTPUT_DTYPE)
+
+    @property
+    def current_frame_number(self):
+        return self.output["frame_number"][0]
+
+    @property
+    def cycles_since_power_on(self):
+        return self.current_frame_number * 100
+
+    def configure_emulator(self, emu_args, instruction_history_count):
+        pass
+
+    def boot_from_file(self, pathname):
+        if pathname == "bad":
+            raise RuntimeError(f"can't boot {pathname}")
+        self.output["frame_number"] = 0
+        self.output["video"] = len(pathname)
+
+    def run_frames(self, num_frames, turbo=True):
+        time.sleep(num_frames * .01)
+        self.output["frame_number"] += num_frames
+
+    def get_frame_rgb(self):
+        video = self.output["video"][0]
+        return np.dstack([video, video, video])
+
+    def end_emulation(self):
+        pass
+
+
+class TestPool:
+    def setup(self):
+        self.pool = EmulatorPool(StubEmulator, 2)
+
+    def teardown(self):
+        self.pool.close()
+
+    def test_boot_and_run(self):
+        pathnames = ["a", "bb", "ccc", "dddd", "eeeee"]
+        results = sorted(self.pool.boot_and_run(pathnames, 5), key=lambda r: r.pathname)
+        assert [r.pathname for r in results] == pathnames
+        for r in results:
+            assert r.frame_number == 5
+            assert r.cycles_since_power_on == 500
+            assert r.rgb.shape == (4, 4, 3)
+            assert np.all(r.rgb == len(r.pathname))
+
+    def test_completion_order(self):
+        jobs = [("slow", "run", 50), ("fast", "run", 1)]
+        results = list(self.pool.run_jobs(jobs, lambda worker, tag, value: (tag, value)))
+        assert results == [("fast", 1), ("slow", 50)]
+
+    def test_error(self):
+        self.pool.num_workers = 1
+        results = list(self.pool.boot_and_run(["a", "bad", "ccc"], 1))
+        assert results[0].pathname == "a"
+        assert isinstance(results[1], errors.EmulatorWorkerError)
+        assert "can't boot bad" in str(results[1])
+        # the worker is still usable after a failed job
+        assert results[2].pathname == "ccc"
+        assert results[2].frame_number == 1
+
+    def test_worker_died(self):
+        def jobs():
+            yield ("slow", "run", 100)
+            # the slow job has been sent by the time the next one is needed
+            for worker in self.pool.workers:
+                if worker.is_busy and worker.pending[1] == "slow":
+                    worker.process.kill()
+            yield ("fast", "run", 1)
+        results = dict(self.pool.run_jobs(jobs(), lambda worker, tag, value: (tag, value)))
+        assert results["fast"] == 1
+        assert isinstance(results["slow"], errors.EmulatorWorkerError)
+        assert "exit code -9" in str(results["slow"])
+        # the dead worker has been replaced
+        assert len(self.pool.workers) == 2
+        assert all(w.is_alive for w in self.pool.workers)
+        results = list(self.pool.boot_and_run(["a", "bb", "ccc"], 1))
+        assert sorted(r.pathname for r in results) == ["a", "bb", "ccc"]
+
+    def test_receive_from_dead_worker(self):
+        self.pool.start()
+        worker = self.pool.workers[0]
+        worker.send("run", 100)
+        worker.process.kill()
+        with pytest.raises(errors.EmulatorWorkerError):
+            worker.receive()
+        assert not worker.is_busy
+
+    def test_busy(self):
+        self.pool.start()
+        worker = self.pool.workers[0]
+        worker.send("run", 1)
+        assert worker.is_busy
+        with pytest.raises(errors.EmulatorInUseError):
+            worker.send("run", 1)
+        assert worker.receive() == 1
+        assert not worker.is_busy
+        with pytest.raises(errors.EmulatorWorkerError):
+            worker.call("unknown")
+
+    def test_close(self):
+        with self.pool:
+            processes = [w.process for w in self.pool.workers]
+            assert len(processes) == 2
+            assert all(p.is_alive() for p in processes)
+        assert self.pool.workers == []
+        assert not any(p.is_alive() for p in processes)
@@ -0,0 +1,164 @@
+from mock import *
+from omnivore.utils import historyutil as h
+
+
+def make_frames(count, size=4096):
+    frames = []
+    data = np.zeros(size, dtype=np.uint8)
+    for i in range(count):
+        data = data.copy()
+        data[0] = i
+        data[(i * 37) % size:(i * 37) % size + 5] += 1
+        data[-1] = 255 - i
+        frames.append(data)
+    return frames
+
+
+class TestXorDelta:
+    def test_roundtrip(self):
+        a = np.arange(1000, dtype=np.uint8)
+        b = a.copy()
+        b[10:20] = 0
+        b[25] = 7
+        b[500] ^= 0xff
+        starts, lengths, values = h.encode_xor_delta(a, b)
+        assert len(starts) == 2  # first two runs merged because of small gap
+        c = a.copy()
+        h.apply_xor_delta(c, starts, lengths, values)
+        assert np.array_equal(c, b)
+        h.apply_xor_delta(c, starts, lengths, values)
+        assert np.array_equal(c, a)
+
+    def test_identical(self):
+        a = np.arange(1000, dtype=np.uint8)
+        starts, lengths, values = h.encode_xor_delta(a, a)
+        assert len(starts) == 0
+        c = a.copy()
+        h.apply_xor_delta(c, starts, lengths, values)
+        assert np.array_equal(c, a)
+
+
+class TestDeltaFrameHistory:
+    def setup(self):
+        self.frames = make_frames(50)
+        self.history = h.DeltaFrameHistory(keyframe_interval=10)
+        for i, data in enumerate(self.frames):
+            self.history[i + 1] = data
+
+    def test_reconstruct(self):
+        # random access order to exercise both the forward and backward paths
+        for i in [49, 3, 4, 3, 20, 19, 18, 50, 1, 10, 11]:
+            assert np.array_equal(self.history[i], self.frames[i - 1])
+        assert self.history.num_keyframes == 5
+        assert self.history.nbytes < 6 * self.frames[0].nbytes
+
+    def test_returned_copy(self):
+        d = self.history[5]
+        d[:] = 0
+        assert np.array_equal(self.history[5], self.frames[4])
+
+    def test_missing(self):
+        with pytest.raises(KeyError):
+            self.history[100]
+        with pytest.raises(IndexError):
+            self.history.previous_key(1)
+        with pytest.raises(IndexError):
+            self.history.next_key(50)
+        assert self.history.previous_key(20) == 19
+        assert self.history.next_key(50 - 1) == 50
+
+    def test_overwrite(self):
+        replacement = np.full(4096, 0x55, dtype=np.uint8)
+        self.history[12] = replacement
+        assert np.array_equal(self.history[12], replacement)
+        for i in range(1, 51):
+            if i != 12:
+                assert np.array_equal(self.history[i], self.frames[i - 1])
+
+    def test_budget(self):
+        history = h.DeltaFrameHistory(keyframe_interval=10, memory_budget=3 * 4096)
+        for i, data in enumerate(self.frames):
+            history[i + 1] = data
+        assert history.nbytes <= 3 * 4096
+        assert 50 in history
+        assert 1 not in history
+        for i in history.keys():
+            assert np.array_equal(history[i], self.frames[i - 1])
+
+
+class TestRestart:
+    def test_delta_restart(self):
+        tree = h.RestartTree(lambda: h.DeltaFrameHistory(keyframe_interval=4))
+        restart = tree.emulator_start
+        frames = make_frames(20)
+        for i, data in enumerate(frames):
+            restart.save_frame(i + 1, data)
+        assert restart.get_previous_frame(10) == 9
+        assert restart.get_next_frame(10) == 11
+        assert restart.get_next_frame(19) == 20
+        assert np.array_equal(restart[7], frames[6])
+
+        child = tree.create_restart(0, 10)
+        assert isinstance(child.frame_history, h.DeltaFrameHistory)
+        assert np.array_equal(child[7], frames[6])
+
+
+def fake_frame(frame_number, size=4096):
+    data = np.zeros(size, dtype=np.uint8)
+    data[0:4] = np.frombuffer(np.uint32(frame_number).tobytes(), dtype=np.uint8)
+    data[100 + frame_number % 1000] = 1
+    return data
+
+
+class TestTieredFrameHistory:
+    def setup(self):
+        self.regenerated = []
+
+    def regenerate(self, history, base_frame_number, base_data, frame_number):
+        assert np.array_equal(base_data, fake_frame(base_frame_number))
+        self.regenerated.append((base_frame_number, frame_number))
+        return [(n, fake_frame(n)) for n in range(base_frame_number + 1, frame_number + 1)]
+
+    def fill(self, history, count):
+        for n in range(1, count + 1):
+            history[n] = fake_frame(n)
+            history.save_input(n, np.zeros(4, dtype=np.uint8))
+
+    def test_thinning(self):
+        history = h.TieredFrameHistory(keyframe_interval=10, dense_count=20, regenerate_callback=self.regenerate)
+        self.fill(history, 200)
+        stored = history.sorted_keys
+        assert len(stored) < 100
+        assert set(range(181, 201)).issubset(stored)
+        assert 1 in stored
+        assert len(history) == 200
+        assert history.previous_key(100) == 99
+        assert history.next_key(100) == 101
+        for n in [200, 150, 99, 33, 2, 1]:
+            assert np.array_equal(history[n], fake_frame(n))
+        assert self.regenerated
+        with pytest.raises(KeyError):
+            history[201]
+
+    def test_spill(self, tmpdir):
+        history = h.TieredFrameHistory(keyframe_interval=10, memory_budget=3 * 4096, dense_count=20, spill_dir=str(tmpdir), cache_count=4, regenerate_callback=self.regenerate)
+        self.fill(history, 100)
+        assert history.nbytes <= 3 * 4096
+        assert history.spilled_keys
+        assert os.path.exists(history.spill_path)
+        for n in [1, 2, 50, 85, 100]:
+            assert np.array_equal(history[n], fake_frame(n))
+        path = history.spill_path
+        history.close()
+        assert not os.path.exists(path)
+
+    def test_input(self):
+        history = h.TieredFrameHistory()
+        history.save_input(5, np.array([1, 2], dtype=np.uint8))
+        history.save_input(6, np.array([1, 2], dtype=np.uint8))
+        history.save_input(9, np.array([3, 4], dtype=np.uint8))
+        assert history.input_change_keys == [5, 9]
+        assert list(history.get_input(8)) == [1, 2]
+        assert list(history.get_input(100)) == [3, 4]
+        with pytest.raises(IndexError):
+            history.get_input(4)
@@ -0,0 +1,83 @@
+from mock import *
+from omnivore.utils.imageutil import IncrementalRowImage, calc_row_runs
+
+
+class TestIncrementalRowImage:
+    def setup(self):
+        self.data = np.arange(40 * 10, dtype=np.uint8).reshape((40, 10))
+        self.style = np.zeros_like(self.data)
+        self.image = IncrementalRowImage()
+        self.rendered = []
+
+    def get_image(self, first_row, nr, layout="a"):
+        data = self.data[first_row:first_row + nr]
+        style = self.style[first_row:first_row + nr]
+
+        def render_rows(start, end):
+            self.rendered.extend(range(first_row + start, first_row + end))
+            # two image rows per table row, one pixel per byte
+            block = np.repeat(data[start:end] ^ style[start:end], 2, axis=0)
+            return np.dstack([block, block, block])
+
+        return self.image.get_image(first_row, first_row * 10, 10, data, style, layout, render_rows)
+
+    def check(self, array, first_row, nr):
+        expected = np.repeat(self.data[first_row:first_row + nr] ^ self.style[first_row:first_row + nr], 2, axis=0)
+        assert np.array_equal(array[:,:,0], expected)
+
+    def test_runs(self):
+        assert calc_row_runs(np.array([0, 1, 1, 0, 1, 0, 0, 1, 1], dtype=bool)) == [(1, 3), (4, 5), (7, 9)]
+        assert calc_row_runs(np.zeros(5, dtype=bool)) == []
+
+    def test_changes(self):
+        self.check(self.get_image(0, 20), 0, 20)
+        assert self.rendered == list(range(20))
+        self.rendered = []
+        self.check(self.get_image(0, 20), 0, 20)
+        assert self.rendered == []
+
+        # change found by comparison
+        self.data[5, 3] = 99
+        self.style[12, 0] = 0x80
+        self.check(self.get_image(0, 20), 0, 20)
+        assert self.rendered == [5, 12]
+
+        # rows marked from a command's index range get rendered even if the
+        # bytes look the same
+        self.rendered = []
+        self.image.mark_dirty_indexes(31, 72)
+        self.check(self.get_image(0, 20), 0, 20)
+        assert self.rendered == [3, 4, 5, 6, 7]
+
+    def test_viewer_flags(self):
+        from types import SimpleNamespace
+        from sawx.utils.command import DisplayFlags
+        from omnivore.viewers.antic import AnticColorViewer
+        line_renderer = SimpleNamespace(row_image=self.image)
+        viewer = SimpleNamespace(control=SimpleNamespace(line_renderer=line_renderer))
+        self.get_image(0, 20)
+
+        flags = DisplayFlags()
+        flags.index_range = (31, 72)
+        self.rendered = []
+        AnticColorViewer.mark_rendered_rows_dirty(viewer, flags)
+        self.get_image(0, 20)
+        assert self.rendered == [3, 4, 5, 6, 7]
+
+        # events fired without a DisplayFlags instance redraw everything
+        self.rendered = []
+        AnticColorViewer.mark_rendered_rows_dirty(viewer, True)
+        self.get_image(0, 20)
+        assert self.rendered == list(range(20))
+
+    def test_scroll(self):
+        self.get_image(0, 20)
+        self.rendered = []
+        self.check(self.get_image(5, 20), 5, 20)
+        assert self.rendered == list(range(20, 25))
+        self.rendered = []
+        self.check(self.get_image(2, 10), 2, 10)
+        assert self.rendered == [2, 3, 4]
+        self.rendered = []
+        self.check(self.get_image(2, 10, "b"), 2, 10)
+        assert self.rendered == list(range(2, 12))
@@ -0,0 +1,81 @@
+from mock import *
+
+from atrip.container import Container
+from atrip.segment import Segment
+from omnivore.utils.searchutil import AlgorithmSearcher, HexSearcher
+
+
+class MockEditor:
+    def __init__(self, segment):
+        self.segment = segment
+
+
+class TestAlgorithmSearcher:
+    def setup(self):
+        data = np.arange(16, dtype=np.uint8)
+        self.segment = Segment(Container(data))
+        self.editor = MockEditor(self.segment)
+
+    def search(self, text):
+        return AlgorithmSearcher(self.editor, text, self.segment.tobytes()).matches
+
+    def test_simple(self):
+        items = [
+            ("a > 1", [(2, 16)]),
+            ("a > $a", [(11, 16)]),
+            ("a > 0xA", [(11, 16)]),
+            ("b > 8", [(9, 16)]),
+            ("(a > 3) & (a > 5)", [(6, 16)]),
+            ("(a * b) > 128", [(12, 16)]),
+            ("(2 * a - b) > 0", [(1, 16)]),
+            ("a % 4 == 3", [(3, 4), (7, 8), (11, 12), (15, 16)]),
+            ("b + b[+1] > 255", []),
+        ]
+        for search_text, expected in items:
+            assert self.search(search_text) == expected
+
+    def test_errors(self):
+        with pytest.raises(ValueError):
+            self.search("((a > 0")
+        with pytest.raises(ValueError):
+            self.search("x > 0")
+
+    def test_relative(self):
+        assert self.search("b == 4 && b[+2] == 6") == [(4, 7)]
+        assert self.search("b[-2] == 4") == [(4, 7)]
+        assert self.search("b[+1] == 0") == []
+        assert self.search("b[-1] < 2") == [(0, 3)]
+        assert self.search("w == $0908") == [(8, 10)]
+        assert self.search("w[+1] == $0f0e") == [(13, 16)]
+        assert self.search("w > 0") == [(0, 16)]
+
+    def test_pattern(self):
+        data = np.zeros(0x1000, dtype=np.uint8)
+        code = [0xa9, 0x01, 0x8d, 0x1a, 0xd0]
+        data[0x100:0x105] = code
+        data[0x800:0x805] = code
+        data[0x804] = 0xd4
+        self.segment = Segment(Container(data), origin=0x2000)
+        self.editor = MockEditor(self.segment)
+        assert self.search("b == $a9 && b[+2] == $8d && w[+3] == $d01a") == [(0x100, 0x105)]
+        assert self.search("b == $8d && w[+1] == $d01a && a > $2000") == [(0x102, 0x105)]
+
+    def test_style(self):
+        self.segment.set_style_ranges([(4, 8)], data=True)
+        assert self.search("(s & data) != 0") == [(4, 8)]
+        assert self.search("(s & data) && (s[+1] & data) == 0") == [(7, 9)]
+
+
+class TestHexSearcher:
+    def setup(self):
+        data = np.tile(np.arange(8, dtype=np.uint8), 4)
+        self.segment = Segment(Container(data))
+        self.editor = MockEditor(self.segment)
+
+    def search(self, text):
+        return HexSearcher(self.editor, text, self.segment.tobytes()).matches
+
+    def test_wildcard(self):
+        assert self.search("0203") == [(2, 4), (10, 12), (18, 20), (26, 28)]
+        assert self.search("07 ?? 01") == [(7, 10), (15, 18), (23, 26)]
+        assert self.search("07 0") == []